@@ -1,10 +1,13 @@
 """处理主要输入是str，经由LLM处理的函数。"""
 import logging
-from typing import AsyncGenerator, Dict, Any, Tuple, List
+from typing import AsyncGenerator, Dict, Any, Optional, Tuple, List
 import datetime 
 from utils.config_utils import get_config, DEFAULT_API
 from agent.tools_handler import parse_and_invoke_tool
-from utils.LLM_utils import LLM, llm_client_manager, PromptsBuilder
+from utils.LLM_utils import LLM, PromptsBuilder
+from utils.llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from utils.image_cache import content_key, image_analysis_cache
+from agent.memory_store import KIND_EXPERIENCE, KIND_SESSION, agent_memory
 from utils.logging_utils import setup_logging
 from utils import file_utils, LLM_utils
 import utils.db_utils as db
@@ -52,89 +55,33 @@ async def run_agent_session(
         experience_context = ""
         
         if enable_memory:
-            # 读取记忆库
+            # 只取与本次输入最相关的前 K 条会话记忆和经验
             try:
-                with open("agent/docs/mem.json", 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if content:
-                        memories = json.loads(content)
-                        # 清理过期记忆
-                        current_time = datetime.datetime.now()
-                        valid_memories = {}
-                        for key, mem in memories.items():
-                            try:
-                                expires_at = datetime.datetime.fromisoformat(mem.get('expires_at', ''))
-                                if current_time <= expires_at:
-                                    valid_memories[key] = mem
-                                    # 如果是当前会话，刷新过期时间
-                                    if session_id and key == session_id:
-                                        mem['expires_at'] = (current_time + datetime.timedelta(minutes=10)).isoformat()
-                                        mem['last_updated'] = current_time.isoformat()
-                            except (ValueError, TypeError):
-                                continue
-                        
-                        # 保存清理后的记忆
-                        if valid_memories != memories:
-                            with open("agent/docs/mem.json", 'w', encoding='utf-8') as f:
-                                json.dump(valid_memories, f, ensure_ascii=False, indent=2)
-                        
-                        # 获取10分钟内的记忆作为上下文
-                        if valid_memories:
-                            # 筛选10分钟内的记忆
-                            recent_memories = []
-                            ten_minutes_ago = current_time - datetime.timedelta(minutes=10)
-                            
-                            for mem_id, mem_data in valid_memories.items():
-                                try:
-                                    mem_timestamp = datetime.datetime.fromisoformat(mem_data.get('timestamp', ''))
-                                    if mem_timestamp >= ten_minutes_ago:
-                                        recent_memories.append((mem_id, mem_data))
-                                except (ValueError, TypeError):
-                                    continue
-                            
-                            # 按时间戳排序，最新的在前
-                            recent_memories.sort(key=lambda x: x[1].get('timestamp', ''), reverse=True)
-                            
-                            if recent_memories:
-                                memory_summaries = []
-                                for mem_id, mem_data in recent_memories:
-                                    summary = mem_data.get('summary', {})
-                                    # 提取关键信息
-                                    session_info = {
-                                        "session_id": mem_id,
-                                        "timestamp": mem_data.get('timestamp', ''),
-                                        "user_request": summary.get('session_summary', {}).get('user_request', ''),
-                                        "completed_tasks": summary.get('session_summary', {}).get('completed_tasks', []),
-                                        "important_info": summary.get('cached_data', {}).get('important_info', []),
-                                        "user_preferences": summary.get('cached_data', {}).get('user_preferences', {}),
-                                        "pending_tasks": summary.get('cached_data', {}).get('pending_tasks', [])
-                                    }
-                                    memory_summaries.append(session_info)
-                                
-                                memory_context = f"\n\n=== 近期会话记忆（10分钟内） ===\n{json.dumps(memory_summaries, ensure_ascii=False, indent=2)}\n"
-                                logger.info(f"已加载 {len(memory_summaries)} 条近期记忆（10分钟内）")
-                            
-                            # 如果当前会话ID存在，刷新其过期时间
-                            if session_id and session_id in valid_memories:
-                                valid_memories[session_id]['expires_at'] = (current_time + datetime.timedelta(minutes=10)).isoformat()
-                                valid_memories[session_id]['last_updated'] = current_time.isoformat()
-                                logger.info(f"已刷新当前会话记忆过期时间: {session_id}")
-            except (FileNotFoundError, json.JSONDecodeError) as e:
-                logger.info(f"无法读取记忆库: {e}")
-            
-            # 读取经验库
-            try:
-                with open("agent/docs/exp.json", 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if content:
-                        experiences = json.loads(content)
-                        if experiences:
-                            # 只取最近的5条经验
-                            recent_experiences = experiences[-5:] if len(experiences) > 5 else experiences
-                            experience_context = f"\n\n=== 经验库 ===\n{json.dumps(recent_experiences, ensure_ascii=False, indent=2)}\n"
-                            logger.info(f"已加载 {len(recent_experiences)} 条经验")
-            except (FileNotFoundError, json.JSONDecodeError) as e:
-                logger.info(f"无法读取经验库: {e}")
+                if session_id:
+                    agent_memory.touch_session(session_id)
+                recent_memories = agent_memory.search(KIND_SESSION, user_input)
+                if recent_memories:
+                    memory_summaries = []
+                    for mem in recent_memories:
+                        summary = mem["content"].get("summary", {})
+                        memory_summaries.append({
+                            "session_id": mem["session_id"],
+                            "timestamp": datetime.datetime.fromtimestamp(mem["created_at"]).isoformat(),
+                            "user_request": summary.get('session_summary', {}).get('user_request', ''),
+                            "completed_tasks": summary.get('session_summary', {}).get('completed_tasks', []),
+                            "important_info": summary.get('cached_data', {}).get('important_info', []),
+                            "user_preferences": summary.get('cached_data', {}).get('user_preferences', {}),
+                            "pending_tasks": summary.get('cached_data', {}).get('pending_tasks', [])
+                        })
+                    memory_context = f"\n\n=== 近期会话记忆 ===\n{json.dumps(memory_summaries, ensure_ascii=False, indent=2)}\n"
+                    logger.info(f"已加载 {len(memory_summaries)} 条相关会话记忆")
+
+                experiences = [mem["content"] for mem in agent_memory.search(KIND_EXPERIENCE, user_input)]
+                if experiences:
+                    experience_context = f"\n\n=== 经验库 ===\n{json.dumps(experiences, ensure_ascii=False, indent=2)}\n"
+                    logger.info(f"已加载 {len(experiences)} 条相关经验")
+            except Exception as e:
+                logger.warning(f"读取记忆库失败: {e}")
 
         system_prompt = f"{prompt_text}\n\n{character_prompt}{bias_prompt}{memory_context}{experience_context}"
         current_messages = [
@@ -149,10 +96,10 @@ async def run_agent_session(
             yield {"status": "thinking", "iteration": iteration}
 
             client.set_messages(current_messages)
-            logger.debug(f"已设置 messages (当前会话): {current_messages}")
+            logger.debug("已设置 messages (当前会话): %s", current_messages)
 
             ai_response = await client.final_response()
-            logger.debug(f"LLM 原始响应: {ai_response}")
+            logger.debug("LLM 原始响应: %s", ai_response)
 
             llm_text_part, display_results, llm_feedback, had_tool_calls = await parse_and_invoke_tool(ai_response)
 
@@ -257,6 +204,7 @@ async def analyze_image_for_rating(
     mime_type: str,
     hard_mode: bool = False,
     parse_mode: str = "markdown",
+    image_key: Optional[str] = None,
 ) -> Tuple[str, List[Dict[str, Any]]]:
     """
     分析图像的base64数据，并返回分析结果和消息历史。
@@ -266,6 +214,8 @@ async def analyze_image_for_rating(
         mime_type (str): 图像的MIME类型。
         hard_mode (bool): 是否启用更激进的评价模式。
         parse_mode (str): 输出格式，可以是 'markdown' 或 'html'。
+        image_key (str, optional): 结果缓存键，通常为 Telegram 的 file_unique_id；
+            不提供时使用图片内容的哈希。
 
     Returns:
         Tuple[str, List[Dict[str, Any]]]: 包含格式化响应和发送给LLM的消息列表的元组。
@@ -305,13 +255,20 @@ async def analyze_image_for_rating(
 
     fuck_api = get_config("fuck_or_not_api", "gemini-2.5")
     llm = LLM_utils.LLM(api=fuck_api)
-    llm.set_messages(llm_messages)
-    response = await llm.final_response()
+    cache_key = image_key or content_key(base64_data)
+    response = image_analysis_cache.get(cache_key, prompt_name, hard_mode, llm.model)
+    cache_hit = response is not None
+    if not cache_hit:
+        llm.set_messages(llm_messages)
+        response = await llm.final_response()
 
     try:
         match = re.search(r"```json\n(.*?)\n```", response, re.DOTALL)
         json_str = match.group(1) if match else response
         data = json.loads(json_str)
+        # 只缓存能正常解析的结果
+        if not cache_hit:
+            image_analysis_cache.put(cache_key, prompt_name, hard_mode, llm.model, response)
 
         if parse_mode == "html":
             score = data.get("score", "N/A")
@@ -344,6 +301,7 @@ async def analyze_image_for_kao(
     base64_data: str,
     mime_type: str,
     parse_mode: str = "markdown",
+    image_key: Optional[str] = None,
 ) -> Tuple[str, List[Dict[str, Any]]]:
     """
     分析图像的base64数据，并返回颜值分析结果和消息历史。
@@ -352,6 +310,7 @@ async def analyze_image_for_kao(
         base64_data (str): 图像的base64编码数据。
         mime_type (str): 图像的MIME类型。
         parse_mode (str): 输出格式，可以是 'markdown' 或 'html'。
+        image_key (str, optional): 结果缓存键，通常为 Telegram 的 file_unique_id。
 
     Returns:
         Tuple[str, List[Dict[str, Any]]]: 包含格式化响应和发送给LLM的消息列表的元组。
@@ -382,13 +341,19 @@ async def analyze_image_for_kao(
 
     kao_api = get_config("fuck_or_not_api", "gemini-2.5") # We can reuse the same API for now
     llm = LLM_utils.LLM(api=kao_api)
-    llm.set_messages(llm_messages)
-    response = await llm.final_response()
+    cache_key = image_key or content_key(base64_data)
+    response = image_analysis_cache.get(cache_key, prompt_name, False, llm.model)
+    cache_hit = response is not None
+    if not cache_hit:
+        llm.set_messages(llm_messages)
+        response = await llm.final_response()
 
     try:
         match = re.search(r"```json\n(.*?)\n```", response, re.DOTALL)
         json_str = match.group(1) if match else response
         data = json.loads(json_str)
+        if not cache_hit:
+            image_analysis_cache.put(cache_key, prompt_name, False, llm.model, response)
 
         if parse_mode == "html":
             score = data.get("score", "N/A")
@@ -442,32 +407,33 @@ async def generate_summary(conversation_id: int,summary_type:str = 'save',start:
         Raises:
             ValueError: 总结生成失败时抛出
         """
-        async with llm_client_manager.semaphore:
-            try:
-                # 构建对话历史
-                client = LLM("gemini-2", "private")
-
-                if summary_type == 'save':
-                    turns = db.dialog_turn_get(conversation_id, 'private')
-                    start = turns - 70 if turns > 70 else 0
-                    messages = PromptsBuilder.build_conv_messages_for_summary(conversation_id, "private", start, turns)
-                    user_prompt = file_utils.load_single_prompt("summary_save_user_prompt")
-                    if not user_prompt:
-                        raise ValueError("无法加载 'summary_save_user_prompt' prompt。")
-                    messages.append({"role": "user", "content": user_prompt})
-                    client.set_messages(messages)
-                elif summary_type == 'zip':
-                    messages = PromptsBuilder.build_conv_messages_for_summary(conversation_id, "private", start, end)
-                    logger.debug(f"总结文本内容：\r\n{messages}")
-                    user_prompt = file_utils.load_single_prompt("summary_zip_user_prompt")
-                    if not user_prompt:
-                        raise ValueError("无法加载 'summary_zip_user_prompt' prompt。")
-                    messages.append({"role": "user", "content": user_prompt})
-                    client.set_messages(messages)
-                return await client.final_response()
-
-            except Exception as e:
-                raise ValueError(f"生成总结失败: {str(e)}")
+        try:
+            # 构建对话历史
+            # 压缩总结由后台任务触发，用户主动保存的总结按交互请求处理
+            priority = PRIORITY_BACKGROUND if summary_type == 'zip' else PRIORITY_INTERACTIVE
+            client = LLM("gemini-2", "private", priority=priority)
+
+            if summary_type == 'save':
+                turns = db.dialog_turn_get(conversation_id, 'private')
+                start = turns - 70 if turns > 70 else 0
+                messages = PromptsBuilder.build_conv_messages_for_summary(conversation_id, "private", start, turns)
+                user_prompt = file_utils.load_single_prompt("summary_save_user_prompt")
+                if not user_prompt:
+                    raise ValueError("无法加载 'summary_save_user_prompt' prompt。")
+                messages.append({"role": "user", "content": user_prompt})
+                client.set_messages(messages)
+            elif summary_type == 'zip':
+                messages = PromptsBuilder.build_conv_messages_for_summary(conversation_id, "private", start, end)
+                logger.debug("总结文本内容：\r\n%s", messages)
+                user_prompt = file_utils.load_single_prompt("summary_zip_user_prompt")
+                if not user_prompt:
+                    raise ValueError("无法加载 'summary_zip_user_prompt' prompt。")
+                messages.append({"role": "user", "content": user_prompt})
+                client.set_messages(messages)
+            return await client.final_response()
+
+        except Exception as e:
+            raise ValueError(f"生成总结失败: {str(e)}")
 
 async def generate_char(character_description: str,nsfw:bool=True) -> str:
         """
@@ -483,34 +449,38 @@ async def generate_char(character_description: str,nsfw:bool=True) -> str:
         Raises:
             ValueError: 角色生成失败时抛出
         """
-        async with llm_client_manager.semaphore:
-            try:
-                # 根据nsfw参数选择对应的prompt
-                prompt_key = "generate_char_prompt" if nsfw else "generate_char_prompt_sfw"
-                system_prompt = file_utils.load_single_prompt(prompt_key)
-                if not system_prompt:
-                    raise ValueError(f"无法加载 '{prompt_key}' prompt。")
-
-                # 构建对话历史
-                history = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": character_description},
-                ]
-                client = LLM(DEFAULT_API, "private")
-                client.set_messages(history)
-                client.set_default_client()
-                result = await client.final_response()
-                logger.debug(f"LLM输出角色\r\n{result}\r\n")
-                return result
+        try:
+            # 根据nsfw参数选择对应的prompt
+            prompt_key = "generate_char_prompt" if nsfw else "generate_char_prompt_sfw"
+            system_prompt = file_utils.load_single_prompt(prompt_key)
+            if not system_prompt:
+                raise ValueError(f"无法加载 '{prompt_key}' prompt。")
+
+            # 构建对话历史
+            history = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": character_description},
+            ]
+            client = LLM(DEFAULT_API, "private")
+            client.set_messages(history)
+            client.set_default_client()
+            result = await client.final_response()
+            logger.debug(f"LLM输出角色\r\n{result}\r\n")
+            return result
 
-            except Exception as e:
-                raise ValueError(f"生成角色失败: {str(e)}")
+        except Exception as e:
+            raise ValueError(f"生成角色失败: {str(e)}")
 
 async def generate_user_profile(group_id: int) -> str:
 
     """
     分析群组聊天记录，为最活跃的用户生成JSON格式的画像。
 
+    以 group_profile_state 中记录的 msg_id 为高水位，只把上次生成之后的新消息连同已有画像
+    交给 LLM 做增量更新；新消息少于 profile.min_new_messages 条时认为画像仍然有效，直接跳过。
+    只附带新消息中出现过的用户的已有画像。LLM 返回的画像解析成功后与高水位在同一个事务中写入，
+    返回无法解析或写入失败时高水位不变，下次仍会处理这批消息。
+
     Args:
         group_id: 目标群组的ID。
 
@@ -519,17 +489,33 @@ async def generate_user_profile(group_id: int) -> str:
              如果找不到聊天记录或发生错误，则返回错误信息的字符串。
     """
     try:
-        # 1. 获取最近800条群聊数据
+        # 1. 检查自上次生成以来的新消息数量
+        state = db.group_profile_state_get(group_id)
+        last_msg_id = state["last_msg_id"]
+        new_count = db.query_db(
+            "SELECT COUNT(*) FROM group_dialogs WHERE group_id = ? AND msg_id > ? AND msg_user IS NOT NULL",
+            (group_id, last_msg_id),
+        )[0][0]
+        min_new_messages = get_config("profile.min_new_messages", 50)
+        if last_msg_id and new_count < min_new_messages:
+            logger.info(f"群组 {group_id} 自上次生成画像后只有 {new_count} 条新消息，跳过更新")
+            return json.dumps({
+                "skipped": True,
+                "message": f"自上次生成画像（{state['last_generated']}）以来只有 {new_count} 条新消息，"
+                           f"少于 {min_new_messages} 条，现有画像仍然有效，无需更新。"
+            }, ensure_ascii=False, indent=2)
+
+        # 2. 只获取高水位之后的群聊数据（最多 profile.max_messages 条）
         command = """
-            SELECT msg_text, msg_user_name, processed_response, create_at, msg_user
+            SELECT msg_text, msg_user_name, processed_response, create_at, msg_user, msg_id
             FROM (SELECT msg_text, msg_user_name, processed_response, create_at, msg_user, msg_id
                   FROM group_dialogs
-                  WHERE group_id = ? AND msg_user IS NOT NULL
+                  WHERE group_id = ? AND msg_id > ? AND msg_user IS NOT NULL
                   ORDER BY msg_id DESC
-                  LIMIT 800) sub
+                  LIMIT ?) sub
             ORDER BY msg_id ASC
         """
-        dialogs_with_user_id = db.query_db(command, (group_id,))
+        dialogs_with_user_id = db.query_db(command, (group_id, last_msg_id, get_config("profile.max_messages", 800)))
 
         if not dialogs_with_user_id:
              return json.dumps({"error": f"无法找到群组 {group_id} 的聊天记录，或记录为空。"}, ensure_ascii=False)
@@ -541,39 +527,65 @@ async def generate_user_profile(group_id: int) -> str:
             ]
         )
 
-        # 3. 构建 Prompt
+        # 3. 构建 Prompt，只附带本批消息中出现的用户的已有画像
+        active_user_ids = sorted({row[4] for row in dialogs_with_user_id})
+        previous_profiles = db.group_profiles_get(group_id, active_user_ids)
         system_prompt = file_utils.load_single_prompt("generate_user_profile_system", "prompts/features_prompts.json")
-        user_prompt_template = file_utils.load_single_prompt("generate_user_profile_user", "prompts/features_prompts.json")
+        if previous_profiles:
+            user_prompt_template = file_utils.load_single_prompt("generate_user_profile_incremental_user", "prompts/features_prompts.json")
+        else:
+            user_prompt_template = file_utils.load_single_prompt("generate_user_profile_user", "prompts/features_prompts.json")
 
         if not system_prompt or not user_prompt_template:
             raise ValueError("无法从 features_prompts.json 加载用户画像生成所需的Prompt。")
-            
-        final_user_prompt = user_prompt_template.format(dialog_content=formatted_dialogs)
+
+        if previous_profiles:
+            previous_text = "\n".join(f"用户ID {p['user_id']}: {p['profile_json']}" for p in previous_profiles)
+            final_user_prompt = user_prompt_template.format(previous_profiles=previous_text, dialog_content=formatted_dialogs)
+        else:
+            final_user_prompt = user_prompt_template.format(dialog_content=formatted_dialogs)
 
         # 4. 调用 LLM
-        client = LLM(api=get_config("analysis.default_api", "gemini-2.5"))
+        client = LLM(api=get_config("analysis.default_api", "gemini-2.5"), priority=PRIORITY_BACKGROUND)
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": final_user_prompt},
         ]
         client.set_messages(messages)
         
-        logger.info(f"正在为群组 {group_id} 生成用户画像...")
+        logger.info(f"正在为群组 {group_id} 生成用户画像（新消息 {len(dialogs_with_user_id)} 条，增量: {bool(previous_profiles)}）...")
         response_data_str = await client.final_response()
 
-        instruction_to_agent = (
-            "已成功生成用户画像的JSON。请解析下面的 `raw_response` 字段（它是一个JSON字符串），"
-            "提取每位用户的信息，并将这些信息更新到 `user_profiles` 数据库表中。"
-            "对于每个用户，请先查询数据库确认是否存在旧画像。如果存在，"
-            "请结合旧内容和新内容作为参考进行更新；如果不存在，请直接插入新画像。"
-            "为了防止单次操作过大，一次调用工具最多处理2-3人的信息。"
-            "对于每个用户的'recent_activities'字段，需要把日期加进去，保留5天的结果。如果超过5天，则去掉最早的结果。"
-            f"现在的时间是 {str(datetime.datetime.now())}，请确保使用当前时间戳更新 `last_updated` 字段。"
-        )
-        
+        # 5. 解析画像，与高水位在同一个事务中写入
+        try:
+            match = re.search(r"```json\n(.*?)\n```", response_data_str or "", re.DOTALL)
+            user_profiles = json.loads(match.group(1) if match else response_data_str)["user_profiles"]
+            if not isinstance(user_profiles, list):
+                raise TypeError("user_profiles 不是列表")
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logger.warning(f"群组 {group_id} 的用户画像返回无法解析，本次不更新: {e}")
+            return json.dumps({"error": f"LLM 返回的用户画像无法解析（{e}），未做任何更新，可以稍后重试。"},
+                              ensure_ascii=False, indent=2)
+
+        profiles = []
+        for profile in user_profiles:
+            try:
+                user_id = int(profile["user_id"])
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"群组 {group_id} 的用户画像缺少有效的 user_id，已忽略: {profile}")
+                continue
+            profile["last_updated"] = str(datetime.datetime.now())
+            profiles.append((user_id, json.dumps(profile, ensure_ascii=False)))
+
+        if not db.group_profiles_save(group_id, profiles, dialogs_with_user_id[-1][5], response_data_str):
+            return json.dumps({"error": "用户画像写入数据库失败，未做任何更新，可以稍后重试。"},
+                              ensure_ascii=False, indent=2)
+
         return json.dumps({
-            "raw_response": response_data_str,
-            "instruction": instruction_to_agent
+            "message": f"已根据 {len(dialogs_with_user_id)} 条新消息更新 {len(profiles)} 位用户的画像，"
+                       "画像已写入 user_profiles 表，无需再次写入。",
+            "updated_user_ids": [user_id for user_id, _ in profiles],
+            "user_profiles": user_profiles
         }, ensure_ascii=False, indent=2)
 
     except Exception as e:
@@ -633,19 +645,6 @@ async def analyze_failure_patterns(conversation_messages: List[Dict[str, Any]])
         Dict[str, Any]: 包含成功/失败状态和失败原因的字典
     """
     try:
-        # 读取现有的经验数据
-        exp_file_path = "agent/docs/exp.json"
-        existing_experiences = []
-        
-        try:
-            with open(exp_file_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if content:
-                    existing_experiences = json.loads(content)
-        except (FileNotFoundError, json.JSONDecodeError):
-            logger.info("exp.json文件不存在或为空，将创建新的经验库")
-            existing_experiences = []
-        
         # 构建分析提示词
         system_prompt = """
 你是一个专业的AI助手经验总结专家。请分析以下对话，提取简洁的执行经验。
@@ -675,13 +674,14 @@ async def analyze_failure_patterns(conversation_messages: List[Dict[str, Any]])
             for msg in conversation_messages
         ])
         
-        # 添加现有经验作为参考
+        # 添加与本次对话相关的现有经验作为参考
+        existing_experiences = [mem["content"] for mem in agent_memory.search(KIND_EXPERIENCE, conversation_text)]
         existing_exp_text = "\n\n现有经验库：\n" + json.dumps(existing_experiences, ensure_ascii=False, indent=2) if existing_experiences else ""
         
         user_prompt = f"请分析以下对话中的工具调用错误：\n\n{conversation_text}{existing_exp_text}"
         
         # 调用LLM进行分析
-        client = LLM(api=get_config("analysis.default_api", "gemini-2.5"))
+        client = LLM(api=get_config("analysis.default_api", "gemini-2.5"), priority=PRIORITY_BACKGROUND)
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
@@ -700,27 +700,17 @@ async def analyze_failure_patterns(conversation_messages: List[Dict[str, Any]])
             else:
                 analysis_result = json.loads(response)
             
-            # 如果提取到了经验，将新经验添加到经验库
+            # 如果提取到了经验，逐条追加到经验库
             if analysis_result.get("has_experience", False):
                 for exp in analysis_result.get("experiences", []):
-                    new_experience = {
+                    agent_memory.add_experience({
                         "timestamp": datetime.datetime.now().isoformat(),
                         "task_type": exp.get("task_type", ""),
                         "execution_order": exp.get("execution_order", ""),
                         "key_points": exp.get("key_points", ""),
                         "function_usage": exp.get("function_usage", "")
-                    }
-                    existing_experiences.append(new_experience)
-                
-                # 保持经验库大小合理（最多保留50条）
-                if len(existing_experiences) > 50:
-                    existing_experiences = existing_experiences[-50:]
-                
-                # 保存更新后的经验库
-                with open(exp_file_path, 'w', encoding='utf-8') as f:
-                    json.dump(existing_experiences, f, ensure_ascii=False, indent=2)
-                
-                logger.info(f"已保存新的失败经验到 {exp_file_path}")
+                    })
+                logger.info("已保存新的失败经验到经验库")
             
             return {
                 "success": True,
@@ -755,19 +745,6 @@ async def summarize_memory(conversation_messages: List[Dict[str, Any]], session_
         Dict[str, Any]: 包含成功/失败状态和失败原因的字典
     """
     try:
-        # 读取现有的记忆数据
-        mem_file_path = "agent/docs/mem.json"
-        existing_memories = {}
-        
-        try:
-            with open(mem_file_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if content:
-                    existing_memories = json.loads(content)
-        except (FileNotFoundError, json.JSONDecodeError):
-            logger.info("mem.json文件不存在或为空，将创建新的记忆库")
-            existing_memories = {}
-        
         # 构建记忆总结提示词
         system_prompt = """
 你是一个专业的AI助手记忆管理专家。请对这一轮agent工作进行总结，重点关注：
@@ -808,15 +785,16 @@ async def summarize_memory(conversation_messages: List[Dict[str, Any]], session_
         
         # 添加现有记忆作为参考
         existing_mem_text = ""
-        if session_id and session_id in existing_memories:
+        existing_memory = agent_memory.get_session(session_id) if session_id else None
+        if existing_memory:
             existing_mem_text = "\n\n现有会话记忆：\n" + json.dumps(
-                existing_memories[session_id], ensure_ascii=False, indent=2
+                existing_memory["content"], ensure_ascii=False, indent=2
             )
         
         user_prompt = f"请总结以下对话中的agent工作：\n\n{conversation_text}{existing_mem_text}"
         
         # 调用LLM进行总结
-        client = LLM(api=get_config("analysis.default_api", "gemini-2.5"))
+        client = LLM(api=get_config("analysis.default_api", "gemini-2.5"), priority=PRIORITY_BACKGROUND)
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
@@ -838,44 +816,14 @@ async def summarize_memory(conversation_messages: List[Dict[str, Any]], session_
             # 准备保存的记忆数据
             session_key = session_id or f"session_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
             
-            memory_entry = {
-                "timestamp": datetime.datetime.now().isoformat(),
-                "last_updated": datetime.datetime.now().isoformat(),
-                "expires_at": (datetime.datetime.now() + datetime.timedelta(minutes=10)).isoformat(),
-                "summary": memory_result,
-                "conversation_length": len(conversation_messages)
-            }
-            
-            # 更新记忆库
-            existing_memories[session_key] = memory_entry
-            
-            # 清理过期的记忆（超过10分钟）
-            current_time = datetime.datetime.now()
-            expired_sessions = []
-            for key, mem in existing_memories.items():
-                try:
-                    expires_at = datetime.datetime.fromisoformat(mem.get('expires_at', ''))
-                    if current_time > expires_at:
-                        expired_sessions.append(key)
-                except (ValueError, TypeError):
-                    # 如果时间格式有问题，也标记为过期
-                    expired_sessions.append(key)
-            
-            for expired_key in expired_sessions:
-                del existing_memories[expired_key]
-                logger.info(f"已清理过期记忆: {expired_key}")
-            
-            # 保存更新后的记忆库
-            with open(mem_file_path, 'w', encoding='utf-8') as f:
-                json.dump(existing_memories, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"已保存会话记忆到 {mem_file_path}, 会话ID: {session_key}")
+            saved = agent_memory.upsert_session(session_key, memory_result, len(conversation_messages))
+            logger.info(f"已保存会话记忆, 会话ID: {session_key}")
             
             return {
                 "success": True,
                 "session_id": session_key,
                 "memory_summary": memory_result,
-                "expires_at": memory_entry["expires_at"]
+                "expires_at": datetime.datetime.fromtimestamp(saved["expires_at"]).isoformat()
             }
             
         except json.JSONDecodeError as e:
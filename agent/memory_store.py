@@ -0,0 +1,251 @@
+"""
+Agent 长期记忆存储
+
+会话记忆和失败经验原先整体保存在 agent/docs/mem.json、exp.json 中，每次会话都要整份读写。
+现在每条记忆是 agent_memories 表中的一行，写入是单条 INSERT/UPSERT；检索通过 FTS5 全文索引
+按 BM25 相关度只取前 K 条，会话开销不随记忆总量增长。
+
+FTS5 表使用 trigram 分词，中文和英文都可以按子串匹配；SQLite 不支持 FTS5 时退化为按时间取最近的记忆。
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils import db_utils as db
+from utils.config_utils import get_config, project_root
+from utils.logging_utils import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+KIND_SESSION = "session"
+KIND_EXPERIENCE = "experience"
+
+_MEMORY_FIELDS = ["id", "kind", "session_id", "content", "tags", "created_at", "updated_at", "expires_at"]
+
+_FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS agent_memories_fts USING fts5("
+    "search_text, tags, content='agent_memories', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS agent_memories_ai AFTER INSERT ON agent_memories BEGIN "
+    "INSERT INTO agent_memories_fts(rowid, search_text, tags) VALUES (new.id, new.search_text, new.tags); END",
+    "CREATE TRIGGER IF NOT EXISTS agent_memories_ad AFTER DELETE ON agent_memories BEGIN "
+    "INSERT INTO agent_memories_fts(agent_memories_fts, rowid, search_text, tags) "
+    "VALUES ('delete', old.id, old.search_text, old.tags); END",
+    "CREATE TRIGGER IF NOT EXISTS agent_memories_au AFTER UPDATE ON agent_memories BEGIN "
+    "INSERT INTO agent_memories_fts(agent_memories_fts, rowid, search_text, tags) "
+    "VALUES ('delete', old.id, old.search_text, old.tags); "
+    "INSERT INTO agent_memories_fts(rowid, search_text, tags) VALUES (new.id, new.search_text, new.tags); END",
+]
+
+
+def _row_to_memory(row) -> Dict[str, Any]:
+    memory = dict(zip(_MEMORY_FIELDS, row))
+    try:
+        memory["content"] = json.loads(memory["content"])
+    except (TypeError, ValueError):
+        pass
+    return memory
+
+
+def _match_query(text: str, max_terms: int = 32) -> str:
+    """
+    把任意文本转换为 FTS5 查询：取每个词的 3 字符片段，用 OR 连接，由 BM25 决定相关度。
+    """
+    terms: List[str] = []
+    for word in re.findall(r"\w+", text or ""):
+        grams = [word] if len(word) <= 3 else [word[i:i + 3] for i in range(len(word) - 2)]
+        for gram in grams:
+            if len(gram) == 3 and gram not in terms:
+                terms.append(gram)
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms[:max_terms])
+
+
+class AgentMemoryStore:
+    """
+    Agent 记忆仓库，采用单例模式。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AgentMemoryStore, cls).__new__(cls)
+            cls._instance._init_store()
+        return cls._instance
+
+    def _init_store(self):
+        self.session_ttl = get_config("agent.memory_session_ttl", 600)
+        self.max_experiences = get_config("agent.max_experiences", 500)
+        self.top_k = get_config("agent.memory_top_k", 5)
+        self.fts_enabled = False
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _execute(self, statements: Iterable[str]) -> None:
+        conn, conn_index = db.db_pool.get_connection()
+        if not conn:
+            raise sqlite3.OperationalError("无法获取数据库连接")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            if conn_index >= 0:
+                db.db_pool.release_connection(conn_index)
+            else:
+                conn.close()
+
+    def _ensure_ready(self) -> None:
+        """首次使用时创建全文索引、会话唯一索引，并导入旧的 exp.json。"""
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            self._execute([
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_agent_memories_session "
+                "ON agent_memories(kind, session_id)"
+            ])
+            try:
+                fts_existed = bool(db.query_db(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'agent_memories_fts'"
+                ))
+                self._execute(_FTS_SCHEMA)
+                if not fts_existed:
+                    self._execute(["INSERT INTO agent_memories_fts(agent_memories_fts) VALUES ('rebuild')"])
+                self.fts_enabled = True
+            except sqlite3.Error as e:
+                logger.warning(f"SQLite 不支持 FTS5 trigram 分词，记忆检索将按时间排序: {e}")
+            self._import_legacy_experiences()
+            self._ready = True
+
+    def _import_legacy_experiences(self) -> None:
+        """经验库为空时，导入旧版 agent/docs/exp.json 中的经验。"""
+        path = os.path.join(project_root, "agent", "docs", "exp.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read().strip()
+            experiences = json.loads(content) if content else []
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if not experiences or db.query_db(
+            "SELECT 1 FROM agent_memories WHERE kind = ? LIMIT 1", (KIND_EXPERIENCE,)
+        ):
+            return
+        for exp in experiences:
+            self.add_experience(exp)
+        logger.info(f"已从 exp.json 导入 {len(experiences)} 条经验")
+
+    # ---- 写入 ----
+
+    def add_experience(self, experience: Dict[str, Any]) -> bool:
+        """追加一条经验，超过 max_experiences 时删除最旧的经验。"""
+        self._ensure_ready()
+        now = time.time()
+        search_text = " ".join(str(experience.get(key, "")) for key in
+                               ("task_type", "execution_order", "key_points", "function_usage"))
+        result = db.revise_db(
+            "INSERT INTO agent_memories (kind, content, search_text, tags, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (KIND_EXPERIENCE, json.dumps(experience, ensure_ascii=False), search_text,
+             str(experience.get("task_type", "")), now, now),
+        )
+        db.revise_db(
+            "DELETE FROM agent_memories WHERE kind = ? AND id NOT IN ("
+            "SELECT id FROM agent_memories WHERE kind = ? ORDER BY id DESC LIMIT ?)",
+            (KIND_EXPERIENCE, KIND_EXPERIENCE, self.max_experiences),
+        )
+        return result > 0
+
+    def upsert_session(self, session_id: str, summary: Dict[str, Any], conversation_length: int = 0) -> Dict[str, Any]:
+        """保存会话记忆，同一会话只保留一条，并顺便清理过期的会话记忆。"""
+        self._ensure_ready()
+        now = time.time()
+        session_summary = summary.get("session_summary", {}) or {}
+        cached_data = summary.get("cached_data", {}) or {}
+        search_text = " ".join([
+            str(session_summary.get("user_request", "")),
+            " ".join(map(str, session_summary.get("completed_tasks", []) or [])),
+            " ".join(map(str, cached_data.get("important_info", []) or [])),
+            " ".join(map(str, cached_data.get("pending_tasks", []) or [])),
+        ])
+        entry = {"summary": summary, "conversation_length": conversation_length}
+        expires_at = now + self.session_ttl
+        db.revise_db(
+            "INSERT INTO agent_memories (kind, session_id, content, search_text, tags, created_at, updated_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(kind, session_id) DO UPDATE SET content = excluded.content, "
+            "search_text = excluded.search_text, updated_at = excluded.updated_at, expires_at = excluded.expires_at",
+            (KIND_SESSION, session_id, json.dumps(entry, ensure_ascii=False), search_text,
+             KIND_SESSION, now, now, expires_at),
+        )
+        self.purge_expired()
+        return {"session_id": session_id, "expires_at": expires_at}
+
+    def touch_session(self, session_id: str) -> None:
+        """刷新会话记忆的过期时间。"""
+        self._ensure_ready()
+        now = time.time()
+        db.revise_db(
+            "UPDATE agent_memories SET updated_at = ?, expires_at = ? WHERE kind = ? AND session_id = ?",
+            (now, now + self.session_ttl, KIND_SESSION, session_id),
+        )
+
+    def purge_expired(self) -> int:
+        return db.revise_db(
+            "DELETE FROM agent_memories WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+        )
+
+    # ---- 检索 ----
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        self._ensure_ready()
+        rows = db.query_db(
+            f"SELECT {', '.join(_MEMORY_FIELDS)} FROM agent_memories WHERE kind = ? AND session_id = ?",
+            (KIND_SESSION, session_id),
+        )
+        return _row_to_memory(rows[0]) if rows else None
+
+    def search(self, kind: str, query: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        检索与 query 最相关的前 K 条未过期记忆。
+
+        Args:
+            kind: 记忆类型，KIND_SESSION 或 KIND_EXPERIENCE
+            query: 查询文本，通常是用户输入
+            k: 返回条数，默认 agent.memory_top_k
+
+        Returns:
+            List[Dict]: 记忆列表，content 已解析为 JSON；没有匹配时返回最近的记忆
+        """
+        self._ensure_ready()
+        k = k or self.top_k
+        now = time.time()
+        columns = ", ".join(f"m.{field}" for field in _MEMORY_FIELDS)
+        match = _match_query(query) if self.fts_enabled else ""
+        rows = []
+        if match:
+            rows = db.query_db(
+                f"SELECT {columns} FROM agent_memories_fts f JOIN agent_memories m ON m.id = f.rowid "
+                "WHERE agent_memories_fts MATCH ? AND m.kind = ? AND (m.expires_at IS NULL OR m.expires_at > ?) "
+                "ORDER BY bm25(agent_memories_fts) LIMIT ?",
+                (match, kind, now, k),
+            )
+        if not rows:
+            rows = db.query_db(
+                f"SELECT {columns} FROM agent_memories m "
+                "WHERE m.kind = ? AND (m.expires_at IS NULL OR m.expires_at > ?) "
+                "ORDER BY m.updated_at DESC LIMIT ?",
+                (kind, now, k),
+            )
+        return [_row_to_memory(row) for row in rows]
+
+
+# 全局记忆仓库实例
+agent_memory = AgentMemoryStore()
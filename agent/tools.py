@@ -2,9 +2,6 @@ import datetime
 import logging
 from typing import Optional
 
-import ccxt.async_support as ccxt  # 使用异步支持以兼容 Telegram 机器人
-import numpy as np  # 用于数值计算
-import pandas as pd  # 用于数据处理和技术指标计算
 from utils import db_utils as db
 from utils.logging_utils import setup_logging
 
@@ -13,6 +10,8 @@ logger = logging.getLogger(__name__)
 
 """
 用于构建交由LLM调用的工具
+
+ccxt / numpy / pandas 导入较慢，只在对应工具被调用时才在函数内导入。
 """
 
 
@@ -40,6 +39,9 @@ class MarketTools:
         Return Value: A dictionary with 'display' for user and 'llm_feedback' for AI.
         Invocation: {"tool_name": "get_coin_index", "parameters": {"symbol": "BTC/USDT", "timeframe": "1h", "limit": 50, "period_rsi": 14, "period_sma": 20,  "exchange": "binance"}}
         """
+        import ccxt.async_support as ccxt  # 使用异步支持以兼容 Telegram 机器人
+        import numpy as np  # 用于数值计算
+        import pandas as pd  # 用于数据处理和技术指标计算
         try:
             exchange_class = getattr(ccxt, exchange.lower(), None)
             if not exchange_class:
@@ -185,6 +187,7 @@ class MarketTools:
         Return Value: A dictionary with 'display' for user and 'llm_feedback' for AI.
         Invocation: {"tool_name": "get_historical_data", "parameters": {"symbol": "BTC/USDT", "timeframe": "1h", "limit": 100, "exchange": "binance"}}
         """
+        import ccxt.async_support as ccxt
         try:
             exchange_class = getattr(ccxt, exchange.lower(), None)
             if not exchange_class:
@@ -297,6 +300,7 @@ class MarketTools:
         Return Value: A dictionary with 'display' for user and 'llm_feedback' for AI.
         Invocation: {"tool_name": "get_market_depth", "parameters": {"symbol": "BTC/USDT", "depth": 10, "exchange": "binance"}}
         """
+        import ccxt.async_support as ccxt
         try:
             exchange_class = getattr(ccxt, exchange.lower(), None)
             if not exchange_class:
@@ -466,6 +470,7 @@ class MarketTools:
         Return Value: A dictionary with 'display' for user and 'llm_feedback' for AI.
         Invocation: {"tool_name": "get_top_movers", "parameters": {"limit": 5, "exchange": "binance"}}
         """
+        import ccxt.async_support as ccxt
         try:
             exchange_class = getattr(ccxt, exchange.lower(), None)
             if not exchange_class:
@@ -514,6 +519,7 @@ class MarketTools:
         Return Value: A dictionary with 'display' for user and 'llm_feedback' for AI.
         Invocation: {"tool_name": "get_candlestick_data", "parameters": {"symbol": "BTC/USDT", "timeframe": "1h", "limit": 50, "exchange": "binance"}}
         """
+        import ccxt.async_support as ccxt
         try:
             exchange_class = getattr(ccxt, exchange.lower(), None)
             if not exchange_class:
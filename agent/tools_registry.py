@@ -66,7 +66,7 @@ class DatabaseSuperToolRegistry:
             "return_value": "包含受影响行数或错误信息的操作结果。",
         },
         "analyze_group_user_profiles": {
-            "description": "分析指定群组的聊天记录，为最活跃的用户生成用户画像。此工具会调用LLM进行深度分析，可能需要一些时间。分析结果将以JSON字符串的形式返回，其中包含一个用户画像对象的列表。",
+            "description": "分析指定群组的聊天记录，为最活跃的用户生成用户画像。此工具会调用LLM进行深度分析，可能需要一些时间。生成的画像会直接写入 user_profiles 表，无需再调用其他工具写入；结果以JSON字符串的形式返回，其中包含本次更新的用户画像列表。",
             "type": "analysis",
             "parameters": {
                 "group_id": {
@@ -19,8 +19,10 @@ from bot_core.data_repository import (
     conversations, user_config, users, groups
 )
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 from .director_classes import DirectorMenu
 from .inline import Inline
+from .router import CallbackRouter
 from bot_core.services.conversation import PrivateConv
 
 setup_logging()
@@ -1059,12 +1061,18 @@ class CallbackHandler:
 
     def __init__(self, callback_mapping: Dict[str, BaseCallback]):
         """
-        初始化回调处理器。
+        初始化回调处理器，并把回调前缀构建为路由表。
 
         Args:
             callback_mapping (Dict[str, BaseCallback]): 回调前缀到处理函数的映射。
+
+        Raises:
+            ValueError: 回调前缀之间存在冲突
         """
         self.callback_mapping = callback_mapping
+        self.router = CallbackRouter()
+        for prefix, callback in callback_mapping.items():
+            self.router.register(prefix, callback)
 
     async def handle_callback_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """处理回调查询"""
@@ -1077,11 +1085,13 @@ class CallbackHandler:
         user_id = query.from_user.id if query.from_user else 0
 
         try:
-            for prefix, callback in self.callback_mapping.items():
-                if data and data.startswith(prefix):
-                    logger.debug(f"匹配到回调处理器: {prefix}, data: {data}")  # 添加日志
-                    await callback.handle_callback(update, context, data[len(prefix):])
-                    return
+            route = self.router.resolve(data)
+            if route is not None:
+                prefix, callback, args = route
+                logger.debug(f"匹配到回调处理器: {prefix}, data: {data}")  # 添加日志
+                with metrics.timer("handler_seconds", handler=f"callback:{prefix}"):
+                    await callback.handle_callback(update, context, args)
+                return
 
             logger.warning(f"未知的回调数据: {data}, user_id: {user_id}")
             if query.message:
@@ -1108,13 +1118,15 @@ def create_callback_handler(module_names: list[str]) -> CallbackHandler:
             if inspect.isclass(obj) and issubclass(obj, BaseCallback) and obj != BaseCallback:  # 检查是否是BaseCallback的子类
                 try:
                     instance = obj()  # 创建回调类实例
-                    if hasattr(instance, 'meta') and hasattr(instance.meta, 'trigger'):  # 确保有meta和trigger属性
-                        if instance.meta.enabled:  # 确保已激活
-                            callback_mapping[instance.meta.trigger] = instance  # 使用预处理过的handler
-                            logger.debug(f"注册回调处理器: {name}, trigger: {instance.meta.trigger}")  # 添加日志
-                    else:
-                        print(f"Callback {name} 缺少 meta 或 trigger 属性")
                 except Exception as e:
                     logger.debug(f"Error creating CallbackHandler for {name}: {e}")  # 打印创建实例或CommandHandler错误，方便调试
                     continue
+                if hasattr(instance, 'meta') and hasattr(instance.meta, 'trigger'):  # 确保有meta和trigger属性
+                    if instance.meta.enabled:  # 确保已激活
+                        if instance.meta.trigger in callback_mapping:  # 重复的前缀会互相覆盖，启动时直接报错
+                            raise ValueError(f"回调触发前缀重复: {instance.meta.trigger} ({name})")
+                        callback_mapping[instance.meta.trigger] = instance  # 使用预处理过的handler
+                        logger.debug(f"注册回调处理器: {name}, trigger: {instance.meta.trigger}")  # 添加日志
+                else:
+                    print(f"Callback {name} 缺少 meta 或 trigger 属性")
     return CallbackHandler(callback_mapping)
@@ -12,6 +12,7 @@ from utils.config_utils import get_config
 from utils.db_utils import manual_wal_checkpoint, close_all_connections
 from bot_core.command_handlers.base import BaseCommand, CommandMeta
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -355,6 +356,33 @@ class CheckpointCommand(BaseCommand):
             logger.error(f"执行 WAL 检查点时发生意外错误: {e}", exc_info=True)
 
 
+class MetricsCommand(BaseCommand):
+    meta = CommandMeta(
+        name='metrics',
+        command_type='admin',
+        trigger='metrics',
+        menu_text='查看运行指标',
+        show_in_menu=False,
+        menu_weight=55,
+        bot_admin_required=True,
+    )
+
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """
+        处理 /metrics 命令，按总耗时列出最重的处理器、数据库和 LLM 指标。
+        """
+        if not update.message:
+            return
+        lines = metrics.summary(top=20)
+        if not lines:
+            await update.message.reply_text("暂无指标数据。")
+            return
+        text = "\n".join(lines)
+        if len(text) > 4000:
+            text = text[:4000] + "\n..."
+        await update.message.reply_text(text)
+
+
 class RestartCommand(BaseCommand):
     meta = CommandMeta(
         name='restart',
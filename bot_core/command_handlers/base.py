@@ -4,6 +4,7 @@ from typing import Callable
 from telegram.ext import ContextTypes
 
 from bot_core.services.utils.decorators import Decorators
+from utils.metrics import metrics
 
 
 class CommandMeta:
@@ -48,6 +49,7 @@ class BaseCommand(ABC):
         func = Decorators.ensure_user_info_updated(func)
         if self.meta.command_type == 'group':
             func = Decorators.ensure_group_info_updated(func)
+        func = metrics.timed("handler_seconds", handler=f"command:{self.meta.name}")(func)
         return func
 
     @abstractmethod
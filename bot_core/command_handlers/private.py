@@ -16,6 +16,7 @@ from agent.llm_functions import run_agent_session,generate_char
 from bot_core.services.conversation import PrivateConv
 from bot_core.data_repository import ConversationsRepository, UserConfigRepository, UsersRepository, SignRepository
 from utils.logging_utils import setup_logging
+from utils.usage_accumulator import usage_accumulator
 from bot_core.command_handlers.base import BaseCommand, CommandMeta
 from agent.tools_registry import MarketToolRegistry
 
@@ -746,6 +747,8 @@ class SignCommand(BaseCommand):
         if not update.message or not update.message.from_user:
             return
         user_id = update.message.from_user.id
+        # 签到按数据库中的临时额度计算上限，先写入累积的扣减
+        usage_accumulator.flush()
         sign_info_result = SignRepository.user_sign_info_get(user_id)
         sign_info = sign_info_result["data"] if sign_info_result["success"] else {"last_sign": 0, "frequency": 0}
         if sign_info.get("last_sign") == 0:
@@ -1,8 +1,11 @@
 import logging
+import time
+from typing import Dict, List, Optional
 from telegram.ext import ContextTypes
 from utils.logging_utils import setup_logging
 from bot_core.command_handlers.base import BaseCommand, CommandMeta
 from bot_core.services.messages import MessageDeletionService, RealTimePositionService
+from bot_core.services.utils.user_names import user_name_resolver
 from utils.config_utils import get_config
 from telegram import Update
 # 导入新的交易服务模块（增强的订单驱动系统）
@@ -394,9 +397,10 @@ class PositionCommand(BaseCommand):
             # 使用新交易系统获取完整信息
             message = await self._get_enhanced_position_info(user_id, group_id)
 
-            # 发送初始消息
+            # 发送初始消息，结束时间与实时刷新共用同一个时间戳
+            expires_at = time.time() + get_config("trading.realtime_duration", 120)
             initial_message = await update.message.reply_text(
-                RealTimePositionService._build_realtime_message(message, 120),
+                RealTimePositionService._build_realtime_message(message, expires_at),
                 parse_mode='HTML'
             )
 
@@ -407,7 +411,8 @@ class PositionCommand(BaseCommand):
                     context=context,
                     user_id=user_id,
                     group_id=group_id,
-                    initial_message=initial_message
+                    initial_message=initial_message,
+                    expires_at=expires_at
                 )
             )
 
@@ -415,14 +420,25 @@ class PositionCommand(BaseCommand):
             logger.error(f"查看仓位失败: {e}")
             await update.message.reply_text("❌ 获取仓位信息失败，请稍后重试")
     
-    async def _get_enhanced_position_info(self, user_id: int, group_id: int) -> str:
-        """获取增强的仓位信息，包括挂单和止盈止损"""
+    async def _get_enhanced_position_info(self, user_id: int, group_id: int,
+                                          positions: Optional[List[Dict]] = None,
+                                          prices: Optional[Dict[str, Optional[float]]] = None) -> str:
+        """
+        获取增强的仓位信息，包括挂单和止盈止损
+
+        Args:
+            positions: 已读取的持仓，为空时重新读取
+            prices: 共享的价格快照 {symbol: price}，为空时按持仓的交易对各取一次价格
+        """
         try:
             # 获取账户信息
             account = account_service.get_or_create_account(user_id, group_id)
             
             # 获取持仓
-            positions = await position_service.get_positions(user_id, group_id)
+            if positions is None:
+                positions = await position_service.get_positions(user_id, group_id)
+            if prices is None:
+                prices = await price_service.get_multiple_prices(list({pos['symbol'] for pos in positions}))
             
             # 获取所有挂单
             orders_result = order_service.get_orders(user_id, group_id, 'pending')
@@ -439,8 +455,7 @@ class PositionCommand(BaseCommand):
                 for pos in positions:
                     total_position_value += pos['size']
                     # 计算未实现盈亏
-                    from bot_core.services.trading.price_service import price_service
-                    current_price = await price_service.get_current_price(pos['symbol'])
+                    current_price = prices.get(pos['symbol'])
                     if current_price and current_price > 0:
                         if pos['side'] == 'long':
                             unrealized_pnl = (current_price - pos['entry_price']) * (pos['size'] / pos['entry_price'])
@@ -474,8 +489,7 @@ class PositionCommand(BaseCommand):
                 message_parts.append("📈 当前持仓:")
                 for pos in positions:
                     # 计算未实现盈亏
-                    from bot_core.services.trading.price_service import price_service
-                    current_price = await price_service.get_current_price(pos['symbol'])
+                    current_price = prices.get(pos['symbol'])
                     if current_price and current_price > 0:
                         if pos['side'] == 'long':
                             unrealized_pnl = (current_price - pos['entry_price']) * (pos['size'] / pos['entry_price'])
@@ -951,6 +965,13 @@ class RankCommand(BaseCommand):
                 await update.message.reply_text("❌ 获取排行榜数据失败，请稍后重试")
                 return
             
+            # 各榜单的用户去重后一次性并发解析名称
+            ranking_keys = ['profit_ranking', 'loss_ranking', 'balance_ranking', 'liquidation_ranking', 'volume_ranking']
+            user_ids = [row['user_id'] for key in ranking_keys for row in result.get(key) or []]
+            if deadbeat_result.get('success'):
+                user_ids += [row['user_id'] for row in deadbeat_result.get('deadbeat_ranking') or []]
+            names = await user_name_resolver.resolve(context.bot, group_id, user_ids)
+
             # 构建排行榜消息
             message_parts = [title]
             
@@ -963,20 +984,7 @@ class RankCommand(BaseCommand):
                     total_pnl = user_data['total_pnl']
                     group_name = user_data.get('group_name', '') if is_global else ''
                     
-                    try:
-                        # 对于全局排行榜，尝试从任意群组获取用户信息
-                        if is_global:
-                            # 尝试从当前群组获取用户信息，如果失败则使用默认名称
-                            try:
-                                user = await context.bot.get_chat_member(group_id, user_id)
-                                username = user.user.first_name or f"用户{user_id}"
-                            except Exception:
-                                username = f"用户{user_id}"
-                        else:
-                            user = await context.bot.get_chat_member(group_id, user_id)
-                            username = user.user.first_name or f"用户{user_id}"
-                    except Exception:
-                        username = f"用户{user_id}"
+                    username = names[user_id]
                     
                     emoji = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else "💎" if i == 4 else "⭐"
                     pnl_text = f"+{total_pnl:.2f}"
@@ -1001,20 +1009,7 @@ class RankCommand(BaseCommand):
                     total_pnl = user_data['total_pnl']
                     group_name = user_data.get('group_name', '') if is_global else ''
                     
-                    try:
-                        # 对于全局排行榜，尝试从任意群组获取用户信息
-                        if is_global:
-                            # 尝试从当前群组获取用户信息，如果失败则使用默认名称
-                            try:
-                                user = await context.bot.get_chat_member(group_id, user_id)
-                                username = user.user.first_name or f"用户{user_id}"
-                            except Exception:
-                                username = f"用户{user_id}"
-                        else:
-                            user = await context.bot.get_chat_member(group_id, user_id)
-                            username = user.user.first_name or f"用户{user_id}"
-                    except Exception:
-                        username = f"用户{user_id}"
+                    username = names[user_id]
                     
                     emoji = "💀" if i == 1 else "☠️" if i == 2 else "💔" if i == 3 else "😭" if i == 4 else "😢"
                     pnl_text = f"{total_pnl:.2f}"
@@ -1039,19 +1034,7 @@ class RankCommand(BaseCommand):
                     floating_balance = user_data['floating_balance']
                     group_name = user_data.get('group_name', '') if is_global else ''
                     
-                    try:
-                        # 对于全局排行榜，尝试从任意群组获取用户信息
-                        if is_global:
-                            try:
-                                user = await context.bot.get_chat_member(group_id, user_id)
-                                username = user.user.first_name or f"用户{user_id}"
-                            except Exception:
-                                username = f"用户{user_id}"
-                        else:
-                            user = await context.bot.get_chat_member(group_id, user_id)
-                            username = user.user.first_name or f"用户{user_id}"
-                    except Exception:
-                        username = f"用户{user_id}"
+                    username = names[user_id]
                     
                     emoji = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else "🏅"
                     
@@ -1075,19 +1058,7 @@ class RankCommand(BaseCommand):
                     liquidation_count = user_data['liquidation_count']
                     group_name = user_data.get('group_name', '') if is_global else ''
 
-                    try:
-                        # 对于全局排行榜，尝试从任意群组获取用户信息
-                        if is_global:
-                            try:
-                                user = await context.bot.get_chat_member(group_id, user_id)
-                                username = user.user.first_name or f"用户{user_id}"
-                            except Exception:
-                                username = f"用户{user_id}"
-                        else:
-                            user = await context.bot.get_chat_member(group_id, user_id)
-                            username = user.user.first_name or f"用户{user_id}"
-                    except Exception:
-                        username = f"用户{user_id}"
+                    username = names[user_id]
 
                     emoji = "💀" if i == 1 else "☠️" if i == 2 else "💥" if i == 3 else "🔥"
 
@@ -1111,19 +1082,7 @@ class RankCommand(BaseCommand):
                     total_volume = user_data['total_volume']
                     group_name = user_data.get('group_name', '') if is_global else ''
 
-                    try:
-                        # 对于全局排行榜，尝试从任意群组获取用户信息
-                        if is_global:
-                            try:
-                                user = await context.bot.get_chat_member(group_id, user_id)
-                                username = user.user.first_name or f"用户{user_id}"
-                            except Exception:
-                                username = f"用户{user_id}"
-                        else:
-                            user = await context.bot.get_chat_member(group_id, user_id)
-                            username = user.user.first_name or f"用户{user_id}"
-                    except Exception:
-                        username = f"用户{user_id}"
+                    username = names[user_id]
 
                     emoji = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else "🏅"
 
@@ -1150,19 +1109,7 @@ class RankCommand(BaseCommand):
                     overdue_days = deadbeat_data['overdue_days']
                     group_name = deadbeat_data.get('group_name', '') if is_global else ''
                     
-                    try:
-                        # 对于全局排行榜，尝试从任意群组获取用户信息
-                        if is_global:
-                            try:
-                                user = await context.bot.get_chat_member(group_id, user_id)
-                                username = user.user.first_name or f"用户{user_id}"
-                            except Exception:
-                                username = f"用户{user_id}"
-                        else:
-                            user = await context.bot.get_chat_member(group_id, user_id)
-                            username = user.user.first_name or f"用户{user_id}"
-                    except Exception:
-                        username = f"用户{user_id}"
+                    username = names[user_id]
                     
                     emoji = "💀" if i == 1 else "☠️" if i == 2 else "🏴‍☠️" if i == 3 else "💸" if i == 4 else "🔴"
                     
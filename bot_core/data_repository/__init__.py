@@ -11,6 +11,8 @@ from .user_profiles_repository import UserProfilesRepository
 from .conversations_repository import ConversationsRepository
 from .groups_repository import GroupsRepository
 from .sign_repository import SignRepository
+from .summary_jobs_repository import SummaryJobsRepository
+from .scheduled_deletions_repository import ScheduledDeletionsRepository
 
 __all__ = [
     'UsersRepository',
@@ -18,7 +20,9 @@ __all__ = [
     'UserProfilesRepository',
     'ConversationsRepository',
     'GroupsRepository',
-    'SignRepository'
+    'SignRepository',
+    'SummaryJobsRepository',
+    'ScheduledDeletionsRepository'
 ]
 
 # 创建便捷的访问方式
@@ -27,4 +31,6 @@ user_config = UserConfigRepository()
 user_profiles = UserProfilesRepository()
 conversations = ConversationsRepository()
 groups = GroupsRepository()
-sign = SignRepository()
\ No newline at end of file
+sign = SignRepository()
+summary_jobs = SummaryJobsRepository()
+scheduled_deletions = ScheduledDeletionsRepository()
\ No newline at end of file
@@ -2,6 +2,7 @@ import random
 import datetime
 from typing import Optional
 import utils.db_utils as db
+from utils.usage_accumulator import usage_accumulator
 from bot_core.data_repository.conv_model import User, Conversation, DialogMessage
 
 class UserRepository:
@@ -23,22 +24,24 @@ class UserRepository:
         if not db.user_info_check(user_id):
             return None
 
-        # 从不同表中获取数据
-        user_info = db.user_info_get(user_id)
-        user_config = db.user_config_get(user_id)
-        sign_info = db.user_sign_info_get(user_id)
-
-        # 将多个字典合并到一个字典中，以便 pydantic 模型可以一次性解析
-        # 注意：键名需要与 User 模型中的字段名或别名匹配
-        combined_data = {
-            'uid': user_id,
-            **user_info,
-            **user_config,
-            **sign_info
-        }
-        
-        # 使用 pydantic 模型进行数据验证和转换
-        return User.model_validate(combined_data)
+        # 读取额度和叠加未写入的增量之间不能有批量写入提交
+        with usage_accumulator.reading():
+            # 从不同表中获取数据
+            user_info = db.user_info_get(user_id)
+            user_config = db.user_config_get(user_id)
+            sign_info = db.user_sign_info_get(user_id)
+
+            # 将多个字典合并到一个字典中，以便 pydantic 模型可以一次性解析
+            # 注意：键名需要与 User 模型中的字段名或别名匹配
+            combined_data = {
+                'uid': user_id,
+                **user_info,
+                **user_config,
+                **sign_info
+            }
+
+            # 使用 pydantic 模型进行数据验证和转换，并叠加尚未写入数据库的额度扣减
+            return usage_accumulator.apply_pending(User.model_validate(combined_data))
 
     def create_user(self, user_id: int, first_name: str, last_name: str, user_name: str) -> Optional[User]:
         """
@@ -9,11 +9,13 @@ from typing import List, Any, Optional, Tuple
 
 from utils.db_utils import query_db, revise_db, get_config, DEFAULT_API, DEFAULT_CHAR, DEFAULT_PRESET
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
 
+@metrics.instrument_repository
 class GroupsRepository:
     """群组相关表相关的数据库操作"""
 
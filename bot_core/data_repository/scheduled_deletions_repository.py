@@ -0,0 +1,70 @@
+"""
+scheduled_deletions_repository.py - 计划删除消息表(scheduled_deletions)相关的操作
+"""
+
+import logging
+from typing import Iterable, List, Tuple
+
+from utils.db_utils import query_db, revise_db_batch
+from utils.logging_utils import setup_logging
+from utils.metrics import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+@metrics.instrument_repository
+class ScheduledDeletionsRepository:
+    """计划删除消息的数据库操作"""
+
+    @staticmethod
+    def deletion_add_many(items: List[Tuple[int, int, float]]) -> dict:
+        """
+        批量登记计划删除的消息，同一条消息重复登记时以最新的删除时间为准。
+
+        Args:
+            items: (chat_id, message_id, due_at) 列表
+        """
+        try:
+            success = revise_db_batch([(
+                "INSERT INTO scheduled_deletions (chat_id, message_id, due_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id, message_id) DO UPDATE SET due_at = excluded.due_at",
+                items,
+            )])
+            return {"success": success}
+        except Exception as e:
+            logger.error(f"登记计划删除消息失败: {e}")
+            return {"success": False, "error": str(e)}
+
+    @staticmethod
+    def deletion_remove_many(keys: Iterable[Tuple[int, int]]) -> dict:
+        """
+        批量移除已处理的计划删除记录。
+
+        Args:
+            keys: (chat_id, message_id) 列表
+        """
+        try:
+            success = revise_db_batch([(
+                "DELETE FROM scheduled_deletions WHERE chat_id = ? AND message_id = ?",
+                list(keys),
+            )])
+            return {"success": success}
+        except Exception as e:
+            logger.error(f"移除计划删除记录失败: {e}")
+            return {"success": False, "error": str(e)}
+
+    @staticmethod
+    def deletion_load_all() -> dict:
+        """
+        读取所有尚未处理的计划删除记录，用于启动时恢复。
+
+        Returns:
+            dict: {"success": bool, "data": List[Tuple[int, int, float]] (chat_id, message_id, due_at), "error": str}
+        """
+        try:
+            rows = query_db("SELECT chat_id, message_id, due_at FROM scheduled_deletions ORDER BY due_at")
+            return {"success": True, "data": [tuple(row) for row in rows]}
+        except Exception as e:
+            logger.error(f"读取计划删除记录失败: {e}")
+            return {"success": False, "data": [], "error": str(e)}
@@ -8,11 +8,13 @@ from typing import Any
 
 from utils.db_utils import query_db, revise_db, get_config
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
 
+@metrics.instrument_repository
 class SignRepository:
     """用户签到表相关的数据库操作"""
 
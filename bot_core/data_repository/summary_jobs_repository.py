@@ -0,0 +1,169 @@
+"""
+summary_jobs_repository.py - 对话摘要任务队列表(summary_jobs)相关的操作
+"""
+
+import logging
+import time
+from typing import Optional
+
+from utils.db_utils import query_db, revise_db
+from utils.logging_utils import setup_logging
+from utils.metrics import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+_JOB_FIELDS = ["id", "conv_id", "status", "attempts", "next_run_at", "last_error", "created_at", "started_at", "finished_at"]
+
+
+@metrics.instrument_repository
+class SummaryJobsRepository:
+    """对话摘要任务队列的数据库操作"""
+
+    @staticmethod
+    def job_enqueue(conv_id: int) -> dict:
+        """
+        为会话创建摘要任务，会话已有 queued/running 任务时不重复创建。
+
+        Returns:
+            dict: {"success": bool, "data": bool (是否新建了任务), "error": str}
+        """
+        try:
+            now = time.time()
+            command = """
+                INSERT INTO summary_jobs (conv_id, status, attempts, next_run_at, created_at)
+                SELECT ?, 'queued', 0, ?, ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM summary_jobs WHERE conv_id = ? AND status IN ('queued', 'running')
+                )
+            """
+            result = revise_db(command, (conv_id, now, now, conv_id))
+            return {"success": True, "data": result > 0}
+        except Exception as e:
+            logger.error(f"创建摘要任务失败: {e}")
+            return {"success": False, "data": False, "error": str(e)}
+
+    @staticmethod
+    def job_claim_next() -> dict:
+        """
+        领取一个已到期的 queued 任务并标记为 running。
+
+        Returns:
+            dict: {"success": bool, "data": Optional[dict] (任务，没有可执行任务时为 None), "error": str}
+        """
+        try:
+            now = time.time()
+            rows = query_db(
+                f"SELECT {', '.join(_JOB_FIELDS)} FROM summary_jobs "
+                "WHERE status = 'queued' AND next_run_at <= ? ORDER BY next_run_at LIMIT 1",
+                (now,),
+            )
+            if not rows:
+                return {"success": True, "data": None}
+            job = dict(zip(_JOB_FIELDS, rows[0]))
+            claimed = revise_db(
+                "UPDATE summary_jobs SET status = 'running', started_at = ?, attempts = attempts + 1 "
+                "WHERE id = ? AND status = 'queued'",
+                (now, job["id"]),
+            )
+            if not claimed:
+                # 已被其他 worker 领取
+                return {"success": True, "data": None}
+            job.update(status="running", started_at=now, attempts=job["attempts"] + 1)
+            return {"success": True, "data": job}
+        except Exception as e:
+            logger.error(f"领取摘要任务失败: {e}")
+            return {"success": False, "data": None, "error": str(e)}
+
+    @staticmethod
+    def job_finish(job_id: int, status: str, error: Optional[str] = None) -> dict:
+        """把任务标记为 done 或 failed。"""
+        try:
+            result = revise_db(
+                "UPDATE summary_jobs SET status = ?, last_error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+            return {"success": result > 0}
+        except Exception as e:
+            logger.error(f"更新摘要任务状态失败: {e}")
+            return {"success": False, "error": str(e)}
+
+    @staticmethod
+    def job_retry(job_id: int, next_run_at: float, error: str) -> dict:
+        """任务失败后重新排队，在 next_run_at 之后再执行。"""
+        try:
+            result = revise_db(
+                "UPDATE summary_jobs SET status = 'queued', next_run_at = ?, last_error = ? WHERE id = ?",
+                (next_run_at, error, job_id),
+            )
+            return {"success": result > 0}
+        except Exception as e:
+            logger.error(f"重新排队摘要任务失败: {e}")
+            return {"success": False, "error": str(e)}
+
+    @staticmethod
+    def job_requeue_running() -> dict:
+        """
+        把仍处于 running 的任务放回队列：启动时恢复上次中断的任务，停止队列时放回被取消的任务。
+
+        Returns:
+            dict: {"success": bool, "data": int (恢复的任务数), "error": str}
+        """
+        try:
+            result = revise_db(
+                "UPDATE summary_jobs SET status = 'queued', next_run_at = ? WHERE status = 'running'",
+                (time.time(),),
+            )
+            return {"success": True, "data": result}
+        except Exception as e:
+            logger.error(f"恢复摘要任务失败: {e}")
+            return {"success": False, "data": 0, "error": str(e)}
+
+    @staticmethod
+    def job_purge_finished(before: float) -> dict:
+        """
+        删除在 before 之前结束的 done/failed 任务。
+
+        Returns:
+            dict: {"success": bool, "data": int (删除的任务数), "error": str}
+        """
+        try:
+            result = revise_db(
+                "DELETE FROM summary_jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (before,),
+            )
+            return {"success": True, "data": result}
+        except Exception as e:
+            logger.error(f"清理摘要任务失败: {e}")
+            return {"success": False, "data": 0, "error": str(e)}
+
+    @staticmethod
+    def job_stats() -> dict:
+        """
+        获取队列统计：各状态任务数、最早排队任务的等待时长、最近完成任务的平均耗时。
+        """
+        try:
+            now = time.time()
+            counts = {status: count for status, count in query_db(
+                "SELECT status, COUNT(*) FROM summary_jobs GROUP BY status"
+            )}
+            oldest = query_db("SELECT MIN(created_at) FROM summary_jobs WHERE status = 'queued'")
+            latency = query_db(
+                "SELECT AVG(finished_at - created_at) FROM ("
+                "SELECT finished_at, created_at FROM summary_jobs WHERE status = 'done' "
+                "ORDER BY finished_at DESC LIMIT 100)"
+            )
+            return {
+                "success": True,
+                "data": {
+                    "queued": counts.get("queued", 0),
+                    "running": counts.get("running", 0),
+                    "done": counts.get("done", 0),
+                    "failed": counts.get("failed", 0),
+                    "oldest_queued_age": round(now - oldest[0][0], 1) if oldest and oldest[0][0] else 0.0,
+                    "avg_latency": round(latency[0][0], 1) if latency and latency[0][0] else 0.0,
+                },
+            }
+        except Exception as e:
+            logger.error(f"获取摘要任务统计失败: {e}")
+            return {"success": False, "data": {}, "error": str(e)}
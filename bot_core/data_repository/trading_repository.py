@@ -6,11 +6,13 @@ from typing import Any, Dict, List, Optional, Tuple
 
 from utils.db_utils import query_db, revise_db
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
 
+@metrics.instrument_repository
 class TradingRepository:
     """交易相关的数据库操作"""
     
@@ -423,7 +425,10 @@ class TradingRepository:
 
     @staticmethod
     def get_loan_summary(user_id: int, group_id: int) -> dict:
-        """获取用户贷款汇总信息"""
+        """
+        获取用户贷款汇总信息。
+        total_debt 是各笔贷款锚点欠款之和，不含上次结算后产生的利息；当前欠款使用 LoanService.get_loan_summary。
+        """
         try:
             # 获取活跃贷款统计
             active_loans_query = """
@@ -578,6 +583,92 @@ class TradingRepository:
                 "error": str(e)
             }
 
+    @staticmethod
+    def get_group_idle_balance_ranking(group_id: int, limit: int = 10) -> dict:
+        """
+        获取群组内没有持仓的账户余额排名。
+        没有持仓的账户浮动余额等于余额，可直接走 (group_id, balance) 索引取前 N 名。
+        """
+        try:
+            command = """
+                SELECT ta.user_id, ta.balance
+                FROM trading_accounts ta
+                WHERE ta.group_id = ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM trading_positions tp
+                      WHERE tp.user_id = ta.user_id AND tp.group_id = ta.group_id
+                  )
+                ORDER BY ta.balance DESC
+                LIMIT ?
+            """
+            result = query_db(command, (group_id, limit))
+
+            accounts = [{"user_id": row[0], "balance": float(row[1])} for row in result]
+            return {
+                "success": True,
+                "accounts": accounts
+            }
+        except Exception as e:
+            logger.error(f"获取群组空仓账户余额排名失败: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    @staticmethod
+    def get_open_position_accounts(group_id: Optional[int] = None) -> dict:
+        """
+        获取有持仓的账户及其持仓，用于计算浮动余额。
+
+        Args:
+            group_id: 指定群组，None 表示所有群组
+
+        Returns:
+            dict: {"success": bool, "accounts": [{user_id, group_id, group_name, balance, positions: [...]}]}
+        """
+        try:
+            command = """
+                SELECT tp.user_id, tp.group_id, g.group_name, ta.balance,
+                       tp.symbol, tp.side, tp.size, tp.entry_price
+                FROM trading_positions tp
+                JOIN trading_accounts ta ON ta.user_id = tp.user_id AND ta.group_id = tp.group_id
+                LEFT JOIN groups g ON tp.group_id = g.group_id
+            """
+            params = ()
+            if group_id is not None:
+                command += " WHERE tp.group_id = ?"
+                params = (group_id,)
+            result = query_db(command, params)
+
+            accounts = {}
+            for row in result:
+                key = (row[0], row[1])
+                if key not in accounts:
+                    accounts[key] = {
+                        "user_id": row[0],
+                        "group_id": row[1],
+                        "group_name": row[2] or f"群组{row[1]}",
+                        "balance": float(row[3]),
+                        "positions": []
+                    }
+                accounts[key]["positions"].append({
+                    "symbol": row[4],
+                    "side": row[5],
+                    "size": float(row[6]),
+                    "entry_price": float(row[7])
+                })
+
+            return {
+                "success": True,
+                "accounts": list(accounts.values())
+            }
+        except Exception as e:
+            logger.error(f"获取持仓账户失败: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
     @staticmethod
     def get_group_liquidation_ranking(group_id: int, limit: int = 10) -> dict:
         """获取群组爆仓次数排行榜"""
@@ -711,6 +802,46 @@ class TradingRepository:
                 "error": str(e)
             }
 
+    @staticmethod
+    def get_global_idle_balance_ranking(limit: int = 10) -> dict:
+        """
+        获取跨群没有持仓的账户余额排名，每个用户只取余额最高的一个群组。
+        """
+        try:
+            # SQLite 保证 MAX() 聚合时其他裸列取自最大值所在的行
+            command = """
+                SELECT ta.user_id, MAX(ta.balance) AS best_balance, ta.group_id, g.group_name
+                FROM trading_accounts ta
+                LEFT JOIN groups g ON ta.group_id = g.group_id
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM trading_positions tp
+                    WHERE tp.user_id = ta.user_id AND tp.group_id = ta.group_id
+                )
+                GROUP BY ta.user_id
+                ORDER BY best_balance DESC
+                LIMIT ?
+            """
+            result = query_db(command, (limit,))
+
+            accounts = []
+            for row in result:
+                accounts.append({
+                    "user_id": row[0],
+                    "balance": float(row[1]),
+                    "group_id": row[2],
+                    "group_name": row[3] or f"群组{row[2]}"
+                })
+            return {
+                "success": True,
+                "accounts": accounts
+            }
+        except Exception as e:
+            logger.error(f"获取跨群空仓账户余额排名失败: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
     @staticmethod
     def get_global_liquidation_ranking() -> dict:
         """获取跨群爆仓次数排行榜"""
@@ -812,107 +943,52 @@ class TradingRepository:
             }
 
     @staticmethod
-    def get_group_deadbeat_ranking(group_id: int, limit: int = 5) -> dict:
-        """获取群组老赖排行榜 - 按欠款金额/净余额比例排序"""
+    def get_active_loans_with_accounts(group_id: Optional[int] = None) -> dict:
+        """
+        获取所有未还清的贷款及其账户余额，用于老赖排行榜。
+        欠款只是锚点值，当前欠款由调用方按计息时间换算后再排序。
+        """
         try:
             command = """
-                SELECT 
-                    l.user_id,
-                    SUM(l.remaining_debt) as total_debt,
-                    ta.balance,
-                    COALESCE(SUM(l.principal / 1.1), 0) as total_loan_received,
-                    (ta.balance - COALESCE(SUM(l.principal / 1.1), 0)) as net_balance,
-                    CASE 
-                        WHEN (ta.balance - COALESCE(SUM(l.principal / 1.1), 0)) > 0 
-                        THEN SUM(l.remaining_debt) / (ta.balance - COALESCE(SUM(l.principal / 1.1), 0))
-                        ELSE 999999
-                    END as debt_ratio,
-                    MIN(l.loan_time) as earliest_loan_time,
-                    MAX(l.last_interest_time) as latest_interest_time
-                FROM loans l
-                JOIN trading_accounts ta ON l.user_id = ta.user_id AND l.group_id = ta.group_id
-                WHERE l.group_id = ? AND l.status = 'active' AND l.remaining_debt > 0
-                GROUP BY l.user_id, ta.balance
-                ORDER BY debt_ratio DESC
-                LIMIT ?
-            """
-            result = query_db(command, (group_id, limit))
-            
-            ranking = []
-            for row in result:
-                ranking.append({
-                "user_id": row[0],
-                "total_debt": float(row[1]),
-                "balance": float(row[2]),
-                "total_loan_received": float(row[3]),
-                "net_balance": float(row[4]),
-                "debt_ratio": float(row[5]),
-                "earliest_loan_time": row[6],
-                "latest_interest_time": row[7]
-            })
-            
-            return {
-                "success": True,
-                "ranking": ranking
-            }
-        except Exception as e:
-            logger.error(f"获取群组老赖排行榜失败: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
-
-    @staticmethod
-    def get_global_deadbeat_ranking(limit: int = 5) -> dict:
-        """获取跨群老赖排行榜 - 按欠款金额/净余额比例排序"""
-        try:
-            command = """
-                SELECT 
+                SELECT
                     l.user_id,
                     l.group_id,
                     g.group_name,
-                    SUM(l.remaining_debt) as total_debt,
-                    ta.balance,
-                    COALESCE(SUM(l.principal / 1.1), 0) as total_loan_received,
-                    (ta.balance - COALESCE(SUM(l.principal / 1.1), 0)) as net_balance,
-                    CASE 
-                        WHEN (ta.balance - COALESCE(SUM(l.principal / 1.1), 0)) > 0 
-                        THEN SUM(l.remaining_debt) / (ta.balance - COALESCE(SUM(l.principal / 1.1), 0))
-                        ELSE 999999
-                    END as debt_ratio,
-                    MIN(l.loan_time) as earliest_loan_time,
-                    MAX(l.last_interest_time) as latest_interest_time
+                    l.principal,
+                    l.remaining_debt,
+                    l.interest_rate,
+                    l.loan_time,
+                    l.last_interest_time,
+                    ta.balance
                 FROM loans l
                 JOIN trading_accounts ta ON l.user_id = ta.user_id AND l.group_id = ta.group_id
                 LEFT JOIN groups g ON l.group_id = g.group_id
                 WHERE l.status = 'active' AND l.remaining_debt > 0
-                GROUP BY l.user_id, l.group_id, ta.balance
-                ORDER BY debt_ratio DESC
-                LIMIT ?
             """
-            result = query_db(command, (limit,))
-            
-            ranking = []
-            for row in result:
-                ranking.append({
-                    "user_id": row[0],
-                    "group_id": row[1],
-                    "group_name": row[2] or f"群组{row[1]}",
-                    "total_debt": float(row[3]),
-                    "balance": float(row[4]),
-                    "total_loan_received": float(row[5]),
-                    "net_balance": float(row[6]),
-                    "debt_ratio": float(row[7]),
-                    "earliest_loan_time": row[8],
-                    "latest_interest_time": row[9]
-                })
-            
+            params = ()
+            if group_id is not None:
+                command += " AND l.group_id = ?"
+                params = (group_id,)
+            result = query_db(command, params)
+
+            loans = [{
+                "user_id": row[0],
+                "group_id": row[1],
+                "group_name": row[2] or f"群组{row[1]}",
+                "principal": float(row[3]),
+                "remaining_debt": float(row[4]),
+                "interest_rate": float(row[5]),
+                "loan_time": row[6],
+                "last_interest_time": row[7],
+                "balance": float(row[8])
+            } for row in result]
+
             return {
                 "success": True,
-                "ranking": ranking
+                "loans": loans
             }
         except Exception as e:
-            logger.error(f"获取跨群老赖排行榜失败: {e}")
+            logger.error(f"获取活跃贷款账户失败: {e}")
             return {
                 "success": False,
                 "error": str(e)
@@ -9,11 +9,13 @@ from utils.db_utils import (
     query_db, revise_db, DEFAULT_API, DEFAULT_PRESET, DEFAULT_CHAR, DEFAULT_STREAM
 )
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
 
+@metrics.instrument_repository
 class UserConfigRepository:
     """用户配置表相关的数据库操作"""
 
@@ -8,11 +8,13 @@ from typing import List, Optional
 
 from utils.db_utils import query_db, revise_db
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
 
+@metrics.instrument_repository
 class UserProfilesRepository:
     """用户画像表相关的数据库操作"""
 
@@ -10,11 +10,13 @@ from utils.db_utils import (
     query_db, revise_db, DEFAULT_FREQUENCY, DEFAULT_BALANCE
 )
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
 
+@metrics.instrument_repository
 class UsersRepository:
     """用户表相关的数据库操作"""
 
@@ -222,6 +224,39 @@ class UsersRepository:
                 "error": str(e)
             }
 
+    @staticmethod
+    def user_names_get(user_ids: List[int]) -> dict:
+        """
+        批量获取用户的显示名称
+
+        Args:
+            user_ids: 用户ID列表
+
+        Returns:
+            dict: {
+                "success": bool,
+                "data": dict {uid: (first_name, user_name)},
+                "error": str (如果有错误)
+            }
+        """
+        if not user_ids:
+            return {"success": True, "data": {}}
+        try:
+            placeholders = ",".join("?" * len(user_ids))
+            command = f"SELECT uid, first_name, user_name FROM users WHERE uid IN ({placeholders})"
+            result = query_db(command, tuple(user_ids))
+            return {
+                "success": True,
+                "data": {row[0]: (row[1], row[2]) for row in result or []}
+            }
+        except Exception as e:
+            logger.error(f"批量获取用户名称失败: {e}")
+            return {
+                "success": False,
+                "data": {},
+                "error": str(e)
+            }
+
     @staticmethod
     def user_info_usage_get(userid: int, column_name: str) -> dict:
         """
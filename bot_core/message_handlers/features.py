@@ -2,6 +2,7 @@
 import asyncio
 import logging
 import os
+import time
 from typing import TYPE_CHECKING
 
 # Third-party imports
@@ -182,17 +183,21 @@ class ImageAnalyzer:
         filepath = None
         try:
             filepath = await file_utils.download_and_convert_image(self.update, self.context, self.user_id)
+            # 登记到图片分析目录，预览页直接分页查询，不再扫描 data/pics
+            filename = os.path.basename(filepath)
+            created_at = int(time.time())
+            db.media_analysis_add(filename, self.user_id, created_at)
             
-            file_id = self.update.message.photo[-1].file_id if self.update.message.photo else \
-                      (self.update.message.sticker.thumbnail.file_id if self.update.message.sticker and self.update.message.sticker.thumbnail else
-                       (self.update.message.sticker.file_id if self.update.message.sticker else
-                        (self.update.message.animation.thumbnail.file_id if self.update.message.animation and self.update.message.animation.thumbnail else
-                         (self.update.message.animation.file_id if self.update.message.animation else None))))
+            media = self.update.message.photo[-1] if self.update.message.photo else \
+                    (self.update.message.sticker.thumbnail if self.update.message.sticker and self.update.message.sticker.thumbnail else
+                     (self.update.message.sticker if self.update.message.sticker else
+                      (self.update.message.animation.thumbnail if self.update.message.animation and self.update.message.animation.thumbnail else
+                       (self.update.message.animation if self.update.message.animation else None))))
 
-            if not file_id:
+            if not media:
                 raise ValueError("未能识别到图片、贴纸或GIF。")
 
-            image_data = await text_utils.convert_file_id_to_base64(file_id, self.context)
+            image_data = await text_utils.convert_file_id_to_base64(media.file_id, self.context)
             if not image_data:
                 raise ValueError("无法将file_id转换为Base64")
 
@@ -201,6 +206,7 @@ class ImageAnalyzer:
                 mime_type=image_data["mime_type"],
                 hard_mode=False,
                 parse_mode="markdown",
+                image_key=media.file_unique_id,
             )
 
             if not formatted_response:
@@ -212,6 +218,7 @@ class ImageAnalyzer:
             txt_filepath = os.path.join("data/pics", txt_filename)
             with open(txt_filepath, "w", encoding="utf-8") as f:
                 f.write(formatted_response)
+            db.media_analysis_add(filename, self.user_id, created_at, formatted_response)
 
             await self.placeholder_msg.delete()
 
@@ -10,6 +10,7 @@ from bot_core.services.utils.decorators import Decorators
 from bot_core.services.utils.error import BotError
 from bot_core.services.utils.tg_parse import update_info_get, parse_commands_with_and
 from utils import db_utils as db
+from utils.metrics import metrics
 from . import features
 
 logger = logging.getLogger(__name__)
@@ -17,6 +18,7 @@ logger = logging.getLogger(__name__)
 
 from bot_core.command_handlers.regist import CommandHandlers
 
+@metrics.timed("handler_seconds", handler="message:group")
 @Decorators.ensure_group_info_updated
 @Decorators.check_message_expiration
 async def group_msg_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -7,12 +7,14 @@ from bot_core.services.utils.decorators import Decorators
 from bot_core.services.utils.tg_parse import parse_commands_with_and
 from . import features
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 setup_logging()
 logger = logging.getLogger(__name__)
 
 
 from bot_core.command_handlers.regist import CommandHandlers
 
+@metrics.timed("handler_seconds", handler="message:private")
 @Decorators.ensure_user_info_updated
 async def private_msg_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
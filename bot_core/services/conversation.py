@@ -20,8 +20,11 @@ from bot_core.data_repository.conversations_repository import ConversationsRepos
 import bot_core.services.utils.usage as usage
 from bot_core.services.utils.prompt import PromptService
 from bot_core.services.utils.summary import SummaryService
+from bot_core.services.utils.tg_scheduler import send_scheduler
 from utils import text_utils as txt
 from utils.LLM_utils import LLM
+from utils.config_utils import get_config
+from utils.llm_scheduler import PRIORITY_GROUP, LLMQueueTimeout, llm_scheduler
 from utils.text_utils import contains_nsfw
 from utils.logging_utils import setup_logging
 setup_logging()
@@ -132,7 +135,7 @@ class GroupConv:
         
         self.images = self._extract_images()
         try:
-            self.client = LLM(self.config.api, 'group')
+            self.client = LLM(self.config.api, 'group', user_id=self.user.id)
         except ValueError as e:
             if "未找到名为" in str(e) and "的API配置" in str(e):
                 # API配置不存在，向用户发送友好提示
@@ -171,9 +174,13 @@ class GroupConv:
         参数:
         trigger (str): 触发类型，例如 'random' 或 'keyword'。
         副作用:
-        更新 self.trigger、self.prompt 属性。
+        更新 self.trigger、self.prompt 属性；随机/关键词触发不是用户主动请求，
+        以较低优先级排队，并在预计排队过久时放弃回复。
         """
         self.trigger = trigger
+        if trigger in (RANDOM, KEYWORD):
+            self.client.priority = PRIORITY_GROUP
+            self.client.deadline = get_config("api.group_queue_deadline", 20)
 
 
     async def response(self):
@@ -184,6 +191,10 @@ class GroupConv:
         发送占位消息并启动异步任务。
         """
         
+        if llm_scheduler.would_exceed(self.client.api, self.client.priority, self.client.deadline):
+            logger.info(f"群组 {self.group.id} 的 {self.trigger} 触发预计排队过久，跳过回复")
+            return
+
         # 检查机器人是否有发送消息的权限
         
         try:
@@ -271,6 +282,13 @@ class GroupConv:
             # 如果存在会话ID，则保存到长期对话历史中
             if self.id:
                 self.conv_service.save_group_turn(self.group, self.id, self.input, self.output, self.trigger, messages)
+        except LLMQueueTimeout:
+            logger.info(f"群组 {self.group.id} 的 {self.trigger} 触发排队超时，撤回占位消息")
+            if self.placeholder:
+                try:
+                    await self.placeholder.delete()
+                except TelegramError as e:
+                    logger.warning(f"删除占位消息失败: {e}")
         except Exception as e:
             logger.error(f"响应用户时发生异常: {e}", exc_info=True)
             error_text = f"❌ 出错了：{str(e)}"
@@ -356,7 +374,7 @@ class PrivateConv:
             pass
         
         try:
-            self.client = LLM(self.user.api, 'private')
+            self.client = LLM(self.user.api, 'private', user_id=self.user.id)
         except ValueError as e:
             if "未找到名为" in str(e) and "的API配置" in str(e):
                 # API配置不存在，向用户发送友好提示
@@ -453,8 +471,9 @@ class PrivateConv:
             save (bool): 是否保存对话记录到数据库.
         """
         last_update_time = asyncio.get_event_loop().time()
-        last_updated_content = "..."
+        last_updated_length = 0
         response_chunks = []
+        response_length = 0
         factory = MessageFactory(update=self.update, context=self.context)
 
         try:
@@ -466,28 +485,27 @@ class PrivateConv:
             prompt_service = PromptService(user=self.user, conversation=self.conversation, input_text=self.input.text_raw)
             messages = prompt_service.build_private_chat_prompts()
             # --- 重构：使用 ConversationService 获取响应 ---
+            # 流式块只追加到缓冲区，仅在需要更新占位消息时才拼接一次
             async for chunk in self.conv_service.get_llm_response(messages):
                 response_chunks.append(chunk)
-                response = "".join(response_chunks)
+                response_length += len(chunk)
                 current_time = asyncio.get_event_loop().time()
-                # 每 4 秒或内容显著变化时更新消息
-                if current_time - last_update_time >= 4.0 and response != last_updated_content:
+                # 按调度器建议的间隔更新消息，繁忙时自动放缓
+                if (current_time - last_update_time >= send_scheduler.edit_interval()
+                        and response_length != last_updated_length):
                     if self.placeholder:
-                        display_text = response
+                        display_text = "".join(response_chunks)
                         if len(display_text) > 4000:
                             display_text = display_text[:4000] + "..."
-                        
-                        try:
-                            await self.placeholder.edit_text(display_text)
-                        except TelegramError as e:
-                            if "Message is not modified" not in str(e):
-                                logger.warning(f"临时更新消息失败: {e}")
-                    last_updated_content = response
+                        # 提交后立即返回，同一消息排队中的旧编辑会被最新内容覆盖
+                        send_scheduler.schedule_edit(self.placeholder, display_text)
+                    last_updated_length = response_length
                     last_update_time = current_time
-                await asyncio.sleep(0.01)
 
             final_response_text = "".join(response_chunks)
-            logger.debug(f"AI原始回复: {final_response_text}")
+            if self.placeholder:
+                await send_scheduler.discard_edit(self.placeholder)
+            logger.debug("AI原始回复: %s", final_response_text)
             logger.debug(f"AI原始回复长度: {len(final_response_text)}")
 
             if self.placeholder:
@@ -514,6 +532,7 @@ class PrivateConv:
             logger.error(f"响应用户时发生异常: {e}", exc_info=True)
             error_text = f"❌ 出错了：{str(e)}"
             if self.placeholder:
+                await send_scheduler.discard_edit(self.placeholder)
                 await factory.edit(self.placeholder, error_text)
 
 
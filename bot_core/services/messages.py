@@ -1,6 +1,8 @@
 import asyncio
 import logging
-from typing import Optional, AsyncGenerator, Dict, Any, Union
+import datetime
+import time
+from typing import Optional, AsyncGenerator, Dict, Any, List, Tuple, Union
 from enum import Enum
 import html
 import re
@@ -9,8 +11,13 @@ from telegram import Update, Message
 from telegram.error import BadRequest, TelegramError
 from telegram.ext import ContextTypes
 
+from utils.config_utils import get_config
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 from bot_core.services.trading.position_service import position_service
+from bot_core.services.trading.price_service import price_service
+from bot_core.services.utils.deletion_scheduler import deletion_scheduler
+from bot_core.services.utils.tg_scheduler import send_scheduler
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -274,25 +281,43 @@ class MessageFactory:
         photo: Optional[bytes]
     ) -> Message:
         """尝试发送或编辑单个消息部分。"""
+        # 所有请求都经过调度器限速，遇到 429 时自动按 retry_after 重试
+        # 文件对象读取后无法重放，只有 bytes 图片允许重试
+        photo_retries = 0 if hasattr(photo, "read") else None
         try:
             if placeholder:
                 # 如果有图片，不能编辑，只能发送新消息
                 if photo:
                     await placeholder.delete() # 删除占位符
-                    return await self.bot.send_photo(chat_id=chat_id, photo=photo, caption=text_part, parse_mode=parse_mode)
+                    return await send_scheduler.run(
+                        chat_id,
+                        lambda: self.bot.send_photo(chat_id=chat_id, photo=photo, caption=text_part, parse_mode=parse_mode),
+                        max_retries=photo_retries
+                    )
 
                 # 编辑消息并统一处理返回值
-                result = await placeholder.edit_text(text=text_part, parse_mode=parse_mode)
+                result = await send_scheduler.run(
+                    chat_id, lambda: placeholder.edit_text(text=text_part, parse_mode=parse_mode)
+                )
                 return self._normalize_message_result(result, placeholder)
 
             if photo:
-                return await self.bot.send_photo(chat_id=chat_id, photo=photo, caption=text_part, parse_mode=parse_mode)
+                return await send_scheduler.run(
+                    chat_id,
+                    lambda: self.bot.send_photo(chat_id=chat_id, photo=photo, caption=text_part, parse_mode=parse_mode),
+                    max_retries=photo_retries
+                )
 
             # 如果是回复，使用 reply_text
             if self.update and self.update.message:
-                return await self.update.message.reply_text(text=text_part, parse_mode=parse_mode)
+                message = self.update.message
+                return await send_scheduler.run(
+                    chat_id, lambda: message.reply_text(text=text_part, parse_mode=parse_mode)
+                )
             # 否则直接发送
-            return await self.bot.send_message(chat_id=chat_id, text=text_part, parse_mode=parse_mode)
+            return await send_scheduler.run(
+                chat_id, lambda: self.bot.send_message(chat_id=chat_id, text=text_part, parse_mode=parse_mode)
+            )
         except Exception as e:
             logger.error(f"发送消息部分失败: {e}", exc_info=True)
             raise
@@ -547,7 +572,7 @@ async def handle_agent_session(
 
 
 class MessageDeletionService:
-    """消息删除服务，提供统一的自动删除功能"""
+    """消息删除服务，提供统一的自动删除功能，删除由 deletion_scheduler 统一调度"""
 
     @staticmethod
     async def schedule_auto_delete(
@@ -558,7 +583,7 @@ class MessageDeletionService:
         user_message_id: Optional[int] = None
     ) -> None:
         """
-        安排消息自动删除
+        安排消息自动删除，登记后立即返回，计划会持久化，重启后仍会执行
 
         Args:
             context: Telegram context
@@ -568,22 +593,9 @@ class MessageDeletionService:
             user_message_id: 用户指令消息ID（可选，如果提供则也会尝试删除）
         """
         try:
-            await asyncio.sleep(delay_seconds)
-
-            # 删除bot回复消息
-            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-            logger.debug(f"已删除bot回复消息: {message_id}")
-
-            # 如果提供了用户消息ID，尝试删除用户指令消息
-            if user_message_id:
-                try:
-                    await context.bot.delete_message(chat_id=chat_id, message_id=user_message_id)
-                    logger.debug(f"已删除用户指令消息: {user_message_id}")
-                except Exception as user_delete_error:
-                    logger.warning(f"删除用户指令消息失败: {user_delete_error}")
-
+            deletion_scheduler.schedule(context.bot, chat_id, [message_id, user_message_id], delay_seconds)
         except Exception as e:
-            logger.warning(f"自动删除消息失败: {e}")
+            logger.warning(f"安排自动删除消息失败: {e}")
 
     @staticmethod
     async def send_and_schedule_delete(
@@ -618,14 +630,12 @@ class MessageDeletionService:
                 user_message_id = update.message.message_id
 
             # 安排自动删除
-            context.application.create_task(
-                MessageDeletionService.schedule_auto_delete(
-                    context=context,
-                    chat_id=update.effective_chat.id,
-                    message_id=sent_message.message_id,
-                    delay_seconds=delay_seconds,
-                    user_message_id=user_message_id
-                )
+            await MessageDeletionService.schedule_auto_delete(
+                context=context,
+                chat_id=update.effective_chat.id,
+                message_id=sent_message.message_id,
+                delay_seconds=delay_seconds,
+                user_message_id=user_message_id
             )
 
         return sent_message
@@ -669,20 +679,45 @@ class MessageDeletionService:
                 user_message_id = update.message.message_id
 
             # 安排自动删除
-            context.application.create_task(
-                MessageDeletionService.schedule_auto_delete(
-                    context=context,
-                    chat_id=update.effective_chat.id,
-                    message_id=sent_message.message_id,
-                    delay_seconds=delay_seconds,
-                    user_message_id=user_message_id
-                )
+            await MessageDeletionService.schedule_auto_delete(
+                context=context,
+                chat_id=update.effective_chat.id,
+                message_id=sent_message.message_id,
+                delay_seconds=delay_seconds,
+                user_message_id=user_message_id
             )
 
         return sent_message
 
+class _RealtimeView:
+    """一个实时仓位消息。"""
+
+    __slots__ = ("message", "chat_id", "expires_at", "last_text")
+
+    def __init__(self, message: Message, chat_id: int, expires_at: float):
+        self.message = message
+        self.chat_id = chat_id
+        self.expires_at = expires_at
+        self.last_text: Optional[str] = None
+
+
 class RealTimePositionService:
-    """实时仓位更新服务，提供定时更新仓位信息的功"""
+    """
+    实时仓位更新服务，提供定时更新仓位信息的功能
+
+    所有实时仓位消息登记在同一个注册表中，由一个后台任务每 trading.realtime_interval 秒刷新一次：
+    同一 (用户, 群组) 的多条消息共用一次持仓计算，所有持仓共用一次价格快照，
+    渲染结果与上次相同的消息不再编辑；同时存在的实时消息数量不超过 trading.realtime_max_views。
+    """
+
+    # (user_id, group_id) -> 该用户在该群打开的实时消息
+    _views: Dict[Tuple[int, int], List[_RealtimeView]] = {}
+    _runner: Optional[asyncio.Task] = None
+    stats = {"ticks": 0, "renders": 0, "edits": 0, "edits_skipped": 0, "rejected": 0}
+
+    @classmethod
+    def view_count(cls) -> int:
+        return sum(len(views) for views in cls._views.values())
 
     @staticmethod
     async def start_realtime_update(
@@ -690,10 +725,11 @@ class RealTimePositionService:
         context: ContextTypes.DEFAULT_TYPE,
         user_id: int,
         group_id: int,
-        initial_message: Message
+        initial_message: Message,
+        expires_at: float
     ) -> None:
         """
-        启动实时仓位更新
+        启动实时仓位更新，登记到共享的刷新任务后立即返回
 
         Args:
             update: Telegram update对象
@@ -701,95 +737,111 @@ class RealTimePositionService:
             user_id: 用户ID
             group_id: 群组ID
             initial_message: 初始消息对象，用于后续编辑
+            expires_at: 实时更新结束的时间戳，与初始消息中显示的结束时间相同
         """
-        try:
-            # 创建消息工厂
-            factory = MessageFactory(update=update, context=context)
-
-            # 总更新时长120秒，每10秒更新一次
-            total_duration = 120
-            update_interval = 10
-            updates_count = total_duration // update_interval
-
-            # 循环更新消息
-            for i in range(updates_count):
-                try:
-                    # 计算剩余时间
-                    remaining_seconds = total_duration - (i + 1) * update_interval
-
-                    # 获取最新的仓位信息 - 需要导入group模块来使用_get_enhanced_position_info方法
-                    from bot_core.command_handlers.group import PositionCommand
-                    position_cmd = PositionCommand()
-                    position_data = await position_cmd._get_enhanced_position_info(user_id, group_id)
-
-                    # 构建实时更新消息
-                    position_message = RealTimePositionService._build_realtime_message(
-                        position_data,
-                        remaining_seconds
-                    )
-
-                    # 编辑消息
-                    await factory.edit(initial_message, position_message)
+        cls = RealTimePositionService
+        # 无论是否能实时刷新，到期后都删除消息；删除计划会持久化，重启后仍然生效
+        deletion_scheduler.schedule(context.bot, group_id, [initial_message.message_id],
+                                    max(0.0, expires_at - time.time()))
+
+        if cls.view_count() >= get_config("trading.realtime_max_views", 50):
+            cls.stats["rejected"] += 1
+            logger.info(f"实时仓位消息已达上限，用户 {user_id} 的仓位消息不再刷新")
+            try:
+                await send_scheduler.run(group_id, lambda: initial_message.edit_text(
+                    "⏸ 当前查看实时仓位的人数较多，本条消息不会自动刷新\n\n"
+                    + initial_message.text_html.split("\n\n", 1)[-1],
+                    parse_mode="HTML",
+                ))
+            except Exception as e:
+                logger.warning(f"更新仓位消息失败: {e}")
+            return
 
-                    # 如果不是最后一次更新，等待下一次更新
-                    if i < updates_count - 1:
-                        await asyncio.sleep(update_interval)
+        view = _RealtimeView(initial_message, group_id, expires_at)
+        cls._views.setdefault((user_id, group_id), []).append(view)
+        if cls._runner is None or cls._runner.done():
+            cls._runner = asyncio.create_task(cls._run())
 
-                except Exception as update_error:
-                    logger.error(f"更新仓位消息失败: {update_error}")
-                    continue
+    @staticmethod
+    async def _run() -> None:
+        """共享的刷新任务，没有实时消息时退出。"""
+        cls = RealTimePositionService
+        interval = get_config("trading.realtime_interval", 10)
+        while cls._views:
+            await asyncio.sleep(interval)
+            try:
+                await cls._tick()
+            except Exception as e:
+                logger.error(f"实时仓位刷新失败: {e}", exc_info=True)
 
-            # 120秒后删除消息
-            await RealTimePositionService._cleanup_message(
-                context, group_id, initial_message.message_id
+    @staticmethod
+    async def _tick() -> None:
+        cls = RealTimePositionService
+        cls.stats["ticks"] += 1
+        now = time.time()
+
+        # 移除到期的消息，删除由 deletion_scheduler 负责
+        for key in list(cls._views):
+            cls._views[key] = [view for view in cls._views[key] if view.expires_at > now]
+            if not cls._views[key]:
+                del cls._views[key]
+        if not cls._views:
+            return
+
+        # 每个 (用户, 群组) 读取一次持仓，所有持仓共用一次价格快照
+        keys = list(cls._views)
+        positions = await asyncio.gather(*(position_service.get_positions(uid, gid) for uid, gid in keys))
+        symbols = list({pos["symbol"] for user_positions in positions for pos in user_positions})
+        prices = await price_service.get_multiple_prices(symbols)
+
+        from bot_core.command_handlers.trading import PositionCommand
+        position_cmd = PositionCommand()
+        for (user_id, group_id), user_positions in zip(keys, positions):
+            position_data = await position_cmd._get_enhanced_position_info(
+                user_id, group_id, positions=user_positions, prices=prices
             )
-
-        except Exception as e:
-            logger.error(f"实时更新过程失败: {e}")
-            # 发生错误时也清理消息
-            try:
-                await RealTimePositionService._cleanup_message(
-                    context, group_id, initial_message.message_id
-                )
-            except Exception as cleanup_error:
-                logger.error(f"清理消息失败: {cleanup_error}")
+            cls.stats["renders"] += 1
+            for view in cls._views.get((user_id, group_id), []):
+                text = cls._build_realtime_message(position_data, view.expires_at)
+                if text == view.last_text:
+                    cls.stats["edits_skipped"] += 1
+                    continue
+                try:
+                    await send_scheduler.run(
+                        view.chat_id, lambda m=view.message, t=text: m.edit_text(t, parse_mode="HTML")
+                    )
+                    view.last_text = text
+                    cls.stats["edits"] += 1
+                except BadRequest as e:
+                    if "not modified" in str(e).lower():
+                        view.last_text = text
+                    else:
+                        logger.warning(f"更新仓位消息失败: {e}")
+                except Exception as e:
+                    logger.error(f"更新仓位消息失败: {e}")
 
     @staticmethod
-    def _build_realtime_message(position_data: str, remaining_seconds: int) -> str:
+    def _build_realtime_message(position_data: str, expires_at: float) -> str:
         """
         构建实时更新消息
 
         Args:
             position_data: 仓位数据字符串
-            remaining_seconds: 剩余时间（秒）
+            expires_at: 实时更新结束的时间戳
 
         Returns:
             格式化的消息字符串
         """
-        # 添加实时更新状态头
-        status_header = f"🔄 实时更新中... (剩余: {remaining_seconds}秒)\n\n"
+        # 显示结束时间而不是倒计时，仓位没有变化时文本不变，可以跳过编辑
+        end_time = datetime.datetime.fromtimestamp(expires_at).strftime("%H:%M:%S")
+        status_header = f"🔄 实时更新中... ({end_time} 结束)\n\n"
 
         # 返回组合后的消息
         return status_header + position_data
 
-    @staticmethod
-    async def _cleanup_message(
-        context: ContextTypes.DEFAULT_TYPE,
-        chat_id: int,
-        message_id: int
-    ) -> None:
-        """
-        清理（删除）消息
-
-        Args:
-            context: Telegram context对象
-            chat_id: 聊天ID
-            message_id: 要删除的消息ID
-        """
-        try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-            logger.debug(f"已删除实时更新消息: {message_id}")
-        except Exception as e:
-            logger.warning(f"删除实时更新消息失败: {e}")
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        return {**cls.stats, "views": cls.view_count(), "keys": len(cls._views)}
 
 
+metrics.register_collector("realtime_positions", RealTimePositionService.get_stats)
@@ -8,6 +8,7 @@ import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
+from .loan_service import loan_service
 from .price_service import price_service
 from bot_core.data_repository.trading_repository import TradingRepository
 from utils.logging_utils import setup_logging
@@ -179,79 +180,61 @@ class AnalysisService:
             }
 
     async def _get_balance_ranking_with_floating(self, group_id: int, limit: int) -> List[Dict]:
-        """获取包含浮动余额的账户排名（优化版：批量获取价格）"""
+        """
+        获取包含浮动余额的账户排名。
+
+        空仓账户的浮动余额就是余额，直接从 (group_id, balance) 索引取前 N 名；
+        只有持仓账户需要结合最新价格计算浮动盈亏，两者合并后再取前 N 名。
+        """
         try:
-            # 获取账户余额信息
-            balance_result = TradingRepository.get_group_balance_accounts(group_id)
-            if not balance_result["success"]:
+            idle_result = TradingRepository.get_group_idle_balance_ranking(group_id, limit)
+            holders_result = TradingRepository.get_open_position_accounts(group_id)
+            if not idle_result["success"] or not holders_result["success"]:
                 return []
 
-            accounts = balance_result["accounts"]
-            
-            # 收集所有需要的交易对
-            all_symbols = set()
-            user_positions = {}
-            
-            # 第一遍遍历：收集所有仓位信息和交易对
-            for account in accounts:
-                user_id = account["user_id"]
-                
-                positions_result = TradingRepository.get_positions(user_id, group_id)
-                if positions_result["success"] and positions_result["positions"]:
-                    user_positions[user_id] = {
-                        "account": account,
-                        "positions": positions_result["positions"]
-                    }
-                    
-                    # 收集所有交易对
-                    for pos in positions_result["positions"]:
-                        all_symbols.add(pos['symbol'])
-                else:
-                    # 没有仓位的用户也要记录
-                    user_positions[user_id] = {
-                        "account": account,
-                        "positions": []
-                    }
-            
-            # 批量获取所有需要的价格（关键优化点！）
-            logger.info(f"群组 {group_id} 批量获取 {len(all_symbols)} 个交易对的价格")
-            symbol_prices = {}
-            if all_symbols:
-                symbol_prices = await price_service.get_multiple_prices(list(all_symbols))
-                logger.info(f"群组 {group_id} 成功获取 {len([p for p in symbol_prices.values() if p is not None])} 个有效价格")
-
-            # 第二遍遍历：计算浮动余额
-            balance_ranking = []
-            for user_id, data in user_positions.items():
-                account = data["account"]
-                positions = data["positions"]
-                balance = account["balance"]
-                
-                total_unrealized_pnl = 0.0
-                for pos in positions:
-                    symbol = pos['symbol']
-                    current_price = symbol_prices.get(symbol)
-                    if current_price:
-                        pnl = self._calculate_pnl(pos['entry_price'], current_price, pos['size'], pos['side'])
-                        total_unrealized_pnl += pnl
-
-                floating_balance = balance + total_unrealized_pnl
+            balance_ranking = [
+                {
+                    "user_id": account["user_id"],
+                    "balance": account["balance"],
+                    "floating_balance": account["balance"],
+                    "unrealized_pnl": 0.0
+                }
+                for account in idle_result["accounts"]
+            ]
+            for account in await self._with_floating_balance(holders_result["accounts"]):
                 balance_ranking.append({
-                    "user_id": user_id,
-                    "balance": balance,
-                    "floating_balance": floating_balance,
-                    "unrealized_pnl": total_unrealized_pnl
+                    "user_id": account["user_id"],
+                    "balance": account["balance"],
+                    "floating_balance": account["floating_balance"],
+                    "unrealized_pnl": account["unrealized_pnl"]
                 })
 
             # 按浮动余额排序
             balance_ranking.sort(key=lambda x: x["floating_balance"], reverse=True)
-            logger.info(f"群组 {group_id} 浮动余额排名计算完成，共 {len(balance_ranking)} 个用户")
+            logger.info(f"群组 {group_id} 浮动余额排名计算完成，持仓账户 {len(holders_result['accounts'])} 个")
             return balance_ranking[:limit]
 
         except Exception as e:
             logger.error(f"计算浮动余额排名失败: {e}")
             return []
 
+    async def _with_floating_balance(self, accounts: List[Dict]) -> List[Dict]:
+        """为持仓账户计算未实现盈亏和浮动余额，价格走 price_service 的共享缓存。"""
+        all_symbols = {pos["symbol"] for account in accounts for pos in account["positions"]}
+        symbol_prices = {}
+        if all_symbols:
+            symbol_prices = await price_service.get_multiple_prices(list(all_symbols))
+
+        for account in accounts:
+            total_unrealized_pnl = 0.0
+            for pos in account["positions"]:
+                current_price = symbol_prices.get(pos["symbol"])
+                if current_price:
+                    total_unrealized_pnl += self._calculate_pnl(pos["entry_price"], current_price, pos["size"], pos["side"])
+            account["unrealized_pnl"] = total_unrealized_pnl
+            account["floating_balance"] = account["balance"] + total_unrealized_pnl
+        return accounts
+
     async def get_global_ranking_data(self) -> Dict:
         """获取跨群排行榜数据"""
         try:
@@ -292,83 +275,33 @@ class AnalysisService:
             }
 
     async def _get_global_balance_ranking_with_floating(self, limit: int) -> List[Dict]:
-        """获取跨群包含浮动余额的账户排名（优化版：批量获取价格）"""
+        """获取跨群包含浮动余额的账户排名，每个用户取其最好成绩（只对持仓账户计算浮动盈亏）"""
         try:
-            # 获取跨群账户余额信息
-            balance_result = TradingRepository.get_global_balance_accounts()
-            if not balance_result["success"]:
+            idle_result = TradingRepository.get_global_idle_balance_ranking(limit)
+            holders_result = TradingRepository.get_open_position_accounts()
+            if not idle_result["success"] or not holders_result["success"]:
                 return []
 
-            accounts = balance_result["accounts"]
-            
-            # 收集所有需要的交易对
-            all_symbols = set()
-            user_positions = {}
-            
-            # 第一遍遍历：收集所有仓位信息和交易对
-            for account in accounts:
-                user_id = account["user_id"]
-                group_id = account["group_id"]
-                
-                positions_result = TradingRepository.get_positions(user_id, group_id)
-                if positions_result["success"] and positions_result["positions"]:
-                    key = f"{user_id}_{group_id}"
-                    user_positions[key] = {
-                        "account": account,
-                        "positions": positions_result["positions"]
-                    }
-                    
-                    # 收集所有交易对
-                    for pos in positions_result["positions"]:
-                        all_symbols.add(pos['symbol'])
-                else:
-                    # 没有仓位的用户也要记录
-                    key = f"{user_id}_{group_id}"
-                    user_positions[key] = {
-                        "account": account,
-                        "positions": []
-                    }
-            
-            # 批量获取所有需要的价格（关键优化点！）
-            logger.info(f"批量获取 {len(all_symbols)} 个交易对的价格")
-            symbol_prices = {}
-            if all_symbols:
-                symbol_prices = await price_service.get_multiple_prices(list(all_symbols))
-                logger.info(f"成功获取 {len([p for p in symbol_prices.values() if p is not None])} 个有效价格")
-
-            # 第二遍遍历：计算浮动余额
+            candidates = [dict(account, floating_balance=account["balance"]) for account in idle_result["accounts"]]
+            candidates += await self._with_floating_balance(holders_result["accounts"])
+
+            # 保存每个用户的最好成绩
             user_best_balance = {}
-            for key, data in user_positions.items():
-                account = data["account"]
-                positions = data["positions"]
+            for account in candidates:
                 user_id = account["user_id"]
-                group_id = account["group_id"]
-                balance = account["balance"]
-                
-                total_unrealized_pnl = 0.0
-                for pos in positions:
-                    symbol = pos['symbol']
-                    current_price = symbol_prices.get(symbol)
-                    if current_price:
-                        pnl = self._calculate_pnl(pos['entry_price'], current_price, pos['size'], pos['side'])
-                        total_unrealized_pnl += pnl
-
-                floating_balance = balance + total_unrealized_pnl
-
-                # 保存该用户的最好成绩
-                if user_id not in user_best_balance or floating_balance > user_best_balance[user_id]["floating_balance"]:
+                if user_id not in user_best_balance or account["floating_balance"] > user_best_balance[user_id]["floating_balance"]:
                     user_best_balance[user_id] = {
                         "user_id": user_id,
-                        "balance": balance,
-                        "floating_balance": floating_balance,
-                        "group_id": group_id,
+                        "balance": account["balance"],
+                        "floating_balance": account["floating_balance"],
+                        "group_id": account["group_id"],
                         "group_name": account["group_name"]
                     }
 
             # 转换为列表并排序
             balance_ranking = list(user_best_balance.values())
             balance_ranking.sort(key=lambda x: x["floating_balance"], reverse=True)
-            logger.info(f"全局浮动余额排名计算完成，共 {len(balance_ranking)} 个用户")
+            logger.info(f"全局浮动余额排名计算完成，持仓账户 {len(holders_result['accounts'])} 个")
             return balance_ranking[:limit]
 
         except Exception as e:
@@ -379,12 +312,12 @@ class AnalysisService:
         """获取集团赖排行榜数据"""
         try:
             # 获取集团赖排行榜数据
-            result = TradingRepository.get_group_deadbeat_ranking(group_id, 10)
+            result = TradingRepository.get_active_loans_with_accounts(group_id)
 
             if result['success']:
                 # 为每个赖计算逾期天数
                 deadbeat_ranking = []
-                for deadbeat in result['ranking']:
+                for deadbeat in self._build_deadbeat_ranking(result['loans'], 10, by_group=False):
                     overdue_days = self._calculate_overdue_days(deadbeat['earliest_loan_time'])
                     deadbeat_ranking.append({
                         **deadbeat,
@@ -412,12 +345,12 @@ class AnalysisService:
         """获取跨群集团赖排行榜数据"""
         try:
             # 获取跨群集团赖排行榜数据
-            result = TradingRepository.get_global_deadbeat_ranking(10)
+            result = TradingRepository.get_active_loans_with_accounts()
 
             if result['success']:
                 # 为每个赖计算逾期天数
                 deadbeat_ranking = []
-                for deadbeat in result['ranking']:
+                for deadbeat in self._build_deadbeat_ranking(result['loans'], 10, by_group=True):
                     overdue_days = self._calculate_overdue_days(deadbeat['earliest_loan_time'])
                     deadbeat_ranking.append({
                         **deadbeat,
@@ -441,6 +374,42 @@ class AnalysisService:
                 "error": str(e)
             }
 
+    def _build_deadbeat_ranking(self, loans: List[Dict], limit: int, by_group: bool) -> List[Dict]:
+        """
+        按当前欠款/净余额比例生成老赖排行榜。
+
+        所有贷款用同一时刻一次性换算当前欠款，再按用户（跨群时按用户+群组）汇总排序。
+        """
+        debts = loan_service.current_debts(loans)
+
+        accounts: Dict[tuple, Dict] = {}
+        for loan, debt in zip(loans, debts):
+            key = (loan['user_id'], loan['group_id']) if by_group else (loan['user_id'],)
+            account = accounts.get(key)
+            if account is None:
+                account = accounts[key] = {
+                    "user_id": loan['user_id'],
+                    "total_debt": 0.0,
+                    "balance": loan['balance'],
+                    "total_loan_received": 0.0,
+                    "earliest_loan_time": loan['loan_time'],
+                    "latest_interest_time": loan['last_interest_time']
+                }
+                if by_group:
+                    account["group_id"] = loan['group_id']
+                    account["group_name"] = loan['group_name']
+            account["total_debt"] += debt
+            account["total_loan_received"] += loan['principal'] / 1.1
+            account["earliest_loan_time"] = min(account["earliest_loan_time"], loan['loan_time'])
+            account["latest_interest_time"] = max(account["latest_interest_time"], loan['last_interest_time'])
+
+        for account in accounts.values():
+            net_balance = account["balance"] - account["total_loan_received"]
+            account["net_balance"] = net_balance
+            account["debt_ratio"] = account["total_debt"] / net_balance if net_balance > 0 else 999999
+
+        return sorted(accounts.values(), key=lambda a: a["debt_ratio"], reverse=True)[:limit]
+
     def _calculate_pnl(self, entry_price: float, current_price: float, size: float, side: str) -> float:
         """计算盈亏"""
         if side == 'long':
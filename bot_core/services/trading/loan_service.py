@@ -4,8 +4,8 @@
 """
 
 import logging
-from datetime import datetime
-from typing import Dict, Optional
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
 
 from .account_service import account_service
 from bot_core.data_repository.trading_repository import TradingRepository
@@ -19,6 +19,10 @@ class LoanService:
     """
     贷款管理服务
     处理贷款的完整生命周期：申请、利息计算、还款
+
+    利息采用惰性计算：数据库中的 remaining_debt 和 last_interest_time 只是一个锚点，
+    当前欠款 = 锚点欠款 * (1 + r)^(锚点之后经过的完整周期数)，读取时按闭式公式计算，
+    只有还款或显式结算时才写回数据库，不再需要后台定期扫描所有贷款。
     """
 
     def __init__(self):
@@ -53,17 +57,14 @@ class LoanService:
             current_total_debt = 0.0
             total_loan_principal = 0.0
 
-            # 更新并计算所有活跃贷款的利息
+            # 计算所有活跃贷款的当前欠款（只读，不写回数据库）
             for loan in loans_result["loans"]:
                 try:
                     updated_debt = self._calculate_compound_interest(
                         loan["remaining_debt"],
                         loan["last_interest_time"],
-                        self.interest_rate_per_period
+                        loan["interest_rate"]
                     )
-
-                    # 更新数据库中的欠款
-                    TradingRepository.update_loan_debt(loan["id"], updated_debt)
                     current_total_debt += updated_debt
                     total_loan_principal += loan["principal"]
 
@@ -162,20 +163,17 @@ class LoanService:
             if not loans_result["loans"]:
                 return {"success": False, "message": "没有待还贷款"}
 
-            # 更新所有贷款的利息并计算总欠款
+            # 计算所有贷款的当前欠款，结算推迟到实际还款时
             total_debt = 0.0
             updated_loans = []
+            now = datetime.now()
 
             for loan in loans_result["loans"]:
-                updated_debt = self._calculate_compound_interest(
-                    loan["remaining_debt"],
-                    loan["last_interest_time"],
-                    loan["interest_rate"]
+                updated_debt, anchor_time = self._accrue(
+                    loan["remaining_debt"], loan["last_interest_time"], loan["interest_rate"], now
                 )
-
-                # 更新数据库
-                TradingRepository.update_loan_debt(loan["id"], updated_debt)
                 loan["remaining_debt"] = updated_debt
+                loan["settled_anchor"] = anchor_time
                 updated_loans.append(loan)
                 total_debt += updated_debt
 
@@ -208,6 +206,9 @@ class LoanService:
                 loan_debt = loan["remaining_debt"]
                 actual_repayment = min(remaining_amount, loan_debt)
 
+                # 先把累计的利息结算进数据库，再在结算后的欠款上扣减还款
+                TradingRepository.update_loan_debt(loan["id"], loan_debt, loan["settled_anchor"])
+
                 # 记录还款
                 repay_result = TradingRepository.repay_loan(
                     loan["id"], user_id, group_id, actual_repayment
@@ -319,6 +320,30 @@ class LoanService:
             logger.error(f"救济金发放失败: {e}")
             return {'success': False, 'message': '救济金发放失败'}
 
+    def get_loan_summary(self, user_id: int, group_id: int) -> Dict:
+        """
+        获取用户贷款汇总，total_debt 为各笔活跃贷款按闭式公式计算的当前欠款之和
+        （数据库中的 remaining_debt 只是上次结算时的锚点）。
+
+        Args:
+            user_id: 用户ID
+            group_id: 群组ID
+
+        Returns:
+            {"success": bool, "summary": 汇总信息, "loans": 活跃贷款列表, "debts": 与 loans 对应的当前欠款}
+        """
+        summary_result = TradingRepository.get_loan_summary(user_id, group_id)
+        if not summary_result["success"]:
+            return summary_result
+        loans_result = TradingRepository.get_active_loans(user_id, group_id)
+        if not loans_result["success"]:
+            return loans_result
+
+        loans = loans_result["loans"]
+        debts = self.current_debts(loans)
+        summary = {**summary_result["summary"], "total_debt": sum(debts)}
+        return {"success": True, "summary": summary, "loans": loans, "debts": debts}
+
     def get_loan_bill(self, user_id: int, group_id: int) -> Dict:
         """
         获取用户贷款账单
@@ -331,34 +356,16 @@ class LoanService:
             贷款账单信息
         """
         try:
-            # 获取贷款汇总
-            summary_result = TradingRepository.get_loan_summary(user_id, group_id)
+            # 获取贷款汇总和活跃贷款，当前欠款已按计息时间换算
+            summary_result = self.get_loan_summary(user_id, group_id)
             if not summary_result["success"]:
                 return {"success": False, "message": "获取贷款信息失败"}
 
             summary = summary_result["summary"]
-
-            # 获取活跃贷款详情并更新利息
-            loans_result = TradingRepository.get_active_loans(user_id, group_id)
-            if not loans_result["success"]:
-                return {"success": False, "message": "获取贷款详情失败"}
-
-            current_total_debt = 0.0
+            current_total_debt = summary["total_debt"]
             loan_details = []
 
-            for loan in loans_result["loans"]:
-                # 计算最新利息
-                updated_debt = self._calculate_compound_interest(
-                    loan["remaining_debt"],
-                    loan["last_interest_time"],
-                    loan["interest_rate"]
-                )
-
-                # 更新数据库
-                TradingRepository.update_loan_debt(loan["id"], updated_debt)
-
-                current_total_debt += updated_debt
-
+            for loan, updated_debt in zip(summary_result["loans"], summary_result["debts"]):
                 # 计算贷款天数
                 try:
                     from datetime import datetime
@@ -426,6 +433,34 @@ class LoanService:
                 "message": f"获取贷款账单失败: {str(e)}"
             }
 
+    def _accrue(self, anchor_debt: float, anchor_time: str, rate: Optional[float] = None,
+                now: Optional[datetime] = None) -> Tuple[float, str]:
+        """
+        按闭式公式计算当前欠款。
+
+        Args:
+            anchor_debt: 锚点欠款（上次结算后的欠款）
+            anchor_time: 锚点时间（上次结算时间）
+            rate: 每周期利率，默认使用服务配置
+            now: 计算时刻，默认当前时间
+
+        Returns:
+            (当前欠款, 结算后应写回的锚点时间)。锚点只前移完整周期，不足一个周期的时间保留到下次。
+        """
+        if rate is None:
+            rate = self.interest_rate_per_period
+        if now is None:
+            now = datetime.now()
+
+        last_time = datetime.fromisoformat(anchor_time.replace('Z', '+00:00'))
+        period = timedelta(hours=self.period_hours)
+        periods = int((now - last_time) / period) if now > last_time else 0
+        if periods < 1:
+            return anchor_debt, anchor_time  # 不足一个周期，不计息
+
+        # 复利计算: A = P(1 + r)^n
+        return anchor_debt * ((1 + rate) ** periods), (last_time + periods * period).isoformat()
+
     def _calculate_compound_interest(self, principal: float, last_interest_time: str,
                                    rate: float = None) -> float:
         """
@@ -440,36 +475,15 @@ class LoanService:
             计算后的本金+利息
         """
         try:
-            if rate is None:
-                rate = self.interest_rate_per_period
-
-            last_time = datetime.fromisoformat(last_interest_time.replace('Z', '+00:00'))
-            current_time = datetime.now()
-
-            # 计算经过的6小时周期数
-            time_diff = current_time - last_time
-            periods = time_diff.total_seconds() / (self.period_hours * 3600)
-
-            if periods < 1:
-                return principal  # 不足一个周期，不计息
-
-            # 复利计算: A = P(1 + r)^n
-            compound_amount = principal * ((1 + rate) ** int(periods))
-
-            # 记录利息变化（大于0.0001时）
-            interest_change = compound_amount - principal
-            if abs(interest_change) > 0.0001:
-                logger.debug(".10f")
-
-            return compound_amount
-
+            return self._accrue(principal, last_interest_time, rate)[0]
         except Exception as e:
             logger.error(f"计算复利失败: {e}")
             return principal  # 返回原始金额避免错误
 
     def update_loan_interests(self, user_id: int, group_id: int) -> Dict:
         """
-        更新用户所有贷款的利息
+        显式结算用户所有贷款的利息，把当前欠款写回数据库。
+        日常读取不需要调用，供管理操作或数据导出前使用。
 
         Args:
             user_id: 用户ID
@@ -481,6 +495,7 @@ class LoanService:
         try:
             updated_count = 0
             total_interest = 0.0
+            now = datetime.now()
 
             # 获取活跃贷款
             loans_result = TradingRepository.get_active_loans(user_id, group_id)
@@ -489,18 +504,18 @@ class LoanService:
 
             for loan in loans_result["loans"]:
                 original_debt = loan["remaining_debt"]
-                updated_debt = self._calculate_compound_interest(
-                    original_debt, loan["last_interest_time"], loan["interest_rate"]
+                updated_debt, anchor_time = self._accrue(
+                    original_debt, loan["last_interest_time"], loan["interest_rate"], now
                 )
 
-                if updated_debt != original_debt:
+                if anchor_time != loan["last_interest_time"]:
                     # 更新数据库
-                    TradingRepository.update_loan_debt(loan["id"], updated_debt)
+                    TradingRepository.update_loan_debt(loan["id"], updated_debt, anchor_time)
                     total_interest += (updated_debt - original_debt)
                     updated_count += 1
 
             if updated_count > 0:
-                logger.info(f"更新贷款利息成功 - 用户{user_id}: {updated_count}笔贷款，累计利息{total_interest:.4f}")
+                logger.info(f"结算贷款利息成功 - 用户{user_id}: {updated_count}笔贷款，累计利息{total_interest:.4f}")
 
             return {
                 "success": True,
@@ -509,12 +524,34 @@ class LoanService:
             }
 
         except Exception as e:
-            logger.error(f"批量更新贷款利息失败: {e}")
+            logger.error(f"结算贷款利息失败: {e}")
             return {
                 "success": False,
                 "message": f"更新失败: {str(e)}"
             }
 
+    def current_debts(self, loans: list, now: Optional[datetime] = None) -> list:
+        """
+        批量计算一组贷款的当前欠款，用于排行榜等一次读取大量贷款的场景。
+
+        Args:
+            loans: 含 remaining_debt / last_interest_time / interest_rate 的贷款字典列表
+            now: 计算时刻，所有贷款使用同一时刻
+
+        Returns:
+            与 loans 顺序一致的当前欠款列表
+        """
+        if now is None:
+            now = datetime.now()
+        debts = []
+        for loan in loans:
+            try:
+                debts.append(self._accrue(loan["remaining_debt"], loan["last_interest_time"], loan["interest_rate"], now)[0])
+            except Exception as e:
+                logger.error(f"计算复利失败: {e}")
+                debts.append(loan["remaining_debt"])
+        return debts
+
 
 # 全局贷款服务实例
 loan_service = LoanService()
\ No newline at end of file
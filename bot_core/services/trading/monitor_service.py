@@ -34,7 +34,6 @@ class MonitorService:
         self.monitor_task = None
         self.price_check_interval = 10  # 价格检查间隔(秒)
         self.liquidation_check_interval = 30  # 强平检查间隔(秒)
-        self.interest_update_interval = 21600  # 利息更新间隔(6小时)
 
         # 回调函数
         self.on_liquidation_callback: Optional[Callable] = None
@@ -42,7 +41,6 @@ class MonitorService:
         # 定时器计数器
         self.price_counter = 0
         self.liquidation_counter = 0
-        self.interest_counter = 0
 
         logger.info("监控服务已初始化")
 
@@ -77,7 +75,6 @@ class MonitorService:
                     # 更新计数器
                     self.price_counter += 1
                     self.liquidation_counter += 1
-                    self.interest_counter += 1
 
                     # 每10秒检查订单触发条件和止盈止损
                     if self.price_counter >= 1:
@@ -90,10 +87,7 @@ class MonitorService:
                         self.liquidation_counter = 0
                         await self._check_liquidations()
 
-                    # 每6小时更新一次利息
-                    if self.interest_counter >= 2160:  # 6小时 * 3600秒 / 10秒
-                        self.interest_counter = 0
-                        await self._update_loan_interests()
+                    # 贷款利息在读取时按闭式公式计算，不再需要定期扫描
 
                     # 等待10秒
                     await asyncio.sleep(10)
@@ -404,46 +398,6 @@ class MonitorService:
         except Exception as e:
             logger.error(f"执行强平清算失败 {user_id}: {e}")
 
-    async def _update_loan_interests(self):
-        """批量更新所有用户的贷款利息"""
-        try:
-            logger.info("开始批量更新贷款利息")
-
-            # 获取所有活跃贷款
-            command = """
-                SELECT DISTINCT user_id, group_id
-                FROM loans
-                WHERE status = 'active'
-            """
-            from utils.db_utils import query_db
-            result = query_db(command)
-
-            updated_count = 0
-            for row in result:
-                user_id = row[0]
-                group_id = row[1]
-
-                try:
-                    # 导入loan_service并更新利息
-                    from .loan_service import loan_service
-                    loan_result = loan_service.update_loan_interests(user_id, group_id)
-                    
-                    if loan_result.get("success", False):
-                        updated_count += 1
-                        logger.debug(f"用户 {user_id} 贷款利息更新成功")
-                    else:
-                        logger.warning(f"用户 {user_id} 贷款利息更新失败: {loan_result.get('message', '未知错误')}")
-
-                except Exception as e:
-                    logger.error(f"更新用户 {user_id} 贷款利息失败: {e}")
-                    continue
-
-            if updated_count > 0:
-                logger.info(f"完成贷款利息更新: {updated_count} 个用户")
-
-        except Exception as e:
-            logger.error(f"批量更新贷款利息失败: {e}")
-
     def set_liquidation_callback(self, callback: Callable):
         """设置强平回调函数"""
         self.on_liquidation_callback = callback
@@ -641,15 +595,13 @@ class MonitorService:
                 "is_running": self.is_running,
                 "check_intervals": {
                     "price_check": f"{self.price_check_interval}s",
-                    "liquidation_check": f"{self.liquidation_check_interval}s",
-                    "interest_update": f"{self.interest_update_interval}s"
+                    "liquidation_check": f"{self.liquidation_check_interval}s"
                 },
                 "pending_orders_count": pending_orders_count,
                 "active_positions_count": positions_count,
                 "performance_counters": {
                     "price_checks": self.price_counter,
-                    "liquidation_checks": self.liquidation_counter,
-                    "interest_updates": self.interest_counter
+                    "liquidation_checks": self.liquidation_counter
                 }
             }
 
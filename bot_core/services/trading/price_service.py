@@ -4,13 +4,13 @@
 """
 
 import asyncio
-import ccxt
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 
 from bot_core.data_repository.trading_repository import TradingRepository
 from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -28,11 +28,8 @@ class PriceService:
     """
 
     def __init__(self):
-        # 初始化交易所连接(使用Bybit作为价格源)
-        self.exchange = ccxt.bybit({
-            'sandbox': False,  # 使用实盘数据但不实际交易
-            'enableRateLimit': True,
-        })
+        # 交易所连接(使用Bybit作为价格源)在第一次取价时创建，避免启动时导入 ccxt
+        self._exchange = None
 
         # 价格缓存相关
         self.price_cache = {}  # 本地价格缓存 {symbol: price}
@@ -41,6 +38,17 @@ class PriceService:
 
         logger.info("价格服务已初始化")
 
+    @property
+    def exchange(self):
+        """交易所连接，首次访问时导入 ccxt 并创建。"""
+        if self._exchange is None:
+            import ccxt
+            self._exchange = ccxt.bybit({
+                'sandbox': False,  # 使用实盘数据但不实际交易
+                'enableRateLimit': True,
+            })
+        return self._exchange
+
     async def get_current_price(self, symbol: str) -> Optional[float]:
         """
         获取实时价格，支持缓存机制
@@ -61,12 +69,12 @@ class PriceService:
             if (symbol in self.price_cache and
                 symbol in self.last_update and
                 (now - self.last_update[symbol]).seconds < self.cache_expiry):
+                metrics.inc("price_cache_total", result="hit")
                 return self.price_cache[symbol]
+            metrics.inc("price_cache_total", result="miss")
 
             # 从交易所获取最新价格
-            ticker = await asyncio.get_event_loop().run_in_executor(
-                None, self.exchange.fetch_ticker, symbol
-            )
+            ticker = await self._fetch_ticker(symbol)
 
             price_val = ticker.get('last')
             if price_val is None:
@@ -109,9 +117,7 @@ class PriceService:
             logger.debug(f"强制获取实时价格: {symbol}")
 
             # 直接从交易所获取最新价格，不使用缓存
-            ticker = await asyncio.get_event_loop().run_in_executor(
-                None, self.exchange.fetch_ticker, symbol
-            )
+            ticker = await self._fetch_ticker(symbol)
 
             price_val = ticker.get('last')
             if price_val is None:
@@ -138,8 +144,16 @@ class PriceService:
             logger.warning(f"降级使用缓存价格: {symbol}")
             return self._get_cached_price(symbol)
 
+    async def _fetch_ticker(self, symbol: str) -> Dict:
+        """在线程池中调用交易所接口，记录耗时"""
+        with metrics.timer("price_fetch_seconds"):
+            return await asyncio.get_event_loop().run_in_executor(
+                None, self.exchange.fetch_ticker, symbol
+            )
+
     def _get_cached_price(self, symbol: str) -> Optional[float]:
         """从数据库获取缓存价格"""
+        metrics.inc("price_cache_total", result="fallback")
         try:
             result = TradingRepository.get_price_cache(symbol)
             if result["success"] and result["cache"]:
@@ -211,4 +225,5 @@ class PriceService:
 
 
 # 全局价格服务实例
-price_service = PriceService()
\ No newline at end of file
+price_service = PriceService()
+metrics.register_collector("price_service", price_service.get_cache_status)
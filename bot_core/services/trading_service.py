@@ -686,41 +686,6 @@ class TradingService:
             logger.error(f"获取仓位失败: {e}")
             return {'success': False, 'message': '获取仓位信息失败'}
     
-    def begging(self, user_id: int, group_id: int) -> Dict:
-        """救济金功能"""
-        try:
-            account = self.get_or_create_account(user_id, group_id)
-            
-            # 检查余额是否小于100
-            if account['balance'] >= 100:
-                return {'success': False, 'message': f'余额充足({account["balance"]:.2f} USDT)，无需救济金'}
-            
-            # 检查今日是否已领取
-            begging_result = TradingRepository.get_begging_record(user_id, group_id)
-            if not begging_result["success"]:
-                return {'success': False, 'message': '检查救济金记录失败'}
-            
-            today = datetime.now().date()
-            
-            if begging_result["record"]:
-                return {'success': False, 'message': '今日已领取救济金，明天再来吧！'}
-            
-            # 发放救济金
-            balance_result = TradingRepository.update_account_balance(user_id, group_id, 1000.0)
-            if not balance_result["success"]:
-                return {'success': False, 'message': '更新账户余额失败'}
-            
-            # 创建救济金记录
-            begging_create_result = TradingRepository.create_begging_record(user_id, group_id, 1000.0)
-            if not begging_create_result["success"]:
-                return {'success': False, 'message': '创建救济金记录失败'}
-            
-            return {'success': True, 'message': '🎁 救济金发放成功！余额已补充至 1000 USDT'}
-                
-        except Exception as e:
-            logger.error(f"救济金发放失败: {e}")
-            return {'success': False, 'message': '救济金发放失败'}
-    
     def _get_position(self, user_id: int, group_id: int, symbol: str, side: str) -> Optional[Dict]:
         """获取指定仓位"""
         try:
@@ -1071,15 +1036,16 @@ class TradingService:
     async def get_deadbeat_ranking_data(self, group_id: int) -> Dict:
         """获取群组老赖排行榜数据"""
         try:
-            # 获取老赖排行榜数据
-            result = TradingRepository.get_group_deadbeat_ranking(group_id)
+            # 获取老赖排行榜数据，当前欠款按计息时间换算
+            from bot_core.services.trading.analysis_service import analysis_service
+            result = TradingRepository.get_active_loans_with_accounts(group_id)
             
             if not result['success']:
                 return result
             
             # 为每个老赖计算逾期天数
             deadbeat_ranking = []
-            for deadbeat in result['ranking']:
+            for deadbeat in analysis_service._build_deadbeat_ranking(result['loans'], 5, by_group=False):
                 overdue_days = self._calculate_overdue_days(deadbeat['earliest_loan_time'])
                 deadbeat_ranking.append({
                     **deadbeat,
@@ -1101,15 +1067,16 @@ class TradingService:
     async def get_global_deadbeat_ranking_data(self) -> Dict:
         """获取跨群老赖排行榜数据"""
         try:
-            # 获取跨群老赖排行榜数据
-            result = TradingRepository.get_global_deadbeat_ranking()
+            # 获取跨群老赖排行榜数据，当前欠款按计息时间换算
+            from bot_core.services.trading.analysis_service import analysis_service
+            result = TradingRepository.get_active_loans_with_accounts()
             
             if not result['success']:
                 return result
             
             # 为每个老赖计算逾期天数
             deadbeat_ranking = []
-            for deadbeat in result['ranking']:
+            for deadbeat in analysis_service._build_deadbeat_ranking(result['loans'], 5, by_group=True):
                 overdue_days = self._calculate_overdue_days(deadbeat['earliest_loan_time'])
                 deadbeat_ranking.append({
                     **deadbeat,
@@ -1350,339 +1317,6 @@ class TradingService:
                 "message": f"获取盈亏报告失败: {str(e)}"
             }
 
-    def apply_loan(self, user_id: int, group_id: int, amount: float) -> Dict:
-        """申请贷款"""
-        try:
-            # 获取用户账户信息
-            account_result = TradingRepository.get_account(user_id, group_id)
-            if not account_result["success"]:
-                return {
-                    "success": False,
-                    "message": "获取账户信息失败"
-                }
-            
-            account = account_result.get("account")
-            if not account:
-                # 创建新账户
-                create_result = TradingRepository.create_account(user_id, group_id)
-                if not create_result["success"]:
-                    return {
-                        "success": False,
-                        "message": "创建账户失败"
-                    }
-                account = {"balance": 1000.0}
-            
-            current_balance = account["balance"]
-            
-            # 获取当前活跃贷款
-            loans_result = TradingRepository.get_active_loans(user_id, group_id)
-            if not loans_result["success"]:
-                return {
-                    "success": False,
-                    "message": "获取贷款信息失败"
-                }
-            
-            # 计算当前总欠款和总贷款本金
-            current_total_debt = 0.0
-            total_loan_principal = 0.0
-            for loan in loans_result["loans"]:
-                # 更新利息
-                updated_debt = self._calculate_compound_interest(
-                    loan["remaining_debt"], 
-                    loan["last_interest_time"], 
-                    loan["interest_rate"]
-                )
-                current_total_debt += updated_debt
-                total_loan_principal += loan["principal"]
-            
-            # 计算净余额：当前余额减去所有贷款本金（排除贷款获得的资金）
-            net_balance = current_balance - total_loan_principal
-            
-            # 检查贷款额度：总欠款不能超过净余额的20倍
-            max_allowed_debt = net_balance * 20
-            new_total_debt = current_total_debt + amount * 1.1  # 包含10%手续费
-            
-            if new_total_debt > max_allowed_debt:
-                # 计算实际最大可贷金额（考虑10%手续费）
-                max_loan_amount = (max_allowed_debt - current_total_debt) / 1.1
-                return {
-                    "success": False,
-                    "message": f"贷款额度不足！\n💰 当前余额: {current_balance:.2f} USDT\n💸 净余额: {net_balance:.2f} USDT (扣除贷款本金: {total_loan_principal:.2f} USDT)\n💳 当前欠款: {current_total_debt:.2f} USDT\n📊 最大可贷: {max_loan_amount:.2f} USDT\n🏦 申请金额: {amount:.2f} USDT (含手续费: {amount * 1.1:.2f} USDT)\n\n💡 最大可贷金额已考虑10%手续费"
-                }
-            
-            # 创建贷款记录
-            loan_result = TradingRepository.create_loan(user_id, group_id, amount)
-            if not loan_result["success"]:
-                return {
-                    "success": False,
-                    "message": "创建贷款记录失败"
-                }
-            
-            # 更新用户余额
-            new_balance = current_balance + amount
-            balance_result = TradingRepository.update_account_balance(user_id, group_id, new_balance)
-            if not balance_result["success"]:
-                return {
-                    "success": False,
-                    "message": "更新余额失败"
-                }
-            
-            return {
-                "success": True,
-                "message": f"🏦 贷款成功！\n\n💰 贷款金额: {amount:.2f} USDT\n💸 手续费(10%): {amount * 0.1:.2f} USDT\n📊 实际欠款: {amount * 1.1:.2f} USDT\n💳 当前余额: {new_balance:.2f} USDT\n\n⚠️ 每6小时产生0.2%复利，请及时还款！",
-                "loan_id": loan_result["loan_id"],
-                "amount": amount,
-                "new_balance": new_balance
-            }
-            
-        except Exception as e:
-            logger.error(f"申请贷款失败: {e}")
-            return {
-                "success": False,
-                "message": f"申请贷款失败: {str(e)}"
-            }
-    
-    def repay_loan(self, user_id: int, group_id: int, amount: Optional[float] = None) -> Dict:
-        """还款操作"""
-        try:
-            # 获取用户账户信息
-            account_result = TradingRepository.get_account(user_id, group_id)
-            if not account_result["success"] or not account_result.get("account"):
-                return {
-                    "success": False,
-                    "message": "账户不存在"
-                }
-            
-            current_balance = account_result["account"]["balance"]
-            
-            # 获取活跃贷款
-            loans_result = TradingRepository.get_active_loans(user_id, group_id)
-            if not loans_result["success"]:
-                return {
-                    "success": False,
-                    "message": "获取贷款信息失败"
-                }
-            
-            if not loans_result["loans"]:
-                return {
-                    "success": False,
-                    "message": "没有待还贷款"
-                }
-            
-            # 更新所有贷款的利息
-            total_debt = 0.0
-            updated_loans = []
-            for loan in loans_result["loans"]:
-                updated_debt = self._calculate_compound_interest(
-                    loan["remaining_debt"], 
-                    loan["last_interest_time"], 
-                    loan["interest_rate"]
-                )
-                # 更新数据库中的欠款
-                TradingRepository.update_loan_debt(loan["id"], updated_debt)
-                loan["remaining_debt"] = updated_debt
-                updated_loans.append(loan)
-                total_debt += updated_debt
-            
-            # 如果没有指定金额，则全额还款
-            if amount is None:
-                amount = total_debt
-            else:
-                # 如果指定了金额，检查是否超过实际欠款
-                if amount > total_debt:
-                    return {
-                        "success": False,
-                        "message": f"还款金额超过实际欠款！\n💸 实际欠款: {total_debt:.2f} USDT\n💰 指定还款: {amount:.2f} USDT\n\n💡 请输入不超过实际欠款的金额，或使用 /repay 进行全额还款"
-                    }
-            
-            # 检查余额是否足够（保留1000 USDT）
-            available_balance = max(0, current_balance - 1000)
-            if amount > available_balance:
-                return {
-                    "success": False,
-                    "message": f"余额不足！\n当前余额: {current_balance:.2f} USDT\n可用于还款: {available_balance:.2f} USDT\n需要还款: {amount:.2f} USDT\n\n💡 系统会保留1000 USDT作为救济金基础"
-                }
-            
-            # 按贷款时间顺序还款（先还旧贷款）
-            remaining_amount = amount
-            repaid_loans = []
-            
-            for loan in sorted(updated_loans, key=lambda x: x["created_at"]):
-                if remaining_amount <= 0:
-                    break
-
-                loan_debt = loan["remaining_debt"]
-                repay_amount = min(remaining_amount, loan_debt)
-
-                # 添加调试日志 - 跟踪还款计算
-                logger.debug(f"处理贷款 #{loan['id']}: 原始债务={loan_debt:.10f}, 还款金额={repay_amount:.10f}")
-
-                # 执行还款
-                repay_result = TradingRepository.repay_loan(
-                    loan["id"], user_id, group_id, repay_amount
-                )
-
-                if repay_result["success"]:
-                    remaining_after = repay_result["remaining_after"]
-                    # 检查是否出现精度损失导致的小额剩余债务
-                    if 0 < remaining_after < 0.05:
-                        logger.warning(f"检测到精度损失: 贷款 #{loan['id']} 剩余债务 {remaining_after:.10f} USDT，低于0.05 USDT阈值")
-                        # 将小额剩余债务设为0并标记为已还款
-                        TradingRepository.update_loan_debt(loan["id"], 0.0)
-                        # 更新贷款状态为已还清
-                        current_time = datetime.now().isoformat()
-                        loan_update_command = """
-                            UPDATE loans
-                            SET remaining_debt = 0, status = 'paid_off', updated_at = ?
-                            WHERE id = ?
-                        """
-                        from utils.db_utils import revise_db
-                        revise_db(loan_update_command, (current_time, loan["id"]))
-                        remaining_after = 0.0
-                        logger.info(f"已清理小额债务: 贷款 #{loan['id']} 剩余债务已设为0")
-
-                    repaid_loans.append({
-                        "loan_id": loan["id"],
-                        "amount": repay_amount,
-                        "remaining": remaining_after,
-                        "paid_off": repay_result["paid_off"] or remaining_after == 0.0
-                    })
-                    remaining_amount -= repay_amount
-            
-            # 更新用户余额
-            new_balance = current_balance - amount
-            TradingRepository.update_account_balance(user_id, group_id, new_balance)
-            
-            # 生成还款报告
-            message_parts = [f"💳 还款成功！\n\n💰 还款金额: {amount:.2f} USDT\n💳 剩余余额: {new_balance:.2f} USDT\n\n"]
-            
-            for repaid in repaid_loans:
-                status = "✅ 已结清" if repaid["paid_off"] else f"剩余: {repaid['remaining']:.2f} USDT"
-                message_parts.append(f"📋 贷款#{repaid['loan_id']}: {repaid['amount']:.2f} USDT ({status})\n")
-            
-            # 检查是否还有剩余欠款
-            remaining_loans = TradingRepository.get_active_loans(user_id, group_id)
-            if remaining_loans["success"] and remaining_loans["loans"]:
-                remaining_total = sum(loan["remaining_debt"] for loan in remaining_loans["loans"])
-                message_parts.append(f"\n⚠️ 剩余总欠款: {remaining_total:.2f} USDT")
-            else:
-                message_parts.append("\n🎉 所有贷款已结清！")
-            
-            return {
-                "success": True,
-                "message": "".join(message_parts),
-                "repaid_amount": amount,
-                "new_balance": new_balance,
-                "repaid_loans": repaid_loans
-            }
-            
-        except Exception as e:
-            logger.error(f"还款失败: {e}")
-            return {
-                "success": False,
-                "message": f"还款失败: {str(e)}"
-            }
-    
-    def get_loan_bill(self, user_id: int, group_id: int) -> Dict:
-        """获取贷款账单"""
-        try:
-            # 获取贷款汇总
-            summary_result = TradingRepository.get_loan_summary(user_id, group_id)
-            if not summary_result["success"]:
-                return {
-                    "success": False,
-                    "message": "获取贷款信息失败"
-                }
-            
-            summary = summary_result["summary"]
-            
-            # 获取活跃贷款详情
-            loans_result = TradingRepository.get_active_loans(user_id, group_id)
-            if not loans_result["success"]:
-                return {
-                    "success": False,
-                    "message": "获取贷款详情失败"
-                }
-            
-            # 更新利息并计算总欠款
-            current_total_debt = 0.0
-            loan_details = []
-            
-            for loan in loans_result["loans"]:
-                # 计算最新利息
-                updated_debt = self._calculate_compound_interest(
-                    loan["remaining_debt"], 
-                    loan["last_interest_time"], 
-                    loan["interest_rate"]
-                )
-                
-                # 更新数据库
-                TradingRepository.update_loan_debt(loan["id"], updated_debt)
-                
-                current_total_debt += updated_debt
-                
-                # 计算贷款天数
-                loan_time = datetime.fromisoformat(loan["loan_time"])
-                days_since_loan = (datetime.now() - loan_time).days
-                
-                loan_details.append({
-                    "id": loan["id"],
-                    "principal": loan["principal"],
-                    "current_debt": updated_debt,
-                    "days": days_since_loan,
-                    "loan_time": loan["loan_time"]
-                })
-            
-            # 生成账单消息
-            if not loan_details:
-                return {
-                    "success": True,
-                    "message": "🎉 恭喜！您当前没有任何贷款\n\n📊 历史统计:\n" +
-                             f"📈 总贷款次数: {summary['total_loans']}\n" +
-                             f"💰 累计借款: {summary['total_borrowed']:.2f} USDT\n" +
-                             f"💳 累计还款: {summary['total_repaid']:.2f} USDT"
-                }
-            
-            message_parts = [
-                "🏦 贷款账单\n\n",
-                f"📊 当前状态:\n",
-                f"💰 活跃贷款: {summary['active_loan_count']} 笔\n",
-                f"💸 总欠款: {current_total_debt:.2f} USDT\n\n",
-                "📋 贷款详情:\n"
-            ]
-            
-            for i, loan in enumerate(loan_details, 1):
-                interest_generated = loan["current_debt"] - loan["principal"] * 1.1
-                message_parts.append(
-                    f"{i}. 贷款#{loan['id']}\n" +
-                    f"   💰 本金: {loan['principal']:.2f} USDT\n" +
-                    f"   💸 当前欠款: {loan['current_debt']:.2f} USDT\n" +
-                    f"   📈 产生利息: {interest_generated:.2f} USDT\n" +
-                    f"   📅 贷款天数: {loan['days']} 天\n\n"
-                )
-            
-            message_parts.extend([
-                "📊 历史统计:\n",
-                f"📈 总贷款次数: {summary['total_loans']}\n",
-                f"💰 累计借款: {summary['total_borrowed']:.2f} USDT\n",
-                f"💳 累计还款: {summary['total_repaid']:.2f} USDT\n\n",
-                "⚠️ 利息每6小时复利0.2%，请及时还款！"
-            ])
-            
-            return {
-                "success": True,
-                "message": "".join(message_parts),
-                "total_debt": current_total_debt,
-                "active_loans": len(loan_details)
-            }
-            
-        except Exception as e:
-            logger.error(f"获取贷款账单失败: {e}")
-            return {
-                "success": False,
-                "message": f"获取贷款账单失败: {str(e)}"
-            }
-    
     def _get_price_precision(self, price: float) -> int:
         """根据价格大小返回小数位数"""
         if price >= 0.01:
@@ -1695,32 +1329,6 @@ class TradingService:
         precision = self._get_price_precision(price)
         return f"{price:.{precision}f}"
 
-    def _calculate_compound_interest(self, principal: float, last_interest_time: str, rate: float = 0.002) -> float:
-        """计算复利"""
-        try:
-            last_time = datetime.fromisoformat(last_interest_time)
-            current_time = datetime.now()
-
-            # 计算经过的6小时周期数
-            time_diff = current_time - last_time
-            periods = time_diff.total_seconds() / (6 * 3600)  # 6小时为一个周期
-
-            if periods < 1:
-                return principal  # 不足一个周期，不计息
-
-            # 复利计算: A = P(1 + r)^n
-            compound_amount = principal * ((1 + rate) ** int(periods))
-
-            # 添加调试日志 - 跟踪利息计算精度
-            if abs(compound_amount - principal) > 0.0001:  # 如果利息变化超过0.0001
-                logger.debug(f"利息计算: 本金={principal:.10f}, 周期数={int(periods)}, 利率={rate}, 计算结果={compound_amount:.10f}, 利息={compound_amount-principal:.10f}")
-
-            return compound_amount
-
-        except Exception as e:
-            logger.error(f"计算复利失败: {e}")
-            return principal
-
     async def _cleanup_small_debts(self) -> None:
         """清理所有用户的小额债务（低于0.05 USDT）"""
         try:
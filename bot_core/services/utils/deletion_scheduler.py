@@ -0,0 +1,219 @@
+"""
+消息定时删除调度器
+
+原先每条需要自动删除的消息都对应一个 asyncio.sleep(delay) 的协程，繁忙的群里会同时挂着上千个任务，
+而且重启后全部丢失。这里改为：
+- 所有待删除消息放在一个按删除时间排序的最小堆里，由一个后台任务负责；
+- 同一时间片(telegram.delete_tick 秒)内到期的消息一起处理，同一聊天的消息用 delete_messages 批量删除；
+- 删除请求经过 send_scheduler 限速；
+- 计划同时写入 scheduled_deletions 表，启动时重新加载，已过期的立即删除；
+- 网络错误或多次 RetryAfter 后仍失败的消息按指数退避（telegram.delete_retry_base 秒起，最多
+  telegram.delete_max_attempts 次）重新安排，计划只在删除成功或 Telegram 明确拒绝（BadRequest）后移除。
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest
+
+from bot_core.data_repository.scheduled_deletions_repository import ScheduledDeletionsRepository
+from bot_core.services.utils.tg_scheduler import send_scheduler
+from utils.config_utils import get_config
+from utils.logging_utils import setup_logging
+from utils.metrics import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+_BATCH_LIMIT = 100  # deleteMessages 单次最多 100 条
+
+
+class MessageDeletionScheduler:
+    """
+    消息定时删除调度器，采用单例模式。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MessageDeletionScheduler, cls).__new__(cls)
+            cls._instance._init_scheduler()
+        return cls._instance
+
+    def _init_scheduler(self):
+        self.tick = get_config("telegram.delete_tick", 1.0)
+        self.retry_base = get_config("telegram.delete_retry_base", 30)
+        self.max_attempts = get_config("telegram.delete_max_attempts", 8)
+        self._bot: Optional[Bot] = None
+        # (删除时间, chat_id, message_id)；重新安排的消息以 _due 中的时间为准，旧条目出堆时跳过
+        self._heap: List[Tuple[float, int, int]] = []
+        self._due: Dict[Tuple[int, int], float] = {}
+        # 删除失败过的消息 -> 已尝试次数
+        self._attempts: Dict[Tuple[int, int], int] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self.stats = {"scheduled": 0, "deleted": 0, "batches": 0, "errors": 0, "retries": 0, "abandoned": 0}
+
+    def start(self, bot: Bot) -> None:
+        """加载上次未完成的删除计划并启动后台任务，需要在事件循环中调用。"""
+        self._bot = bot
+        if self._runner is not None and not self._runner.done():
+            return
+        restored = ScheduledDeletionsRepository.deletion_load_all().get("data", [])
+        for chat_id, message_id, due_at in restored:
+            self._push(chat_id, message_id, due_at)
+        if restored:
+            logger.info(f"恢复了 {len(restored)} 条待删除消息")
+        self._wakeup = asyncio.Event()
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务，未删除的计划保留在数据库中，下次启动时恢复。"""
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+    def _push(self, chat_id: int, message_id: int, due_at: float) -> None:
+        self._due[(chat_id, message_id)] = due_at
+        heapq.heappush(self._heap, (due_at, chat_id, message_id))
+
+    def schedule(self, bot: Bot, chat_id: int, message_ids: Iterable[Optional[int]], delay_seconds: float) -> None:
+        """
+        安排在 delay_seconds 秒后删除消息。
+
+        Args:
+            bot: Bot 实例，调度器尚未启动时用于启动
+            chat_id: 聊天ID
+            message_ids: 要删除的消息ID，None 会被忽略
+            delay_seconds: 删除延迟时间（秒）
+        """
+        due_at = time.time() + delay_seconds
+        items = [(chat_id, message_id, due_at) for message_id in message_ids if message_id]
+        if not items:
+            return
+        ScheduledDeletionsRepository.deletion_add_many(items)
+        earliest = self._heap[0][0] if self._heap else None
+        for item in items:
+            self._push(*item)
+        self.stats["scheduled"] += len(items)
+
+        if self._runner is None or self._runner.done():
+            self.start(bot)
+        elif earliest is None or due_at < earliest:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                timeout = self._heap[0][0] - time.time() if self._heap else None
+                if timeout is None or timeout > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._delete_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"消息删除调度出错: {e}", exc_info=True)
+                await asyncio.sleep(self.tick)
+
+    def _pop_due(self) -> Dict[int, List[int]]:
+        """取出当前时间片内到期的消息，按聊天分组。"""
+        horizon = time.time() + self.tick
+        by_chat: Dict[int, List[int]] = defaultdict(list)
+        while self._heap and self._heap[0][0] <= horizon:
+            due_at, chat_id, message_id = heapq.heappop(self._heap)
+            if self._due.get((chat_id, message_id)) != due_at:
+                continue  # 已被重新安排
+            del self._due[(chat_id, message_id)]
+            by_chat[chat_id].append(message_id)
+        return by_chat
+
+    async def _delete_due(self) -> None:
+        by_chat = self._pop_due()
+        if not by_chat:
+            return
+        failed = await asyncio.gather(*(self._delete_chat(chat_id, ids) for chat_id, ids in by_chat.items()))
+        retry_keys = {(chat_id, message_id) for chat_id, ids in zip(by_chat, failed) for message_id in ids}
+
+        done, retries = [], []
+        now = time.time()
+        for chat_id, ids in by_chat.items():
+            for message_id in ids:
+                key = (chat_id, message_id)
+                if key not in retry_keys:
+                    self._attempts.pop(key, None)
+                    done.append(key)
+                    continue
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= self.max_attempts:
+                    self._attempts.pop(key, None)
+                    self.stats["abandoned"] += 1
+                    logger.warning(f"消息 {message_id} (chat_id={chat_id}) 删除失败 {attempts} 次，放弃删除")
+                    done.append(key)
+                    continue
+                self._attempts[key] = attempts
+                retries.append((chat_id, message_id, now + self.retry_base * 2 ** (attempts - 1)))
+
+        if retries:
+            self.stats["retries"] += len(retries)
+            ScheduledDeletionsRepository.deletion_add_many(retries)
+            for item in retries:
+                self._push(*item)
+        if done:
+            ScheduledDeletionsRepository.deletion_remove_many(done)
+
+    async def _delete_chat(self, chat_id: int, message_ids: List[int]) -> List[int]:
+        """
+        删除一个聊天中的消息。
+
+        Returns:
+            List[int]: 因网络错误、限流等临时原因没有删除、需要稍后重试的消息ID
+        """
+        bot = self._bot
+        failed: List[int] = []
+        for start in range(0, len(message_ids), _BATCH_LIMIT):
+            batch = message_ids[start:start + _BATCH_LIMIT]
+            try:
+                if len(batch) > 1 and hasattr(bot, "delete_messages"):
+                    await send_scheduler.run(chat_id, lambda: bot.delete_messages(chat_id=chat_id, message_ids=batch))
+                else:
+                    for message_id in batch:
+                        await self._delete_one(chat_id, message_id)
+                self.stats["batches"] += 1
+                self.stats["deleted"] += len(batch)
+            except BadRequest as e:
+                # 消息已被删除或超过 48 小时无法删除，不再重试
+                logger.debug(f"删除消息失败: chat_id={chat_id}, {batch}: {e}")
+            except Exception as e:
+                self.stats["errors"] += 1
+                failed.extend(batch)
+                logger.warning(f"自动删除消息失败，稍后重试: chat_id={chat_id}, {batch}: {e}")
+        return failed
+
+    async def _delete_one(self, chat_id: int, message_id: int) -> None:
+        try:
+            await send_scheduler.run(chat_id, lambda: self._bot.delete_message(chat_id=chat_id, message_id=message_id))
+        except BadRequest as e:
+            logger.debug(f"删除消息 {message_id} 失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        next_due = self._heap[0][0] - time.time() if self._heap else None
+        return {**self.stats, "pending": len(self._due),
+                "next_due_in": round(next_due, 1) if next_due is not None else None}
+
+
+# 全局消息删除调度器
+deletion_scheduler = MessageDeletionScheduler()
+metrics.register_collector("deletion_scheduler", deletion_scheduler.get_stats)
@@ -34,9 +34,11 @@ class PromptService:
         if group and self.group_config:
             preset = self.group_config.preset
             character = self.group_config.char
+            api = self.group_config.api
         else:
             preset = self.user.preset
             character = self.user.character
+            api = self.user.api
 
         # 确定用户昵称的备用逻辑
         if self.group:
@@ -52,7 +54,8 @@ class PromptService:
             prompts_set=preset,
             input_txt=self.input_text,
             character=character,
-            user_nick=user_display_name
+            user_nick=user_display_name,
+            api=api
         )
 
     def build_private_chat_prompts(self) -> List[Dict[str, Any]]:
@@ -62,20 +65,16 @@ class PromptService:
         if not self.conversation:
             raise ValueError("私聊场景需要提供 conversation 对象。")
 
-        # 1. 加载历史消息
-        if self.conversation.id:
-            # 注意：这里的 build_conv_messages 仍然依赖 db_utils，
-            # 在未来的重构中，可以考虑将其逻辑也移入 Repository 或 Service。
-            self.prompt_builder.build_conv_messages(self.conversation.id, "private")
+        # 1. 按 token 预算加载会话摘要和历史消息
+        # 注意：这里的 build_conv_messages 仍然依赖 db_utils，
+        # 在未来的重构中，可以考虑将其逻辑也移入 Repository 或 Service。
+        self.prompt_builder.build_conv_messages(self.conversation.id, "private",
+                                                summaries=self.conversation.summaries)
 
-        # 2. 插入会话摘要
-        if self.conversation.summaries:
-            summary_content = "\n".join([s['content'] for s in self.conversation.summaries])
-            self.prompt_builder.insert_summary(summary_content)
-
-        # 3. 构建最终消息
+        # 2. 构建最终消息
         self.prompt_builder.build_openai_messages()
-        logger.debug(f"Final private chat messages for LLM: {json.dumps(self.prompt_builder.messages, indent=2, ensure_ascii=False)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Final private chat messages for LLM: {json.dumps(self.prompt_builder.messages, indent=2, ensure_ascii=False)}")
         return self.prompt_builder.messages
 
     def build_group_chat_prompts(self, images: Optional[List[str]] = None) -> List[Dict[str, Any]]:
@@ -88,10 +87,7 @@ class PromptService:
         if not self.group or not self.conversation:
             raise ValueError("群聊场景需要提供 group 和 conversation 对象。")
 
-        # 1. 加载群聊历史
-        self.prompt_builder.build_conv_messages(self.conversation.id, "group")
-
-        # 2. 加载并插入群聊上下文和用户画像
+        # 1. 加载并插入群聊上下文和用户画像
         group_dialog = self.prompt_builder.load_group_dialog(self.group.id)
         user_profiles = db.user_profile_get(self.user.id)
 
@@ -113,7 +109,11 @@ class PromptService:
                                                                                                 f"我们正处于群聊模式，你需要先看看群友在聊什么，再加入他们的对话\r\n{group_dialog}\r\n</群聊模式>"})
         self.prompt_builder.insert_any({"location":"input_mark_end","mode":"after","content":profile_prompt})
 
-        # 4. 构建最终消息
+        # 2. 在剩余的 token 预算内加载群聊历史（需要在插入上下文之后，预算才包含这些内容）
+        self.prompt_builder.build_conv_messages(self.conversation.id, "group")
+
+        # 3. 构建最终消息
         self.prompt_builder.build_openai_messages()
-        logger.debug(f"Final group chat messages for LLM: {json.dumps(self.prompt_builder.messages, indent=2, ensure_ascii=False)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Final group chat messages for LLM: {json.dumps(self.prompt_builder.messages, indent=2, ensure_ascii=False)}")
         return self.prompt_builder.messages
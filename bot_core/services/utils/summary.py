@@ -1,9 +1,46 @@
 import asyncio
 import logging
+import time
+from typing import Dict, List, Optional, Tuple
 from agent.llm_functions import generate_summary
-from utils.db_utils import dialog_summary_add
-logger = logging.getLogger(__name__)
+from utils.config_utils import get_config
+from utils.db_utils import dialog_summary_add, dialog_summary_get, dialog_turn_get
+from utils.logging_utils import setup_logging
+from utils.metrics import metrics
 from bot_core.data_repository.conv_model import Conversation
+from bot_core.data_repository.summary_jobs_repository import SummaryJobsRepository
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+SUMMARY_AREA_SIZE = 30  # 每个摘要区域覆盖的轮次
+SUMMARY_MIN_TURNS = 60  # 超过该轮次才开始摘要
+_PURGE_INTERVAL = 3600  # 空闲时清理已结束任务的最小间隔(秒)
+
+
+def find_missing_areas(turns: int, summaries: Optional[List[Dict]]) -> List[Tuple[int, int, str]]:
+    """
+    计算会话中尚未生成摘要的区域。
+
+    Args:
+        turns: 会话当前轮次
+        summaries: 已有的摘要列表，元素包含 summary_area 字段
+
+    Returns:
+        List[Tuple[int, int, str]]: (起始轮次, 结束轮次, 区域字符串) 列表
+    """
+    if turns <= SUMMARY_MIN_TURNS:
+        return []
+    area_count = (turns - 1) // SUMMARY_AREA_SIZE
+    exist_areas = {s.get('summary_area') for s in summaries or [] if s.get('summary_area')}
+    missing_areas = []
+    for i in range(1, area_count + 1):
+        start = (i - 1) * SUMMARY_AREA_SIZE + 1
+        end = i * SUMMARY_AREA_SIZE
+        area_str = f"{start}-{end}"
+        if area_str not in exist_areas:
+            missing_areas.append((start, end, area_str))
+    return missing_areas
 
 
 class SummaryService:
@@ -22,94 +59,175 @@ class SummaryService:
 
     def check_and_generate_summaries_async(self):
         """
-        检查当前会话是否需要总结，并异步启动一个后台任务来补全所有缺失的摘要。
+        检查当前会话是否需要总结，需要时把会话放入摘要任务队列，由后台 worker 补全所有缺失的摘要。
         """
         if not self.conversation.id:
             return
-        logger.info(f"开始检查对话 {self.conversation.id} 的摘要情况。")
-        logger.info(f"该对话当前轮次为 {self.conversation.turns} 轮。")
-        if self.conversation.turns <= 60:
-            logger.info("轮次不足 (<= 60)，跳过摘要检查。")
-            return
-
-        # 计算需要检查的总结区域数量
-        area_count = (self.conversation.turns - 1) // 30
-        summaries = self.conversation.summaries
-
-        # 构建已存在的总结区域集合
-        exist_areas = {s.get('summary_area') for s in summaries if s.get('summary_area')}
-
-        # 确定需要补全的区域列表
-        missing_areas = []
-        for i in range(1, area_count + 1):
-            start = (i - 1) * 30 + 1
-            end = i * 30
-            area_str = f"{start}-{end}"
-            if area_str not in exist_areas:
-                missing_areas.append((start, end, area_str))
-
+        missing_areas = find_missing_areas(self.conversation.turns, self.conversation.summaries)
         if not missing_areas:
-            logger.info(f"对话 {self.conversation.id} 的所有摘要区域均已存在。")
             return
 
-        logger.info(f"对话 {self.conversation.id} 发现缺失的摘要区域: {[a[2] for a in missing_areas]}，将启动后台任务依次补全。")
+        logger.info(f"对话 {self.conversation.id} 发现缺失的摘要区域: {[a[2] for a in missing_areas]}，已加入摘要队列。")
+        summary_job_queue.submit(self.conversation.id)
 
-        async def generate_all_summaries():
-            for start, end, area_str in missing_areas:
-                result = await self._generate_summary(start, end)
-                if not result:
-                    logger.warning(f"区域 {area_str} 总结生成失败，后续区域将不再尝试。")
-                    break
-
-        # 启动后台任务
-        asyncio.create_task(generate_all_summaries())
+    @staticmethod
+    async def generate_missing_summaries(conv_id: int) -> Optional[str]:
+        """
+        按顺序补全会话缺失的摘要，每次执行都重新读取已有摘要，重试时从失败的区域继续。
 
-    async def _generate_summary(self, start: int, end: int) -> bool:
+        Returns:
+            Optional[str]: 成功返回 None，失败返回错误描述。
+        """
+        turns = dialog_turn_get(conv_id, 'private')
+        for start, end, area_str in find_missing_areas(turns, dialog_summary_get(conv_id)):
+            error = await SummaryService._generate_summary(conv_id, start, end)
+            if error:
+                return f"区域 {area_str}: {error}"
+            logger.info(f"成功为对话 {conv_id} 的区域 {area_str} 添加总结。")
+        return None
+
+    @staticmethod
+    async def _generate_summary(conv_id: int, start: int, end: int) -> Optional[str]:
         """
         为指定区域的内容生成并添加 summary。
 
         Args:
+            conv_id (int): 会话ID。
             start (int): 区域起始轮次。
             end (int): 区域结束轮次。
 
         Returns:
-            bool: 添加总结是否成功。
+            Optional[str]: 成功返回 None，失败返回错误描述。重试由任务队列负责。
         """
-        if not self.conversation.id:
-            logger.error("无法生成摘要，因为没有会话ID。")
-            return False
-
-        area_str = f"{start}-{end}"
-        max_retry = 4
-        for attempt in range(1, max_retry + 1):
-            try:
-                summary_text = await generate_summary(self.conversation.id, summary_type='zip', start=start, end=end)
-
-                if not summary_text or len(summary_text) < 200:
-                    logger.warning(f"第 {attempt}/{max_retry} 次尝试：区域 {area_str} 生成的总结过短（<200字符），将重试。")
-                    await asyncio.sleep(5)
-                    continue
-
-                result = dialog_summary_add(self.conversation.id, area_str, summary_text)
-                if result:
-                    logger.info(f"成功为区域 {area_str} 添加总结。")
-                    return True
-                else:
-                    logger.warning(f"第 {attempt}/{max_retry} 次尝试：为区域 {area_str} 添加总结到数据库失败，将重试。")
-
-            except Exception as e:
-                logger.error(f"第 {attempt}/{max_retry} 次尝试为区域 {area_str} 生成或添加总结时出错: {e}", exc_info=True)
-
-            if attempt < max_retry:
-                await asyncio.sleep(5)
-
-        logger.error(f"区域 {area_str} 总结生成失败，已达最大重试次数 {max_retry}。")
-        return False
-
-
-
+        try:
+            summary_text = await generate_summary(conv_id, summary_type='zip', start=start, end=end)
+        except Exception as e:
+            logger.error(f"为对话 {conv_id} 区域 {start}-{end} 生成总结时出错: {e}")
+            return str(e)
 
+        if not summary_text or len(summary_text) < 200:
+            return "生成的总结过短（<200字符）"
+        if not dialog_summary_add(conv_id, f"{start}-{end}", summary_text):
+            return "添加总结到数据库失败"
+        return None
 
 
+class SummaryJobQueue:
+    """
+    对话摘要任务队列，采用单例模式。
 
+    任务保存在 summary_jobs 表中，同一会话同时最多一个待执行任务；固定数量的 worker 领取任务，
+    失败后按指数退避重新排队，超过最大次数标记为 failed。进程重启时未完成的任务会重新排队。
+    结束超过 summary.job_retention_days 天的 done/failed 任务在启动时和空闲时（每小时最多一次）删除。
+    """
 
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SummaryJobQueue, cls).__new__(cls)
+            cls._instance._init_queue()
+        return cls._instance
+
+    def _init_queue(self):
+        self.concurrency = get_config("summary.max_concurrency", 2)
+        self.max_attempts = get_config("summary.max_attempts", 5)
+        self.retry_base = get_config("summary.retry_base_seconds", 30)
+        self.retry_max = get_config("summary.retry_max_seconds", 1800)
+        self.poll_interval = get_config("summary.poll_interval", 30)
+        self.retention = get_config("summary.job_retention_days", 7) * 86400
+        self._last_purge = 0.0
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        """恢复中断的任务并启动 worker，需要在事件循环中调用。"""
+        if self._workers:
+            return
+        recovered = SummaryJobsRepository.job_requeue_running()
+        if recovered.get("data"):
+            logger.info(f"恢复了 {recovered['data']} 个中断的摘要任务")
+        self._purge_finished()
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.concurrency)
+        ]
+        logger.info(f"摘要任务队列已启动，worker 数量: {self.concurrency}")
+
+    async def stop(self) -> None:
+        """停止 worker，被中断的任务放回队列，下次启动时重新执行。"""
+        if not self._workers:
+            return
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        requeued = SummaryJobsRepository.job_requeue_running()
+        if requeued.get("data"):
+            logger.info(f"{requeued['data']} 个执行中的摘要任务已放回队列")
+
+    def submit(self, conv_id: int) -> bool:
+        """提交会话的摘要任务，已有未完成任务时忽略。"""
+        result = SummaryJobsRepository.job_enqueue(conv_id)
+        if not self._workers:
+            try:
+                self.start()
+            except RuntimeError:
+                # 不在事件循环中，任务留在表里，等队列启动后执行
+                pass
+        if result.get("data") and self._wakeup is not None:
+            self._wakeup.set()
+        return bool(result.get("data"))
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            try:
+                # 先清除唤醒标记再领取，领取之后提交的任务会立即唤醒
+                self._wakeup.clear()
+                claimed = SummaryJobsRepository.job_claim_next()
+                job = claimed.get("data")
+                if job is None:
+                    if time.time() - self._last_purge >= _PURGE_INTERVAL:
+                        self._purge_finished()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"摘要 worker {index} 出错: {e}", exc_info=True)
+                await asyncio.sleep(self.poll_interval)
+
+    def _purge_finished(self) -> None:
+        """删除结束时间超过保留期限的任务。"""
+        self._last_purge = time.time()
+        purged = SummaryJobsRepository.job_purge_finished(self._last_purge - self.retention)
+        if purged.get("data"):
+            logger.info(f"清理了 {purged['data']} 个已结束的摘要任务")
+
+    async def _run_job(self, job: Dict) -> None:
+        job_id, conv_id, attempts = job["id"], job["conv_id"], job["attempts"]
+        error = await SummaryService.generate_missing_summaries(conv_id)
+        if error is None:
+            SummaryJobsRepository.job_finish(job_id, "done")
+            logger.info(f"对话 {conv_id} 的摘要任务完成，耗时 {time.time() - job['created_at']:.1f}s")
+        elif attempts >= self.max_attempts:
+            SummaryJobsRepository.job_finish(job_id, "failed", error)
+            logger.error(f"对话 {conv_id} 的摘要任务失败，已达最大重试次数 {self.max_attempts}: {error}")
+        else:
+            delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+            SummaryJobsRepository.job_retry(job_id, time.time() + delay, error)
+            logger.warning(f"对话 {conv_id} 的摘要任务第 {attempts} 次失败，{delay}s 后重试: {error}")
+
+    def get_stats(self) -> Dict:
+        """队列深度、等待时长和平均完成耗时。"""
+        stats = SummaryJobsRepository.job_stats().get("data", {})
+        return {**stats, "workers": len(self._workers)}
+
+
+# 全局摘要任务队列
+summary_job_queue = SummaryJobQueue()
+metrics.register_collector("summary_job_queue", summary_job_queue.get_stats)
@@ -0,0 +1,293 @@
+"""
+Telegram 出站消息调度器
+
+所有发往 Telegram 的发送/编辑请求都经过这里：
+- 全局令牌桶 + 每个聊天独立的令牌桶，避免触发 429；
+- 收到 RetryAfter 时冻结对应聊天的令牌桶，并按 retry_after 重试；
+- 流式回复的中间编辑按消息合并（只保留最新文本），同一条消息同一时间最多一个编辑在排队。
+
+配置热加载时重新读取 telegram.* 的速率和重试设置，并更新已有的令牌桶。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from utils.config_utils import ConfigSnapshot, get_config, on_config_reload
+from utils.logging_utils import setup_logging
+from utils.metrics import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+class _TokenBucket:
+    """简单的令牌桶，按 rate 个/秒补充，最多积累 capacity 个。"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """返回距离下一个可用令牌还需等待的秒数，0 表示可以立即发送。"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        """在 seconds 秒内拒绝发放令牌，并清空已积累的令牌。"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+        self.updated = self.blocked_until
+
+    def is_idle(self, now: float) -> bool:
+        """令牌已补满且没有被冻结，可以安全回收。"""
+        self._refill(now)
+        return now >= self.blocked_until and self.tokens >= self.capacity
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    """兼容 retry_after 为 int 或 timedelta 的不同 PTB 版本。"""
+    value = error.retry_after
+    if hasattr(value, "total_seconds"):
+        return float(value.total_seconds())
+    return float(value)
+
+
+class TelegramSendScheduler:
+    """
+    Telegram 出站请求调度器，采用单例模式。
+
+    - run(): 在限速下执行任意一次 Bot API 调用，遇到 RetryAfter 自动等待重试。
+    - schedule_edit(): 提交一次可合并的中间编辑，立即返回，不阻塞流式循环。
+    - discard_edit(): 丢弃尚未发出的中间编辑，在最终编辑前调用。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TelegramSendScheduler, cls).__new__(cls)
+            cls._instance._init_scheduler()
+        return cls._instance
+
+    def _init_scheduler(self):
+        """读取配置并初始化令牌桶和合并队列。"""
+        self._load_settings()
+
+        self._global_bucket = _TokenBucket(self.global_rate, self.global_rate)
+        self._chat_buckets: Dict[int, _TokenBucket] = {}
+
+        # (chat_id, message_id) -> (message, text, parse_mode)，只保存最新一次提交
+        self._pending_edits: Dict[Tuple[int, int], Tuple[Message, str, Optional[str]]] = {}
+        self._edit_workers: Dict[Tuple[int, int], asyncio.Task] = {}
+        self._inflight_edits: set = set()
+
+        self.stats = {
+            "calls": 0,
+            "edits_sent": 0,
+            "edits_coalesced": 0,
+            "edits_discarded": 0,
+            "retry_after_hits": 0,
+            "throttled_seconds": 0.0,
+        }
+
+    def _load_settings(self) -> None:
+        self.global_rate = get_config("telegram.global_rate", 25)
+        self.private_rate = get_config("telegram.private_chat_rate", 1.0)
+        self.group_rate = get_config("telegram.group_chat_rate", 0.33)
+        self.chat_burst = get_config("telegram.chat_burst", 3)
+        self.max_retries = get_config("telegram.max_retries", 3)
+        self.stream_edit_interval = get_config("telegram.stream_edit_interval", 4.0)
+
+    def reload_config(self, snapshot: Optional[ConfigSnapshot] = None) -> None:
+        """配置热加载回调（在事件循环中执行）：更新速率设置和已有令牌桶的速率、容量。"""
+        self._load_settings()
+        self._global_bucket.rate = self._global_bucket.capacity = self.global_rate
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            bucket.rate = self.group_rate if chat_id < 0 else self.private_rate
+            bucket.capacity = self.chat_burst
+
+    def _chat_bucket(self, chat_id: int) -> _TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # 群组/频道 chat_id 为负数，Telegram 对其限制更严格
+            rate = self.group_rate if chat_id < 0 else self.private_rate
+            bucket = _TokenBucket(rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+            if len(self._chat_buckets) > 4096:
+                self._prune_buckets()
+        return bucket
+
+    def _prune_buckets(self) -> None:
+        """回收已经空闲的聊天令牌桶，防止字典无限增长。"""
+        now = time.monotonic()
+        idle = [cid for cid, bucket in self._chat_buckets.items() if bucket.is_idle(now)]
+        for cid in idle:
+            del self._chat_buckets[cid]
+
+    async def acquire(self, chat_id: int) -> None:
+        """等待直到全局和该聊天的令牌桶都有可用令牌。"""
+        chat_bucket = self._chat_bucket(chat_id)
+        while True:
+            now = time.monotonic()
+            wait = max(self._global_bucket.delay(now), chat_bucket.delay(now))
+            if wait <= 0:
+                self._global_bucket.consume()
+                chat_bucket.consume()
+                return
+            self.stats["throttled_seconds"] += wait
+            await asyncio.sleep(wait)
+
+    def penalize(self, chat_id: int, retry_after: float) -> None:
+        """记录一次 429：冻结该聊天的令牌桶，并清空全局令牌以整体降速。"""
+        now = time.monotonic()
+        self.stats["retry_after_hits"] += 1
+        self._chat_bucket(chat_id).block(now, retry_after)
+        self._global_bucket.tokens = 0
+        logger.warning(f"Telegram 限流: chat_id={chat_id}，{retry_after:.1f} 秒后重试")
+
+    async def run(
+        self, chat_id: int, call: Callable[[], Awaitable[Any]], max_retries: Optional[int] = None
+    ) -> Any:
+        """
+        在限速下执行一次 Bot API 调用。
+
+        Args:
+            chat_id: 目标聊天ID，用于选择令牌桶
+            call: 无参协程工厂，每次重试都会重新调用
+            max_retries: 被限流时的最大重试次数，默认使用配置值；
+                         上传文件对象等不可重放的请求应传 0
+
+        Returns:
+            Any: call() 的返回值
+
+        Raises:
+            RetryAfter: 超过最大重试次数后仍被限流时抛出
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        attempt = 0
+        while True:
+            await self.acquire(chat_id)
+            self.stats["calls"] += 1
+            try:
+                return await call()
+            except RetryAfter as e:
+                attempt += 1
+                self.penalize(chat_id, _retry_after_seconds(e))
+                if attempt > max_retries:
+                    raise
+
+    def schedule_edit(self, message: Message, text: str, parse_mode: Optional[str] = None) -> None:
+        """
+        提交一次中间编辑。若该消息已有编辑在排队，则直接替换为最新文本。
+
+        Args:
+            message: 要编辑的消息对象
+            text: 新的消息文本
+            parse_mode: 解析模式，默认不解析
+        """
+        key = (message.chat_id, message.message_id)
+        if key in self._pending_edits:
+            self.stats["edits_coalesced"] += 1
+        self._pending_edits[key] = (message, text, parse_mode)
+
+        worker = self._edit_workers.get(key)
+        if worker is None or worker.done():
+            self._edit_workers[key] = asyncio.create_task(self._edit_worker(key))
+
+    async def discard_edit(self, message: Message) -> None:
+        """
+        丢弃该消息尚未发出的中间编辑；若有编辑正在发送，等待其完成，
+        保证随后的最终编辑不会被旧内容覆盖。
+        """
+        key = (message.chat_id, message.message_id)
+        if self._pending_edits.pop(key, None) is not None:
+            self.stats["edits_discarded"] += 1
+
+        worker = self._edit_workers.pop(key, None)
+        if worker is None or worker.done():
+            return
+        if key in self._inflight_edits:
+            try:
+                await worker
+            except Exception:
+                pass
+        else:
+            worker.cancel()
+
+    def edit_interval(self) -> float:
+        """
+        流式回复的建议编辑间隔。排队中的编辑越多，间隔越长，
+        让全局令牌优先留给新消息。
+        """
+        backlog = len(self._pending_edits)
+        budget = max(1.0, self.global_rate * self.stream_edit_interval / 2)
+        return self.stream_edit_interval * max(1.0, backlog / budget)
+
+    async def _edit_worker(self, key: Tuple[int, int]) -> None:
+        """发送某条消息最新的待编辑文本，直到队列中没有该消息的新内容。"""
+        chat_id = key[0]
+        try:
+            while key in self._pending_edits:
+                await self.acquire(chat_id)
+                pending = self._pending_edits.pop(key, None)
+                if pending is None:
+                    return
+                message, text, parse_mode = pending
+
+                self._inflight_edits.add(key)
+                try:
+                    await message.edit_text(text, parse_mode=parse_mode)
+                    self.stats["edits_sent"] += 1
+                except RetryAfter as e:
+                    self.penalize(chat_id, _retry_after_seconds(e))
+                    # 没有更新的内容时，把这次的文本放回去等待重试
+                    self._pending_edits.setdefault(key, pending)
+                except BadRequest as e:
+                    if "Message is not modified" not in str(e):
+                        logger.warning(f"临时更新消息失败: {e}")
+                except TelegramError as e:
+                    logger.warning(f"临时更新消息失败: {e}")
+                finally:
+                    self._inflight_edits.discard(key)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if self._edit_workers.get(key) is asyncio.current_task():
+                del self._edit_workers[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度器统计信息。"""
+        return {
+            **self.stats,
+            "pending_edits": len(self._pending_edits),
+            "chat_buckets": len(self._chat_buckets),
+        }
+
+
+# 全局调度器实例
+send_scheduler = TelegramSendScheduler()
+on_config_reload(send_scheduler.reload_config, in_loop=True)
+metrics.register_collector("send_scheduler", send_scheduler.get_stats)
@@ -1,10 +1,11 @@
 import utils.db_utils as db
-import tiktoken
 import logging
 from utils.logging_utils import setup_logging
 from bot_core.data_repository.conv_model import User
 from utils.config_utils import get_api_multiple
-from typing import List, Dict, Any, Optional, Tuple
+from utils.context_budget import count_message_tokens, count_tokens
+from utils.usage_accumulator import usage_accumulator
+from typing import List, Dict, Any, Callable, Optional, Tuple
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -18,12 +19,7 @@ def circulate_token(text: str):
     Returns:
         int: 文本的token数量。如果计算失败，则返回字符串的长度。
     """
-    try:
-        encoder = tiktoken.get_encoding("cl100k_base")
-        return len(encoder.encode(text))
-    except Exception as e:
-        print(f"错误: 计算token时发生错误 - {e}. 输出为字符串长度。")
-        return len(str(text))
+    return count_tokens(text, cache=False)
 
 def update_user_usage(user: Any, messages: List[Dict[str, Any]], output: str, trigger_type: str) -> Optional[Tuple[int, int]]:
     """更新用户的token使用量和频率信息。
@@ -37,7 +33,8 @@ def update_user_usage(user: Any, messages: List[Dict[str, Any]], output: str, tr
     Returns:
         一个包含更新后的 (remain_frequency, temporary_frequency) 的元组，如果不是私聊场景则返回 None。
     """
-    input_tokens = circulate_token(str(messages))
+    # 只计消息文本，不把 repr 的引号转义和图片的 base64 算进去
+    input_tokens = count_message_tokens(messages)
     output_tokens = circulate_token(output)
 
     # --- Private Chat & Photo Handling ---
@@ -47,39 +44,26 @@ def update_user_usage(user: Any, messages: List[Dict[str, Any]], output: str, tr
             return None
 
         user_id = user.id
-        db.user_info_update(user_id, 'input_tokens', input_tokens, True)
-        db.user_info_update(user_id, 'output_tokens', output_tokens, True)
-
         cost = 2 if trigger_type == 'private_photo' else get_api_multiple(user.api)
         tmp_frequency = user.temporary_frequency
-        
-        if tmp_frequency >= cost:
-            db.user_sign_info_update(user_id, 'frequency', -cost)
-            logger.debug(f"用户 {user_id} 消耗 {cost}, 扣除临时额度. 剩余: {tmp_frequency - cost}")
-        else:
-            remaining_cost = cost - tmp_frequency
-            if tmp_frequency > 0:
-                db.user_sign_info_update(user_id, 'frequency', -tmp_frequency)
-            db.user_info_update(user_id, 'remain_frequency', -remaining_cost, True)
-            logger.debug(f"用户 {user_id} 消耗 {cost}. 扣光临时额度 {tmp_frequency}, 再扣除常规额度 {remaining_cost}.")
-
-        conv_id = user.active_conversation_id
-        if conv_id:
-            conv_turn = db.dialog_turn_get(conv_id, 'private')
-            db.conversation_private_arg_update(conv_id , 'turns', conv_turn)
-        db.user_info_update(user_id, 'dialog_turns', 1, True)
-        logger.debug(f"已为{user_id}更新私聊使用记录\r\n输入:{input_tokens}输出:{output_tokens}")
-
-        # --- 修复：从数据库重新获取更新后的额度信息并返回 ---
-        updated_user_info = db.user_info_get(user_id)
-        updated_sign_info = db.user_sign_info_get(user_id)
-        
-        if updated_user_info and updated_sign_info:
-            return (updated_user_info.get('remain_frequency', 0), updated_sign_info.get('frequency', 0))
-        else:
-            # 如果获取失败，返回一个表示可能出错的值或记录日志
-            logger.error(f"更新额度后无法重新获取用户 {user_id} 的信息。")
-            return None
+
+        # 先扣临时额度，不足部分再扣常规额度；增量由累加器合并写入
+        tmp_used = min(max(tmp_frequency, 0), cost)
+        remaining_cost = cost - tmp_used
+        usage_accumulator.add_user(
+            user_id,
+            conv_id=user.active_conversation_id,
+            frequency=-tmp_used,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            remain_frequency=-remaining_cost,
+            dialog_turns=1,
+        )
+        logger.debug("用户 %s 消耗 %s: 临时额度 %s, 常规额度 %s", user_id, cost, tmp_used, remaining_cost)
+        logger.debug("已为%s记录私聊使用量\r\n输入:%s输出:%s", user_id, input_tokens, output_tokens)
+
+        # user 已叠加未写入的增量（见 UsageAccumulator.apply_pending），直接在内存中算出新额度
+        return (user.remain_frequency - remaining_cost, tmp_frequency - tmp_used)
 
     # --- Group Chat & Photo Handling ---
     elif trigger_type == 'group_chat':
@@ -88,10 +72,10 @@ def update_user_usage(user: Any, messages: List[Dict[str, Any]], output: str, tr
             return None
         group_id = user.group.id
         user_id = user.user.id
-        db.group_info_update(group_id, 'call_count', 1, True)
-        db.conversation_group_update(group_id, user_id, 'turns', 1)
-        db.group_info_update(group_id, 'input_token', input_tokens, True)
-        db.group_info_update(group_id, 'output_token', output_tokens, True)
+        usage_accumulator.add_group(
+            group_id, user_id=user_id, turns=1,
+            call_count=1, input_token=input_tokens, output_token=output_tokens,
+        )
         logger.debug(f"已为群组{group_id}更新消息使用记录\r\n输入:{input_tokens}\r\n输出:{output_tokens}")
         return None
 
@@ -100,18 +84,19 @@ def update_user_usage(user: Any, messages: List[Dict[str, Any]], output: str, tr
             logger.error(f"在 {trigger_type} 中, 'user' 参数必须是群组ID (int)。")
             return None
         group_id = user
-        db.group_info_update(group_id, 'call_count', 1, True)
-        db.group_info_update(group_id, 'input_token', input_tokens, True)
-        db.group_info_update(group_id, 'output_token', output_tokens, True)
+        usage_accumulator.add_group(group_id, call_count=1, input_token=input_tokens, output_token=output_tokens)
         logger.debug(f"已为群组{group_id}更新图片分析使用记录\r\n输入:{input_tokens}\r\n输出:{output_tokens}")
         return None
 
 
 
 
-def _get_core_stats():
+def _get_core_stats(query_db: Callable = db.query_db):
     """获取核心统计数据。
 
+    Args:
+        query_db: 执行查询的函数，Web 管理界面传入 web_db.query_db 以包含已归档的群聊消息。
+
     Returns:
         dict: 包含总用户数、总对话数、总消息数、总输入token、总输出token和总token的字典。
     """
@@ -119,37 +104,37 @@ def _get_core_stats():
     
     # 获取总用户数
     stats["total_users"] = (
-        db.query_db("SELECT COUNT(*) FROM users")[0][0]
-        if db.query_db("SELECT COUNT(*) FROM users")
+        query_db("SELECT COUNT(*) FROM users")[0][0]
+        if query_db("SELECT COUNT(*) FROM users")
         else 0
     )
     
     # 获取总对话数
     stats["total_conversations"] = (
-        db.query_db("SELECT COUNT(*) FROM conversations")[0][0]
-        if db.query_db("SELECT COUNT(*) FROM conversations")
+        query_db("SELECT COUNT(*) FROM conversations")[0][0]
+        if query_db("SELECT COUNT(*) FROM conversations")
         else 0
     )
     
     # 获取总消息数
     stats["total_dialogs"] = (
-        db.query_db("SELECT COUNT(*) FROM dialogs")[0][0]
-        if db.query_db("SELECT COUNT(*) FROM dialogs")
+        query_db("SELECT COUNT(*) FROM dialogs")[0][0]
+        if query_db("SELECT COUNT(*) FROM dialogs")
         else 0
     )
     
     # 获取总群聊消息数
     stats["total_group_dialogs"] = (
-        db.query_db("SELECT COUNT(*) FROM group_dialogs")[0][0]
-        if db.query_db("SELECT COUNT(*) FROM group_dialogs")
+        query_db("SELECT COUNT(*) FROM group_dialogs")[0][0]
+        if query_db("SELECT COUNT(*) FROM group_dialogs")
         else 0
     )
     
     # 获取用户和群组的令牌总数
-    user_token_stats = db.query_db(
+    user_token_stats = query_db(
         "SELECT SUM(input_tokens) as input_total, SUM(output_tokens) as output_total FROM users"
     )
-    group_token_stats = db.query_db(
+    group_token_stats = query_db(
         "SELECT SUM(input_token) as input_total, SUM(output_token) as output_total FROM groups"
     )
     
@@ -171,11 +156,12 @@ def _get_core_stats():
     
     return stats
 
-def _get_active_users_and_groups(today):
+def _get_active_users_and_groups(today, query_db: Callable = db.query_db):
     """获取活跃用户和群组。
 
     Args:
         today (str): 当天的日期字符串。
+        query_db: 执行查询的函数。
 
     Returns:
         dict: 包含活跃用户列表和活跃群组列表的字典。
@@ -184,7 +170,7 @@ def _get_active_users_and_groups(today):
     stats = {}
     
     # 获取活跃用户
-    active_users = db.query_db(
+    active_users = query_db(
         """
         SELECT u.uid, u.user_name, u.first_name, u.last_name, COUNT(d.id) as message_count
         FROM users u
@@ -200,7 +186,7 @@ def _get_active_users_and_groups(today):
     stats["active_users"] = active_users or []
     
     # 获取活跃群组
-    active_groups = db.query_db(
+    active_groups = query_db(
         """
         SELECT g.group_id, g.group_name, COUNT(*) as message_count
         FROM groups g
@@ -217,11 +203,12 @@ def _get_active_users_and_groups(today):
     return stats
 
 
-def _get_trends(time_range):
+def _get_trends(time_range, query_db: Callable = db.query_db):
     """获取增长趋势数据。
 
     Args:
         time_range (str): 时间范围，例如 '30d', '7d', '1d'。
+        query_db: 执行查询的函数。
 
     Returns:
         dict: 包含用户增长和对话趋势数据的字典。
@@ -263,7 +250,7 @@ def _get_trends(time_range):
         group_group_format = "date(create_at)"
 
     if time_range == "1d":
-        user_growth = db.query_db("""
+        user_growth = query_db("""
             SELECT strftime('%H:00', create_at) as date, COUNT(*) as count
             FROM users
             WHERE date(create_at) = date('now')
@@ -271,7 +258,7 @@ def _get_trends(time_range):
             ORDER BY strftime('%H', create_at)
         """)
     else:
-        user_growth = db.query_db(f"""
+        user_growth = query_db(f"""
             SELECT {user_date_format} as date, COUNT(*) as count
             FROM users
             WHERE date(create_at) >= date('now', '-{days_back} days')
@@ -281,7 +268,7 @@ def _get_trends(time_range):
     stats["user_growth"] = user_growth or []
 
     if time_range == "1d":
-        dialog_trend = db.query_db("""
+        dialog_trend = query_db("""
             SELECT strftime('%H:00', created_at) as date, COUNT(*) as count
             FROM dialogs
             WHERE date(created_at) = date('now')
@@ -289,7 +276,7 @@ def _get_trends(time_range):
             ORDER BY strftime('%H', created_at)
         """)
     else:
-        dialog_trend = db.query_db(f"""
+        dialog_trend = query_db(f"""
             SELECT {dialog_date_format} as date, COUNT(*) as count
             FROM dialogs
             WHERE date(created_at) >= date('now', '-{days_back} days')
@@ -299,7 +286,7 @@ def _get_trends(time_range):
     stats["dialog_trend"] = dialog_trend or []
 
     if time_range == "1d":
-        group_trend = db.query_db("""
+        group_trend = query_db("""
             SELECT strftime('%H:00', create_at) as date, COUNT(*) as count
             FROM group_dialogs
             WHERE date(create_at) = date('now')
@@ -307,7 +294,7 @@ def _get_trends(time_range):
             ORDER BY strftime('%H', create_at)
         """)
     else:
-        group_trend = db.query_db(f"""
+        group_trend = query_db(f"""
             SELECT {group_date_format} as date, COUNT(*) as count
             FROM group_dialogs
             WHERE date(create_at) >= date('now', '-{days_back} days')
@@ -324,26 +311,32 @@ def _get_trends(time_range):
     return stats
 
 
-def get_dashboard_stats(time_range="7d"):
-    """获取仪表盘的所有统计数据"""
-    stats = _get_core_stats()
+def get_dashboard_stats(time_range="7d", query_db: Callable = db.query_db):
+    """获取仪表盘的所有统计数据
+
+    Args:
+        time_range (str): 时间范围，例如 '30d', '7d', '1d'。
+        query_db: 执行查询的函数，默认使用机器人的连接池；
+            Web 管理界面传入 web_db.query_db，群聊消息统计会包含已归档的记录。
+    """
+    stats = _get_core_stats(query_db)
     
     today = datetime.now().strftime("%Y-%m-%d")
     
     # 获取今日统计
-    today_conversations = db.query_db(
+    today_conversations = query_db(
         "SELECT COUNT(*) FROM conversations WHERE date(create_at) = ?", (today,)
     )
     stats["today_conversations"] = (
         today_conversations[0][0] if today_conversations else 0
     )
     
-    today_dialogs = db.query_db(
+    today_dialogs = query_db(
         "SELECT COUNT(*) FROM dialogs WHERE date(created_at) = ?", (today,)
     )
     stats["today_dialogs"] = today_dialogs[0][0] if today_dialogs else 0
     
-    today_group_dialogs = db.query_db(
+    today_group_dialogs = query_db(
         "SELECT COUNT(*) FROM group_dialogs WHERE date(create_at) = ?", (today,)
     )
     stats["today_group_dialogs"] = (
@@ -363,11 +356,11 @@ def get_dashboard_stats(time_range="7d"):
         stats["today_total_tokens"] = 0
         
     # 获取活跃用户和群组
-    active_stats = _get_active_users_and_groups(today)
+    active_stats = _get_active_users_and_groups(today, query_db)
     stats.update(active_stats)
     
     # 获取趋势数据
-    trend_stats = _get_trends(time_range)
+    trend_stats = _get_trends(time_range, query_db)
     stats.update(trend_stats)
     
     # 为令牌趋势计算，在函数内部临时合并消息趋势
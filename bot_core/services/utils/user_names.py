@@ -0,0 +1,129 @@
+"""
+用户显示名称解析
+
+排行榜等需要一次展示很多用户的场景，统一通过这里把 user_id 解析为显示名称：
+- 先查进程内的 TTL 缓存；
+- 未命中的用户去重后并发调用 get_chat_member（有并发上限）；
+- Telegram 查询失败的用户回退到本地 users 表，仍然没有则显示 "用户{id}"。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telegram import Bot
+
+from bot_core.data_repository.users_repository import UsersRepository
+from utils.config_utils import get_config
+from utils.logging_utils import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def default_name(user_id: int) -> str:
+    return f"用户{user_id}"
+
+
+class UserNameResolver:
+    """
+    用户显示名称解析器，采用单例模式，缓存在所有命令之间共享。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(UserNameResolver, cls).__new__(cls)
+            cls._instance._init_resolver()
+        return cls._instance
+
+    def _init_resolver(self):
+        self.ttl = get_config("telegram.name_cache_ttl", 3600)
+        self.fallback_ttl = get_config("telegram.name_cache_fallback_ttl", 600)
+        self.concurrency = get_config("telegram.name_resolve_concurrency", 5)
+        self.max_entries = 10000
+        # user_id -> (显示名称, 过期时间)
+        self._cache: Dict[int, Tuple[str, float]] = {}
+
+    def get_cached(self, user_id: int) -> Optional[str]:
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._cache[user_id]
+            return None
+        return name
+
+    def remember(self, user_id: int, name: str, ttl: Optional[float] = None) -> None:
+        """写入缓存，其他模块拿到新的用户名时也可以直接调用。"""
+        if not name:
+            return
+        if len(self._cache) >= self.max_entries:
+            now = time.monotonic()
+            self._cache = {uid: e for uid, e in self._cache.items() if e[1] > now}
+            if len(self._cache) >= self.max_entries:
+                self._cache.clear()
+        self._cache[user_id] = (name, time.monotonic() + (ttl or self.ttl))
+
+    async def _fetch_member_name(self, bot: Bot, chat_id: int, user_id: int,
+                                 semaphore: asyncio.Semaphore) -> Optional[str]:
+        async with semaphore:
+            try:
+                member = await bot.get_chat_member(chat_id, user_id)
+                return member.user.first_name or None
+            except Exception as e:
+                logger.debug(f"获取群成员 {user_id} 失败: {e}")
+                return None
+
+    async def resolve(self, bot: Bot, chat_id: int, user_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        批量解析用户显示名称。
+
+        Args:
+            bot: Bot 实例
+            chat_id: 用于 get_chat_member 的群组ID
+            user_ids: 需要解析的用户ID，可以有重复
+
+        Returns:
+            Dict[int, str]: user_id -> 显示名称，所有传入的用户都有值
+        """
+        names: Dict[int, str] = {}
+        missing: List[int] = []
+        for user_id in dict.fromkeys(user_ids):
+            cached = self.get_cached(user_id)
+            if cached is not None:
+                names[user_id] = cached
+            else:
+                missing.append(user_id)
+
+        if missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            fetched = await asyncio.gather(
+                *(self._fetch_member_name(bot, chat_id, uid, semaphore) for uid in missing)
+            )
+            unresolved = []
+            for user_id, name in zip(missing, fetched):
+                if name:
+                    names[user_id] = name
+                    self.remember(user_id, name)
+                else:
+                    unresolved.append(user_id)
+
+            if unresolved:
+                db_result = UsersRepository.user_names_get(unresolved)
+                db_names = db_result["data"] if db_result["success"] else {}
+                for user_id in unresolved:
+                    first_name, user_name = db_names.get(user_id, (None, None))
+                    name = first_name or user_name or default_name(user_id)
+                    names[user_id] = name
+                    # 回退结果只短时间缓存，避免全局榜单里不在本群的用户每次都重新请求 Telegram
+                    self.remember(user_id, name, self.fallback_ttl)
+
+        return names
+
+
+# 全局解析器实例
+user_name_resolver = UserNameResolver()
@@ -1,8 +1,6 @@
+import asyncio
 import logging
-import os
-import subprocess
-import sys
-import threading
+from utils.startup_timer import startup_timer
 from telegram import BotCommand as TelegramBotCommand
 from telegram import BotCommandScopeAllGroupChats, BotCommandScopeDefault, Update
 from telegram.ext import (  # InlineQueryHandler,  # 注释掉内联相关
@@ -16,14 +14,18 @@ import bot_core.message_handlers.group as group_handler
 import bot_core.message_handlers.private as private_handler
 from bot_core.callback_handlers.callback import create_callback_handler  # 修改导入路径
 from bot_core.command_handlers.regist import CommandHandlers
-from utils.config_utils import BOT_TOKEN
+from utils.config_utils import BOT_TOKEN, bind_reload_loop, start_config_watcher
 from bot_core.services.utils.error import BotError
 from utils.logging_utils import setup_logging
 from bot_core.services.utils.error import error_handler
 from bot_core.services.trading.monitor_service import monitor_service
-from bot_core.services.trading.monitor_service import monitor_service
+from bot_core.services.utils.summary import summary_job_queue
+from bot_core.services.utils.deletion_scheduler import deletion_scheduler
+from utils.history_archive import group_dialog_archiver
+from utils.db_maintenance import db_maintenance
 setup_logging()
 logger = logging.getLogger(__name__)
+startup_timer.mark("导入模块(含数据库初始化)")
 
 
 
@@ -65,20 +67,17 @@ def setup_handlers(app: Application) -> None:
         app.add_handler(handler)
 
 
-def start_web_app():
+def start_web_app(loop=None):
     """
-     启动Web管理界面
+     在当前进程内启动Web管理界面（多线程 WSGI 服务器，后台线程运行）
+
+    Args:
+        loop: 机器人的事件循环，Web 请求需要调用 LLM 等协程时提交到该循环
     """
     try:
-        # 获取当前脚本所在目录
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        web_dir = os.path.join(current_dir, "web")
-        app_py_path = os.path.join(web_dir, "app.py")
-
         logger.info("正在启动Web管理界面...")
-
-        # 启动web应用
-        subprocess.run([sys.executable, app_py_path], cwd=web_dir)
+        from web.server import web_server
+        web_server.start(loop)
     except Exception as e:
         logger.error(f"启动Web管理界面失败: {str(e)}", exc_info=True)
 
@@ -91,22 +90,21 @@ def main() -> None:
         1. 初始化应用实例
         2. 设置命令菜单
         3. 注册消息处理器
-        4. 启动Web管理界面（后台线程）
-        5. 启动Bot轮询
+        4. 启动Bot轮询
+        5. 机器人初始化完成后启动Web管理界面（后台线程），避免两个进程同时冷启动
         6. 确保资源正确释放
     """
     try:
-        # 启动Web管理界面（在后台线程中运行）
-        web_thread = threading.Thread(target=start_web_app, daemon=True)
-        web_thread.start()
-        logger.info("Web管理界面已在后台启动")
-
         # 创建 Application 实例
         app = Application.builder().token(BOT_TOKEN).build()
 
         # --- 关键优化：在启动时预加载所有命令处理器 ---
         CommandHandlers.initialize()
         logger.info("所有命令处理器已预加载。")
+        startup_timer.mark("加载命令处理器")
+
+        # 配置文件变化时热加载，读取方始终拿到完整的新快照或旧快照
+        start_config_watcher()
 
         async def setup_command_menu(app_instance: Application) -> None:
             """
@@ -155,6 +153,7 @@ def main() -> None:
 
         # 添加错误处理器
         app.add_error_handler(error_handler)
+        startup_timer.mark("注册处理器")
         
 
         
@@ -170,11 +169,45 @@ def main() -> None:
         # 添加交易监控启动到post_init
         original_post_init = app.post_init
         async def combined_post_init(app_instance: Application) -> None:
+            # 调度器的配置重载回调在本事件循环中执行
+            bind_reload_loop(asyncio.get_running_loop())
             if original_post_init:
                 await original_post_init(app_instance)
+            startup_timer.mark("设置命令菜单")
             await start_trading_monitor(app_instance)
+            startup_timer.mark("启动交易监控")
+            # 启动摘要任务队列，并恢复上次未完成的任务
+            summary_job_queue.start()
+            # 恢复上次未执行的消息自动删除计划
+            deletion_scheduler.start(app_instance.bot)
+            # 在安静时段把过期的群聊消息移到归档库（需在 Web 界面启动前创建归档库）
+            group_dialog_archiver.start()
+            # 监控 WAL 大小并在空闲时执行检查点，定期 PRAGMA optimize
+            db_maintenance.start()
+            startup_timer.report(logger)
+
+            # 启动Web管理界面（在后台线程中运行）
+            start_web_app(asyncio.get_running_loop())
         
         app.post_init = combined_post_init
+
+        async def shutdown_services(app_instance: Application) -> None:
+            """停止Web管理界面和后台调度器，关闭共享的 LLM 连接池"""
+            from web.server import web_server
+            # 停止服务会等待请求线程退出，不能阻塞事件循环（请求可能正在等待本循环中的协程）
+            await asyncio.to_thread(web_server.stop)
+            await summary_job_queue.stop()
+            await deletion_scheduler.stop()
+            await group_dialog_archiver.stop()
+            await db_maintenance.stop()
+            # 事件循环仍在运行时停止用量的后台写入任务并写入剩余增量
+            from utils.usage_accumulator import usage_accumulator
+            await usage_accumulator.aclose()
+            from utils.LLM_utils import llm_client_manager
+            await llm_client_manager.close_all_clients()
+            logger.info("LLM 连接池已关闭")
+
+        app.post_shutdown = shutdown_services
         
         logger.info("机器人初始化完成，准备启动...")
 
@@ -190,15 +223,18 @@ def main() -> None:
             
             # 停止交易监控服务
             try:
-                import asyncio
                 asyncio.create_task(monitor_service.stop_monitoring())
                 logger.info("交易监控服务已停止")
             except Exception as e:
                 logger.error(f"停止交易监控服务失败: {e}")
             
-            # 关闭数据库连接
+            # 写入累积的用量后再关闭数据库连接（通常已在 shutdown_services 中写入）
+            from utils.usage_accumulator import usage_accumulator
+            usage_accumulator.close()
             from utils.db_utils import close_all_connections
             close_all_connections()
+            from utils.image_cache import image_analysis_cache
+            image_analysis_cache.close()
             logger.info("数据库连接已关闭")
     except Exception as e:
         logger.error(f"机器人启动失败: {str(e)}", exc_info=True)
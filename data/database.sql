@@ -24,9 +24,14 @@ create table dialogs
     turn_order        ANY     not null,
     created_at        ANY     not null,
     processed_content ANY,
-    msg_id            integer
+    msg_id            integer,
+    tokens            integer,
+    content_tokens    integer,
+    summary_tokens    integer
 );
 
+create index idx_dialogs_conv on dialogs(conv_id);
+
 create table group_dialogs
 (
     group_id           integer,
@@ -42,6 +47,8 @@ create table group_dialogs
     create_at          ANY
 );
 
+create index idx_group_dialogs_group_msg on group_dialogs(group_id, msg_id);
+
 create table group_user_conversations
 (
     user_id     integer,
@@ -65,9 +72,12 @@ create table group_user_dialogs
     processed_content TEXT,
     id                INTEGER
         constraint id
-            primary key
+            primary key,
+    tokens            integer
 );
 
+create index idx_group_user_dialogs_conv on group_user_dialogs(conv_id);
+
 create table groups
 (
     group_id        integer primary key,
@@ -123,6 +133,7 @@ create table users
     remain_frequency integer,
     balance          REAL
 );
+create index idx_users_uid on users(uid);
 create table dialog_summary
 (
     conv_id      integer not null,
@@ -130,6 +141,48 @@ create table dialog_summary
     content      TEXT
 );
 
+-- 对话摘要任务队列，每个会话同一时间最多一个 queued/running 任务
+create table summary_jobs
+(
+    id           integer not null primary key autoincrement,
+    conv_id      integer not null,
+    status       TEXT not null default 'queued',  -- queued / running / done / failed
+    attempts     integer not null default 0,
+    next_run_at  REAL not null,                    -- 可执行时间(unix 时间戳)，用于退避
+    last_error   TEXT,
+    created_at   REAL not null,
+    started_at   REAL,
+    finished_at  REAL
+);
+create index idx_summary_jobs_status_next on summary_jobs(status, next_run_at);
+create index idx_summary_jobs_conv_status on summary_jobs(conv_id, status);
+
+-- 计划删除的消息，重启后重新加载，见 bot_core/services/utils/deletion_scheduler.py
+create table scheduled_deletions
+(
+    chat_id      integer not null,
+    message_id   integer not null,
+    due_at       REAL not null,                    -- 删除时间(unix 时间戳)
+    primary key (chat_id, message_id)
+);
+create index idx_scheduled_deletions_due on scheduled_deletions(due_at);
+
+-- Agent 长期记忆：会话记忆(session)和经验(experience)，全文索引由 agent/memory_store.py 创建
+create table agent_memories
+(
+    id           integer not null primary key autoincrement,
+    kind         TEXT not null,        -- 'session' 或 'experience'
+    session_id   TEXT,                 -- 会话记忆的会话ID，经验为空
+    content      TEXT not null,        -- JSON 内容
+    search_text  TEXT,                 -- 用于检索的文本
+    tags         TEXT,                 -- 空格分隔的标签
+    created_at   REAL not null,
+    updated_at   REAL not null,
+    expires_at   REAL                  -- 过期时间(unix 时间戳)，为空表示不过期
+);
+create index idx_agent_memories_kind_updated on agent_memories(kind, updated_at);
+create index idx_agent_memories_expires on agent_memories(expires_at);
+
 
 
 create table user_profiles
@@ -141,6 +194,26 @@ create table user_profiles
     primary key (user_id, group_id)
 );
 
+-- 群组用户画像生成进度：已处理到的最大 msg_id 以及上一次生成结果
+create table group_profile_state
+(
+    group_id         integer not null primary key,
+    last_msg_id      integer not null default 0,
+    last_result      TEXT,
+    last_generated   ANY
+);
+
+-- 图片分析目录：data/pics 下每张图片一行，分析结果预览页按 (created_at, id) 键集分页
+create table media_analysis
+(
+    id           integer not null primary key autoincrement,
+    filename     TEXT not null unique,  -- data/pics 下的文件名
+    user_id      integer,
+    created_at   integer not null,      -- 保存时间(unix 时间戳)
+    analysis     TEXT                   -- 分析结果文本，分析完成前为空
+);
+create index idx_media_analysis_created on media_analysis(created_at, id);
+
 -- 模拟盘交易相关表
 -- 用户模拟盘账户表
 create table trading_accounts
@@ -169,6 +242,8 @@ create table trading_accounts
 -- 创建账户表索引
 create index idx_trading_accounts_user on trading_accounts(user_id);
 create index idx_trading_accounts_group on trading_accounts(group_id);
+create index idx_trading_accounts_group_balance on trading_accounts(group_id, balance);
+create index idx_trading_accounts_balance on trading_accounts(balance);
 
 -- 交易订单表
 create table trading_orders
@@ -0,0 +1,5 @@
+"""
+离线压测工具：模拟 Telegram 和 LLM 服务，在本机重放消息流并统计延迟和吞吐。
+
+用法: python -m loadtest --help
+"""
@@ -0,0 +1,74 @@
+"""
+python -m loadtest [参数]
+
+示例：
+    python -m loadtest --messages 500 --rate 50 --rate-limit-ratio 0.02
+    python -m loadtest --updates-file updates.jsonl --db data/data.db --json result.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+from dataclasses import fields
+
+from loadtest.harness import LoadTestOptions, check_offline_ready, format_report, prepare_environment, run
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = LoadTestOptions()
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description="离线压测机器人消息处理链路")
+    workload = parser.add_argument_group("消息流")
+    workload.add_argument("--messages", type=int, default=defaults.messages, help="合成消息条数")
+    workload.add_argument("--private-users", type=int, default=defaults.private_users, help="私聊用户数")
+    workload.add_argument("--groups", type=int, default=defaults.groups, help="群组数")
+    workload.add_argument("--group-users", type=int, default=defaults.group_users, help="群聊发言用户数")
+    workload.add_argument("--private-ratio", type=float, default=defaults.private_ratio, help="私聊消息比例")
+    workload.add_argument("--mention-ratio", type=float, default=defaults.mention_ratio,
+                          help="群聊消息中 @ 机器人的比例")
+    workload.add_argument("--updates-file", default=None,
+                          help="录制的 Update（每行一个 JSON），指定后不再合成消息")
+    workload.add_argument("--rate", type=float, default=defaults.rate, help="提交速率(条/秒)，0 表示一次全部提交")
+    workload.add_argument("--concurrent-updates", type=int, default=defaults.concurrent_updates,
+                          help="同时处理的 Update 数，1 与 Application 默认行为一致")
+    workload.add_argument("--db", default=None, help="以该数据库的副本为初始数据，默认使用空库")
+
+    telegram = parser.add_argument_group("模拟 Telegram")
+    telegram.add_argument("--tg-latency", type=float, default=defaults.tg_latency, help="每次调用的延迟(秒)")
+    telegram.add_argument("--tg-jitter", type=float, default=defaults.tg_jitter, help="随机抖动上限(秒)")
+    telegram.add_argument("--rate-limit-ratio", type=float, default=defaults.rate_limit_ratio,
+                          help="返回 429 的概率")
+    telegram.add_argument("--retry-after", type=int, default=defaults.retry_after, help="429 的 retry_after(秒)")
+
+    llm = parser.add_argument_group("模拟 LLM")
+    llm.add_argument("--llm-tps", type=float, default=defaults.llm_tps, help="流式输出速度(token/秒)")
+    llm.add_argument("--llm-tokens", type=int, default=defaults.llm_tokens, help="每次回复的 token 数")
+    llm.add_argument("--llm-first-token", type=float, default=defaults.llm_first_token, help="首 token 延迟(秒)")
+    llm.add_argument("--llm-concurrency", type=int, default=defaults.llm_concurrency, help="API 并发上限")
+    llm.add_argument("--no-stream", dest="stream", action="store_false", help="私聊使用非流式回复")
+
+    parser.add_argument("--settle", type=float, default=defaults.settle, help="判定回复全部完成的空闲时间(秒)")
+    parser.add_argument("--timeout", type=float, default=defaults.timeout, help="整次压测的最长时间(秒)")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="随机种子")
+    parser.add_argument("--log-level", default=defaults.log_level, help="机器人日志级别")
+    parser.add_argument("--json", default=None, help="把完整结果写入该 JSON 文件")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    options = LoadTestOptions(**{f.name: getattr(args, f.name) for f in fields(LoadTestOptions)})
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        llm_socket = prepare_environment(options, workdir)
+        for warning in check_offline_ready():
+            print(f"警告: {warning}", file=sys.stderr)
+        result = asyncio.run(run(options, llm_socket))
+    print(format_report(result))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+本地 OpenAI 兼容服务
+
+只依赖标准库的 asyncio HTTP/1.1 服务，支持 keep-alive：
+- POST .../chat/completions：stream=true 时按 tokens_per_second 逐个发送 SSE 块（分块传输），否则等生成完后一次返回；
+- GET .../models：返回一个模型。
+
+回复内容由 random.Random(seed) 从固定词表生成，相同参数下每次运行的回复相同。
+"""
+
+import asyncio
+import json
+import random
+import socket
+import time
+from typing import Any, Dict, Optional, Tuple
+
+_WORDS = ["喵", "今天", "天气", "不错", "呢", "，", "要不要", "一起", "去", "散步", "？", "嗯", "好的", "。", "\n"]
+
+
+class FakeLLMServer:
+    """
+    模拟的 OpenAI 兼容服务。
+
+    Args:
+        tokens_per_second: 流式输出速度
+        response_tokens: 每次回复的 token 数
+        first_token_delay: 首个 token 之前的等待(秒)
+        seed: 随机种子
+    """
+
+    def __init__(self, tokens_per_second: float = 100.0, response_tokens: int = 80,
+                 first_token_delay: float = 0.3, seed: int = 0):
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.first_token_delay = first_token_delay
+        self._rng = random.Random(seed)
+        self._server: Optional[asyncio.base_events.Server] = None
+        self.stats = {"requests": 0, "streamed": 0, "tokens": 0, "active": 0, "max_active": 0}
+
+    @staticmethod
+    def bind(host: str = "127.0.0.1", port: int = 0) -> socket.socket:
+        """先绑定端口，便于在导入机器人模块之前把地址写进配置。"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        return sock
+
+    async def start(self, sock: socket.socket) -> None:
+        self._server = await asyncio.start_server(self._handle, sock=sock)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _tokens(self):
+        return [self._rng.choice(_WORDS) for _ in range(self.response_tokens)]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, body = request
+                if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    await self._chat_completions(writer, json.loads(body or b"{}"))
+                elif method == "GET" and path.rstrip("/").endswith("/models"):
+                    self._write_json(writer, 200, {"object": "list", "data": [{"id": "loadtest", "object": "model"}]})
+                else:
+                    self._write_json(writer, 404, {"error": {"message": f"not found: {path}"}})
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+        return method, path, body
+
+    @staticmethod
+    def _write_json(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+
+    async def _chat_completions(self, writer: asyncio.StreamWriter, request: Dict[str, Any]) -> None:
+        stats = self.stats
+        stats["requests"] += 1
+        stats["active"] += 1
+        stats["max_active"] = max(stats["max_active"], stats["active"])
+        try:
+            model = request.get("model", "loadtest")
+            tokens = self._tokens()
+            interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+            created = int(time.time())
+            await asyncio.sleep(self.first_token_delay)
+
+            if not request.get("stream"):
+                await asyncio.sleep(interval * len(tokens))
+                stats["tokens"] += len(tokens)
+                self._write_json(writer, 200, {
+                    "id": "chatcmpl-loadtest",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(tokens)}}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+                })
+                return
+
+            stats["streamed"] += 1
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                         b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n")
+            for index, token in enumerate(tokens):
+                delta = {"role": "assistant", "content": token} if index == 0 else {"content": token}
+                self._write_event(writer, {
+                    "id": "chatcmpl-loadtest",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                })
+                stats["tokens"] += 1
+                await writer.drain()
+                if interval:
+                    await asyncio.sleep(interval)
+            self._write_event(writer, {
+                "id": "chatcmpl-loadtest",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            })
+            self._write_chunk(writer, b"data: [DONE]\n\n")
+            writer.write(b"0\r\n\r\n")
+        finally:
+            stats["active"] -= 1
+
+    def _write_event(self, writer: asyncio.StreamWriter, payload: Dict[str, Any]) -> None:
+        self._write_chunk(writer, f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode())
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: bytes) -> None:
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
@@ -0,0 +1,243 @@
+"""
+离线 Telegram Bot API
+
+实现 python-telegram-bot 的 BaseRequest，不访问网络：
+- 每个 API 调用按 latency + 随机抖动 等待后返回合法的 JSON 结果（发送/编辑类返回 Message，其余返回 True）；
+- 按 rate_limit_ratio 的概率返回 429 和 retry_after，由 PTB 转换为 RetryAfter，用来检验发送调度器的退避；
+- 记录所有调用，用于统计每条用户消息的回复完成时间。
+
+延迟和 429 由 (种子, 方法, chat_id, 该聊天该方法的第几次调用) 决定，与并发下的调用先后无关，
+相同参数下每次运行注入的位置相同。
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_ID = 7000000001
+BOT_USERNAME = "loadtest_bot"
+BOT_USER = {"id": BOT_ID, "is_bot": True, "first_name": "LoadTest", "username": BOT_USERNAME}
+
+# 返回 Message 的方法前缀；其余方法返回 True
+_MESSAGE_METHODS = ("send", "edit", "forward", "copy")
+
+
+class CallRecorder:
+    """
+    记录 Bot API 调用。
+
+    消息 ID 由这里统一分配，合成的用户消息和机器人发出的消息共用同一个计数器，不会冲突。
+    """
+
+    def __init__(self):
+        self._message_ids = itertools.count(1)
+        self.calls: Counter = Counter()
+        self.rate_limited: Counter = Counter()
+        # (chat_id, 用户消息ID) -> 回复它的机器人消息ID
+        self.replies: Dict[Tuple[int, int], int] = {}
+        # chat_id -> 正在处理、尚未得到回复的用户消息ID
+        self._handling: Dict[int, List[int]] = {}
+        # (chat_id, 机器人消息ID) -> 最后一次发送/编辑的时间
+        self.last_touch: Dict[Tuple[int, int], float] = {}
+        self.last_activity = time.monotonic()
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    def begin_update(self, chat_id: int, message_id: int) -> None:
+        """
+        标记开始处理一条用户消息。
+
+        私聊的 reply_text 默认不引用原消息，处理期间该聊天中第一条没有引用的发送视为这条消息的回复
+        （占位消息在处理器内发送，之后的流式编辑都落在这条消息上）。
+        """
+        self._handling.setdefault(chat_id, []).append(message_id)
+
+    def end_update(self, chat_id: int, message_id: int) -> None:
+        handling = self._handling.get(chat_id)
+        if handling and message_id in handling:
+            handling.remove(message_id)
+
+    def link_reply(self, chat_id: int, reply_to: Optional[int], message_id: int) -> None:
+        handling = self._handling.get(chat_id)
+        if reply_to is None:
+            if not handling:
+                return
+            reply_to = handling[0]
+        if handling and reply_to in handling:
+            handling.remove(reply_to)
+        self.replies.setdefault((chat_id, int(reply_to)), message_id)
+
+    def reply_finished_at(self, chat_id: int, message_id: int) -> Optional[float]:
+        """用户消息的回复最后一次更新的时间，没有回复时返回 None。"""
+        reply_id = self.replies.get((chat_id, message_id))
+        if reply_id is None:
+            return None
+        return self.last_touch.get((chat_id, reply_id))
+
+
+def _chat(chat_id: int) -> Dict[str, Any]:
+    if chat_id < 0:
+        return {"id": chat_id, "type": "supergroup", "title": f"group{-chat_id}"}
+    return {"id": chat_id, "type": "private", "first_name": f"user{chat_id}"}
+
+
+def _reply_to(params: Dict[str, Any]) -> Optional[int]:
+    reply_parameters = params.get("reply_parameters")
+    if isinstance(reply_parameters, str):
+        reply_parameters = json.loads(reply_parameters)
+    if isinstance(reply_parameters, dict):
+        return reply_parameters.get("message_id")
+    return params.get("reply_to_message_id")
+
+
+class FakeTelegramRequest(BaseRequest):
+    """
+    不访问网络的 BaseRequest。
+
+    Args:
+        recorder: 调用记录，多个实例（bot 请求和 get_updates 请求）可以共用
+        latency: 每次调用的基础延迟(秒)
+        jitter: 额外的随机延迟上限(秒)
+        rate_limit_ratio: 返回 429 的概率
+        retry_after: 429 响应中的 retry_after(秒)
+        seed: 随机种子
+    """
+
+    def __init__(self, recorder: CallRecorder, latency: float = 0.05, jitter: float = 0.02,
+                 rate_limit_ratio: float = 0.0, retry_after: int = 1, seed: int = 0):
+        self.recorder = recorder
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.seed = seed
+        self._sequence: Counter = Counter()
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return 5.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        key = (api_method, params.get("chat_id"))
+        self._sequence[key] += 1
+        rng = random.Random(f"{self.seed}:{api_method}:{key[1]}:{self._sequence[key]}")
+        delay = self.latency + rng.random() * self.jitter
+        limited = api_method not in ("getMe", "getUpdates") and rng.random() < self.rate_limit_ratio
+
+        await asyncio.sleep(delay)
+        recorder = self.recorder
+        recorder.calls[api_method] += 1
+        recorder.last_activity = time.monotonic()
+        if limited:
+            recorder.rate_limited[api_method] += 1
+            body = {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+            return 429, json.dumps(body).encode()
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+
+    def _result(self, api_method: str, params: Dict[str, Any]) -> Any:
+        if api_method == "getMe":
+            return BOT_USER
+        if api_method == "getUpdates":
+            return []
+
+        chat_id = params.get("chat_id")
+        chat_id = int(chat_id) if chat_id is not None else 0
+        if api_method == "getChat":
+            # Bot API 7.3 起 getChat 返回 ChatFullInfo，这两个字段是必填的
+            return {**_chat(chat_id), "accent_color_id": 0, "max_reaction_count": 11}
+        if api_method == "getChatAdministrators":
+            return [{"status": "creator", "is_anonymous": False,
+                     "user": {"id": 1, "is_bot": False, "first_name": "owner"}}]
+        if not api_method.startswith(_MESSAGE_METHODS):
+            return True
+        if params.get("inline_message_id"):
+            return True
+
+        recorder = self.recorder
+        if api_method.startswith("edit"):
+            message_id = int(params["message_id"])
+        else:
+            message_id = recorder.next_message_id()
+            recorder.link_reply(chat_id, _reply_to(params), message_id)
+        recorder.last_touch[(chat_id, message_id)] = time.monotonic()
+
+        message: Dict[str, Any] = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        if api_method.startswith("edit"):
+            message["edit_date"] = int(time.time())
+        return message
+
+
+def build_message_update(recorder: CallRecorder, update_id: int, chat_id: int, user_id: int,
+                         text: str) -> Dict[str, Any]:
+    """构造一条文本消息的 Update JSON，日期在提交时再改写为当前时间。"""
+    user: Dict[str, Any] = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}",
+                            "username": f"user{user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": recorder.next_message_id(),
+            "date": int(time.time()),
+            "chat": _chat(chat_id) if chat_id < 0 else {**_chat(chat_id), "username": user["username"]},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+def load_recorded_updates(path: str, recorder: CallRecorder) -> List[Dict[str, Any]]:
+    """
+    读取录制的 Update（每行一个 Bot API 的 Update JSON）。
+
+    消息ID重新分配，避免和机器人发出的消息冲突；日期在提交时改写。
+    """
+    updates = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            message = data.get("message")
+            if message is None:
+                continue
+            message["message_id"] = recorder.next_message_id()
+            updates.append(data)
+    return updates
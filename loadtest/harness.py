@@ -0,0 +1,312 @@
+"""
+离线压测
+
+把合成的或录制的 Update 流送进机器人注册的处理器（与 bot_run 相同的 setup_handlers 和命令表），
+Telegram 和 LLM 分别由 fake_telegram / fake_llm 在本进程内模拟，不访问网络，数据库使用临时文件。
+
+prepare_environment 必须在导入任何机器人模块之前调用：它把模拟服务的地址、临时数据库等写进覆盖配置
+（环境变量 CONFIG_OVERLAY / DB_PATH），并给 SQLite 连接装上计时。
+
+输出：
+- 处理器耗时 p50/p95/p99（process_update 本身，不含后台生成回复的任务）；
+- 回复耗时 p50/p95/p99（提交 Update 到机器人最后一次发送/编辑该回复）；
+- 每条消息的数据库耗时和语句数；
+- LLM 排队等待（llm_scheduler 统计）；
+- 消息吞吐（条/秒）、Bot API 调用和注入的 429 次数。
+"""
+
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from loadtest.fake_llm import FakeLLMServer
+from loadtest.metrics import db_timer, percentiles
+
+LOADTEST_API = "loadtest"
+
+
+@dataclass
+class LoadTestOptions:
+    """压测参数，含义见 python -m loadtest --help。"""
+
+    private_users: int = 20
+    groups: int = 5
+    group_users: int = 10
+    messages: int = 200
+    private_ratio: float = 0.5
+    mention_ratio: float = 0.3
+    rate: float = 20.0
+    concurrent_updates: int = 1
+    updates_file: Optional[str] = None
+    db: Optional[str] = None
+    tg_latency: float = 0.05
+    tg_jitter: float = 0.02
+    rate_limit_ratio: float = 0.0
+    retry_after: int = 1
+    llm_tps: float = 100.0
+    llm_tokens: int = 80
+    llm_first_token: float = 0.3
+    llm_concurrency: int = 5
+    stream: bool = True
+    settle: float = 2.0
+    timeout: float = 300.0
+    seed: int = 0
+    log_level: str = "WARNING"
+
+
+def prepare_environment(options: LoadTestOptions, workdir: str) -> socket.socket:
+    """
+    准备临时数据库和覆盖配置，返回模拟 LLM 服务已绑定的套接字。
+
+    Args:
+        options: 压测参数
+        workdir: 临时目录，存放数据库、覆盖配置和日志
+    """
+    db_path = os.path.join(workdir, "loadtest.db")
+    if options.db:
+        shutil.copyfile(options.db, db_path)
+
+    llm_socket = FakeLLMServer.bind()
+    port = llm_socket.getsockname()[1]
+    overlay = {
+        "TG_TOKEN": "7000000001:LOADTEST",
+        "ADMIN": [],
+        "api_list": [{
+            "name": LOADTEST_API,
+            "key": "sk-loadtest",
+            "url": f"http://127.0.0.1:{port}/v1/",
+            "model": "loadtest",
+            "group": 0,
+            "multiple": 1,
+            "concurrency": options.llm_concurrency,
+        }],
+        "api": {"default_api": LOADTEST_API, "q_command_api": LOADTEST_API},
+        "fuck_or_not_api": LOADTEST_API,
+        "user": {"default_stream": "yes" if options.stream else "no"},
+        "database": {"default_path": db_path},
+        "config": {"reload_interval": 0},
+        "logging": {
+            "console_level": options.log_level,
+            "file_level": options.log_level,
+            "file": os.path.join(workdir, "loadtest.log"),
+        },
+    }
+    overlay_path = os.path.join(workdir, "overlay.json")
+    with open(overlay_path, "w", encoding="utf-8") as f:
+        json.dump(overlay, f, ensure_ascii=False, indent=2)
+
+    os.environ["CONFIG_OVERLAY"] = overlay_path
+    os.environ["DB_PATH"] = db_path
+    db_timer.install()
+    return llm_socket
+
+
+def check_offline_ready() -> List[str]:
+    """检查离线运行时会访问网络的依赖，返回警告信息。"""
+    warnings = []
+    try:
+        import tiktoken
+
+        tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        warnings.append(
+            "tiktoken 的 cl100k_base 编码文件不可用：token 计数会退化为字符数，且每次计数都会尝试下载，"
+            "耗时不可比。请在联网环境预先下载并通过 TIKTOKEN_CACHE_DIR 指定缓存目录。"
+        )
+    return warnings
+
+
+def build_workload(options: LoadTestOptions, recorder) -> List[Dict[str, Any]]:
+    """按种子生成私聊和群聊消息，群聊中 mention_ratio 比例的消息 @ 机器人。"""
+    from loadtest.fake_telegram import BOT_USERNAME, build_message_update, load_recorded_updates
+
+    if options.updates_file:
+        return load_recorded_updates(options.updates_file, recorder)
+
+    rng = random.Random(options.seed)
+    updates = []
+    for update_id in range(1, options.messages + 1):
+        private = options.groups <= 0 or (options.private_users > 0 and rng.random() < options.private_ratio)
+        if private:
+            user_id = 100000 + rng.randrange(options.private_users)
+            chat_id = user_id
+            text = f"你好，这是第 {update_id} 条消息"
+        else:
+            chat_id = -1000000000000 - rng.randrange(options.groups)
+            user_id = 200000 + rng.randrange(options.group_users)
+            text = f"群聊消息 {update_id}"
+            if rng.random() < options.mention_ratio:
+                text = f"@{BOT_USERNAME} {text}"
+        updates.append(build_message_update(recorder, update_id, chat_id, user_id, text))
+    return updates
+
+
+def _background_idle(recorder, fake_llm: FakeLLMServer, settle: float) -> bool:
+    from bot_core.services.utils.tg_scheduler import send_scheduler
+    from utils.llm_scheduler import llm_scheduler
+
+    lanes = llm_scheduler.get_stats()["apis"].values()
+    return (
+        fake_llm.stats["active"] == 0
+        and all(lane["active"] == 0 and lane["queued"] == 0 for lane in lanes)
+        and send_scheduler.get_stats()["pending_edits"] == 0
+        and time.monotonic() - recorder.last_activity >= settle
+    )
+
+
+async def run(options: LoadTestOptions, llm_socket: socket.socket) -> Dict[str, Any]:
+    """执行一次压测并返回结果。"""
+    from telegram import Update
+    from telegram.ext import Application
+
+    import bot_run
+    from bot_core.command_handlers.regist import CommandHandlers
+    from bot_core.services.utils.deletion_scheduler import deletion_scheduler
+    from bot_core.services.utils.error import error_handler
+    from bot_core.services.utils.tg_scheduler import send_scheduler
+    from loadtest.fake_telegram import CallRecorder, FakeTelegramRequest
+    from utils.config_utils import BOT_TOKEN
+    from utils.LLM_utils import llm_client_manager
+    from utils.llm_scheduler import llm_scheduler
+
+    # 群聊随机回复使用全局 random
+    random.seed(options.seed)
+    recorder = CallRecorder()
+    fake_llm = FakeLLMServer(options.llm_tps, options.llm_tokens, options.llm_first_token, options.seed)
+    await fake_llm.start(llm_socket)
+
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(FakeTelegramRequest(recorder, options.tg_latency, options.tg_jitter,
+                                     options.rate_limit_ratio, options.retry_after, options.seed))
+        .get_updates_request(FakeTelegramRequest(recorder, seed=options.seed + 1))
+        .build()
+    )
+    CommandHandlers.initialize()
+    bot_run.setup_handlers(app)
+    app.add_error_handler(error_handler)
+    await app.initialize()
+    await app.start()
+
+    updates = build_workload(options, recorder)
+    # Application 默认顺序处理 Update，concurrent_updates > 1 对应 concurrent_updates(N)
+    semaphore = asyncio.Semaphore(max(1, options.concurrent_updates))
+    handler_seconds: List[float] = []
+    submitted: Dict[Tuple[int, int], float] = {}
+
+    async def process(data: Dict[str, Any]) -> None:
+        async with semaphore:
+            message = data["message"]
+            message["date"] = int(time.time())
+            update = Update.de_json(data, app.bot)
+            recorder.begin_update(message["chat"]["id"], message["message_id"])
+            start = time.monotonic()
+            try:
+                await app.process_update(update)
+            finally:
+                handler_seconds.append(time.monotonic() - start)
+                recorder.end_update(message["chat"]["id"], message["message_id"])
+
+    db_before = db_timer.snapshot()
+    started = time.monotonic()
+    tasks = []
+    for index, data in enumerate(updates):
+        if options.rate > 0:
+            delay = started + index / options.rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        message = data["message"]
+        submitted[(message["chat"]["id"], message["message_id"])] = time.monotonic()
+        tasks.append(asyncio.create_task(process(data)))
+    await asyncio.gather(*tasks, return_exceptions=True)
+    handled = time.monotonic()
+
+    # 处理器返回后，回复在后台任务中生成；等 LLM、发送队列和 Bot API 都空闲后再统计
+    timed_out = False
+    while not _background_idle(recorder, fake_llm, options.settle):
+        if time.monotonic() - started > options.timeout:
+            timed_out = True
+            break
+        await asyncio.sleep(0.1)
+    finished = max(handled, recorder.last_activity)
+    db_after = db_timer.snapshot()
+
+    reply_seconds = []
+    for (chat_id, message_id), submitted_at in submitted.items():
+        finished_at = recorder.reply_finished_at(chat_id, message_id)
+        if finished_at is not None:
+            reply_seconds.append(finished_at - submitted_at)
+
+    elapsed = max(finished - started, 1e-9)
+    count = len(updates)
+    db_seconds = db_after["seconds"] - db_before["seconds"]
+    result = {
+        "options": asdict(options),
+        "updates": count,
+        "replies": len(reply_seconds),
+        "elapsed_seconds": round(elapsed, 3),
+        "timed_out": timed_out,
+        "messages_per_second": round(count / elapsed, 2),
+        "replies_per_second": round(len(reply_seconds) / elapsed, 2),
+        "handler_latency_ms": percentiles(handler_seconds),
+        "reply_latency_ms": percentiles(reply_seconds),
+        "db": {
+            "ms_per_message": round(db_seconds * 1000 / count, 3) if count else 0.0,
+            "statements_per_message": round((db_after["statements"] - db_before["statements"]) / count, 1)
+            if count else 0.0,
+            "total_seconds": round(db_seconds, 3),
+        },
+        "llm_queue_wait": llm_scheduler.get_stats()["queue_wait"],
+        "llm_server": fake_llm.get_stats(),
+        "telegram": {"calls": dict(recorder.calls), "rate_limited": dict(recorder.rate_limited)},
+        "send_scheduler": send_scheduler.get_stats(),
+    }
+
+    await app.stop()
+    await app.shutdown()
+    await deletion_scheduler.stop()
+    await llm_client_manager.close_all_clients()
+    await fake_llm.stop()
+
+    from utils.usage_accumulator import usage_accumulator
+    from utils.db_utils import close_all_connections
+    await usage_accumulator.aclose()
+    close_all_connections()
+    return result
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    """把结果整理成便于阅读的文本。"""
+    handler = result["handler_latency_ms"]
+    reply = result["reply_latency_ms"]
+    lines = [
+        f"消息数: {result['updates']}，得到回复: {result['replies']}，"
+        f"耗时: {result['elapsed_seconds']}s{'（等待回复超时）' if result['timed_out'] else ''}",
+        f"吞吐: {result['messages_per_second']} 条/秒，回复 {result['replies_per_second']} 条/秒",
+        f"处理器耗时(ms): p50={handler['p50']} p95={handler['p95']} p99={handler['p99']} max={handler['max']}",
+        f"回复耗时(ms):   p50={reply['p50']} p95={reply['p95']} p99={reply['p99']} max={reply['max']}",
+        f"数据库: 每条消息 {result['db']['ms_per_message']}ms / {result['db']['statements_per_message']} 条语句，"
+        f"共 {result['db']['total_seconds']}s",
+    ]
+    for priority, wait in result["llm_queue_wait"].items():
+        if wait["count"]:
+            lines.append(
+                f"LLM 排队({priority}): {wait['count']} 次，平均 {wait['avg_wait']}s，"
+                f"p95 {wait['p95_wait']}s，最长 {wait['max_wait']}s，放弃 {wait['dropped']}"
+            )
+    llm = result["llm_server"]
+    lines.append(f"模拟 LLM: {llm['requests']} 次请求（流式 {llm['streamed']}），{llm['tokens']} tokens，"
+                 f"最大并发 {llm['max_active']}")
+    calls = ", ".join(f"{name}={n}" for name, n in sorted(result["telegram"]["calls"].items()))
+    lines.append(f"Bot API: {calls}")
+    if result["telegram"]["rate_limited"]:
+        limited = ", ".join(f"{name}={n}" for name, n in sorted(result["telegram"]["rate_limited"].items()))
+        lines.append(f"注入 429: {limited}")
+    return "\n".join(lines)
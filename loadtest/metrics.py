@@ -0,0 +1,116 @@
+"""
+压测指标
+
+- DbTimer：替换 sqlite3.connect 的默认连接类，统计所有语句的执行和取数耗时；
+  必须在导入 utils.db_utils 之前安装，之后创建的连接都会计时；
+- percentiles：延迟分位数。
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable
+
+
+class DbTimer:
+    """统计 SQLite 耗时，多线程共用，累加时加锁。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = 0.0
+        self.statements = 0
+        self._original_connect = None
+
+    def add(self, elapsed: float, statements: int = 0) -> None:
+        with self._lock:
+            self.seconds += elapsed
+            self.statements += statements
+
+    def install(self) -> None:
+        if self._original_connect is not None:
+            return
+        timer = self
+
+        class _TimedCursor(sqlite3.Cursor):
+            def execute(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return super().execute(*args, **kwargs)
+                finally:
+                    timer.add(time.perf_counter() - start, 1)
+
+            def executemany(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return super().executemany(*args, **kwargs)
+                finally:
+                    timer.add(time.perf_counter() - start, 1)
+
+            def fetchone(self):
+                start = time.perf_counter()
+                try:
+                    return super().fetchone()
+                finally:
+                    timer.add(time.perf_counter() - start)
+
+            def fetchmany(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return super().fetchmany(*args, **kwargs)
+                finally:
+                    timer.add(time.perf_counter() - start)
+
+            def fetchall(self):
+                start = time.perf_counter()
+                try:
+                    return super().fetchall()
+                finally:
+                    timer.add(time.perf_counter() - start)
+
+        class _TimedConnection(sqlite3.Connection):
+            def cursor(self, factory=_TimedCursor):
+                return super().cursor(factory)
+
+            def execute(self, *args, **kwargs):
+                return self.cursor().execute(*args, **kwargs)
+
+            def executemany(self, *args, **kwargs):
+                return self.cursor().executemany(*args, **kwargs)
+
+            def commit(self):
+                start = time.perf_counter()
+                try:
+                    return super().commit()
+                finally:
+                    timer.add(time.perf_counter() - start)
+
+        original = sqlite3.connect
+        self._original_connect = original
+
+        def connect(*args, **kwargs):
+            kwargs.setdefault("factory", _TimedConnection)
+            return original(*args, **kwargs)
+
+        sqlite3.connect = connect
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {"seconds": self.seconds, "statements": self.statements}
+
+
+def percentiles(samples: Iterable[float], points=(50, 95, 99)) -> Dict[str, float]:
+    """最近秩法计算分位数(毫秒)，没有样本时为 0。"""
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        if not ordered:
+            result[f"p{point}"] = 0.0
+            continue
+        index = max(0, min(len(ordered) - 1, -(-len(ordered) * point // 100) - 1))
+        result[f"p{point}"] = round(ordered[index] * 1000, 1)
+    result["max"] = round(ordered[-1] * 1000, 1) if ordered else 0.0
+    return result
+
+
+# 进程内共用的计时器
+db_timer = DbTimer()
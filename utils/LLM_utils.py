@@ -1,19 +1,23 @@
 import asyncio
 import base64
+import importlib.util
 import json
 import logging
 import time
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import httpx
 import openai
-import tiktoken
 
 # 避免循环导入
 import utils.db_utils as db
 import utils.file_utils as file
 import utils.text_utils as txt
 from utils.config_utils import DEFAULT_API, get_api_config, get_config
+from utils.context_budget import (count_message_tokens, count_tokens, dialog_forms, get_context_budget,
+                                  pack_history, preferred_form, select_summaries)
+from utils.llm_scheduler import PRIORITY_INTERACTIVE, llm_scheduler
+from utils.metrics import metrics
 from utils.logging_utils import setup_logging
 
 setup_logging()
@@ -26,17 +30,19 @@ class LLMClientManager:
 
     特性:
     - 线程安全的客户端创建和获取
-    - 并发控制(最大并发数为3)
-    - 客户端连接池管理
+    - 每个上游(scheme://host:port)一个共享的 httpx 连接池，不同 API key、模型共用，
+      减少重复的 TLS 握手；连接数、keep-alive 时长和 HTTP/2 由 api.http_* 配置
+    - 记录每个上游的请求数、错误数和当前连接数，见 get_stats
+
+    并发控制由 utils.llm_scheduler.llm_scheduler 负责。
     """
 
     _instance = None
-    _clients: Dict[Tuple[str, str, str], openai.AsyncOpenAI] = (
+    _clients: Dict[Tuple[str, str], openai.AsyncOpenAI] = (
         {}
-    )  # 客户端连接池，键为(api_key, base_url, model)
-    _semaphore: asyncio.Semaphore = asyncio.Semaphore(
-        get_config("api.semaphore_limit", 5)
-    )  # 并发控制信号量
+    )  # 客户端，键为(api_key, base_url)
+    _pools: Dict[str, httpx.AsyncClient] = {}  # 共享连接池，键为上游地址
+    _pool_stats: Dict[str, Dict[str, int]] = {}
     _lock = asyncio.Lock()  # 客户端操作锁
 
     def __new__(cls):
@@ -47,6 +53,39 @@ class LLMClientManager:
             cls._instance = super(LLMClientManager, cls).__new__(cls)
         return cls._instance
 
+    @staticmethod
+    def _upstream(base_url: str) -> str:
+        url = httpx.URL(base_url)
+        port = f":{url.port}" if url.port else ""
+        return f"{url.scheme}://{url.host}{port}"
+
+    def _create_pool(self, upstream: str) -> httpx.AsyncClient:
+        """为上游创建连接池，启用 HTTP/2 需要安装 h2。"""
+        http2 = get_config("api.http2", False)
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("配置启用了 HTTP/2，但未安装 h2，回退到 HTTP/1.1")
+            http2 = False
+        limits = httpx.Limits(
+            max_connections=get_config("api.http_max_connections", 50),
+            max_keepalive_connections=get_config("api.http_max_keepalive", 20),
+            keepalive_expiry=get_config("api.http_keepalive_expiry", 60),
+        )
+        stats = self._pool_stats.setdefault(upstream, {"requests": 0, "errors": 0})
+
+        async def on_request(request: httpx.Request) -> None:
+            stats["requests"] += 1
+
+        async def on_response(response: httpx.Response) -> None:
+            if response.status_code >= 400:
+                stats["errors"] += 1
+
+        logger.info(f"为 {upstream} 创建连接池, http2={http2}, limits={limits}")
+        return httpx.AsyncClient(
+            limits=limits,
+            http2=http2,
+            event_hooks={"request": [on_request], "response": [on_response]},
+        )
+
     async def get_client(
         self, api_key: str, base_url: str, model: str
     ) -> openai.AsyncOpenAI:
@@ -56,7 +95,7 @@ class LLMClientManager:
         Args:
             api_key: API密钥
             base_url: API基础URL
-            model: 模型名称
+            model: 模型名称（同一 key 和 base_url 的不同模型共用客户端）
 
         Returns:
             openai.AsyncOpenAI: 配置好的异步客户端
@@ -64,13 +103,19 @@ class LLMClientManager:
         Raises:
             ValueError: 客户端初始化失败时抛出
         """
+        client_key = (api_key, base_url)
+        client = self._clients.get(client_key)
+        if client is not None:
+            return client
         async with self._lock:
-            client_key = (api_key, base_url, model)
             if client_key not in self._clients:
                 try:
-                    http_client = httpx.AsyncClient()
+                    upstream = self._upstream(base_url)
+                    pool = self._pools.get(upstream)
+                    if pool is None or pool.is_closed:
+                        pool = self._pools[upstream] = self._create_pool(upstream)
                     self._clients[client_key] = openai.AsyncOpenAI(
-                        api_key=api_key, base_url=base_url, http_client=http_client
+                        api_key=api_key, base_url=base_url, http_client=pool
                     )
                 except Exception as e:
                     raise ValueError(f"客户端初始化失败: {str(e)}")
@@ -78,41 +123,60 @@ class LLMClientManager:
 
     async def close_all_clients(self):
         """
-        关闭所有已创建的LLM客户端连接并清空连接池。
+        关闭所有共享连接池并清空客户端。
         """
         async with self._lock:
-            for client in self._clients.values():
-                await client.close()
+            # 客户端共用连接池，只需逐个关闭连接池
+            for pool in self._pools.values():
+                await pool.aclose()
+            self._pools.clear()
             self._clients.clear()
 
-    @property
-    def semaphore(self) -> asyncio.Semaphore:
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
         """
-        获取用于控制并发请求的信号量。
-        
-        Returns:
-            asyncio.Semaphore: 并发信号量。
+        每个上游的连接池统计: 客户端数、请求数、错误响应数、当前连接数和空闲连接数。
         """
-        return self._semaphore
+        stats = {}
+        for upstream, pool in self._pools.items():
+            # httpx 没有公开连接池状态，从底层 httpcore 连接池读取，取不到时记为 0
+            connections = getattr(getattr(pool, "_transport", None), "_pool", None)
+            connections = getattr(connections, "connections", []) or []
+            stats[upstream] = {
+                **self._pool_stats.get(upstream, {}),
+                "clients": sum(1 for _, url in self._clients if self._upstream(url) == upstream),
+                "connections": len(connections),
+                "idle_connections": sum(1 for conn in connections if conn.is_idle()),
+            }
+        return stats
 
 
 # 全局客户端管理器实例
 llm_client_manager = LLMClientManager()
+metrics.register_collector("llm_client_manager", llm_client_manager.get_stats)
 
 
 class LLM:
     """
     LLM类用于处理与大型语言模型（LLM）的交互，包括构建消息、发送请求和处理响应。
     """
-    def __init__(self, api=DEFAULT_API, chat_type="private"):
+    def __init__(self, api=DEFAULT_API, chat_type="private",
+                 priority: int = PRIORITY_INTERACTIVE, user_id: Optional[int] = None,
+                 deadline: Optional[float] = None):
         """
         初始化LLM实例。
 
         Args:
             api (str): API名称，默认为DEFAULT_API。
             chat_type (str): 聊天类型，'private' 或 'group'。
+            priority (int): 调度优先级，见 utils.llm_scheduler。
+            user_id (int, optional): 发起请求的用户ID，用于同优先级内的公平调度。
+            deadline (float, optional): 最长排队秒数，超过则抛出 LLMQueueTimeout。
         """
+        self.api = api
         self.key, self.base_url, self.model = get_api_config(api)
+        self.priority = priority
+        self.user_id = user_id
+        self.deadline = deadline
         self.client = None
         self.messages = []
         self.chat_type = chat_type
@@ -167,6 +231,7 @@ class LLM:
         """
         将LLM实例的API配置重置为默认API。
         """
+        self.api = DEFAULT_API
         self.key, self.base_url, self.model = get_api_config(DEFAULT_API)
 
     async def response(self, stream: bool = False):
@@ -181,11 +246,16 @@ class LLM:
 
         Raises:
             RuntimeError: API调用失败时抛出。
+            LLMQueueTimeout: 排队时间超过 deadline 时抛出。
         """
         self.client = await llm_client_manager.get_client(
             self.key, self.base_url, self.model
         )
-        async with llm_client_manager.semaphore:
+        waiting_since = time.perf_counter()
+        async with llm_scheduler.slot(self.api, self.priority, self.user_id, self.deadline):
+            started = time.perf_counter()
+            metrics.observe("llm_slot_wait_seconds", started - waiting_since, api=self.api)
+            first_token = True
             try:
                 if stream:
                     response_stream = await self.client.chat.completions.create(
@@ -200,6 +270,9 @@ class LLM:
                             and chunk.choices[0].delta
                             and chunk.choices[0].delta.content
                         ):
+                            if first_token:
+                                first_token = False
+                                metrics.observe("llm_first_token_seconds", time.perf_counter() - started, api=self.api)
                             yield chunk.choices[0].delta.content
                 else:
                     response_completion = await self.client.chat.completions.create(
@@ -208,10 +281,14 @@ class LLM:
                         max_tokens=get_config("api.max_tokens", 8000),
                         stream=False,
                     )
+                    metrics.observe("llm_first_token_seconds", time.perf_counter() - started, api=self.api)
                     if response_completion.choices and response_completion.choices[0].message:
                         yield response_completion.choices[0].message.content
             except Exception as e:
+                metrics.inc("llm_errors_total", api=self.api)
                 raise RuntimeError(f"API调用失败 (stream): {str(e)}")
+            finally:
+                metrics.observe("llm_request_seconds", time.perf_counter() - started, api=self.api)
 
     async def final_response(self):
         """
@@ -221,12 +298,9 @@ class LLM:
             str: 完整的响应内容。
         """
         response_chunks = []
-        response = ""
         async for chunk in self.response():
             response_chunks.append(chunk)
-            response = "".join(response_chunks)
-            await asyncio.sleep(0.01)
-        return response
+        return "".join(response_chunks)
 
 
 
@@ -241,12 +315,7 @@ class LLM:
         Returns:
             int: token数量，如果计算失败则返回字符串长度
         """
-        try:
-            encoder = tiktoken.get_encoding("cl100k_base")
-            return len(encoder.encode(text))
-        except Exception as e:
-            print(f"错误: 计算token时发生错误 - {e}. 输出为字符串长度。")
-            return len(str(text))
+        return count_tokens(text)
 
 
 class PromptCache:
@@ -349,7 +418,8 @@ class PromptsBuilder:
     def __init__(self, prompts_set:Optional[str], input_txt:Optional[str],
                  character:Optional[str],
                  user_nick:Optional[str],
-                 chat_type:str="private"):
+                 chat_type:str="private",
+                 api:Optional[str]=None):
         """初始化PromptsBuilder实例。
 
         Args:
@@ -360,15 +430,19 @@ class PromptsBuilder:
             user_nick: 用户昵称。
             summary: 对话总结。
             chat_type: 聊天类型
+            api: 使用的API名称，决定上下文的 token 预算
         """
         self.user_nick = user_nick or ""
         self.prompts_name = prompts_set
         self.input = input_txt or ""
         self.character = character or ""
         self.chat_type = chat_type
+        self.api = api
         self.dialog = []
         self.list = []
         self.messages = []
+        self.prompt_tokens = 0
+        self._prepared = False
         self._build_base_list()
 
     
@@ -418,85 +492,81 @@ class PromptsBuilder:
         self.list = combined_prompts
         return self.list
  
-    def build_conv_messages(self,conv_id=0,chat_type="private"):
+    def build_conv_messages(self, conv_id=0, chat_type="private", summaries: Optional[List[Dict]] = None):
         """
-        构建符合OpenAI API要求的消息列表
+        按 token 预算构建符合OpenAI API要求的对话历史，见 utils.context_budget。
+
+        预设、角色、用户输入以及此前 insert_any 插入的内容先计入预算，
+        再从新到旧装入会话摘要和对话历史，因此需要在其他 insert_any 之后调用。
+
         Args:
             conv_id: 对话ID
+            chat_type: 'private' 或 'group'
+            summaries: 会话摘要列表（含 summary_area 和 content），选中的摘要通过 insert_summary 插入
         Returns:
             list: 格式化后的消息列表，包含role和content字段
         """
-        dialog_history = []
-        if chat_type == "group":  # 如果 type 是 'group'，限制对话历史
-            dialog_history = db.dialog_content_load(conv_id, chat_type)
-            if not dialog_history:
-                return None
-            group_limit = get_config("dialog.group_history_limit", 10)
-            dialog_history = dialog_history[-group_limit:]
-        elif chat_type == "private":
-            # 获取私聊历史记录限制
-            dialog_history = db.dialog_content_load(conv_id, chat_type,raw=True)
-            if not dialog_history:
-                return None
-            private_limit = get_config("dialog.private_history_limit", 60)
-            summary_location = db.dialog_summary_location_get(conv_id)
-            turn = db.dialog_turn_get(conv_id, chat_type)
-
-            if summary_location:
-                private_limit = turn - summary_location+30
-                logger.info(f"该对话共{turn}轮,已总结到{summary_location}轮, 读取最新{private_limit}轮对话")
-                if private_limit > 120:
-                    logger.info("对话轮数超过120轮,限制为120轮")
-                    private_limit = 120
-            
-            # 获取原始对话历史
-            dialog_history = dialog_history[-private_limit:]
-
-            # 根据规则修饰对话历史
-            processed_history = []
-            assistant_messages = [(i, role, turn_order, content) for i, (role, turn_order, content) in enumerate(dialog_history) if role.lower() == 'assistant']
-            assistant_len = len(assistant_messages)
-
-            for i, (role, turn_order, content) in enumerate(dialog_history):
-                if role.lower() == 'user':
-                    processed_history.append((role, turn_order, content))
-                    continue
-
-                # 定位当前 assistant 消息在 assistant_messages 中的索引
-                current_assistant_index = -1
-                for j, (orig_i, _, _, _) in enumerate(assistant_messages):
-                    if i == orig_i:
-                        current_assistant_index = j
-                        break
-                
-                if current_assistant_index == -1:
-                    processed_history.append((role, turn_order, content))
-                    continue
-
-                # 最新的3轮AI对话
-                if current_assistant_index >= assistant_len - 3:
-                    processed_history.append((role, turn_order, content))
-                # 4-10轮AI对话
-                elif current_assistant_index >= assistant_len - 10:
-                    content_content = txt.extract_tag_content(content, 'content')
-                    processed_history.append((role, turn_order, content_content))
-                # 10轮以外的AI对话
-                else:
-                    summary_content = txt.extract_tag_content(content, 'summary')
-                    if summary_content != content and len(summary_content) >= 10: # 提取成功且内容长度合适
-                        final_content = f"对话被折叠，总结如下:\r\n{summary_content}"
-                    else: # 提取失败或内容过短
-                        final_content = txt.extract_tag_content(content, 'content')
-                    processed_history.append((role, turn_order, final_content))
-            dialog_history = processed_history
+        total_budget = get_context_budget(self.api)
+        remaining = total_budget - self.fixed_tokens()
+        if remaining <= 0:
+            logger.warning(f"提示词固定部分已超过 {total_budget} tokens 的预算，不再加入摘要和历史")
+
+        if summaries:
+            ratio = get_config("dialog.summary_budget_ratio", 0.3)
+            chosen, _ = select_summaries(summaries, int(max(remaining, 0) * ratio))
+            if chosen:
+                self.insert_summary("\n".join(chosen))
+                remaining = total_budget - self.fixed_tokens()
+            if len(chosen) < len(summaries):
+                logger.info(f"会话 {conv_id} 的摘要超出预算，保留最新的 {len(chosen)}/{len(summaries)} 条")
+
+        if chat_type == "group":
+            limit = get_config("dialog.group_history_limit", 10)
+        else:
+            limit = get_config("dialog.private_history_limit", 200)
+        rows = db.dialog_tail_load(conv_id, chat_type, limit) if conv_id else []
+        entries = self._history_entries(rows, chat_type)
+        self.dialog, used = pack_history(entries, max(remaining, 0))
+        self.prompt_tokens = total_budget - remaining + used
+        if len(self.dialog) < len(entries):
+            logger.info(f"会话 {conv_id} 共 {len(entries)} 条历史，按 {total_budget} tokens 的预算装入 {len(self.dialog)} 条")
+        return self.dialog
 
-        messages = []
-        for role, turn_order, content in dialog_history:
-            formatted_role = role.lower()
-            if formatted_role in ["user", "assistant"] and content:
-                messages.append({"role": formatted_role, "content": content})
-        self.dialog= messages
-        return messages
+    @staticmethod
+    def _history_entries(rows: List[Tuple], chat_type: str) -> List[Tuple]:
+        """
+        把 db.dialog_tail_load 的结果转换为 pack_history 的输入，缺少的 token 数在这里计算并写回数据库。
+        """
+        entries = []
+        missing = []
+        assistant_rank = 0
+        for row_id, role, _, content, tokens, content_tokens, summary_tokens in rows:
+            role = (role or "").lower()
+            if role not in ("user", "assistant") or not content:
+                continue
+            if chat_type == "group":
+                forms = (content,)
+                counts = (tokens,)
+                if tokens is None:
+                    counts = (count_tokens(content, cache=False),)
+                    missing.append((counts[0], row_id))
+                preferred = 0
+            else:
+                forms = dialog_forms(role, content)
+                counts = (tokens, content_tokens, summary_tokens)[:len(forms)]
+                if None in counts:
+                    counts = tuple(count_tokens(form, cache=False) for form in forms)
+                    # user 消息只有一种形式，三列写入相同的值
+                    missing.append(counts + (counts[-1],) * (3 - len(counts)) + (row_id,))
+                if role == "assistant":
+                    preferred = preferred_form(assistant_rank)
+                    assistant_rank += 1
+                else:
+                    preferred = 0
+            entries.append((role, forms, counts, preferred))
+        if missing:
+            db.dialog_tokens_save(chat_type, missing)
+        return entries
 
     @staticmethod
     def build_conv_messages_for_summary(conv_id: int, chat_type: str, start: int = 0, end: int = 0):
@@ -512,12 +582,13 @@ class PromptsBuilder:
         Returns:
             list: 格式化后的消息列表，包含role和content字段。
         """
-        dialog_history = db.dialog_content_load(conv_id, chat_type)
+        if start == 0 and end == 0:
+            dialog_history = db.dialog_content_load(conv_id, chat_type)
+        else:
+            # 只读取需要总结的区间，避免长对话每次都加载全部记录
+            dialog_history = db.dialog_content_load(conv_id, chat_type, offset=start, limit=max(end - start, 0))
         if not dialog_history:
             return []
-        if start == 0 and end == 0:
-            end = len(dialog_history)
-        dialog_history = dialog_history[start:end]
         messages = []
         for role, turn_order, content in dialog_history:
             formatted_role = role.lower()
@@ -587,12 +658,26 @@ class PromptsBuilder:
                 elif insert_info["mode"] == "after":
                     item["content"] = item["content"] + insert_info["content"]
         
+    def _prepare(self):
+        """插入角色信息和用户输入，只执行一次。"""
+        if self._prepared:
+            return
+        self._prepared = True
+        self._insert_character()
+        self._insert_input()
+
+    def fixed_tokens(self) -> int:
+        """对话历史之外的两条消息（对话标记之前和之后）的 token 数。"""
+        self._prepare()
+        before = self._combine_messages_via_dialog_mark(mode="before")
+        after = self._combine_messages_via_dialog_mark(mode="after")
+        return count_message_tokens([{"content": before}, {"content": after}])
+
     def build_openai_messages(self):
         """构建OpenAI消息格式。
         遍历提示词列表，根据提示词类型构建OpenAI消息格式。
         """
-        self._insert_character()
-        self._insert_input()
+        self._prepare()
         messages = []
         messages.append({"role":"user","content":self._combine_messages_via_dialog_mark(mode="before")})
         for i in self.dialog:
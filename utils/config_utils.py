@@ -3,12 +3,27 @@
 
 该模块负责加载和管理应用程序的配置，提供统一的配置访问接口，
 减少硬编码的默认值，并帮助解决模块间的循环依赖问题。
+
+配置加载后生成一个只读快照：按完整点号路径展平的字典，以及按名称索引的 API 配置，
+get_config / get_api_config 都是一次字典查找。配置文件变化时（start_config_watcher 按 mtime 轮询）
+生成新快照并整体替换引用，读取方不加锁，也不会看到半更新的状态。
+
+每次调用 get_config 的地方在热加载后立即使用新值。启动时读取一次配置的组件通过 on_config_reload
+登记回调，修改调度状态的回调在 bind_reload_loop 绑定的事件循环中执行：LLM 调度器的并发上限
+（api.semaphore_limit、api.interactive_reserve、api_list[].concurrency）、Telegram 发送调度器的
+telegram.* 速率和重试、用量累加器的写入间隔、数据库维护的检查间隔和阈值。
+以下设置只在启动时读取，修改后需要重启：TG_TOKEN、web.*、metrics.*、api.http*（HTTP 连接池）、
+summary.*（摘要任务队列）、cache.ttl、retention.*（归档任务）、image_cache.*、telegram.name_*、telegram.delete_*、
+agent.memory_*、database.maintenance_enabled / checkpoint_busy_timeout_ms / analysis_limit。
 """
 
+import asyncio
 import json
 import logging
 import os
-from typing import Any, Dict, Optional
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
 
 # 获取项目根目录的绝对路径
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -20,11 +35,52 @@ logger = logging.getLogger(__name__)
 DEFAULT_CONFIG_PATH = os.path.join(project_root, "config", "default_config.json")
 CONFIG_PATH = os.path.join(project_root, "config", "config.json")
 CONFIG_LOCAL_PATH = os.path.join(project_root, "config", "config_local.json")
+# 覆盖配置，最后合并；用于压测等需要在启动前替换 API、Token 的场景
+CONFIG_OVERLAY_PATH = os.environ.get("CONFIG_OVERLAY", "")
+
+_MISSING = object()
+
+
+class ConfigSnapshot:
+    """
+    不可变的配置快照。
+
+    Attributes:
+        tree: 合并后的完整配置（嵌套字典）
+        flat: 点号路径 -> 值，包含每一级的中间节点
+        apis: API 名称 -> api_list 中的配置项
+        mtimes: 生成快照时各配置文件的修改时间
+    """
+
+    __slots__ = ("tree", "flat", "apis", "mtimes")
+
+    def __init__(self, tree: Dict[str, Any], mtimes: Tuple[float, ...]):
+        flat: Dict[str, Any] = {}
+        _flatten(tree, "", flat)
+        apis = {item.get("name"): item for item in tree.get("api_list", []) or [] if isinstance(item, dict)}
+        object.__setattr__(self, "tree", tree)
+        object.__setattr__(self, "flat", MappingProxyType(flat))
+        object.__setattr__(self, "apis", MappingProxyType(apis))
+        object.__setattr__(self, "mtimes", mtimes)
 
-# 全局配置对象
-_config: Dict[str, Any] = {}
-_default_config: Dict[str, Any] = {}
-_user_config: Dict[str, Any] = {}
+    def __setattr__(self, name, value):
+        raise AttributeError("ConfigSnapshot 是只读的")
+
+
+def _flatten(node: Dict[str, Any], prefix: str, out: Dict[str, Any]) -> None:
+    for key, value in node.items():
+        path = f"{prefix}{key}"
+        out[path] = value
+        if isinstance(value, dict):
+            _flatten(value, path + ".", out)
+
+
+# 当前配置快照，只通过整体替换更新
+_snapshot: Optional[ConfigSnapshot] = None
+# (回调, 是否在机器人事件循环中执行)
+_reload_callbacks: List[Tuple[Callable[[ConfigSnapshot], None], bool]] = []
+_reload_loop: Optional[asyncio.AbstractEventLoop] = None
+_watcher: Optional[threading.Thread] = None
 
 
 def load_json_file(file_path: str) -> Dict[str, Any]:
@@ -55,50 +111,162 @@ def load_json_file(file_path: str) -> Dict[str, Any]:
         raise
 
 
-def init_config() -> None:
+def _config_mtimes() -> Tuple[float, ...]:
+    mtimes = []
+    for path in (DEFAULT_CONFIG_PATH, CONFIG_LOCAL_PATH, CONFIG_PATH, CONFIG_OVERLAY_PATH):
+        try:
+            mtimes.append(os.path.getmtime(path))
+        except OSError:
+            mtimes.append(0.0)
+    return tuple(mtimes)
+
+
+def _build_snapshot(strict: bool = False) -> ConfigSnapshot:
     """
-    初始化配置，加载默认配置和用户配置
+    加载默认配置和用户配置，合并后生成快照。
+
+    Args:
+        strict: 为 True 时配置文件读取失败直接抛出异常（热加载时使用，避免用空配置替换旧配置）
     """
-    global _config, _default_config, _user_config
+    mtimes = _config_mtimes()
 
     # 加载默认配置
     try:
-        _default_config = load_json_file(DEFAULT_CONFIG_PATH)
+        default_config = load_json_file(DEFAULT_CONFIG_PATH)
         logger.info("默认配置加载成功")
     except Exception as e:
         logger.error(f"加载默认配置失败: {str(e)}")
-        _default_config = {}
+        if strict:
+            raise
+        default_config = {}
 
     # 加载用户配置
     try:
         # 优先尝试加载本地配置
         if os.path.exists(CONFIG_LOCAL_PATH):
-            _user_config = load_json_file(CONFIG_LOCAL_PATH)
+            user_config = load_json_file(CONFIG_LOCAL_PATH)
             logger.info("本地配置加载成功")
         else:
-            _user_config = load_json_file(CONFIG_PATH)
+            user_config = load_json_file(CONFIG_PATH)
             logger.info("标准配置加载成功")
     except Exception as e:
         logger.error(f"加载用户配置失败: {str(e)}")
-        _user_config = {}
+        if strict and not isinstance(e, FileNotFoundError):
+            raise
+        user_config = {}
 
     # 合并配置
-    _config = _default_config.copy()
-    _deep_update(_config, _user_config)
+    config = default_config.copy()
+    _deep_update(config, user_config)
+
+    if CONFIG_OVERLAY_PATH:
+        try:
+            _deep_update(config, load_json_file(CONFIG_OVERLAY_PATH))
+            logger.info(f"覆盖配置加载成功: {CONFIG_OVERLAY_PATH}")
+        except Exception as e:
+            logger.error(f"加载覆盖配置失败: {str(e)}")
+            if strict:
+                raise
 
     # 验证必要的配置项
-    if not _config.get("TG_TOKEN"):
-        if _user_config.get("TG_TOKEN"):
-            _config["TG_TOKEN"] = _user_config["TG_TOKEN"]
-        else:
-            logger.warning("未找到TG_TOKEN配置")
+    if not config.get("TG_TOKEN"):
+        logger.warning("未找到TG_TOKEN配置")
+
+    if not config.get("ADMIN"):
+        logger.warning("未找到ADMIN配置")
+        config["ADMIN"] = []
+
+    return ConfigSnapshot(config, mtimes)
+
+
+def init_config() -> None:
+    """
+    初始化配置，加载默认配置和用户配置并替换当前快照
+    """
+    global _snapshot
+    _snapshot = _build_snapshot()
+
 
-    if not _config.get("ADMIN"):
-        if _user_config.get("ADMIN"):
-            _config["ADMIN"] = _user_config["ADMIN"]
+def reload_config_if_changed() -> bool:
+    """
+    配置文件的修改时间变化时重新加载。
+    新配置解析失败时保留旧快照，返回是否发生了替换。
+    """
+    global _snapshot
+    current = _snapshot
+    if current is not None and _config_mtimes() == current.mtimes:
+        return False
+    try:
+        new_snapshot = _build_snapshot(strict=True)
+    except Exception as e:
+        logger.error(f"重新加载配置失败，继续使用旧配置: {e}")
+        return False
+    if current is not None and new_snapshot.tree == current.tree:
+        # 只有 mtime 变化，内容相同
+        _snapshot = new_snapshot
+        return False
+    _snapshot = new_snapshot
+    logger.info("配置文件已变化，已切换到新配置")
+    loop = _reload_loop
+    for callback, in_loop in list(_reload_callbacks):
+        if in_loop and loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(_run_reload_callback, callback, new_snapshot)
+            except RuntimeError:
+                # 事件循环在检查后关闭
+                pass
         else:
-            logger.warning("未找到ADMIN配置")
-            _config["ADMIN"] = []
+            _run_reload_callback(callback, new_snapshot)
+    return True
+
+
+def _run_reload_callback(callback: Callable[[ConfigSnapshot], None], snapshot: ConfigSnapshot) -> None:
+    try:
+        callback(snapshot)
+    except Exception as e:
+        logger.error(f"执行配置重载回调失败: {e}")
+
+
+def on_config_reload(callback: Callable[[ConfigSnapshot], None], in_loop: bool = False) -> None:
+    """
+    注册配置重载回调，用于刷新由配置派生的设置和缓存。
+
+    回调执行时 get_config 已返回新值。默认在配置监视线程中执行，只应做简单的赋值；
+    in_loop 为 True 时通过 call_soon_threadsafe 在 bind_reload_loop 绑定的事件循环中执行，
+    用于修改只在事件循环中访问、不加锁的调度状态（未绑定事件循环时直接执行）。
+    """
+    _reload_callbacks.append((callback, in_loop))
+
+
+def bind_reload_loop(loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """绑定机器人的事件循环，供 in_loop 的配置重载回调使用。"""
+    global _reload_loop
+    _reload_loop = loop
+
+
+def start_config_watcher(interval: Optional[float] = None) -> None:
+    """
+    启动后台线程，按 mtime 轮询配置文件并在变化时热加载。
+
+    Args:
+        interval: 轮询间隔(秒)，默认 config.reload_interval；不大于 0 时不启动
+    """
+    global _watcher
+    if _watcher is not None:
+        return
+    if interval is None:
+        interval = get_config("config.reload_interval", 5)
+    if not interval or interval <= 0:
+        return
+
+    def _watch():
+        stop = threading.Event()
+        while not stop.wait(interval):
+            reload_config_if_changed()
+
+    _watcher = threading.Thread(target=_watch, name="config-watcher", daemon=True)
+    _watcher.start()
+    logger.info(f"配置热加载已启动，轮询间隔 {interval}s")
 
 
 def _deep_update(target: Dict[str, Any], source: Dict[str, Any]) -> None:
@@ -116,6 +284,15 @@ def _deep_update(target: Dict[str, Any], source: Dict[str, Any]) -> None:
             target[key] = value
 
 
+def get_snapshot() -> ConfigSnapshot:
+    """返回当前配置快照，同一次处理中需要多次读取时可以先取快照保证一致。"""
+    snapshot = _snapshot
+    if snapshot is None:
+        init_config()
+        snapshot = _snapshot
+    return snapshot
+
+
 def get_config(key: Optional[str] = None, default: Any = None) -> Any:
     """
     获取配置值
@@ -126,25 +303,15 @@ def get_config(key: Optional[str] = None, default: Any = None) -> Any:
         default: 默认值，当配置项不存在时返回
 
     Returns:
-        Any: 配置值或默认值
+        Any: 配置值或默认值。返回的字典/列表属于只读快照，调用方不应修改。
     """
-    if not _config:
-        init_config()
+    snapshot = get_snapshot()
 
     if key is None:
-        return _config
+        return snapshot.tree
 
-    # 处理嵌套键
-    keys = key.split(".")
-    value = _config
-
-    for k in keys:
-        if isinstance(value, dict) and k in value:
-            value = value[k]
-        else:
-            return default
-
-    return value
+    value = snapshot.flat.get(key, _MISSING)
+    return default if value is _MISSING else value
 
 
 def get_path(path_key: str) -> str:
@@ -164,6 +331,22 @@ def get_path(path_key: str) -> str:
     return path or ""
 
 
+def get_api_entry(api_name: Optional[str] = None) -> Optional[Mapping[str, Any]]:
+    """
+    按名称获取 api_list 中的配置项
+
+    Args:
+        api_name: API名称，如果为None则使用默认API
+
+    Returns:
+        Optional[Mapping[str, Any]]: 配置项，找不到时返回 None
+    """
+    snapshot = get_snapshot()
+    if api_name is None:
+        api_name = snapshot.flat.get("api.default_api")
+    return snapshot.apis.get(api_name)
+
+
 def get_api_config(api_name: Optional[str] = None) -> tuple:
     """
     获取API配置
@@ -180,16 +363,14 @@ def get_api_config(api_name: Optional[str] = None) -> tuple:
     if api_name is None:
         api_name = get_config("api.default_api")
 
-    api_list = get_config("api_list", [])
-    for api_config_item in api_list:
-        if api_config_item.get("name") == api_name:
-            return (
-                api_config_item.get("key", ""),
-                api_config_item.get("url", ""),
-                api_config_item.get("model", ""),
-            )
-
-    raise ValueError(f"未找到名为 '{api_name}' 的API配置")
+    api_config_item = get_api_entry(api_name)
+    if api_config_item is None:
+        raise ValueError(f"未找到名为 '{api_name}' 的API配置")
+    return (
+        api_config_item.get("key", ""),
+        api_config_item.get("url", ""),
+        api_config_item.get("model", ""),
+    )
 
 
 def get_api_multiple(api_name: Optional[str] = None) -> int:
@@ -202,15 +383,8 @@ def get_api_multiple(api_name: Optional[str] = None) -> int:
     Returns:
         int: multiple值，默认为1
     """
-    if api_name is None:
-        api_name = get_config("api.default_api")
-
-    api_list = get_config("api_list", [])
-    for api in api_list:
-        if api.get("name") == api_name:
-            return api.get("multiple", 1)
-
-    return 1
+    api = get_api_entry(api_name)
+    return api.get("multiple", 1) if api is not None else 1
 
 
 # 初始化配置
@@ -0,0 +1,194 @@
+"""
+按 token 预算组装上下文
+
+原先对话历史按行数截断（dialog.private_history_limit / dialog.group_history_limit），
+消息长短不同时提示词大小差别很大：长消息撑爆上下文，短消息又浪费可用的上下文。这里改为：
+- 每个 API 一个提示词预算（api_list 中的 context_budget，缺省为 dialog.context_budget）；
+- 固定部分（预设、角色、输入和插入的上下文）先计入，再按 dialog.summary_budget_ratio 从新到旧装入会话摘要，
+  剩余的预算从最新一条开始装入对话历史；
+- 私聊中 assistant 的回复有三种形式：原文、<content> 正文、<summary> 折叠摘要。越旧的回复默认形式越省，
+  放不下时继续降级，连最省的形式也放不下就停止，更早的内容由会话摘要覆盖；
+- 每条对话各形式的 token 数保存在对话表的 tokens / content_tokens / summary_tokens 列中，
+  第一次用到时计算并写回，之后不再重复分词。
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import tiktoken
+
+import utils.text_utils as txt
+from utils.config_utils import get_api_entry, get_config
+from utils.logging_utils import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# 每条消息的角色和分隔符的大致开销（OpenAI 的计算方式）
+MESSAGE_OVERHEAD = 4
+
+_encoder = None
+_encoder_failed = False
+_encoder_lock = threading.Lock()
+
+_cache: "OrderedDict[str, int]" = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 1024
+
+
+def _get_encoder():
+    """加载一次 cl100k_base 编码器；加载失败（例如离线环境无法下载）后不再重试。"""
+    global _encoder, _encoder_failed
+    if _encoder is None and not _encoder_failed:
+        with _encoder_lock:
+            if _encoder is None and not _encoder_failed:
+                try:
+                    _encoder = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    _encoder_failed = True
+                    logger.warning(f"加载 tiktoken 编码器失败，token 数按字符数估算: {e}")
+    return _encoder
+
+
+def count_tokens(text: Optional[str], cache: bool = True) -> int:
+    """
+    计算文本的 token 数量，最近用过的文本（预设、角色、摘要等）有进程内缓存。
+
+    Args:
+        text: 要计算的文本
+        cache: 是否使用进程内缓存；对话记录的计数保存在数据库中，不需要再占用缓存
+
+    Returns:
+        int: token 数量，编码器不可用时返回字符数
+    """
+    if not text:
+        return 0
+    if cache:
+        with _cache_lock:
+            cached = _cache.get(text)
+            if cached is not None:
+                _cache.move_to_end(text)
+                return cached
+    encoder = _get_encoder()
+    if encoder is None:
+        return len(text)
+    count = len(encoder.encode(text, disallowed_special=()))
+    if not cache:
+        return count
+    with _cache_lock:
+        _cache[text] = count
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return count
+
+
+def count_message_tokens(messages: Sequence[Dict[str, Any]]) -> int:
+    """
+    计算 OpenAI 消息列表的 token 数量，多模态消息只计文本部分。
+
+    组装好的消息包含每次都不同的用户输入，缓存不会命中，因此不使用缓存。
+    """
+    total = 2
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            total += sum(count_tokens(part.get("text", ""), cache=False) for part in content if part.get("type") == "text")
+        else:
+            total += count_tokens(content if isinstance(content, str) else str(content or ""), cache=False)
+        total += MESSAGE_OVERHEAD
+    return total
+
+
+def get_context_budget(api: Optional[str] = None) -> int:
+    """提示词的 token 预算：api_list 中该 API 的 context_budget，缺省为 dialog.context_budget。"""
+    entry = get_api_entry(api)
+    budget = entry.get("context_budget") if entry is not None else None
+    return int(budget or get_config("dialog.context_budget", 24000))
+
+
+def dialog_forms(role: str, content: str) -> Tuple[str, ...]:
+    """
+    一条私聊历史可用的形式，从完整到最省。
+
+    assistant 为 (原文, <content> 正文, 折叠摘要)，没有 <summary> 时折叠形式就是正文；user 只有原文。
+    """
+    if role.lower() != "assistant":
+        return (content,)
+    body = txt.extract_tag_content(content, 'content')
+    summary = txt.extract_tag_content(content, 'summary')
+    if summary != content and len(summary) >= 10:
+        folded = f"对话被折叠，总结如下:\r\n{summary}"
+    else:
+        folded = body
+    return (content, body, folded)
+
+
+def preferred_form(assistant_rank: int) -> int:
+    """按 assistant 回复从新到旧的序号决定默认形式：最新 3 条原文，4-10 条正文，更早的折叠。"""
+    if assistant_rank < 3:
+        return 0
+    if assistant_rank < 10:
+        return 1
+    return 2
+
+
+def select_summaries(summaries: List[Dict[str, Any]], budget: int) -> Tuple[List[str], int]:
+    """
+    从最新的摘要开始装入预算。
+
+    Args:
+        summaries: [{'summary_area': '起始-结束', 'content': ...}]
+        budget: 可用的 token 数
+
+    Returns:
+        Tuple[List[str], int]: 按时间顺序排列的摘要内容和占用的 token 数
+    """
+    def end_turn(summary: Dict[str, Any]) -> int:
+        try:
+            return int(str(summary.get("summary_area", "")).split("-")[1])
+        except (ValueError, IndexError):
+            return 0
+
+    chosen: List[str] = []
+    used = 0
+    for summary in sorted(summaries, key=end_turn, reverse=True):
+        content = summary.get("content") or ""
+        tokens = count_tokens(content) + 1
+        if used + tokens > budget:
+            break
+        chosen.append(content)
+        used += tokens
+    chosen.reverse()
+    return chosen, used
+
+
+def pack_history(entries: List[Tuple[str, Tuple[str, ...], Tuple[int, ...], int]],
+                 budget: int) -> Tuple[List[Dict[str, str]], int]:
+    """
+    从最新一条开始把对话历史装入预算。
+
+    Args:
+        entries: 从新到旧的 (角色, 各形式文本, 各形式 token 数, 默认形式序号)
+        budget: 可用的 token 数
+
+    Returns:
+        Tuple[List[Dict[str, str]], int]: 按时间顺序排列的 OpenAI 消息和占用的 token 数
+    """
+    packed: List[Dict[str, str]] = []
+    used = 0
+    for role, forms, tokens, preferred in entries:
+        if not any(forms):
+            continue
+        choice = None
+        for index in range(min(preferred, len(forms) - 1), len(forms)):
+            if forms[index] and used + tokens[index] + MESSAGE_OVERHEAD <= budget:
+                choice = index
+                break
+        if choice is None:
+            break
+        packed.append({"role": role.lower(), "content": forms[choice]})
+        used += tokens[choice] + MESSAGE_OVERHEAD
+    packed.reverse()
+    return packed, used
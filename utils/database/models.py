@@ -45,6 +45,9 @@ class Dialog(Base):
     created_at = Column(Text, nullable=False)
     processed_content = Column(Text)
     msg_id = Column(Integer)
+    tokens = Column(Integer)
+    content_tokens = Column(Integer)
+    summary_tokens = Column(Integer)
 
 
 class GroupDialog(Base):
@@ -86,6 +89,7 @@ class GroupUserDialog(Base):
     turn_order = Column(Integer)
     created_at = Column(Text)
     processed_content = Column(Text)
+    tokens = Column(Integer)
 
 
 class Group(Base):
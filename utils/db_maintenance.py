@@ -0,0 +1,174 @@
+"""
+数据库维护
+
+连接池开启了 WAL，但检查点完全交给 SQLite 的自动检查点（约 1000 页）。Web 后台持续有读连接时，
+自动检查点无法把 WAL 回卷到开头，WAL 文件会一直变大，读取也随之变慢；也从来没有运行过 ANALYZE。
+这里用一个后台任务每 database.maintenance_interval 秒检查一次：
+- WAL 超过 database.wal_passive_mb 时执行 wal_checkpoint(PASSIVE)，不等待读写；
+- WAL 超过 database.wal_truncate_mb，或 WAL 不为空且连接池已空闲 database.maintenance_idle_seconds 秒时，
+  执行 wal_checkpoint(TRUNCATE)。维护连接的 busy_timeout 很短，有读写时放弃，下一轮再试；
+- 启动时和每 database.optimize_interval 秒执行一次 PRAGMA optimize（analysis_limit 限制 ANALYZE 的开销）。
+
+WAL 大小、检查点耗时和结果通过 get_stats 和 utils.metrics 导出。
+检查间隔和各项阈值在配置热加载后的下一轮检查生效；maintenance_enabled、checkpoint_busy_timeout_ms
+和 analysis_limit 作用在启动时打开的维护连接上，需要重启。
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+from utils.config_utils import ConfigSnapshot, get_config, on_config_reload
+from utils.db_utils import db_pool
+from utils.logging_utils import setup_logging
+from utils.metrics import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+
+class DatabaseMaintenance:
+    """
+    数据库维护任务，采用单例模式。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(DatabaseMaintenance, cls).__new__(cls)
+            cls._instance._init_maintenance()
+        return cls._instance
+
+    def _init_maintenance(self):
+        self.enabled = get_config("database.maintenance_enabled", True)
+        self.reload_config()
+        self.wal_file = f"{db_pool.db_file}-wal"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._last_optimize: Optional[float] = None
+        self.stats = {"checkpoints_passive": 0, "checkpoints_truncate": 0, "checkpoints_busy": 0,
+                      "last_checkpoint_seconds": 0.0, "last_checkpoint_pages": 0,
+                      "optimize_runs": 0, "last_optimize_seconds": 0.0, "errors": 0}
+
+    def reload_config(self, snapshot: Optional[ConfigSnapshot] = None) -> None:
+        """读取检查间隔和阈值，配置热加载时也会调用。"""
+        self.interval = get_config("database.maintenance_interval", 30)
+        self.idle_seconds = get_config("database.maintenance_idle_seconds", 2.0)
+        self.passive_bytes = get_config("database.wal_passive_mb", 4) * _MB
+        self.truncate_bytes = get_config("database.wal_truncate_mb", 64) * _MB
+        self.busy_timeout_ms = get_config("database.checkpoint_busy_timeout_ms", 1000)
+        self.optimize_interval = get_config("database.optimize_interval", 21600)
+        self.analysis_limit = get_config("database.analysis_limit", 400)
+
+    def start(self) -> None:
+        """启动后台任务，需要在事件循环中调用。"""
+        if not self.enabled:
+            return
+        if self._runner is not None and not self._runner.done():
+            return
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(db_pool.db_file, timeout=self.busy_timeout_ms / 1000,
+                                   check_same_thread=False, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            conn.execute(f"PRAGMA analysis_limit={int(self.analysis_limit)}")
+            self._conn = conn
+        return self._conn
+
+    def wal_size(self) -> int:
+        """当前 WAL 文件大小（字节），不存在时为 0。"""
+        try:
+            return os.path.getsize(self.wal_file)
+        except OSError:
+            return 0
+
+    def is_idle(self) -> bool:
+        """连接池没有连接在用，且最近 idle_seconds 秒内没有取过连接。"""
+        return (not db_pool.get_stats()["in_use"]
+                and time.monotonic() - db_pool.last_activity >= self.idle_seconds)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"数据库维护出错: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> None:
+        """检查一次 WAL 大小，按需执行检查点；到期时执行 PRAGMA optimize。"""
+        wal_bytes = self.wal_size()
+        idle = self.is_idle()
+        if wal_bytes >= self.truncate_bytes or (wal_bytes and idle):
+            await asyncio.to_thread(self.checkpoint, "TRUNCATE")
+        elif wal_bytes >= self.passive_bytes:
+            await asyncio.to_thread(self.checkpoint, "PASSIVE")
+
+        if self._last_optimize is None or (idle and time.monotonic() - self._last_optimize >= self.optimize_interval):
+            await asyncio.to_thread(self.optimize)
+
+    def checkpoint(self, mode: str = "PASSIVE") -> bool:
+        """
+        执行 WAL 检查点。
+
+        Args:
+            mode: PASSIVE / FULL / RESTART / TRUNCATE
+
+        Returns:
+            bool: 是否完成（TRUNCATE 遇到读写而放弃时返回 False）
+        """
+        started = time.perf_counter()
+        busy, log_pages, checkpointed = self._connection().execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        elapsed = time.perf_counter() - started
+        metrics.observe("db_checkpoint_seconds", elapsed, mode=mode.lower())
+        self.stats["last_checkpoint_seconds"] = round(elapsed, 4)
+        self.stats["last_checkpoint_pages"] = checkpointed
+        if busy:
+            self.stats["checkpoints_busy"] += 1
+            logger.debug(f"WAL 检查点({mode})未完成: WAL {log_pages} 页，已写回 {checkpointed} 页")
+            return False
+        self.stats[f"checkpoints_{mode.lower()}"] = self.stats.get(f"checkpoints_{mode.lower()}", 0) + 1
+        logger.debug(f"WAL 检查点({mode})完成: {checkpointed} 页，耗时 {elapsed * 1000:.1f}ms")
+        return True
+
+    def optimize(self) -> None:
+        """执行 PRAGMA optimize，0x10002 表示检查所有表（而不只是本连接查询过的表）并按需 ANALYZE。"""
+        started = time.perf_counter()
+        self._connection().execute("PRAGMA optimize=0x10002")
+        elapsed = time.perf_counter() - started
+        self._last_optimize = time.monotonic()
+        metrics.observe("db_optimize_seconds", elapsed)
+        self.stats["optimize_runs"] += 1
+        self.stats["last_optimize_seconds"] = round(elapsed, 4)
+        logger.info(f"PRAGMA optimize 完成，耗时 {elapsed:.2f}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "wal_bytes": self.wal_size()}
+
+
+# 全局数据库维护实例
+db_maintenance = DatabaseMaintenance()
+on_config_reload(db_maintenance.reload_config, in_loop=True)
+metrics.histogram("db_checkpoint_seconds", "WAL 检查点耗时")
+metrics.histogram("db_optimize_seconds", "PRAGMA optimize 耗时")
+metrics.register_collector("db_maintenance", db_maintenance.get_stats)
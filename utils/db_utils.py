@@ -1,15 +1,20 @@
 import datetime
+import hashlib
 import json
 import logging
 import os
+import re
 import sqlite3
 import threading
+import time
 from sqlite3 import Error
 from typing import Any, List, Optional, Tuple,Union
 
 from utils.config_utils import get_config, project_root
 from utils.logging_utils import setup_logging
-from utils.schema_migration import check_and_migrate_database_schema
+from utils.metrics import metrics
+from utils.schema_migration import check_and_migrate_database_schema, get_database_path
+from utils.startup_timer import startup_timer
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -23,16 +28,50 @@ DEFAULT_FREQUENCY = get_config("user.default_frequency")  # 用户默认的每
 DEFAULT_BALANCE = get_config("user.default_balance")  # 用户默认的初始余额
 
 
+def _schema_fingerprint(sql_path: str) -> int:
+    """
+    计算 database.sql 的指纹，取 SHA-256 前 28 位，可以直接存入 PRAGMA user_version。
+    """
+    with open(sql_path, "rb") as f:
+        return int(hashlib.sha256(f.read()).hexdigest()[:7], 16)
+
+
+def _get_stored_fingerprint(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _store_fingerprint(db_path: str, fingerprint: int):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"PRAGMA user_version = {int(fingerprint)}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
 def init_database_if_not_exists():
     """
-    检查 data/data.db 是否存在，如果不存在则用 data/database.sql 初始化数据库。
+    检查 data/data.db（设置了环境变量 DB_PATH 时为该文件）是否存在，如果不存在则用 data/database.sql 初始化数据库。
     同时检查所需的表是否都存在，如果有缺失则创建。
     现在还会检查表结构是否符合 database.sql，如果不符合则进行迁移。
+
+    完成迁移后会把 database.sql 的指纹写入数据库的 user_version；
+    之后启动时指纹一致则跳过表结构检查和索引创建，database.sql 变化后才会重新迁移。
+    可通过 database.force_schema_check 强制检查。
     """
     # 使用绝对路径，确保无论从哪个目录运行都能找到文件
-    db_path = os.path.join(project_root, "data", "data.db")
+    db_path = get_database_path()
     sql_path = os.path.join(project_root, "data", "database.sql")
     
+    with startup_timer.phase("数据库初始化"):
+        _init_database(db_path, sql_path)
+
+
+def _init_database(db_path: str, sql_path: str):
     # 如果数据库文件不存在，创建新数据库
     if not os.path.exists(db_path):
         logger.info("检测到 data.db 不存在，正在初始化数据库...")
@@ -40,6 +79,8 @@ def init_database_if_not_exists():
             with open(sql_path, "r", encoding="utf-8") as f:
                 sql_script = f.read()
             conn = sqlite3.connect(db_path)
+            # 必须在建表之前设置；增量模式下归档删除的空闲页可以用 incremental_vacuum 归还
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
             with conn:
                 conn.executescript(sql_script)
             conn.close()
@@ -47,8 +88,18 @@ def init_database_if_not_exists():
         except Exception as e:
             logger.error(f"数据库初始化失败: {e}", exc_info=True)
             raise RuntimeError(f"数据库初始化失败: {e}")
+
+    fingerprint = _schema_fingerprint(sql_path)
+    if not get_config("database.force_schema_check", False):
+        try:
+            if _get_stored_fingerprint(db_path) == fingerprint:
+                logger.info("数据库表结构指纹未变化，跳过迁移检查")
+                return
+        except sqlite3.Error as e:
+            logger.warning(f"读取表结构指纹失败，将执行完整检查: {e}")
     
     # 使用新的表结构检查和迁移功能
+    migration_success = False
     try:
         logger.info("开始检查和迁移数据库表结构...")
         migration_success = check_and_migrate_database_schema()
@@ -77,6 +128,14 @@ def init_database_if_not_exists():
         logger.error(f"数据库索引检查和创建失败: {e}", exc_info=True)
         # 索引创建失败不应该阻止应用启动，只记录警告
         logger.warning("索引创建失败，但不影响基本功能")
+        return
+
+    # 只有迁移完全成功才记录指纹，否则下次启动继续检查
+    if migration_success:
+        try:
+            _store_fingerprint(db_path, fingerprint)
+        except sqlite3.Error as e:
+            logger.warning(f"保存表结构指纹失败: {e}")
 
 
 def _fallback_table_check(db_path: str, sql_path: str):
@@ -228,6 +287,8 @@ class DatabaseConnectionPool:
         self.max_connections = max_connections
         self.connections: List[sqlite3.Connection] = []
         self.connection_locks: List[threading.Lock] = []
+        # 最近一次取连接的时间（time.monotonic），数据库维护任务据此判断是否空闲
+        self.last_activity = time.monotonic()
         self._initialized = True
         self.initialize_pool()
 
@@ -275,6 +336,15 @@ class DatabaseConnectionPool:
                 如果成功获取连接，connection 是 sqlite3.Connection 对象，index 是连接在池中的索引（临时连接为 -1）。
                 如果获取失败，connection 是 None，index 是 -1。
         """
+        start = time.perf_counter()
+        self.last_activity = time.monotonic()
+        conn, index = self._acquire_connection()
+        metrics.observe("db_pool_acquire_seconds", time.perf_counter() - start)
+        if conn is not None and index < 0:
+            metrics.inc("db_pool_temporary_connections_total")
+        return conn, index
+
+    def _acquire_connection(self) -> Tuple[Optional[sqlite3.Connection], int]:
         for i, lock in enumerate(self.connection_locks):
             if lock.acquire(blocking=False):
                 return self.connections[i], i
@@ -308,6 +378,13 @@ class DatabaseConnectionPool:
         if 0 <= index < len(self.connection_locks):
             self.connection_locks[index].release()
 
+    def get_stats(self) -> dict:
+        """连接池大小和正在使用的连接数。"""
+        return {
+            "size": len(self.connections),
+            "in_use": sum(1 for lock in self.connection_locks if lock.locked()),
+        }
+
     def close_all(self):
         """关闭连接池中的所有数据库连接，并清空连接列表。应在应用退出时调用。"""
         for conn in self.connections:
@@ -349,6 +426,7 @@ class DatabaseConnectionPool:
 # 创建全局连接池实例前，先确保数据库存在
 init_database_if_not_exists()
 db_pool = DatabaseConnectionPool()
+metrics.register_collector("db_pool", db_pool.get_stats)
 
 
 def create_connection() -> Optional[sqlite3.Connection]:
@@ -378,6 +456,7 @@ def execute_db_operation(operation_type: str, command: str, params: Tuple = ()):
         Union[List[Any], int]: 如果是查询操作，返回结果列表；如果是更新操作，返回受影响的行数。
             发生错误时，查询返回空列表，更新返回0。
     """
+    start = time.perf_counter()
     conn, conn_index = db_pool.get_connection()
     if not conn:
         print(f"数据库错误: 无法获取连接以执行 {operation_type} 操作: {command}")
@@ -403,6 +482,7 @@ def execute_db_operation(operation_type: str, command: str, params: Tuple = ()):
         else:  # 如果是临时连接，关闭它
             if conn:  # 确保临时连接存在才关闭
                 conn.close()
+        metrics.observe("db_operation_seconds", time.perf_counter() - start, op=operation_type)
 
 
 def execute_raw_sql(command: str) -> Union[List[Any], int, str]:
@@ -475,6 +555,41 @@ def revise_db(command: str, params: Tuple = ()) -> int:
     return cast(int, execute_db_operation("update", command, params))
 
 
+def revise_db_batch(statements: List[Tuple[str, List[Tuple]]]) -> bool:
+    """
+    在同一个事务中批量执行多条更新语句，只提交一次。
+
+    Args:
+        statements: [(SQL 命令, 参数列表)]，每条命令对其参数列表执行 executemany
+
+    Returns:
+        bool: 全部执行成功返回 True，失败时回滚并返回 False
+    """
+    start = time.perf_counter()
+    conn, conn_index = db_pool.get_connection()
+    if not conn:
+        print("数据库错误: 无法获取连接以执行批量更新")
+        return False
+
+    try:
+        cursor = conn.cursor()
+        for command, params_list in statements:
+            if params_list:
+                cursor.executemany(command, params_list)
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"数据库批量更新失败: {e}")
+        return False
+    finally:
+        if conn_index >= 0:
+            db_pool.release_connection(conn_index)
+        else:
+            conn.close()
+        metrics.observe("db_operation_seconds", time.perf_counter() - start, op="batch")
+
+
 def query_db(command: str, params: Tuple = ()) -> List[Any]:
     """
     执行数据库查询操作。
@@ -528,15 +643,21 @@ def group_has_profile(group_id: int) -> bool:
     return bool(result)
 
 
-def group_profiles_get(group_id: int) -> List[dict]:
-    """获取指定群组的所有用户画像。"""
+def group_profiles_get(group_id: int, user_ids: Optional[List[int]] = None) -> List[dict]:
+    """获取指定群组的用户画像，传入 user_ids 时只获取这些用户的画像。"""
     command = """
         SELECT up.user_id, up.profile_json, u.user_name, u.first_name, u.last_name
         FROM user_profiles up
         JOIN users u ON up.user_id = u.uid
         WHERE up.group_id = ?
     """
-    results = query_db(command, (group_id,))
+    params: Tuple = (group_id,)
+    if user_ids is not None:
+        if not user_ids:
+            return []
+        command += f" AND up.user_id IN ({','.join('?' * len(user_ids))})"
+        params += tuple(user_ids)
+    results = query_db(command, params)
     profiles = []
     for row in results:
         profiles.append({
@@ -569,6 +690,98 @@ def group_profile_update_or_create(group_id: int, user_id: int, profile_json: st
     return result > 0
 
 
+def group_profile_state_get(group_id: int) -> dict:
+    """获取群组用户画像的生成进度，没有记录时 last_msg_id 为 0。"""
+    command = "SELECT last_msg_id, last_result, last_generated FROM group_profile_state WHERE group_id = ?"
+    result = query_db(command, (group_id,))
+    if result:
+        return {"last_msg_id": result[0][0] or 0, "last_result": result[0][1], "last_generated": result[0][2]}
+    return {"last_msg_id": 0, "last_result": None, "last_generated": None}
+
+
+def group_profiles_save(group_id: int, profiles: List[Tuple[int, str]], last_msg_id: int, last_result: str) -> bool:
+    """
+    在同一个事务中写入一批用户画像并推进群组画像的高水位，写入失败时高水位不变。
+
+    Args:
+        group_id: 群组ID
+        profiles: [(user_id, profile_json)]
+        last_msg_id: 本次处理到的最大 msg_id
+        last_result: 本次 LLM 的原始输出
+
+    Returns:
+        bool: 是否写入成功
+    """
+    now = str(datetime.datetime.now())
+    profile_command = """
+        INSERT INTO user_profiles (user_id, group_id, profile_json, last_updated) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id, group_id) DO UPDATE SET profile_json = excluded.profile_json,
+            last_updated = excluded.last_updated
+    """
+    state_command = """
+        INSERT INTO group_profile_state (group_id, last_msg_id, last_result, last_generated)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(group_id) DO UPDATE SET last_msg_id = excluded.last_msg_id,
+            last_result = excluded.last_result, last_generated = excluded.last_generated
+    """
+    return revise_db_batch([
+        (profile_command, [(user_id, group_id, profile_json, now) for user_id, profile_json in profiles]),
+        (state_command, [(group_id, last_msg_id, last_result, now)]),
+    ])
+
+
+def media_analysis_add(filename: str, user_id: int, created_at: int, analysis: Optional[str] = None) -> bool:
+    """
+    登记 data/pics 下保存的图片；同一文件再次登记时只在 analysis 非空时更新分析结果。
+    """
+    command = """
+        INSERT INTO media_analysis (filename, user_id, created_at, analysis) VALUES (?, ?, ?, ?)
+        ON CONFLICT(filename) DO UPDATE SET analysis = COALESCE(excluded.analysis, media_analysis.analysis)
+    """
+    result = revise_db(command, (filename, user_id, created_at, analysis))
+    return result > 0
+
+
+def media_analysis_import(items: list) -> bool:
+    """
+    批量登记图片，已登记的文件忽略。
+
+    Args:
+        items: (filename, user_id, created_at, analysis) 元组列表
+    """
+    if not items:
+        return True
+    return revise_db_batch([(
+        "INSERT OR IGNORE INTO media_analysis (filename, user_id, created_at, analysis) VALUES (?, ?, ?, ?)",
+        items,
+    )])
+
+
+def media_analysis_page(limit: int, before: Optional[tuple] = None) -> list:
+    """
+    按保存时间倒序分页读取图片分析记录，使用 (created_at, id) 键集分页，并一次性关联用户名称。
+
+    Args:
+        limit: 每页条数
+        before: 上一页最后一条的 (created_at, id)，为空时从最新的开始
+
+    Returns:
+        list: 字典列表，包含 id, filename, user_id, created_at, analysis, first_name, last_name
+    """
+    command = """
+        SELECT m.id, m.filename, m.user_id, m.created_at, m.analysis, u.first_name, u.last_name
+        FROM media_analysis m LEFT JOIN users u ON u.uid = m.user_id
+    """
+    params: tuple = ()
+    if before:
+        command += " WHERE (m.created_at, m.id) < (?, ?)"
+        params = (before[0], before[1])
+    command += " ORDER BY m.created_at DESC, m.id DESC LIMIT ?"
+    rows = query_db(command, params + (limit,))
+    fields = ["id", "filename", "user_id", "created_at", "analysis", "first_name", "last_name"]
+    return [dict(zip(fields, row)) for row in rows]
+
+
 def user_config_get(userid: int) -> dict:
     """
     获取用户的完整配置信息。
@@ -855,7 +1068,7 @@ def dialog_turn_get(conv_id: int, chat_type: str = "private") -> int:
 
 
 def dialog_content_load(
-    conv_id: int, chat_type: str = "private",raw:bool=False
+    conv_id: int, chat_type: str = "private",raw:bool=False, offset: int = 0, limit: Optional[int] = None
 ) -> Optional[List[Tuple]]:
     """
     加载指定会话的对话内容。
@@ -864,6 +1077,8 @@ def dialog_content_load(
         conv_id: 会话ID
         chat_type: 对话类型，'private' 或 'group'，其他类型将默认查询私聊对话表
         raw: 是否返回原始内容，默认为False，返回处理后的内容
+        offset: 跳过的记录数，与 limit 一起按插入顺序只读取一段记录
+        limit: 最多读取的记录数，默认读取全部
     Returns:
         Optional[List[Tuple]]: 对话内容列表 (role, turn_order, processed_content)，如果不存在则返回None
     """
@@ -879,10 +1094,56 @@ def dialog_content_load(
         command = f"SELECT role, turn_order, raw_content FROM {table_name} WHERE conv_id = ?"
     else:
         command = f"SELECT role, turn_order, processed_content FROM {table_name} WHERE conv_id = ?"
-    result = query_db(command, (conv_id,))
+    params: Tuple = (conv_id,)
+    if limit is not None:
+        command += " ORDER BY rowid LIMIT ? OFFSET ?"
+        params = (conv_id, limit, offset)
+    result = query_db(command, params)
     return result if result else None
 
 
+def dialog_tail_load(conv_id: int, chat_type: str = "private", limit: int = 200) -> List[Tuple]:
+    """
+    从新到旧读取指定会话最近 limit 条对话，附带缓存的 token 数。
+
+    私聊读取 raw_content 及 tokens / content_tokens / summary_tokens；
+    群聊读取 processed_content 及 tokens，后两列返回 None。未计算过的计数为 None。
+
+    Args:
+        conv_id: 会话ID
+        chat_type: 对话类型，'private' 或 'group'
+        limit: 最多读取的记录数
+
+    Returns:
+        List[Tuple]: [(id, role, turn_order, content, tokens, content_tokens, summary_tokens)]
+    """
+    if chat_type == "group":
+        command = ("SELECT id, role, turn_order, processed_content, tokens, NULL, NULL "
+                   "FROM group_user_dialogs WHERE conv_id = ? ORDER BY id DESC LIMIT ?")
+    else:
+        command = ("SELECT id, role, turn_order, raw_content, tokens, content_tokens, summary_tokens "
+                   "FROM dialogs WHERE conv_id = ? ORDER BY id DESC LIMIT ?")
+    return query_db(command, (conv_id, limit)) or []
+
+
+def dialog_tokens_save(chat_type: str, counts: List[Tuple]) -> bool:
+    """
+    写回对话记录的 token 数。
+
+    Args:
+        chat_type: 对话类型，'private' 或 'group'
+        counts: 私聊为 [(tokens, content_tokens, summary_tokens, id)]，群聊为 [(tokens, id)]
+
+    Returns:
+        bool: 是否写入成功
+    """
+    if not counts:
+        return True
+    if chat_type == "group":
+        command = "UPDATE group_user_dialogs SET tokens = ? WHERE id = ?"
+    else:
+        command = "UPDATE dialogs SET tokens = ?, content_tokens = ?, summary_tokens = ? WHERE id = ?"
+    return revise_db_batch([(command, counts)])
 
 
 def dialog_summary_get(conv_id: int) -> Optional[list]:
@@ -1291,7 +1552,7 @@ def group_dialog_get(
               ORDER BY msg_id ASC \
               """
     result = query_db(command, (group_id, num))
-    print(f"Querying with group_id={group_id}, num={num}, result={result}")  # 调试日志
+    logger.debug("group_dialog_get: group_id=%s, num=%s, rows=%s", group_id, num, len(result) if result else 0)
     return result if result else []
 
 
@@ -1412,6 +1673,114 @@ def get_all_table_names() -> List[str]:
     result = query_db(command)
     return [row[0] for row in result] if result else []
 
+def _open_readonly_connection(timeout_ms: int) -> Tuple[sqlite3.Connection, bool]:
+    """
+    为数据库查看器打开独立的只读连接，不占用机器人使用的连接池。
+    存在群聊消息归档库时一并附加（见 utils.history_archive），group_dialogs 包含已归档的记录。
+    通过 progress handler 限制总执行时间，超时后语句被中断并抛出 sqlite3.OperationalError。
+
+    Returns:
+        Tuple[sqlite3.Connection, bool]: (连接, 是否附加了归档库)
+    """
+    from utils.history_archive import attach_archive_view
+
+    conn = sqlite3.connect(f"file:{db_pool.db_file}?mode=ro", uri=True, timeout=5.0, check_same_thread=False)
+    archived = attach_archive_view(conn)
+    deadline = time.monotonic() + timeout_ms / 1000
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+    return conn, archived
+
+
+def _plan_table_search(cursor: sqlite3.Cursor, table_name: str, columns: List[tuple], search_term: str,
+                       allow_fts: bool = True) -> Tuple[str, list, str]:
+    """
+    根据表结构为搜索词选择查询方式：
+    - 纯数字：在有索引的整数/ID 列上做等值匹配；
+    - 文本：表有 FTS5 外部内容索引且搜索词不少于 3 个字符时走全文索引；
+    - 其他情况：只在文本列上做 LIKE，整数列做等值匹配，由超时保护。
+
+    Args:
+        columns: PRAGMA main.table_info 的结果
+        allow_fts: 是否允许使用全文索引（归档库中的记录没有全文索引）
+
+    Returns:
+        Tuple[str, list, str]: (WHERE 条件, 参数, 搜索方式)
+    """
+    names = [col[1] for col in columns]
+    int_columns = [col[1] for col in columns
+                   if "INT" in (col[2] or "").upper() or col[1] in ("id", "uid") or col[1].endswith("_id")]
+    text_columns = [col[1] for col in columns
+                    if not col[2] or any(t in col[2].upper() for t in ("TEXT", "CHAR", "CLOB", "ANY"))]
+
+    indexed = {col[1] for col in columns if col[5] == 1 and "INT" in (col[2] or "").upper()}
+    cursor.execute(f'PRAGMA main.index_list("{table_name}")')
+    for index in cursor.fetchall():
+        cursor.execute(f'PRAGMA index_info("{index[1]}")')
+        leading = [info[2] for info in cursor.fetchall() if info[0] == 0]
+        indexed.update(leading)
+
+    if re.fullmatch(r"-?\d+", search_term):
+        indexed_int = [name for name in int_columns if name in indexed]
+        if indexed_int:
+            return (" OR ".join(f'"{name}" = ?' for name in indexed_int),
+                    [int(search_term)] * len(indexed_int), "index")
+
+    if allow_fts and len(search_term) >= 3:
+        cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND sql LIKE '%USING fts5%'")
+        for fts_name, sql in cursor.fetchall():
+            match = re.search(r"content\s*=\s*'?(\w+)'?", sql or "")
+            if match and match.group(1) == table_name:
+                phrase = '"' + search_term.replace('"', '""') + '"'
+                return (f'rowid IN (SELECT rowid FROM "{fts_name}" WHERE "{fts_name}" MATCH ?)',
+                        [phrase], "fts")
+
+    clauses, params = [], []
+    for name in text_columns:
+        clauses.append(f'"{name}" LIKE ?')
+        params.append(f"%{search_term}%")
+    if re.fullmatch(r"-?\d+", search_term):
+        for name in int_columns:
+            if name not in text_columns:
+                clauses.append(f'"{name}" = ?')
+                params.append(int(search_term))
+    if not clauses:
+        clauses = [f'CAST("{name}" AS TEXT) LIKE ?' for name in names]
+        params = [f"%{search_term}%"] * len(names)
+    return " OR ".join(clauses), params, "scan"
+
+
+def _table_row_count(cursor: sqlite3.Cursor, table_name: str, archived: bool, count_cap: int) -> Tuple[int, bool]:
+    """
+    不带搜索条件时的总行数。
+
+    rowid 表先取 rowid 的跨度 MAX(rowid) - MIN(rowid) + 1（只读 B 树两端），不超过 count_cap 时再精确 COUNT(*)；
+    更大的表直接用跨度作为上限估计，删除留下的空洞只会让最后几页为空，所有记录都能翻到。
+    归档的 group_dialogs 按主库和归档库分别取跨度再相加：移入归档的最旧记录在主库留下的是跨度以下的空洞，
+    不会被重复计算，归档库只追加，其 rowid 从 1 连续增长。
+    没有 rowid 的表和视图退回精确的 COUNT(*)。
+
+    Returns:
+        Tuple[int, bool]: (总行数, 是否为估计值)
+    """
+    schemas = ["main", "archive"] if archived else ["main"]
+    try:
+        upper = 0
+        for schema in schemas:
+            # 两个子查询各自走 MIN/MAX 优化，只读 B 树一端
+            high, low = cursor.execute(
+                f'SELECT (SELECT MAX(rowid) FROM {schema}."{table_name}"), '
+                f'(SELECT MIN(rowid) FROM {schema}."{table_name}")'
+            ).fetchone()
+            if high is not None:
+                upper += high - low + 1
+    except sqlite3.OperationalError:
+        upper = None
+    if upper is not None and upper > count_cap:
+        return upper, True
+    cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"')
+    return cursor.fetchone()[0], False
+
+
 def get_table_data(
     table_name: str,
     page: int,
@@ -1422,6 +1791,10 @@ def get_table_data(
     """
     获取指定表的数据，支持分页、搜索和排序。
 
+    查询使用独立的只读连接并限制执行时间（database.viewer_timeout_ms）。
+    搜索结果的总行数最多统计到 database.viewer_count_cap 条，超过时 count_capped 为 True；
+    不搜索时大表的总行数用 rowid 跨度估计（count_estimated 为 True），可以一直翻到最后一页。
+
     Args:
         table_name: 表名
         page: 当前页码
@@ -1430,51 +1803,53 @@ def get_table_data(
         sorters: 排序器列表 (e.g., [{'field': 'name', 'dir': 'asc'}])
 
     Returns:
-        dict: 包含 headers, rows, total_rows, total_pages 的字典
+        dict: 包含 headers, rows, total_rows, total_pages, count_capped, count_estimated, search_mode 的字典
     """
-    conn, conn_index = db_pool.get_connection()
-    if not conn:
-        return {
-            "headers": [],
-            "rows": [],
-            "total_rows": 0,
-            "total_pages": 0,
-            "error": "无法获取数据库连接",
-        }
+    from utils.history_archive import ARCHIVED_TABLE
 
+    timeout_ms = get_config("database.viewer_timeout_ms", 3000)
+    count_cap = get_config("database.viewer_count_cap", 10000)
+    conn = None
     try:
+        conn, archived = _open_readonly_connection(timeout_ms)
+        archived = archived and table_name == ARCHIVED_TABLE
         cursor = conn.cursor()
 
-        # 获取表头
-        cursor.execute(f"PRAGMA table_info({table_name});")
-        headers = [info[1] for info in cursor.fetchall()]
+        # 获取表头（归档表以主库的表结构为准，同名临时视图没有主键和索引信息）
+        cursor.execute(f'PRAGMA main.table_info("{table_name}");')
+        columns = cursor.fetchall()
+        headers = [info[1] for info in columns]
 
         # 构建查询
-        base_query = f"FROM {table_name}"
-        where_clauses = []
+        base_query = f'FROM "{table_name}"'
         params = []
+        search_mode = None
 
         if search_term and headers:
-            search_clauses = []
-            for header in headers:
-                search_clauses.append(f"CAST({header} AS TEXT) LIKE ?")
-            where_clauses.append("(" + " OR ".join(search_clauses) + ")")
-            params.extend([f"%{search_term}%"] * len(headers))
-
-        # 获取总行数
-        count_query = "SELECT COUNT(*) " + base_query
-        if where_clauses:
-            count_query += " WHERE " + " AND ".join(where_clauses)
-        
-        cursor.execute(count_query, tuple(params))
-        total_rows = cursor.fetchone()[0]
+            where_clause, params, search_mode = _plan_table_search(cursor, table_name, columns, search_term)
+            if search_mode == "fts" and archived:
+                # 全文索引只覆盖主库，归档库中的记录按普通方式匹配
+                archive_clause, archive_params, _ = _plan_table_search(
+                    cursor, table_name, columns, search_term, allow_fts=False)
+                base_query = (f'FROM (SELECT * FROM main."{table_name}" WHERE {where_clause} '
+                              f'UNION ALL SELECT * FROM archive."{table_name}" WHERE {archive_clause})')
+                params = list(params) + list(archive_params)
+            else:
+                base_query += f" WHERE {where_clause}"
+
+        # 获取总行数：搜索结果最多统计到 count_cap 条，浏览整表时用 rowid 跨度估计大表
+        count_capped = count_estimated = False
+        if search_mode:
+            cursor.execute(f"SELECT COUNT(*) FROM (SELECT 1 {base_query} LIMIT ?)", tuple(params) + (count_cap,))
+            total_rows = cursor.fetchone()[0]
+            count_capped = total_rows >= count_cap
+        else:
+            total_rows, count_estimated = _table_row_count(cursor, table_name, archived, count_cap)
         total_pages = (total_rows + per_page - 1) // per_page
 
         # 获取当前页数据
         offset = (page - 1) * per_page
         data_query = f"SELECT * {base_query}"
-        if where_clauses:
-            data_query += " WHERE " + " AND ".join(where_clauses)
 
         # 添加排序逻辑
         order_by_clause = ""
@@ -1492,7 +1867,7 @@ def get_table_data(
         
         data_query += order_by_clause
         data_query += " LIMIT ? OFFSET ?"
-        params.extend([per_page, offset])
+        params = list(params) + [per_page, offset]
 
         cursor.execute(data_query, tuple(params))
         rows = cursor.fetchall()
@@ -1502,22 +1877,25 @@ def get_table_data(
             "rows": rows,
             "total_rows": total_rows,
             "total_pages": total_pages,
+            "count_capped": count_capped,
+            "count_estimated": count_estimated,
+            "search_mode": search_mode,
         }
 
     except sqlite3.Error as e:
+        error = str(e)
+        if "interrupted" in error:
+            error = f"查询超过 {timeout_ms}ms 已中断，请使用更精确的搜索词"
         return {
             "headers": [],
             "rows": [],
             "total_rows": 0,
             "total_pages": 0,
-            "error": str(e),
+            "error": error,
         }
     finally:
-        if conn_index >= 0:
-            db_pool.release_connection(conn_index)
-        else:
-            if conn:
-                conn.close()
+        if conn:
+            conn.close()
 
 
 # 应用退出时关闭所有数据库连接
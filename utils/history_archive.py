@@ -0,0 +1,287 @@
+"""
+群聊消息归档
+
+group_dialogs 保存了见过的每一条群消息，从不清理，而机器人本身只读取每个群最近的几十到几百条。
+这里把超过 retention.group_dialog_days 天的记录分批移动到单独的归档库（ATTACH 到同一个连接）：
+- 每个群至少保留最近 retention.keep_per_group 条，不论多旧；
+- 只在 retention.quiet_hours 时段内、连接池空闲时执行，每批之间暂停 retention.batch_pause 秒；
+- 每批在一个事务里 INSERT OR IGNORE 到归档库再从主库删除。WAL 模式下跨库提交不是原子的，
+  归档库在 (group_id, msg_id) 上有唯一索引，中断后重跑不会产生重复；
+- 有记录被移走后执行 PRAGMA incremental_vacuum 归还空闲页。新建的数据库默认使用增量 auto_vacuum，
+  已有数据库需要一次完整 VACUUM 才能切换，设置 retention.convert_auto_vacuum 后在安静时段执行。
+
+Web 管理界面的只读连接会以只读方式附加归档库，见 attach_archive_view。
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.config_utils import get_config
+from utils.db_utils import db_pool
+from utils.logging_utils import setup_logging
+from utils.metrics import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+ARCHIVED_TABLE = "group_dialogs"
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({_quote(table)})")]
+
+
+def get_archive_path() -> str:
+    """归档库路径，默认在主数据库旁边，文件名加 _archive 后缀。"""
+    configured = get_config("retention.archive_path", "")
+    if configured:
+        return configured
+    stem, ext = os.path.splitext(db_pool.db_file)
+    return f"{stem}_archive{ext or '.db'}"
+
+
+def attach_archive_view(conn: sqlite3.Connection) -> bool:
+    """
+    以只读方式附加归档库，并创建同名的临时视图 group_dialogs 合并主库和归档库。
+
+    临时视图优先于 main 中的同名表被解析，已有的查询不用修改即可包含归档记录。
+    连接必须以 uri=True 打开，且要在 PRAGMA query_only 之前调用。
+
+    Returns:
+        bool: 是否附加成功（归档库不存在时返回 False，连接保持原样）
+    """
+    archive_path = get_archive_path()
+    if not os.path.exists(archive_path):
+        return False
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (f"file:{archive_path}?mode=ro",))
+        if not _columns(conn, "archive", ARCHIVED_TABLE):
+            conn.execute("DETACH DATABASE archive")
+            return False
+        columns = ", ".join(_quote(name) for name in _columns(conn, "main", ARCHIVED_TABLE))
+        conn.execute(
+            f"CREATE TEMP VIEW {ARCHIVED_TABLE} AS "
+            f"SELECT {columns} FROM main.{ARCHIVED_TABLE} "
+            f"UNION ALL SELECT {columns} FROM archive.{ARCHIVED_TABLE}"
+        )
+        return True
+    except sqlite3.Error as e:
+        logger.warning(f"附加归档库失败，只查询主库: {e}")
+        return False
+
+
+class GroupDialogArchiver:
+    """
+    群聊消息归档任务，采用单例模式。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(GroupDialogArchiver, cls).__new__(cls)
+            cls._instance._init_archiver()
+        return cls._instance
+
+    def _init_archiver(self):
+        self.enabled = get_config("retention.enabled", True)
+        self.retention_days = get_config("retention.group_dialog_days", 30)
+        self.keep_per_group = get_config("retention.keep_per_group", 500)
+        self.batch_size = get_config("retention.batch_size", 500)
+        self.batch_pause = get_config("retention.batch_pause", 1.0)
+        self.quiet_hours = get_config("retention.quiet_hours", [3, 6])
+        self.check_interval = get_config("retention.check_interval", 600)
+        self.vacuum_pages = get_config("retention.vacuum_pages", 1000)
+        self.convert_auto_vacuum = get_config("retention.convert_auto_vacuum", False)
+        self.archive_path = get_archive_path()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._column_list = ""
+        self._runner: Optional[asyncio.Task] = None
+        # 归档连接只有一个，同一时间只允许一轮归档
+        self._pass_lock = asyncio.Lock()
+        self.stats = {"passes": 0, "archived": 0, "batches": 0, "vacuumed_pages": 0, "errors": 0,
+                      "last_pass_seconds": 0.0}
+
+    def start(self) -> None:
+        """创建归档库并启动后台任务，需要在事件循环中调用。"""
+        if not self.enabled:
+            return
+        if self._runner is not None and not self._runner.done():
+            return
+        try:
+            self._connection()
+        except sqlite3.Error as e:
+            logger.error(f"打开归档库失败，归档任务未启动: {e}")
+            return
+        self._runner = asyncio.create_task(self._run())
+        logger.info(f"群聊消息归档已启动，保留 {self.retention_days} 天，归档库: {self.archive_path}")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """归档专用连接：主库 + 可写的归档库，首次调用时创建归档表并补齐主库新增的列。"""
+        if self._conn is not None:
+            return self._conn
+        conn = sqlite3.connect(db_pool.db_file, timeout=30.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+        conn.execute("PRAGMA archive.journal_mode=WAL")
+        conn.execute("PRAGMA archive.synchronous=NORMAL")
+
+        # (列名, 声明类型)，归档表不带主库的约束，只保留列和类型
+        main_columns = [(row[1], row[2]) for row in conn.execute(f"PRAGMA main.table_info({ARCHIVED_TABLE})")]
+        archive_columns = set(_columns(conn, "archive", ARCHIVED_TABLE))
+        if not archive_columns:
+            definition = ", ".join(f"{_quote(name)} {decl}".strip() for name, decl in main_columns)
+            conn.execute(f"CREATE TABLE archive.{ARCHIVED_TABLE} ({definition})")
+        else:
+            for name, decl in main_columns:
+                if name not in archive_columns:
+                    conn.execute(f"ALTER TABLE archive.{ARCHIVED_TABLE} ADD COLUMN {_quote(name)} {decl}".strip())
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_{ARCHIVED_TABLE}_group_msg "
+                     f"ON {ARCHIVED_TABLE}(group_id, msg_id)")
+        self._column_list = ", ".join(_quote(name) for name, _ in main_columns)
+        self._conn = conn
+        return conn
+
+    def is_quiet(self) -> bool:
+        """当前是否处于安静时段（按本地时间的小时，[开始, 结束)，可以跨零点；开始等于结束表示全天）。"""
+        start, end = self.quiet_hours
+        if start == end:
+            return True
+        hour = datetime.datetime.now().hour
+        if start < end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self.is_quiet():
+                    await self.archive_pass()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"群聊消息归档出错: {e}", exc_info=True)
+            await asyncio.sleep(self.check_interval)
+
+    async def archive_pass(self) -> int:
+        """
+        归档一轮：逐个群分批移动过期记录，离开安静时段时中止。
+
+        Returns:
+            int: 本轮移动的记录数
+        """
+        async with self._pass_lock:
+            started = time.perf_counter()
+            cutoff = str(datetime.datetime.now() - datetime.timedelta(days=self.retention_days))
+            moved_total = 0
+            group_ids = await asyncio.to_thread(self._group_ids)
+            for group_id in group_ids:
+                while True:
+                    if not self.is_quiet():
+                        break
+                    if db_pool.get_stats()["in_use"]:
+                        await asyncio.sleep(self.batch_pause)
+                        continue
+                    moved = await asyncio.to_thread(self._move_batch, group_id, cutoff)
+                    moved_total += moved
+                    if moved < self.batch_size:
+                        break
+                    await asyncio.sleep(self.batch_pause)
+
+            if self.convert_auto_vacuum and self.is_quiet():
+                await asyncio.to_thread(self._convert_auto_vacuum)
+            if moved_total:
+                await asyncio.to_thread(self._incremental_vacuum)
+                logger.info(f"归档了 {moved_total} 条群聊消息（早于 {cutoff}）")
+            self.stats["passes"] += 1
+            self.stats["last_pass_seconds"] = round(time.perf_counter() - started, 3)
+            return moved_total
+
+    def _group_ids(self) -> List[int]:
+        conn = self._connection()
+        return [row[0] for row in conn.execute(f"SELECT DISTINCT group_id FROM main.{ARCHIVED_TABLE}")]
+
+    def _move_batch(self, group_id: int, cutoff: str) -> int:
+        """在一个事务里把一批记录复制到归档库并从主库删除，返回移动的条数。"""
+        conn = self._connection()
+        with metrics.timer("retention_batch_seconds"):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 该群第 keep_per_group+1 新的消息，它和更早的消息才可以归档
+                boundary = conn.execute(
+                    f"SELECT msg_id FROM main.{ARCHIVED_TABLE} WHERE group_id = ? "
+                    f"ORDER BY msg_id DESC LIMIT 1 OFFSET ?",
+                    (group_id, self.keep_per_group),
+                ).fetchone()
+                if boundary is None or boundary[0] is None:
+                    conn.execute("COMMIT")
+                    return 0
+                selection = (
+                    f"SELECT rowid FROM main.{ARCHIVED_TABLE} "
+                    f"WHERE group_id = ? AND msg_id <= ? AND create_at < ? ORDER BY msg_id LIMIT ?"
+                )
+                params = (group_id, boundary[0], cutoff, self.batch_size)
+                conn.execute(
+                    f"INSERT OR IGNORE INTO archive.{ARCHIVED_TABLE} ({self._column_list}) "
+                    f"SELECT {self._column_list} FROM main.{ARCHIVED_TABLE} WHERE rowid IN ({selection})",
+                    params,
+                )
+                moved = conn.execute(
+                    f"DELETE FROM main.{ARCHIVED_TABLE} WHERE rowid IN ({selection})", params
+                ).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if moved:
+            self.stats["batches"] += 1
+            self.stats["archived"] += moved
+        return moved
+
+    def _incremental_vacuum(self) -> None:
+        conn = self._connection()
+        if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] != 2:
+            return
+        before = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+        conn.execute(f"PRAGMA main.incremental_vacuum({int(self.vacuum_pages)})").fetchall()
+        after = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+        self.stats["vacuumed_pages"] += before - after
+
+    def _convert_auto_vacuum(self) -> None:
+        """把已有数据库切换为增量 auto_vacuum，需要一次完整 VACUUM，只执行一次。"""
+        conn = self._connection()
+        self.convert_auto_vacuum = False
+        if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2:
+            return
+        started = time.perf_counter()
+        conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM main")
+        logger.info(f"数据库已切换为增量 auto_vacuum，VACUUM 耗时 {time.perf_counter() - started:.1f}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+# 全局群聊消息归档实例
+group_dialog_archiver = GroupDialogArchiver()
+metrics.histogram("retention_batch_seconds", "每批归档（复制 + 删除）持有写锁的时间")
+metrics.register_collector("retention", group_dialog_archiver.get_stats)
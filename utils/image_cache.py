@@ -0,0 +1,180 @@
+"""
+图片分析结果缓存
+
+同一张表情包/转发图片（相同 file_unique_id 或相同内容）在短时间内被反复评分时，
+直接复用之前的 LLM 输出，避免重复调用最昂贵的视觉模型。
+
+缓存键为 (图片键, prompt 变体, hard_mode, 模型)，其中图片键优先使用 Telegram 的
+file_unique_id，没有时使用图片内容的 SHA-256。结果保存在 data/pics 目录下独立的
+SQLite 文件中，按 TTL 过期，超过条目上限时淘汰最久未使用的记录。
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils.config_utils import get_config, project_root
+from utils.logging_utils import setup_logging
+from utils.metrics import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS image_analysis_cache (
+    image_key TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    hard_mode INTEGER NOT NULL DEFAULT 0,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (image_key, variant, hard_mode, model)
+);
+CREATE INDEX IF NOT EXISTS idx_image_analysis_cache_last_used ON image_analysis_cache(last_used);
+"""
+
+
+def content_key(base64_data: str) -> str:
+    """没有 file_unique_id 时，用图片内容的哈希作为缓存键。"""
+    return "sha256:" + hashlib.sha256(base64_data.encode("ascii", "ignore")).hexdigest()
+
+
+class ImageAnalysisCache:
+    """
+    图片分析结果缓存，采用单例模式。
+
+    数据库连接在首次使用时才创建，未启用缓存时不会生成任何文件。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ImageAnalysisCache, cls).__new__(cls)
+            cls._instance._init_cache()
+        return cls._instance
+
+    def _init_cache(self):
+        self.enabled = get_config("image_cache.enabled", True)
+        self.ttl_seconds = get_config("image_cache.ttl_hours", 168) * 3600
+        self.max_entries = get_config("image_cache.max_entries", 5000)
+        self.db_path = os.path.join(
+            project_root, get_config("image_cache.path", "data/pics/analysis_cache.db")
+        )
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def get(self, image_key: str, variant: str, hard_mode: bool, model: str) -> Optional[str]:
+        """
+        查询缓存。
+
+        Returns:
+            Optional[str]: 命中时返回 LLM 原始输出，未命中或已过期返回 None
+        """
+        if not self.enabled or not image_key:
+            return None
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT response, created_at FROM image_analysis_cache "
+                    "WHERE image_key = ? AND variant = ? AND hard_mode = ? AND model = ?",
+                    (image_key, variant, int(hard_mode), model),
+                ).fetchone()
+                if row is None or now - row[1] > self.ttl_seconds:
+                    self.stats["misses"] += 1
+                    return None
+                conn.execute(
+                    "UPDATE image_analysis_cache SET last_used = ?, hit_count = hit_count + 1 "
+                    "WHERE image_key = ? AND variant = ? AND hard_mode = ? AND model = ?",
+                    (now, image_key, variant, int(hard_mode), model),
+                )
+                conn.commit()
+                self.stats["hits"] += 1
+                return row[0]
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            logger.warning(f"读取图片分析缓存失败: {e}")
+            return None
+
+    def put(self, image_key: str, variant: str, hard_mode: bool, model: str, response: str) -> None:
+        """写入缓存，并定期清理过期和超出上限的记录。"""
+        if not self.enabled or not image_key or not response:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO image_analysis_cache "
+                    "(image_key, variant, hard_mode, model, response, created_at, last_used, hit_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                    (image_key, variant, int(hard_mode), model, response, now, now),
+                )
+                conn.commit()
+                self.stats["stores"] += 1
+                self._puts_since_prune += 1
+                if self._puts_since_prune >= 100:
+                    self._prune(conn, now)
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            logger.warning(f"写入图片分析缓存失败: {e}")
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        """删除过期记录，并按 last_used 淘汰超出 max_entries 的部分。"""
+        self._puts_since_prune = 0
+        expired = conn.execute(
+            "DELETE FROM image_analysis_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        overflow = conn.execute(
+            "DELETE FROM image_analysis_cache WHERE rowid IN ("
+            "SELECT rowid FROM image_analysis_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        conn.commit()
+        self.stats["evictions"] += expired + overflow
+        if expired or overflow:
+            logger.info(f"图片分析缓存清理: 过期 {expired} 条，超限淘汰 {overflow} 条")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计。"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        entries = 0
+        if self._conn is not None:
+            with self._lock:
+                entries = self._conn.execute("SELECT COUNT(*) FROM image_analysis_cache").fetchone()[0]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 全局缓存实例
+image_analysis_cache = ImageAnalysisCache()
+metrics.register_collector("image_analysis_cache", image_analysis_cache.get_stats)
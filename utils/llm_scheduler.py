@@ -0,0 +1,321 @@
+"""
+LLM 请求调度器
+
+替代原先全局共享的 asyncio.Semaphore：
+- 每个 API 独立的并发上限（api_list 中的 concurrency 字段，缺省为 api.semaphore_limit）；
+- 三个优先级：私聊/指令等交互请求 > 群聊随机/关键词回复 > 摘要、画像等后台任务；
+- 同一优先级内按用户轮转，单个用户的突发请求不会挤占其他用户；
+- 后台任务最多占用 limit - api.interactive_reserve 个并发，给交互请求预留位置；
+- 可为请求设置排队期限，预计等待超过期限时直接放弃（群聊非交互触发）；
+- 记录各优先级的排队时间，供监控使用。
+
+配置热加载时（见 utils.config_utils.on_config_reload）重新读取各 API 的并发上限，已有的队列保留。
+
+调度状态不加锁，只能在机器人的事件循环中访问：等待者的 Future 由释放位置的一方直接 set_result，
+其他线程（如 Web 请求线程）需要调用 LLM 时通过 asyncio.run_coroutine_threadsafe 提交到该循环。
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from utils.config_utils import ConfigSnapshot, get_api_entry, get_config, on_config_reload
+from utils.logging_utils import setup_logging
+from utils.metrics import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# 优先级，数值越小越优先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_GROUP = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_GROUP: "group",
+    PRIORITY_BACKGROUND: "background",
+}
+
+
+class LLMQueueTimeout(Exception):
+    """请求在排队期限内无法获得执行位置"""
+    pass
+
+
+class _Waiter:
+    __slots__ = ("future", "priority", "user_key", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, priority: int, user_key: Any):
+        self.future = future
+        self.priority = priority
+        self.user_key = user_key
+        self.enqueued_at = time.monotonic()
+
+
+class _ApiLane:
+    """单个 API 的并发状态和等待队列。"""
+
+    def __init__(self, name: str, limit: int, reserve: int):
+        self.name = name
+        self.limit = max(1, limit)
+        # 后台任务可用的最大并发数，至少保留 1
+        self.background_limit = max(1, self.limit - reserve)
+        self.active = 0
+        self.active_by_priority: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        # priority -> OrderedDict[user_key, deque[_Waiter]]
+        self.queues: Dict[int, "OrderedDict[Any, Deque[_Waiter]]"] = {
+            p: OrderedDict() for p in PRIORITY_NAMES
+        }
+        self.service_ewma = 10.0  # 平均单次请求耗时(秒)，用于估算排队时间
+
+    def set_limit(self, limit: int, reserve: int) -> None:
+        self.limit = max(1, limit)
+        self.background_limit = max(1, self.limit - reserve)
+
+    def queued(self, max_priority: Optional[int] = None) -> int:
+        """统计排在指定优先级(含)之前的等待请求数。"""
+        total = 0
+        for priority, users in self.queues.items():
+            if max_priority is None or priority <= max_priority:
+                total += sum(len(q) for q in users.values())
+        return total
+
+    def can_start(self, priority: int) -> bool:
+        if self.active >= self.limit:
+            return False
+        if priority == PRIORITY_BACKGROUND:
+            return self.active_by_priority[PRIORITY_BACKGROUND] < self.background_limit
+        return True
+
+    def enqueue(self, waiter: _Waiter) -> None:
+        users = self.queues[waiter.priority]
+        if waiter.user_key not in users:
+            users[waiter.user_key] = deque()
+        users[waiter.user_key].append(waiter)
+
+    def remove(self, waiter: _Waiter) -> None:
+        users = self.queues[waiter.priority]
+        queue = users.get(waiter.user_key)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue:
+            del users[waiter.user_key]
+
+    def pop_next(self) -> Optional[_Waiter]:
+        """按优先级取出下一个可执行的请求，同一优先级内按用户轮转。"""
+        for priority in sorted(self.queues):
+            users = self.queues[priority]
+            if not users or not self.can_start(priority):
+                continue
+            user_key, queue = next(iter(users.items()))
+            waiter = queue.popleft()
+            if queue:
+                users.move_to_end(user_key)
+            else:
+                del users[user_key]
+            return waiter
+        return None
+
+
+class LLMRequestScheduler:
+    """
+    LLM 请求调度器，采用单例模式。
+
+    使用方式:
+        async with llm_scheduler.slot(api_name, PRIORITY_INTERACTIVE, user_id):
+            ...  # 调用 LLM
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(LLMRequestScheduler, cls).__new__(cls)
+            cls._instance._init_scheduler()
+        return cls._instance
+
+    def _init_scheduler(self):
+        self.default_limit = get_config("api.semaphore_limit", 5)
+        self.interactive_reserve = get_config("api.interactive_reserve", 1)
+        self._lanes: Dict[str, _ApiLane] = {}
+        self._wait_samples: Dict[int, Deque[float]] = {p: deque(maxlen=500) for p in PRIORITY_NAMES}
+        self._wait_totals: Dict[int, Dict[str, float]] = {
+            p: {"count": 0, "total": 0.0, "max": 0.0, "dropped": 0} for p in PRIORITY_NAMES
+        }
+
+    def _api_limit(self, api_name: str) -> int:
+        api = get_api_entry(api_name)
+        return api.get("concurrency", self.default_limit) if api is not None else self.default_limit
+
+    def _lane(self, api_name: str) -> _ApiLane:
+        lane = self._lanes.get(api_name)
+        if lane is None:
+            lane = _ApiLane(api_name, self._api_limit(api_name), self.interactive_reserve)
+            self._lanes[api_name] = lane
+        return lane
+
+    def reload_config(self, snapshot: Optional[ConfigSnapshot] = None) -> None:
+        """
+        配置热加载回调（在事件循环中执行）：更新并发上限和预留数。
+
+        上限调高时立即调度已在排队的请求；调低时正在执行的请求不受影响，归还位置后按新上限调度。
+        """
+        self.default_limit = get_config("api.semaphore_limit", 5)
+        self.interactive_reserve = get_config("api.interactive_reserve", 1)
+        for name, lane in list(self._lanes.items()):
+            limit = self._api_limit(name)
+            if limit == lane.limit and max(1, limit - self.interactive_reserve) == lane.background_limit:
+                continue
+            logger.info(f"API {name} 的并发上限调整为 {limit}")
+            lane.set_limit(limit, self.interactive_reserve)
+            self._dispatch(lane)
+
+    def estimate_wait(self, api_name: str, priority: int) -> float:
+        """估算一个新请求在该 API 上的排队时间(秒)。"""
+        lane = self._lane(api_name)
+        if lane.can_start(priority) and lane.queued(priority) == 0:
+            return 0.0
+        ahead = lane.queued(priority) + 1
+        return ahead / lane.limit * lane.service_ewma
+
+    def would_exceed(self, api_name: str, priority: int, deadline: Optional[float]) -> bool:
+        """判断请求预计等待时间是否超过期限，用于在发送占位消息前提前放弃。"""
+        if deadline is None:
+            return False
+        return self.estimate_wait(api_name, priority) > deadline
+
+    def _record_wait(self, priority: int, waited: float) -> None:
+        totals = self._wait_totals[priority]
+        totals["count"] += 1
+        totals["total"] += waited
+        totals["max"] = max(totals["max"], waited)
+        self._wait_samples[priority].append(waited)
+
+    def _drop(self, priority: int, api_name: str, reason: str) -> LLMQueueTimeout:
+        self._wait_totals[priority]["dropped"] += 1
+        logger.info(f"LLM 请求被丢弃: api={api_name}, priority={PRIORITY_NAMES[priority]}, {reason}")
+        return LLMQueueTimeout(f"API {api_name} 排队超时: {reason}")
+
+    async def acquire(
+        self,
+        api_name: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        user_id: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ) -> None:
+        """
+        获取一个执行位置。
+
+        Args:
+            api_name: API 名称
+            priority: 优先级
+            user_id: 发起请求的用户，用于同优先级内的公平轮转
+            deadline: 最长排队秒数，None 表示一直等待
+
+        Raises:
+            LLMQueueTimeout: 预计或实际排队时间超过 deadline 时抛出
+        """
+        lane = self._lane(api_name)
+        if lane.can_start(priority) and lane.queued(priority) == 0:
+            lane.active += 1
+            lane.active_by_priority[priority] += 1
+            self._record_wait(priority, 0.0)
+            return
+
+        if self.would_exceed(api_name, priority, deadline):
+            raise self._drop(priority, api_name, "预计等待时间超过期限")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), priority, user_id)
+        lane.enqueue(waiter)
+        try:
+            if deadline is None:
+                await waiter.future
+            else:
+                await asyncio.wait_for(waiter.future, deadline)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            lane.remove(waiter)
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已被分配位置但调用方不再需要，归还位置
+                self._release_slot(lane, priority)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._drop(priority, api_name, "排队超时")
+            raise
+        self._record_wait(priority, time.monotonic() - waiter.enqueued_at)
+
+    def release(self, api_name: str, priority: int, service_time: Optional[float] = None) -> None:
+        """归还执行位置，并唤醒下一个等待的请求。"""
+        lane = self._lane(api_name)
+        if service_time is not None:
+            lane.service_ewma = lane.service_ewma * 0.8 + service_time * 0.2
+        self._release_slot(lane, priority)
+
+    def _release_slot(self, lane: _ApiLane, priority: int) -> None:
+        lane.active = max(0, lane.active - 1)
+        lane.active_by_priority[priority] = max(0, lane.active_by_priority[priority] - 1)
+        self._dispatch(lane)
+
+    def _dispatch(self, lane: _ApiLane) -> None:
+        while True:
+            waiter = lane.pop_next()
+            if waiter is None:
+                return
+            future = waiter.future
+            if future.done() or future.get_loop().is_closed():
+                continue
+            lane.active += 1
+            lane.active_by_priority[waiter.priority] += 1
+            future.set_result(True)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        api_name: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        user_id: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ):
+        """acquire/release 的上下文管理器形式，同时记录请求耗时。"""
+        await self.acquire(api_name, priority, user_id, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(api_name, priority, time.monotonic() - started)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各 API 的并发情况和各优先级的排队时间统计。"""
+        lanes = {
+            name: {
+                "limit": lane.limit,
+                "active": lane.active,
+                "queued": lane.queued(),
+                "avg_service_seconds": round(lane.service_ewma, 3),
+            }
+            for name, lane in self._lanes.items()
+        }
+        waits = {}
+        for priority, totals in self._wait_totals.items():
+            samples = sorted(self._wait_samples[priority])
+            p95 = samples[int(len(samples) * 0.95) - 1] if samples else 0.0
+            waits[PRIORITY_NAMES[priority]] = {
+                "count": int(totals["count"]),
+                "dropped": int(totals["dropped"]),
+                "avg_wait": round(totals["total"] / totals["count"], 3) if totals["count"] else 0.0,
+                "p95_wait": round(p95, 3),
+                "max_wait": round(totals["max"], 3),
+            }
+        return {"apis": lanes, "queue_wait": waits}
+
+
+# 全局调度器实例
+llm_scheduler = LLMRequestScheduler()
+on_config_reload(llm_scheduler.reload_config, in_loop=True)
+metrics.register_collector("llm_scheduler", llm_scheduler.get_stats)
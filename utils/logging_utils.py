@@ -1,4 +1,8 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import random
 
 class ThirdPartyFilter(logging.Filter):
     """
@@ -20,39 +24,99 @@ class ThirdPartyFilter(logging.Filter):
         # 对于非第三方库（即你的代码），允许所有级别
         return True
 
+
+class SamplingFilter(logging.Filter):
+    """
+    对高频日志按比例采样。
+    sample_rates 为 {logger 名称前缀: 保留比例}，只对 WARNING 以下的日志生效。
+    """
+
+    def __init__(self, sample_rates: dict):
+        super().__init__()
+        # 按前缀长度倒序，优先匹配最具体的 logger
+        self.sample_rates = sorted(sample_rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.sample_rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return random.random() < rate
+        return True
+
+
+_queue_listener = None
+
+
+def _stop_listener():
+    """进程退出时刷新队列中剩余的日志。"""
+    global _queue_listener
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
 def setup_logging():
     """
-    设置日志配置，确保控制台显示所有模块的 DEBUG 日志，文件只保存 INFO 日志。
-    使用过滤器抑制第三方库的低级别日志。
+    设置日志配置，控制台和文件默认都只记录 INFO 及以上的日志，排查问题时把 logging.console_level
+    设为 DEBUG 打开调试日志。
+
+    - 根 logger 只挂一个 QueueHandler，格式化和写文件都在 QueueListener 的后台线程完成，
+      不阻塞事件循环；
+    - 文件按大小轮转（logging.max_bytes / logging.backup_count）；
+    - 根 logger 的级别取控制台和文件级别中较低者，未启用的级别在 isEnabledFor 处直接短路
+      （默认配置下 DEBUG 日志和 isEnabledFor(logging.DEBUG) 保护的调试输出都不会执行）；
+    - logging.sample_rates 可对高频 logger 按比例采样。
+
+    各模块在导入时都会调用本函数，只有第一次调用会真正配置。
     """
-    # 设置根 logger 级别为 DEBUG，覆盖所有模块
-    root_logger = logging.getLogger('')
-    root_logger.setLevel(logging.DEBUG)
+    global _queue_listener
+    if _queue_listener is not None:
+        return
+
+    from utils.config_utils import get_config
+
+    console_level = logging.getLevelName(str(get_config("logging.console_level", "INFO")).upper())
+    file_level = logging.getLevelName(str(get_config("logging.file_level", "INFO")).upper())
 
     # 创建两个 handler：一个用于文件，一个用于控制台
-    file_handler = logging.FileHandler("bot.log", encoding='utf-8')
+    file_handler = logging.handlers.RotatingFileHandler(
+        get_config("logging.file", "bot.log"),
+        maxBytes=get_config("logging.max_bytes", 10 * 1024 * 1024),
+        backupCount=get_config("logging.backup_count", 5),
+        encoding='utf-8',
+    )
     stream_handler = logging.StreamHandler()
-
-    # 设置文件 handler 的级别为 INFO 或以上（不记录 DEBUG）
-    file_handler.setLevel(logging.INFO)
-    # 设置控制台 handler 的级别为 DEBUG（允许显示 DEBUG 日志）
-    stream_handler.setLevel(logging.DEBUG)
+    file_handler.setLevel(file_level)
+    stream_handler.setLevel(console_level)
 
     # 设置日志格式
     log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     file_handler.setFormatter(log_format)
     stream_handler.setFormatter(log_format)
 
-    # 清除默认 handler（避免重复添加）
-    root_logger.handlers = []
+    # 第三方库的低级别日志在 logger 上直接拦截，不再创建记录
+    for lib in ThirdPartyFilter.third_party_libs:
+        logging.getLogger(lib).setLevel(logging.WARNING)
+
+    # 根 logger 只负责把记录放进队列
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ThirdPartyFilter())
+    sample_rates = get_config("logging.sample_rates", {})
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
 
-    # 添加 handler 到根 logger
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(stream_handler)
+    root_logger = logging.getLogger('')
+    root_logger.setLevel(min(console_level, file_level))
+    # 清除默认 handler（避免重复添加）
+    root_logger.handlers = [queue_handler]
 
-    # 添加自定义过滤器到控制台 handler，抑制第三方库的低级别日志
-    stream_handler.addFilter(ThirdPartyFilter())
-    file_handler.addFilter(ThirdPartyFilter())
+    _queue_listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    _queue_listener.start()
+    atexit.register(_stop_listener)
 
 # 调用配置函数（在主程序入口处调用）
 if __name__ == "__main__":
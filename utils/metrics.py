@@ -0,0 +1,352 @@
+"""
+运行指标
+
+轻量的计数器和直方图注册表，用来观察处理器、数据库、LLM 和行情请求的耗时：
+- 写入只修改当前线程自己的分片（threading.local 中的字典），热路径上没有锁；
+  线程第一次写入时登记分片，导出时合并所有分片；线程结束后它的分片并入一个汇总分片，
+  Web 服务器每个请求一个线程时分片数量也不会增长，累计值不会倒退；
+- 直方图使用固定的桶（秒），导出为 Prometheus 文本格式；
+- 各组件已有的 get_stats() 通过 register_collector 登记，导出时作为 gauge 一起输出。
+
+metrics.enabled 为 false 时 inc / observe 直接返回。
+"""
+
+import bisect
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.config_utils import get_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+SeriesKey = Tuple[str, LabelKey]
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    if not labels:
+        return ()
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: LabelKey) -> str:
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in labels:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(round(value, 6))
+
+
+class _Shard:
+    """单个线程的累加器。"""
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters: Dict[SeriesKey, float] = {}
+        # 每个序列: [各桶计数..., +Inf 计数, 总和]
+        self.histograms: Dict[SeriesKey, List[float]] = {}
+
+    def merge_into(self, counters: Dict[SeriesKey, float], histograms: Dict[SeriesKey, List[float]]) -> None:
+        for key, value in list(self.counters.items()):
+            counters[key] = counters.get(key, 0.0) + value
+        for key, series in list(self.histograms.items()):
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = list(series)
+            else:
+                for index, value in enumerate(series):
+                    merged[index] += value
+
+
+class _ShardHandle:
+    """保存在 threading.local 中，线程结束时被回收，触发分片并入汇总分片。"""
+
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self, shard: _Shard):
+        self.shard = shard
+
+
+class MetricsRegistry:
+    """
+    指标注册表，采用单例模式。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MetricsRegistry, cls).__new__(cls)
+            cls._instance._init_registry()
+        return cls._instance
+
+    def _init_registry(self):
+        self.enabled = get_config("metrics.enabled", True)
+        self.prefix = get_config("metrics.prefix", "waifu")
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        # 已结束线程的累计值
+        self._retired = _Shard()
+        self._shards_lock = threading.RLock()
+        # 名称 -> (类型, 说明)
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    # ---- 定义 ----
+
+    def counter(self, name: str, help_text: str) -> None:
+        """声明计数器，未声明的名称也可以直接使用，只是没有说明文字。"""
+        self._meta[name] = ("counter", help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """声明直方图及其桶（秒）。"""
+        self._meta[name] = ("histogram", help_text)
+        self._buckets[name] = tuple(sorted(buckets))
+
+    def register_collector(self, name: str, collect: Callable[[], Dict[str, Any]]) -> None:
+        """
+        登记一个统计来源，导出时调用 collect() 并把其中的数值作为 gauge 输出。
+
+        嵌套字典的键变成指标名的一部分；值全部是字典的一层（例如按 API 名称区分）变成 name 标签。
+        """
+        self._collectors[name] = collect
+
+    # ---- 写入 ----
+
+    def _shard(self) -> _Shard:
+        handle = getattr(self._local, "handle", None)
+        if handle is None:
+            shard = _Shard()
+            handle = _ShardHandle(shard)
+            weakref.finalize(handle, self._retire, shard)
+            self._local.handle = handle
+            with self._shards_lock:
+                self._shards.append(shard)
+        return handle.shard
+
+    def _retire(self, shard: _Shard) -> None:
+        """线程结束后把它的分片并入汇总分片。"""
+        with self._shards_lock:
+            try:
+                self._shards.remove(shard)
+            except ValueError:
+                return
+            shard.merge_into(self._retired.counters, self._retired.histograms)
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        if not self.enabled:
+            return
+        counters = self._shard().counters
+        key = (name, _label_key(labels))
+        counters[key] = counters.get(key, 0.0) + amount
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        if not self.enabled:
+            return
+        histograms = self._shard().histograms
+        key = (name, _label_key(labels))
+        buckets = self._buckets.get(name, DEFAULT_BUCKETS)
+        series = histograms.get(key)
+        if series is None:
+            series = histograms[key] = [0.0] * (len(buckets) + 2)
+        series[bisect.bisect_left(buckets, seconds)] += 1
+        series[-1] += seconds
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """记录代码块耗时，异常时同样记录。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels) -> Callable:
+        """函数耗时装饰器，支持同步和异步函数。"""
+
+        def decorator(func: Callable) -> Callable:
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.observe(name, time.perf_counter() - start, **labels)
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+
+            return wrapper
+
+        return decorator
+
+    def instrument_repository(self, cls: type) -> type:
+        """
+        类装饰器：为数据访问类的公开静态方法/类方法/普通方法记录 repository_seconds{repository, method}。
+        """
+        repository = cls.__name__
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_"):
+                continue
+            labels = {"repository": repository, "method": attr}
+            if isinstance(value, staticmethod):
+                setattr(cls, attr, staticmethod(self.timed("repository_seconds", **labels)(value.__func__)))
+            elif isinstance(value, classmethod):
+                setattr(cls, attr, classmethod(self.timed("repository_seconds", **labels)(value.__func__)))
+            elif inspect.isfunction(value):
+                setattr(cls, attr, self.timed("repository_seconds", **labels)(value))
+        return cls
+
+    # ---- 导出 ----
+
+    def collect(self) -> Dict[str, Dict[SeriesKey, Any]]:
+        """合并所有线程的分片和已结束线程的汇总分片。"""
+        counters: Dict[SeriesKey, float] = {}
+        histograms: Dict[SeriesKey, List[float]] = {}
+        # 持锁合并，避免某个分片恰好在合并过程中并入汇总分片而被算两次
+        with self._shards_lock:
+            self._retired.merge_into(counters, histograms)
+            for shard in self._shards:
+                shard.merge_into(counters, histograms)
+        return {"counters": counters, "histograms": histograms}
+
+    def _gauges(self) -> List[Tuple[str, LabelKey, float]]:
+        gauges: List[Tuple[str, LabelKey, float]] = []
+
+        def walk(path: str, node: Dict[str, Any], labels: Dict[str, str]) -> None:
+            for key, value in node.items():
+                name = f"{path}_{_NAME_RE.sub('_', str(key))}"
+                if isinstance(value, (int, float)):
+                    gauges.append((name, _label_key(labels), float(value)))
+                elif isinstance(value, dict) and value:
+                    if all(isinstance(child, dict) for child in value.values()):
+                        for child_key, child in value.items():
+                            walk(name, child, {**labels, "name": str(child_key)})
+                    else:
+                        walk(name, value, labels)
+
+        for source, collect in list(self._collectors.items()):
+            try:
+                walk(_NAME_RE.sub("_", source), collect(), {})
+            except Exception as e:
+                logger.warning(f"读取 {source} 的统计失败: {e}")
+        return gauges
+
+    def render_prometheus(self) -> str:
+        """导出 Prometheus 文本格式。"""
+        prefix = self.prefix
+        data = self.collect()
+        lines: List[str] = []
+        described = set()
+
+        def header(name: str, kind: str) -> None:
+            if name in described:
+                return
+            described.add(name)
+            help_text = self._meta.get(name, (kind, ""))[1]
+            if help_text:
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        for (name, labels), value in sorted(data["counters"].items()):
+            header(name, "counter")
+            lines.append(f"{prefix}_{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), series in sorted(data["histograms"].items()):
+            header(name, "histogram")
+            buckets = self._buckets.get(name, DEFAULT_BUCKETS)
+            cumulative = 0.0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f"{prefix}_{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} "
+                             f"{_format_value(cumulative)}")
+            count = cumulative + series[len(buckets)]
+            lines.append(f"{prefix}_{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {_format_value(count)}")
+            lines.append(f"{prefix}_{name}_sum{_format_labels(labels)} {_format_value(series[-1])}")
+            lines.append(f"{prefix}_{name}_count{_format_labels(labels)} {_format_value(count)}")
+
+        for name, labels, value in self._gauges():
+            header(name, "gauge")
+            lines.append(f"{prefix}_{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, top: Optional[int] = None) -> List[str]:
+        """
+        可读的摘要：每个直方图序列的次数、平均值和按桶估算的 p95，以及计数器。
+
+        Args:
+            top: 只保留总耗时最多的前若干个直方图序列
+        """
+        data = self.collect()
+        rows = []
+        for (name, labels), series in data["histograms"].items():
+            buckets = self._buckets.get(name, DEFAULT_BUCKETS)
+            count = sum(series[:-1])
+            if not count:
+                continue
+            target = count * 0.95
+            cumulative = 0.0
+            p95_text = f">{buckets[-1]:g}s"
+            for bound, bucket_count in zip(buckets, series):
+                cumulative += bucket_count
+                if cumulative >= target:
+                    p95_text = f"≤{bound * 1000:g}ms"
+                    break
+            rows.append((series[-1], name, labels, int(count), series[-1] / count, p95_text))
+        rows.sort(key=lambda row: row[0], reverse=True)
+        if top is not None:
+            rows = rows[:top]
+
+        lines = []
+        for total, name, labels, count, avg, p95_text in rows:
+            lines.append(f"{name}{_format_labels(labels)} n={count} avg={avg * 1000:.1f}ms p95{p95_text} "
+                         f"total={total:.1f}s")
+        for (name, labels), value in sorted(data["counters"].items()):
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+metrics.histogram("handler_seconds", "Telegram 处理器耗时")
+metrics.histogram("db_operation_seconds", "query_db / revise_db / revise_db_batch 耗时（含取连接）")
+metrics.histogram("db_pool_acquire_seconds", "从连接池取得连接的耗时（池满时含创建临时连接）",
+                  buckets=(0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
+metrics.counter("db_pool_temporary_connections_total", "连接池已满时创建的临时连接数")
+metrics.histogram("repository_seconds", "数据访问方法耗时")
+metrics.histogram("llm_slot_wait_seconds", "LLM 请求等待调度器并发槽位的时间")
+metrics.histogram("llm_first_token_seconds", "取得槽位到收到第一个内容块的时间")
+metrics.histogram("llm_request_seconds", "取得槽位到响应结束的时间")
+metrics.counter("llm_errors_total", "LLM 请求失败次数")
+metrics.histogram("price_fetch_seconds", "从交易所获取行情的耗时")
+metrics.counter("price_cache_total", "价格查询按结果计数（hit / miss / fallback）")
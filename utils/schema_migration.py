@@ -360,6 +360,10 @@ class DatabaseSchemaComparator:
             expected.autoincrement != current.autoincrement
         )
 
+def get_database_path() -> str:
+    """数据库文件路径，环境变量 DB_PATH 优先（与连接池一致）"""
+    return os.environ.get("DB_PATH") or os.path.join(project_root, "data", "data.db")
+
 def get_schema_parser() -> SQLSchemaParser:
     """获取SQL结构解析器实例"""
     sql_file_path = os.path.join(project_root, "data", "database.sql")
@@ -367,7 +371,7 @@ def get_schema_parser() -> SQLSchemaParser:
 
 def get_schema_comparator() -> DatabaseSchemaComparator:
     """获取数据库结构比较器实例"""
-    db_path = os.path.join(project_root, "data", "data.db")
+    db_path = get_database_path()
     return DatabaseSchemaComparator(db_path)
 
 class DatabaseSchemaMigrator:
@@ -552,7 +556,7 @@ class DatabaseSchemaMigrator:
 
 def get_schema_migrator() -> DatabaseSchemaMigrator:
     """获取数据库结构迁移器实例"""
-    db_path = os.path.join(project_root, "data", "data.db")
+    db_path = get_database_path()
     return DatabaseSchemaMigrator(db_path)
 
 def check_and_migrate_database_schema() -> bool:
@@ -0,0 +1,50 @@
+"""
+启动耗时统计
+
+记录进程启动各阶段的耗时，在机器人开始轮询前输出一份报告，方便定位冷启动慢的环节。
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+# 进程内尽早导入本模块，以此作为启动计时的起点
+_PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    """按阶段记录启动耗时。"""
+
+    def __init__(self):
+        self.phases: List[Tuple[str, float]] = []
+        self._last_mark = _PROCESS_START
+        self.reported = False
+
+    @contextmanager
+    def phase(self, name: str):
+        """统计 with 块内代码的耗时，不影响 mark() 的计时区间。"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def mark(self, name: str) -> None:
+        """记录从上一次标记(或进程启动)到现在的耗时。"""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last_mark))
+        self._last_mark = now
+
+    def report(self, logger: logging.Logger) -> None:
+        """输出各阶段耗时，只在第一次调用时生效。"""
+        if self.reported:
+            return
+        self.reported = True
+        total = time.perf_counter() - _PROCESS_START
+        lines = [f"  {name:<24} {seconds * 1000:>9.1f} ms" for name, seconds in self.phases]
+        logger.info("启动耗时报告:\n" + "\n".join(lines) + f"\n  {'总计':<24} {total * 1000:>9.1f} ms")
+
+
+# 全局启动计时器
+startup_timer = StartupTimer()
@@ -1,5 +1,8 @@
 import re
 import base64
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def extract_tag_content(text, tag):
@@ -18,9 +21,7 @@ def extract_tag_content(text, tag):
     Returns:
         匹配的标签内容（纯文本），如果没有匹配到，则返回原始文本。
     """
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.debug(f"extract_tag_content 收到文本 (tag={tag}): {text}")
+    logger.debug("extract_tag_content 收到文本 (tag=%s): %s", tag, text)
 
     match_content = None
 
@@ -84,13 +85,13 @@ def extract_tag_content(text, tag):
         logger.debug(f"extract_tag_content 未找到 {tag} 标签内容，返回'暂无'")
         return "暂无"
 
-    logger.debug(f"extract_tag_content 提取的 {tag} 标签内容: {match_content}")
+    logger.debug("extract_tag_content 提取的 %s 标签内容: %s", tag, match_content)
 
     # 移除所有HTML标签，只返回纯文本
     plain_text = re.sub(r'<.*?>', '', match_content, flags=re.DOTALL)
     result = plain_text.strip()
 
-    logger.debug(f"extract_tag_content 处理后返回 (tag={tag}): {result}")
+    logger.debug("extract_tag_content 处理后返回 (tag=%s): %s", tag, result)
     return result
 
 
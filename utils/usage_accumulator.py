@@ -0,0 +1,271 @@
+"""
+用量与额度的合并写入
+
+每次回复都会产生 token、额度、轮次等多项计数变化，原先每一项都单独执行一条 UPDATE 并提交。
+这里先把增量累积在内存里，按用户/群组合并后，每隔 flush_interval_ms 毫秒或累计 flush_max_events
+次记录时，由事件循环中的后台任务在工作线程里用一个事务批量 UPDATE 写入数据库；
+关闭时（aclose，事件循环已关闭时用 close）写入剩余部分。
+
+额度检查读取的用户对象会叠加尚未写入的增量（见 apply_pending），因此扣费在写入前也能立即生效。
+读取数据库和叠加增量要在 reading() 中进行：批量写入从取出增量到提交（或失败放回）的整个过程持有同一把锁，
+读取方看到的要么是写入前的数据库加内存中的增量，要么是写入后的数据库，不会两边都缺。
+"""
+
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from utils import db_utils as db
+from utils.config_utils import ConfigSnapshot, get_config, on_config_reload
+from utils.logging_utils import setup_logging
+from utils.metrics import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+_USER_FIELDS = ("input_tokens", "output_tokens", "remain_frequency", "dialog_turns")
+_GROUP_FIELDS = ("call_count", "input_token", "output_token")
+
+
+def _counter() -> Dict[str, int]:
+    return defaultdict(int)
+
+
+class UsageAccumulator:
+    """
+    用量累加器，采用单例模式。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(UsageAccumulator, cls).__new__(cls)
+            cls._instance._init_accumulator()
+        return cls._instance
+
+    def _init_accumulator(self):
+        self.reload_config()
+        self._lock = threading.Lock()
+        # 批量写入期间持有，见 reading()
+        self._commit_lock = threading.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._reset_pending()
+        self.stats = {"events": 0, "flushes": 0, "statements": 0, "errors": 0}
+
+    def reload_config(self, snapshot: Optional[ConfigSnapshot] = None) -> None:
+        """读取写入间隔和条数，配置热加载时也会调用。"""
+        self.flush_interval = get_config("usage.flush_interval_ms", 1000) / 1000
+        self.flush_max_events = get_config("usage.flush_max_events", 50)
+
+    def _reset_pending(self):
+        self._users: Dict[int, Dict[str, int]] = defaultdict(_counter)
+        self._signs: Dict[int, int] = defaultdict(int)
+        self._groups: Dict[int, Dict[str, int]] = defaultdict(_counter)
+        self._group_convs: Dict[Tuple[int, int], int] = defaultdict(int)
+        self._convs: Set[int] = set()
+        self._events = 0
+
+    # ---- 记录 ----
+
+    def add_user(self, user_id: int, conv_id: Optional[int] = None, frequency: int = 0, **deltas: int) -> None:
+        """
+        记录用户用量增量。
+
+        Args:
+            user_id: 用户ID
+            conv_id: 需要同步轮次的私聊会话ID
+            frequency: user_sign.frequency（临时额度）的增量
+            **deltas: users 表字段的增量，如 input_tokens=10, remain_frequency=-1
+        """
+        with self._lock:
+            pending = self._users[user_id]
+            for field, value in deltas.items():
+                if field not in _USER_FIELDS:
+                    raise ValueError(f"不支持累积的用户字段: {field}")
+                pending[field] += value
+            if frequency:
+                self._signs[user_id] += frequency
+            if conv_id:
+                self._convs.add(conv_id)
+            self._events += 1
+        self._after_record()
+
+    def add_group(self, group_id: int, user_id: Optional[int] = None, turns: int = 0, **deltas: int) -> None:
+        """
+        记录群组用量增量。
+
+        Args:
+            group_id: 群组ID
+            user_id: 需要增加群聊会话轮次的用户ID
+            turns: 群聊用户会话(group_user_conversations.turns)的增量
+            **deltas: groups 表字段的增量，如 call_count=1
+        """
+        with self._lock:
+            pending = self._groups[group_id]
+            for field, value in deltas.items():
+                if field not in _GROUP_FIELDS:
+                    raise ValueError(f"不支持累积的群组字段: {field}")
+                pending[field] += value
+            if user_id is not None and turns:
+                self._group_convs[(group_id, user_id)] += turns
+            self._events += 1
+        self._after_record()
+
+    def pending_quota(self, user_id: int) -> Tuple[int, int]:
+        """返回尚未写入数据库的 (remain_frequency 增量, 临时额度增量)。"""
+        with self._lock:
+            pending = self._users.get(user_id)
+            remain = pending.get("remain_frequency", 0) if pending else 0
+            return remain, self._signs.get(user_id, 0)
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        """
+        从数据库读取额度并叠加未写入增量时持有，期间没有批量写入在提交。
+        """
+        with self._commit_lock:
+            yield
+
+    def apply_pending(self, user: Any) -> Any:
+        """把未写入的额度增量叠加到从数据库读出的 User 对象上。"""
+        remain, frequency = self.pending_quota(user.id)
+        if remain or frequency:
+            user.remain_frequency += remain
+            user.temporary_frequency += frequency
+        return user
+
+    # ---- 写入 ----
+
+    def _after_record(self) -> None:
+        self.stats["events"] += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有事件循环（脚本、工作线程）时只按条数写入
+            if self._events >= self.flush_max_events:
+                self.flush()
+            return
+        self._ensure_flusher(loop)
+        if self._events >= self.flush_max_events:
+            # 达到条数时提前唤醒后台写入，不在事件循环中同步提交
+            self._wakeup.set()
+
+    def _ensure_flusher(self, loop: asyncio.AbstractEventLoop) -> None:
+        """在事件循环中启动后台写入任务，按时间间隔或被唤醒时写入。"""
+        if self._flusher is not None and not self._flusher.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._flusher = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._events:
+                continue
+            await asyncio.to_thread(self.flush)
+
+    def flush(self) -> bool:
+        """把累积的增量在一个事务中写入数据库。"""
+        with self._commit_lock:
+            return self._flush()
+
+    def _flush(self) -> bool:
+        with self._lock:
+            if not self._events:
+                return True
+            users, signs, groups = self._users, self._signs, self._groups
+            group_convs, convs = self._group_convs, self._convs
+            self._reset_pending()
+
+        statements = []
+        if users:
+            statements.append((
+                "UPDATE users SET "
+                + ", ".join(f"{field} = COALESCE({field}, 0) + ?" for field in _USER_FIELDS)
+                + " WHERE uid = ?",
+                [tuple(d[field] for field in _USER_FIELDS) + (uid,) for uid, d in users.items()],
+            ))
+        if signs:
+            statements.append((
+                "UPDATE user_sign SET frequency = COALESCE(frequency, 0) + ? WHERE user_id = ?",
+                [(delta, uid) for uid, delta in signs.items() if delta],
+            ))
+        if convs:
+            statements.append((
+                "UPDATE conversations SET turns = "
+                "(SELECT COALESCE(MAX(turn_order), 0) FROM dialogs WHERE conv_id = ?) WHERE conv_id = ?",
+                [(conv_id, conv_id) for conv_id in convs],
+            ))
+        if groups:
+            statements.append((
+                "UPDATE groups SET "
+                + ", ".join(f"{field} = COALESCE({field}, 0) + ?" for field in _GROUP_FIELDS)
+                + " WHERE group_id = ?",
+                [tuple(d[field] for field in _GROUP_FIELDS) + (gid,) for gid, d in groups.items()],
+            ))
+        if group_convs:
+            statements.append((
+                "UPDATE group_user_conversations SET turns = COALESCE(turns, 0) + ? "
+                "WHERE group_id = ? AND user_id = ? AND delete_mark = 'no'",
+                [(delta, gid, uid) for (gid, uid), delta in group_convs.items()],
+            ))
+
+        if db.revise_db_batch(statements):
+            self.stats["flushes"] += 1
+            self.stats["statements"] += sum(len(params) for _, params in statements)
+            return True
+
+        # 写入失败时把增量放回去，下次再试，避免丢失扣费
+        self.stats["errors"] += 1
+        logger.error("用量批量写入失败，增量将在下次写入时重试")
+        with self._lock:
+            for uid, d in users.items():
+                for field, value in d.items():
+                    self._users[uid][field] += value
+            for uid, delta in signs.items():
+                self._signs[uid] += delta
+            for gid, d in groups.items():
+                for field, value in d.items():
+                    self._groups[gid][field] += value
+            for key, delta in group_convs.items():
+                self._group_convs[key] += delta
+            self._convs |= convs
+            self._events += 1
+        return False
+
+    async def aclose(self) -> None:
+        """在事件循环关闭前调用：停止后台写入任务，并在工作线程中写入剩余的增量。"""
+        flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            flusher.cancel()
+            await asyncio.gather(flusher, return_exceptions=True)
+        await asyncio.to_thread(self.flush)
+
+    def close(self) -> None:
+        """停止定时写入并写入剩余的增量；事件循环已关闭时也可以调用。"""
+        flusher, self._flusher = self._flusher, None
+        try:
+            if flusher is not None and not flusher.get_loop().is_closed():
+                flusher.cancel()
+        finally:
+            self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._events
+        return {**self.stats, "pending_events": pending}
+
+
+# 全局用量累加器实例
+usage_accumulator = UsageAccumulator()
+on_config_reload(usage_accumulator.reload_config, in_loop=True)
+metrics.register_collector("usage_accumulator", usage_accumulator.get_stats)
@@ -5,10 +5,16 @@ import sys
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, project_root)
 
-from web.factory import create_app, app_logger
+from web.factory import create_app
 
+# WSGI 入口，例如: waitress-serve --threads 8 --port 8081 web.app:app
 app = create_app()
 
 if __name__ == "__main__":
-    app_logger.info("启动Web管理界面，地址: http://0.0.0.0:8081")
-    app.run(debug=False, host="0.0.0.0", port=8081, use_reloader=False)
+    # 单独运行 Web 管理界面；随机器人一起运行时由 bot_run 在进程内启动 web.server.web_server
+    from web.server import web_server
+
+    try:
+        web_server.serve_forever(app)
+    finally:
+        web_server.stop()
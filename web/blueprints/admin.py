@@ -13,6 +13,7 @@ from flask import (
 from web.factory import viewer_or_admin_required, format_datetime, get_admin_ids
 from bot_core.services.utils.usage import get_dashboard_stats
 from utils import db_utils as db
+from web.db_access import web_db
 import os
 
 admin_bp = Blueprint("admin", __name__)
@@ -52,16 +53,16 @@ def index():
         admin_ids_str = ",".join(map(str, admin_ids))
         stats = {}
         stats["total_users"] = (
-            db.query_db(f"SELECT COUNT(*) FROM users WHERE uid NOT IN ({admin_ids_str})")[0][0] or 0
+            web_db.query_db(f"SELECT COUNT(*) FROM users WHERE uid NOT IN ({admin_ids_str})")[0][0] or 0
         )
         stats["total_conversations"] = (
-            db.query_db(
+            web_db.query_db(
                 f"SELECT COUNT(*) FROM conversations WHERE user_id NOT IN ({admin_ids_str})"
             )[0][0]
             or 0
         )
         stats["total_dialogs"] = (
-            db.query_db(
+            web_db.query_db(
                 f"SELECT COUNT(*) FROM dialogs d JOIN conversations c ON d.conv_id = c.conv_id WHERE c.user_id NOT IN ({admin_ids_str})"
             )[0][0]
             or 0
@@ -69,14 +70,14 @@ def index():
         from datetime import datetime
 
         today = datetime.now().strftime("%Y-%m-%d")
-        today_conversations = db.query_db(
+        today_conversations = web_db.query_db(
             f"SELECT COUNT(*) FROM conversations WHERE date(create_at) = ? AND user_id NOT IN ({admin_ids_str})",
             (today,),
         )
         stats["today_conversations"] = (
             today_conversations[0][0] if today_conversations else 0
         )
-        today_dialogs = db.query_db(
+        today_dialogs = web_db.query_db(
             f"SELECT COUNT(*) FROM dialogs d JOIN conversations c ON d.conv_id = c.conv_id WHERE date(d.created_at) = ? AND c.user_id NOT IN ({admin_ids_str})",
             (today,),
         )
@@ -86,7 +87,7 @@ def index():
         stats["today_group_dialogs"] = 0 # viewer模式不统计群聊
         stats["total_group_dialogs"] = 0
 
-        user_token_stats = db.query_db(
+        user_token_stats = web_db.query_db(
             f"SELECT SUM(input_tokens), SUM(output_tokens) FROM users WHERE uid NOT IN ({admin_ids_str})"
         )
         stats["total_input_tokens"] = user_token_stats[0][0] or 0
@@ -104,7 +105,7 @@ def index():
             stats["today_output_tokens"] = 0
             stats["today_total_tokens"] = 0
 
-        active_users = db.query_db(
+        active_users = web_db.query_db(
             f"""
             SELECT u.uid, u.user_name, u.first_name, u.last_name, COUNT(d.id) as message_count
             FROM users u
@@ -123,7 +124,7 @@ def index():
 
     # 管理员视图
     time_range = request.args.get("time_range", "7d")
-    stats = get_dashboard_stats(time_range)
+    stats = get_dashboard_stats(time_range, query_db=web_db.query_db)
     return render_template("index.html", stats=stats, user_role=user_role)
 
 
@@ -171,8 +172,8 @@ def users():
     query += " LIMIT ? OFFSET ?"
     params.extend([per_page, offset])
 
-    users_data = db.query_db(query, tuple(params))
-    total_result = db.query_db(count_query, tuple(count_params))
+    users_data = web_db.query_db(query, tuple(params))
+    total_result = web_db.query_db(count_query, tuple(count_params))
     total_users = total_result[0][0] if total_result else 0
     total_pages = (total_users + per_page - 1) // per_page
     users_list = []
@@ -283,8 +284,8 @@ def conversations():
     query += f" ORDER BY c.{sort_by} {order} LIMIT ? OFFSET ?"
     params.extend([per_page, offset])
 
-    conversations_data = db.query_db(query, tuple(params))
-    total_result = db.query_db(count_query, tuple(count_params))
+    conversations_data = web_db.query_db(query, tuple(params))
+    total_result = web_db.query_db(count_query, tuple(count_params))
     total_conversations = total_result[0][0] if total_result else 0
     total_pages = (total_conversations + per_page - 1) // per_page
     conversations_list = []
@@ -342,7 +343,7 @@ def dialogs(conv_id):
         admin_ids = get_admin_ids()
         if admin_ids:
             admin_ids_str = ",".join(map(str, admin_ids))
-            conv_check = db.query_db(
+            conv_check = web_db.query_db(
                 f"SELECT user_id FROM conversations WHERE conv_id = ? AND user_id NOT IN ({admin_ids_str})",
                 (conv_id,),
             )
@@ -351,7 +352,7 @@ def dialogs(conv_id):
                 return redirect(url_for("admin.conversations"))
 
     # 获取对话信息
-    conversation_data = db.query_db(
+    conversation_data = web_db.query_db(
         """
         SELECT c.*, u.first_name, u.last_name, u.user_name
         FROM conversations c
@@ -412,8 +413,8 @@ def dialogs(conv_id):
         f"SELECT COUNT(*) FROM dialogs WHERE conv_id = ? AND turn_order != 0{search_clause if search else ''}"
     )
 
-    dialogs_data = db.query_db(query, tuple(params))
-    total_result = db.query_db(count_query, tuple(count_params))
+    dialogs_data = web_db.query_db(query, tuple(params))
+    total_result = web_db.query_db(count_query, tuple(count_params))
     total_dialogs = total_result[0][0] if total_result else 0
     total_pages = (total_dialogs + per_page - 1) // per_page
 
@@ -495,7 +496,7 @@ def groups():
     query += f" ORDER BY {sort_by} {sort_order}"
     query += " LIMIT ? OFFSET ?"
     params.extend([per_page, offset])
-    groups_data = db.query_db(query, tuple(params))
+    groups_data = web_db.query_db(query, tuple(params))
     count_query = "SELECT COUNT(*) FROM groups"
     count_params = []
     if search_term:
@@ -511,7 +512,7 @@ def groups():
                 search_param,
             ]
         )
-    total_result = db.query_db(count_query, tuple(count_params))
+    total_result = web_db.query_db(count_query, tuple(count_params))
     total_groups = total_result[0][0] if total_result else 0
     total_pages = (total_groups + per_page - 1) // per_page
     groups_list = []
@@ -571,7 +572,7 @@ def group_dialogs(group_id):
     search = request.args.get("search", "", type=str).strip()
     per_page = 50
     offset = (page - 1) * per_page
-    group_data = db.query_db("SELECT * FROM groups WHERE group_id = ?", (group_id,))
+    group_data = web_db.query_db("SELECT * FROM groups WHERE group_id = ?", (group_id,))
     if not group_data:
         return "群组不存在", 404
     group_columns = [
@@ -608,20 +609,20 @@ def group_dialogs(group_id):
             ORDER BY create_at DESC
             LIMIT ? OFFSET ?
         """
-        dialogs_data = db.query_db(
+        dialogs_data = web_db.query_db(
             query,
             (group_id, per_page, f"%{search}%", per_page, offset)
         )
-        total_result = db.query_db(
+        total_result = web_db.query_db(
             "SELECT COUNT(*) FROM group_dialogs WHERE group_id = ? AND msg_text LIKE ?",
             (group_id, f"%{search}%"),
         )
     else:
-        dialogs_data = db.query_db(
+        dialogs_data = web_db.query_db(
             "SELECT * FROM group_dialogs WHERE group_id = ? ORDER BY create_at DESC LIMIT ? OFFSET ?",
             (group_id, per_page, offset),
         )
-        total_result = db.query_db(
+        total_result = web_db.query_db(
             "SELECT COUNT(*) FROM group_dialogs WHERE group_id = ?", (group_id,)
         )
     total_dialogs = total_result[0][0] if total_result else 0
@@ -672,7 +673,7 @@ def search():
             "search.html", results={}, query="", format_datetime=format_datetime
         )
     results = {"dialogs": [], "users": [], "groups": [], "conversations": []}
-    dialogs_data = db.query_db(
+    dialogs_data = web_db.query_db(
         "SELECT d.*, c.character, c.user_id, u.user_name, u.first_name, u.last_name FROM dialogs d LEFT JOIN conversations c ON d.conv_id = c.conv_id LEFT JOIN users u ON c.user_id = u.uid WHERE d.raw_content LIKE ? OR d.processed_content LIKE ? ORDER BY d.created_at DESC",
         (f"%{query}%", f"%{query}%"),
     )
@@ -704,7 +705,7 @@ def search():
             )
             dialog_dict["type"] = "private"
             results["dialogs"].append(dialog_dict)
-    group_dialogs_data = db.query_db(
+    group_dialogs_data = web_db.query_db(
         "SELECT gd.group_id, gd.msg_user, gd.trigger_type, gd.msg_text, gd.msg_user_name, gd.msg_id, gd.raw_response, gd.processed_response, gd.delete_mark, gd.group_name, gd.create_at, g.group_name as groups_group_name, ROW_NUMBER() OVER (ORDER BY gd.create_at DESC) as id FROM group_dialogs gd LEFT JOIN groups g ON gd.group_id = g.group_id WHERE gd.msg_text LIKE ? OR gd.raw_response LIKE ? OR gd.processed_response LIKE ? ORDER BY gd.create_at DESC",
         (f"%{query}%", f"%{query}%", f"%{query}%"),
     )
@@ -736,7 +737,7 @@ def search():
             )
             group_dialog_dict["type"] = "group"
             results["dialogs"].append(group_dialog_dict)
-    users_data = db.query_db(
+    users_data = web_db.query_db(
         "SELECT u.uid, u.first_name, u.last_name, u.user_name, u.create_at, u.conversations as conversations_orig, u.dialog_turns as dialog_turns_orig, u.update_at, u.input_tokens, u.output_tokens, u.account_tier, u.remain_frequency, u.balance, COUNT(DISTINCT c.conv_id) as conversations, SUM(CASE WHEN d.id IS NOT NULL THEN 1 ELSE 0 END) as dialog_turns FROM users u LEFT JOIN conversations c ON u.uid = c.user_id LEFT JOIN dialogs d ON c.conv_id = d.conv_id WHERE u.user_name LIKE ? OR u.first_name LIKE ? OR u.last_name LIKE ? OR CAST(u.uid AS TEXT) LIKE ? GROUP BY u.uid ORDER BY u.create_at DESC",
         (f"%{query}%", f"%{query}%", f"%{query}%", f"%{query}%"),
     )
@@ -761,7 +762,7 @@ def search():
         for row in users_data:
             user_dict = {user_columns[i]: row[i] for i in range(len(user_columns))}
             results["users"].append(user_dict)
-    groups_data = db.query_db(
+    groups_data = web_db.query_db(
         "SELECT g.group_id, g.group_name, g.char, g.call_count, g.active, g.update_time, COUNT(DISTINCT gd.msg_id) as dialog_count FROM groups g LEFT JOIN group_dialogs gd ON g.group_id = gd.group_id WHERE g.group_name LIKE ? OR CAST(g.group_id AS TEXT) LIKE ? GROUP BY g.group_id ORDER BY g.update_time DESC",
         (f"%{query}%", f"%{query}%"),
     )
@@ -778,7 +779,7 @@ def search():
         for row in groups_data:
             group_dict = {group_columns[i]: row[i] for i in range(len(group_columns))}
             results["groups"].append(group_dict)
-    conversations_data = db.query_db(
+    conversations_data = web_db.query_db(
         "SELECT c.conv_id, c.user_id, c.character, c.preset, c.summary, c.create_at, c.update_at, u.user_name, u.first_name, u.last_name, COUNT(d.id) as turns FROM conversations c LEFT JOIN users u ON c.user_id = u.uid LEFT JOIN dialogs d ON c.conv_id = d.conv_id WHERE c.character LIKE ? OR c.preset LIKE ? OR c.summary LIKE ? OR u.user_name LIKE ? OR u.first_name LIKE ? OR u.last_name LIKE ? OR CAST(c.user_id AS TEXT) LIKE ? GROUP BY c.conv_id ORDER BY c.update_at DESC",
         (
             f"%{query}%",
@@ -864,123 +865,117 @@ def database_viewer():
     )
 
 
-@admin_bp.route("/analysis_preview")
-@viewer_or_admin_required
-def analysis_preview():
-    """分析结果预览页面 - 支持分页"""
-    if session.get("user_role") == "viewer":
-        abort(403)
-    page = request.args.get("page", 1, type=int)
-    per_page = 20  # 每页显示20个项目
-    
-    pics_dir = os.path.join(current_app.root_path, '..', 'data', 'pics')
-    all_files = []
-    if os.path.exists(pics_dir):
-        all_files = [f for f in os.listdir(pics_dir) if f.lower().endswith(('.jpg', '.png', '.jpeg', '.gif'))]
-        # 按文件名中的时间戳降序排序
-        all_files.sort(key=lambda x: int(x.split('_')[-1].split('.')[0]), reverse=True)
-
-    total_items = len(all_files)
-    total_pages = (total_items + per_page - 1) // per_page
-    
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_files = all_files[start:end]
+ANALYSIS_PAGE_SIZE = 20  # 分析结果预览每页显示的项目数
+_media_catalog_synced = False
 
-    analysis_items = []
-    for filename in paginated_files:
+
+def _pics_dir():
+    return os.path.join(current_app.root_path, '..', 'data', 'pics')
+
+
+def _sync_media_catalog():
+    """
+    进程内第一次访问时，把 media_analysis 表中还没有登记的旧图片导入进来（只扫描一次目录）。
+    之后新图片由 ImageAnalyzer 在保存时登记。
+    """
+    global _media_catalog_synced
+    if _media_catalog_synced:
+        return
+    _media_catalog_synced = True
+
+    pics_dir = _pics_dir()
+    if not os.path.exists(pics_dir):
+        return
+    known = {row[0] for row in web_db.query_db("SELECT filename FROM media_analysis")}
+    items = []
+    for filename in os.listdir(pics_dir):
+        if filename in known or not filename.lower().endswith(('.jpg', '.png', '.jpeg', '.gif')):
+            continue
         name, _ = os.path.splitext(filename)
         parts = name.split('_')
-        user_id = parts[0]
-        timestamp = int(parts[1]) if len(parts) > 1 else 0
-        
-        # 获取用户信息
-        user_info = db.query_db("SELECT first_name, last_name FROM users WHERE uid = ?", (user_id,))
-        user_name = f"{user_info[0][0] or ''} {user_info[0][1] or ''}".strip() if user_info else "未知用户"
-
-        # 格式化时间
-        from datetime import datetime
-        date_time = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-
-        txt_filename = f"{name}.txt"
-        txt_filepath = os.path.join(pics_dir, txt_filename)
-        
-        content = ""
+        try:
+            user_id = int(parts[0])
+            timestamp = int(parts[1]) if len(parts) > 1 else 0
+        except ValueError:
+            continue
+        content = None
+        txt_filepath = os.path.join(pics_dir, f"{name}.txt")
         if os.path.exists(txt_filepath):
             try:
                 with open(txt_filepath, 'r', encoding='utf-8') as f:
                     content = f.read()
             except Exception as e:
                 content = f"读取文件出错: {e}"
+        items.append((filename, user_id, timestamp, content))
+    if items:
+        db.media_analysis_import(items)
+        current_app.logger.info(f"已将 {len(items)} 张旧图片导入分析目录")
 
+
+def _load_analysis_page(cursor=None):
+    """
+    读取一页分析结果。
+
+    Args:
+        cursor: 上一页返回的游标 "created_at_id"，为空时从最新的开始
+
+    Returns:
+        tuple: (项目列表, 下一页游标；没有更多时为 None)
+    """
+    from datetime import datetime
+
+    _sync_media_catalog()
+    before = None
+    if cursor:
+        try:
+            created_at, item_id = cursor.split('_', 1)
+            before = (int(created_at), int(item_id))
+        except ValueError:
+            abort(400)
+
+    # 多取一条用来判断是否还有下一页
+    rows = db.media_analysis_page(ANALYSIS_PAGE_SIZE + 1, before)
+    has_next = len(rows) > ANALYSIS_PAGE_SIZE
+    rows = rows[:ANALYSIS_PAGE_SIZE]
+
+    analysis_items = []
+    for row in rows:
+        user_name = f"{row['first_name'] or ''} {row['last_name'] or ''}".strip() if row['first_name'] or row['last_name'] else "未知用户"
         analysis_items.append({
-            'image_url': url_for('api.serve_pic', filename=filename),
-            'content': content,
+            'image_url': url_for('api.serve_pic', filename=row['filename']),
+            'content': row['analysis'] or "",
             'user_name': user_name,
-            'date_time': date_time
+            'date_time': datetime.fromtimestamp(row['created_at']).strftime('%Y-%m-%d %H:%M:%S')
         })
 
+    next_cursor = f"{rows[-1]['created_at']}_{rows[-1]['id']}" if has_next else None
+    return analysis_items, next_cursor
+
+
+@admin_bp.route("/analysis_preview")
+@viewer_or_admin_required
+def analysis_preview():
+    """分析结果预览页面 - 显示第一页，后续通过无限滚动按游标加载"""
+    if session.get("user_role") == "viewer":
+        abort(403)
+    analysis_items, next_cursor = _load_analysis_page()
+
     return render_template(
         "analysis_preview.html",
         items=analysis_items,
-        page=page,
-        total_pages=total_pages
+        next_cursor=next_cursor
     )
 
 @admin_bp.route("/api/analysis_previews")
 @viewer_or_admin_required
 def api_analysis_previews():
-    """为无限滚动提供分析结果的 API 端点"""
+    """为无限滚动提供分析结果的 API 端点，使用 cursor 参数做键集分页"""
     if session.get("user_role") == "viewer":
         abort(403)
-    page = request.args.get("page", 1, type=int)
-    per_page = 20
-    
-    pics_dir = os.path.join(current_app.root_path, '..', 'data', 'pics')
-    all_files = []
-    if os.path.exists(pics_dir):
-        all_files = [f for f in os.listdir(pics_dir) if f.lower().endswith(('.jpg', '.png', '.jpeg', '.gif'))]
-        all_files.sort(key=lambda x: int(x.split('_')[-1].split('.')[0]), reverse=True)
-
-    total_items = len(all_files)
-    total_pages = (total_items + per_page - 1) // per_page
-    
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_files = all_files[start:end]
-
-    analysis_items = []
-    for filename in paginated_files:
-        name, _ = os.path.splitext(filename)
-        parts = name.split('_')
-        user_id = parts[0]
-        timestamp = int(parts[1]) if len(parts) > 1 else 0
-        
-        user_info = db.query_db("SELECT first_name, last_name FROM users WHERE uid = ?", (user_id,))
-        user_name = f"{user_info[0][0] or ''} {user_info[0][1] or ''}".strip() if user_info else "未知用户"
-
-        from datetime import datetime
-        date_time = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-
-        txt_filename = f"{name}.txt"
-        txt_filepath = os.path.join(pics_dir, txt_filename)
-        
-        content = ""
-        if os.path.exists(txt_filepath):
-            try:
-                with open(txt_filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            except Exception as e:
-                content = f"读取文件出错: {e}"
-
-        analysis_items.append({
-            'image_url': url_for('api.serve_pic', filename=filename),
-            'content': content,
-            'user_name': user_name,
-            'date_time': date_time
-        })
+    analysis_items, next_cursor = _load_analysis_page(request.args.get("cursor"))
 
     return jsonify({
         'items': analysis_items,
-        'has_next': page < total_pages
+        'next_cursor': next_cursor,
+        'has_next': next_cursor is not None
     })
\ No newline at end of file
@@ -1,4 +1,3 @@
-import asyncio
 import json
 import os
 import time
@@ -6,6 +5,7 @@ from datetime import datetime
 from flask import Blueprint, jsonify, request, Response, send_from_directory, current_app, session
 from typing import Union
 from utils import db_utils as db
+from web.db_access import web_db
 from agent.llm_functions import generate_summary
 from web.factory import admin_required, viewer_required, get_admin_ids, app_logger
 from web.factory import viewer_or_admin_required
@@ -22,14 +22,14 @@ def get_message_page(group_id, msg_id):
     except ValueError:
         return jsonify({"error": "Invalid group ID"}), 400
     per_page = 50
-    msg_data = db.query_db(
+    msg_data = web_db.query_db(
         "SELECT create_at FROM group_dialogs WHERE group_id = ? AND msg_id = ?",
         (group_id, msg_id),
     )
     if not msg_data:
         return jsonify({"error": "Message not found"}), 404
     msg_create_at = msg_data[0][0]
-    count_result = db.query_db(
+    count_result = web_db.query_db(
         "SELECT COUNT(*) FROM group_dialogs WHERE group_id = ? AND create_at > ?",
         (group_id, msg_create_at),
     )
@@ -46,7 +46,7 @@ def export_group_dialogs(group_id):
         group_id = int(group_id)
     except ValueError:
         return jsonify({"error": "Invalid group ID"}), 400
-    group_data = db.query_db("SELECT * FROM groups WHERE group_id = ?", (group_id,))
+    group_data = web_db.query_db("SELECT * FROM groups WHERE group_id = ?", (group_id,))
     if not group_data:
         return jsonify({"error": "群组不存在"}), 404
     group_columns = [
@@ -66,7 +66,7 @@ def export_group_dialogs(group_id):
         "disabled_topics",
     ]
     group = {group_columns[i]: group_data[0][i] for i in range(len(group_columns))}
-    dialogs_data = db.query_db(
+    dialogs_data = web_db.query_db(
         "SELECT * FROM group_dialogs WHERE group_id = ? ORDER BY create_at ASC",
         (group_id,),
     )
@@ -133,13 +133,13 @@ def api_user_detail(user_id) -> Union[Response, tuple[Response, int]]:
             return jsonify({"error": "无权限查看此用户信息"}), 403
 
     if request.method == "GET":
-        user_data = db.query_db("SELECT * FROM users WHERE uid = ?", (user_id,))
+        user_data = web_db.query_db("SELECT * FROM users WHERE uid = ?", (user_id,))
         if not user_data:
             return jsonify({"error": "用户不存在"}), 404
-        user_config_data = db.query_db(
+        user_config_data = web_db.query_db(
             "SELECT * FROM user_config WHERE uid = ?", (user_id,)
         )
-        conversations_count_data = db.query_db(
+        conversations_count_data = web_db.query_db(
             "SELECT COUNT(*) FROM conversations WHERE user_id = ?", (user_id,)
         )
         conversations_count = (
@@ -184,7 +184,7 @@ def api_user_detail(user_id) -> Union[Response, tuple[Response, int]]:
                 set_clause = ", ".join([f"{key} = ?" for key in user_updates.keys()])
                 params = list(user_updates.values()) + [user_id]
                 user_sql = f"UPDATE users SET {set_clause} WHERE uid = ?"
-                db.revise_db(user_sql, tuple(params))
+                web_db.revise_db(user_sql, tuple(params))
 
             # 更新 user_config 表
             if "config" in data and isinstance(data["config"], dict):
@@ -196,19 +196,19 @@ def api_user_detail(user_id) -> Union[Response, tuple[Response, int]]:
                         config_updates[field] = config_data[field]
                 
                 if config_updates:
-                    existing_config = db.query_db("SELECT uid FROM user_config WHERE uid = ?", (user_id,))
+                    existing_config = web_db.query_db("SELECT uid FROM user_config WHERE uid = ?", (user_id,))
                     if existing_config:
                         set_clause = ", ".join([f"{key} = ?" for key in config_updates.keys()])
                         params = list(config_updates.values()) + [user_id]
                         config_sql = f"UPDATE user_config SET {set_clause} WHERE uid = ?"
-                        db.revise_db(config_sql, tuple(params))
+                        web_db.revise_db(config_sql, tuple(params))
                     else:
                         config_updates["uid"] = user_id
                         columns = ", ".join(config_updates.keys())
                         placeholders = ", ".join(["?"] * len(config_updates))
                         params = list(config_updates.values())
                         config_sql = f"INSERT INTO user_config ({columns}) VALUES ({placeholders})"
-                        db.revise_db(config_sql, tuple(params))
+                        web_db.revise_db(config_sql, tuple(params))
 
             return jsonify({"success": True, "message": "用户信息更新成功"})
         except Exception as e:
@@ -456,14 +456,11 @@ def api_generate_summary():
         app_logger.info(f"解析到的conversation_id: {conversation_id}")
         if not conversation_id:
             return jsonify({"error": "缺少对话ID参数"}), 400
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            summary = loop.run_until_complete(generate_summary(conversation_id))
-        finally:
-            loop.close()
+        # LLM 客户端和调度器属于机器人的事件循环，摘要在该循环中生成
+        from web.server import web_server
+        summary = web_server.run_coroutine(generate_summary(conversation_id))
         if summary:
-            db.revise_db(
+            web_db.revise_db(
                 "UPDATE conversations SET summary = ? WHERE conv_id = ?",
                 (summary, conversation_id),
             )
@@ -488,7 +485,7 @@ def export_dialogs(conv_id):
             admin_ids = get_admin_ids()
             if admin_ids:
                 admin_ids_str = ",".join(map(str, admin_ids))
-                conv_check = db.query_db(
+                conv_check = web_db.query_db(
                     f"SELECT user_id FROM conversations WHERE conv_id = ? AND user_id NOT IN ({admin_ids_str})",
                     (conv_id,),
                 )
@@ -496,7 +493,7 @@ def export_dialogs(conv_id):
                     return jsonify({"error": "对话不存在或您没有权限查看"}), 403
         
         # 获取对话信息
-        conversation_data = db.query_db(
+        conversation_data = web_db.query_db(
             """
             SELECT c.*, u.first_name, u.last_name, u.user_name
             FROM conversations c
@@ -528,7 +525,7 @@ def export_dialogs(conv_id):
         }
 
         # 获取完整的对话数据（不分页）
-        dialogs_data = db.query_db(
+        dialogs_data = web_db.query_db(
             "SELECT * FROM dialogs WHERE conv_id = ? AND turn_order != 0 ORDER BY turn_order ASC",
             (conv_id,),
         )
@@ -566,7 +563,7 @@ def export_dialogs(conv_id):
 def get_conversation_summary(conv_id):
     """获取对话摘要"""
     try:
-        conversation_data = db.query_db(
+        conversation_data = web_db.query_db(
             "SELECT summary FROM conversations WHERE conv_id = ?", (conv_id,)
         )
         if not conversation_data:
@@ -588,7 +585,7 @@ def edit_message():
         new_content = data.get("content", "").strip()
         if not dialog_id:
             return jsonify({"error": "缺少消息ID"}), 400
-        db.revise_db(
+        web_db.revise_db(
             "UPDATE dialogs SET processed_content = ? WHERE id = ?",
             (new_content, dialog_id),
         )
@@ -608,7 +605,7 @@ def api_group_detail(group_id) -> Union[Response, tuple[Response, int]]:
         return jsonify({"error": "Invalid group ID"}), 400
 
     if request.method == "GET":
-        group_data = db.query_db("SELECT * FROM groups WHERE group_id = ?", (group_id,))
+        group_data = web_db.query_db("SELECT * FROM groups WHERE group_id = ?", (group_id,))
         if not group_data:
             return jsonify({"error": "群组不存在"}), 404
         
@@ -640,7 +637,7 @@ def api_group_detail(group_id) -> Union[Response, tuple[Response, int]]:
                 set_clause = ", ".join([f"{key} = ?" for key in updates.keys()])
                 params = list(updates.values()) + [group_id]
                 sql = f"UPDATE groups SET {set_clause} WHERE group_id = ?"
-                db.revise_db(sql, tuple(params))
+                web_db.revise_db(sql, tuple(params))
 
             return jsonify({"success": True, "message": "群组信息更新成功"})
         except Exception as e:
@@ -0,0 +1,27 @@
+import hmac
+
+from flask import Blueprint, Response, request, session
+
+from utils.config_utils import get_config as get_bot_config
+from utils.metrics import metrics
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+def _authorized() -> bool:
+    """配置了 web.metrics_token 时接受 Bearer 令牌或 ?token=，否则要求管理员登录。"""
+    token = get_bot_config("web.metrics_token", "")
+    if token:
+        auth = request.headers.get("Authorization", "")
+        supplied = auth[7:] if auth.startswith("Bearer ") else request.args.get("token", "")
+        if supplied and hmac.compare_digest(supplied, token):
+            return True
+    return "logged_in" in session and session.get("user_role") == "admin"
+
+
+@metrics_bp.route("/metrics")
+def prometheus_metrics():
+    """Prometheus 文本格式的运行指标"""
+    if not _authorized():
+        return Response("unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
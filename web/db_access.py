@@ -0,0 +1,124 @@
+"""
+Web 管理界面的数据库访问
+
+管理界面的查询不再使用机器人的连接池：
+- 读：最多 web.threads 个只读连接（mode=ro + PRAGMA query_only）组成连接池，每次查询借出、用完归还，
+  Werkzeug 每个请求一个新线程时也不会越开越多；单条语句超过 web.query_timeout_ms 会被中断；
+  存在群聊消息归档库时一并附加，group_dialogs 同时包含已归档的记录（见 utils.history_archive）；
+- 写：编辑操作共用一个写连接，用锁串行执行，忙等待时间较短，避免长时间占用 SQLite 写锁。
+
+接口与 utils.db_utils 的 query_db / revise_db 保持一致，出错时查询返回空列表，更新返回 0。
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional, Tuple
+
+from utils.config_utils import get_config
+from utils.db_utils import db_pool
+from utils.history_archive import attach_archive_view
+
+logger = logging.getLogger(__name__)
+
+
+class WebDatabase:
+    """
+    Web 管理界面的数据库连接管理，采用单例模式。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(WebDatabase, cls).__new__(cls)
+            cls._instance._init_database()
+        return cls._instance
+
+    def _init_database(self):
+        self.db_file = db_pool.db_file
+        self.query_timeout = get_config("web.query_timeout_ms", 5000) / 1000
+        self.pool_size = max(1, get_config("web.threads", 8))
+        # 空闲的 (连接, 截止时间) ，截止时间放在列表里供进度回调读取
+        self._idle: "queue.LifoQueue[Tuple[sqlite3.Connection, List[float]]]" = queue.LifoQueue()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.Lock()
+
+    def _open_reader(self) -> Tuple[sqlite3.Connection, List[float]]:
+        conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, timeout=5.0, check_same_thread=False)
+        attach_archive_view(conn)
+        conn.execute("PRAGMA query_only = ON")
+        deadline = [float("inf")]
+        conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline[0] else 0, 10000)
+        return conn, deadline
+
+    @contextmanager
+    def _reader(self) -> Iterator[Tuple[sqlite3.Connection, List[float]]]:
+        """借出一个只读连接，用完归还；连接都在用时最多等待 web.query_timeout_ms。"""
+        try:
+            reader = self._idle.get_nowait()
+        except queue.Empty:
+            reader = None
+            with self._readers_lock:
+                if len(self._readers) < self.pool_size:
+                    reader = self._open_reader()
+                    self._readers.append(reader[0])
+            if reader is None:
+                reader = self._idle.get(timeout=self.query_timeout)
+        try:
+            yield reader
+        finally:
+            reader[1][0] = float("inf")
+            self._idle.put(reader)
+
+    def query_db(self, command: str, params: Tuple = ()) -> List[Any]:
+        """借一个只读连接执行查询。"""
+        try:
+            with self._reader() as (conn, deadline):
+                deadline[0] = time.monotonic() + self.query_timeout
+                return conn.execute(command, params).fetchall()
+        except queue.Empty:
+            logger.error(f"Web 查询失败: 等待只读连接超时 ({self.pool_size} 个连接都在使用) 语句: {command}")
+            return []
+        except sqlite3.Error as e:
+            logger.error(f"Web 查询失败: {command} 参数: {params} 错误: {e}")
+            return []
+
+    def revise_db(self, command: str, params: Tuple = ()) -> int:
+        """在共享的写连接上执行更新。"""
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = sqlite3.connect(self.db_file, timeout=5.0, check_same_thread=False)
+                self._writer.execute("PRAGMA busy_timeout = 5000")
+            try:
+                cursor = self._writer.execute(command, params)
+                self._writer.commit()
+                return cursor.rowcount
+            except sqlite3.Error as e:
+                self._writer.rollback()
+                logger.error(f"Web 更新失败: {command} 参数: {params} 错误: {e}")
+                return 0
+
+    def close(self) -> None:
+        """关闭所有读写连接。"""
+        with self._readers_lock:
+            for conn in self._readers:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._readers.clear()
+            self._idle = queue.LifoQueue()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+# 全局 Web 数据库实例
+web_db = WebDatabase()
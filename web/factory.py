@@ -151,8 +151,10 @@ def create_app():
     from .blueprints.auth import auth_bp
     from .blueprints.admin import admin_bp
     from .blueprints.api import api_bp
+    from .blueprints.metrics import metrics_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(api_bp)
+    app.register_blueprint(metrics_bp)
 
     return app
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Web 管理界面的 WSGI 服务
+
+在机器人进程内用多线程 WSGI 服务器托管 web.factory.create_app 创建的应用，
+不再通过子进程启动 Flask 开发服务器（子进程会重新导入整个机器人并再次执行数据库结构检查）。
+安装了 waitress 时使用 waitress，否则使用 Werkzeug 的多线程服务器。
+
+LLM 客户端、请求调度器等异步对象属于机器人的事件循环，请求处理线程需要调用协程时
+通过 run_coroutine 提交到该循环执行，不能在线程内另建事件循环。
+"""
+
+import asyncio
+import concurrent.futures
+import importlib.util
+import logging
+import threading
+from typing import Any, Coroutine, Optional
+
+from utils.config_utils import get_config
+
+logger = logging.getLogger(__name__)
+
+
+class WebServer:
+    """
+    Web 管理界面服务器，采用单例模式，生命周期跟随机器人进程。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(WebServer, cls).__new__(cls)
+            cls._instance._init_server()
+        return cls._instance
+
+    def _init_server(self):
+        self.host = get_config("web.host", "0.0.0.0")
+        self.port = get_config("web.port", 8081)
+        self.threads = get_config("web.threads", 8)
+        self._server = None
+        self._backend: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._bot_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _create_server(self, app=None):
+        if app is None:
+            from web.factory import create_app
+
+            app = create_app()
+        if importlib.util.find_spec("waitress") is not None:
+            from waitress.server import create_server
+
+            self._backend = "waitress"
+            return create_server(app, host=self.host, port=self.port, threads=self.threads)
+
+        from werkzeug.serving import make_server
+
+        self._backend = "werkzeug"
+        return make_server(self.host, self.port, app, threaded=True)
+
+    def serve_forever(self, app=None) -> None:
+        """
+        在当前线程中运行服务器，直到 stop 被调用。
+
+        Args:
+            app: 要托管的 Flask 应用，默认用 web.factory.create_app 创建
+        """
+        self._server = self._create_server(app)
+        logger.info(f"Web管理界面已启动 ({self._backend})，地址: http://{self.host}:{self.port}")
+        if self._backend == "waitress":
+            self._server.run()
+        else:
+            self._server.serve_forever()
+
+    def run_coroutine(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """
+        在机器人的事件循环中执行协程，并在当前请求线程中等待结果。
+
+        Args:
+            coro: 要执行的协程
+            timeout: 最长等待秒数，默认 web.coroutine_timeout
+
+        Raises:
+            RuntimeError: 机器人事件循环未运行
+            concurrent.futures.TimeoutError: 超时（协程会被取消）
+        """
+        loop = self._bot_loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            coro.close()
+            raise RuntimeError("机器人事件循环未运行")
+        if timeout is None:
+            timeout = get_config("web.coroutine_timeout", 180)
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        在后台线程中启动服务器。
+
+        Args:
+            loop: 机器人的事件循环，供 run_coroutine 提交协程
+        """
+        if loop is not None:
+            self._bot_loop = loop
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def _run():
+            try:
+                self.serve_forever()
+            except Exception as e:
+                logger.error(f"Web管理界面运行失败: {e}", exc_info=True)
+
+        self._thread = threading.Thread(target=_run, name="web-admin", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止接受新请求，等待服务线程退出，并关闭 Web 使用的数据库连接。"""
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                if self._backend == "waitress":
+                    server.close()
+                    # 等待正在处理的请求完成
+                    server.task_dispatcher.shutdown(timeout=timeout)
+                else:
+                    server.shutdown()
+                    server.server_close()
+            except Exception as e:
+                logger.warning(f"停止Web管理界面时出错: {e}")
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+        from web.db_access import web_db
+        web_db.close()
+        logger.info("Web管理界面已停止")
+
+
+# 全局 Web 服务器实例
+web_server = WebServer()
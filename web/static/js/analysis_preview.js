@@ -46,20 +46,19 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
-    let page = 1;
-    let isLoading = false;
-    let hasNext = true;
     const loadingIndicator = document.getElementById('loading-indicator');
     const grid = document.querySelector('.analysis-grid');
+    let cursor = grid.dataset.nextCursor;
+    let isLoading = false;
+    let hasNext = Boolean(cursor);
 
     function loadMoreItems() {
         if (isLoading || !hasNext) return;
 
         isLoading = true;
         loadingIndicator.style.display = 'block';
-        page++;
 
-        fetch(`/api/analysis_previews?page=${page}`)
+        fetch(`/api/analysis_previews?cursor=${encodeURIComponent(cursor)}`)
             .then(response => response.json())
             .then(data => {
                 data.items.forEach(item => {
@@ -85,6 +84,7 @@ document.addEventListener('DOMContentLoaded', function () {
                     card.addEventListener('click', () => openModal(card));
                 });
 
+                cursor = data.next_cursor;
                 hasNext = data.has_next;
                 isLoading = false;
                 loadingIndicator.style.display = 'none';